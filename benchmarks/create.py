@@ -0,0 +1,61 @@
+"""Швидкість хешування при створенні торенту залежно від кількості файлів, загального розміру та процесів.
+
+Для кожної пари (розмір, кількість файлів) у тимчасовій папці створюються випадкові файли однакового розміру,
+потім для кожної кількості процесів вимірюється час creator.hash_pieces. Файли щойно записані, тож
+зазвичай читаються з кешу сторінок - вимірюється саме хешування, а не швидкість диска.
+
+    $ python3 -m benchmarks.create --sizes 64,512 --files 1,64,1024 --workers 1,4
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from bittorrentclient import creator
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="64,512", help="comma separated total sizes, MiB")
+    parser.add_argument("--files", default="1,64,1024", help="comma separated counts of files")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count()}", help="comma separated counts of processes")
+    parser.add_argument("--piece-length", type=int, default=None, help="piece length, KiB (chosen by size by default)")
+    return parser.parse_args()
+
+
+def make_files(directory: str, size: int, count: int) -> None:
+    file_size = size // count
+    for i in range(count):
+        path = os.path.join(directory, f"dir{i % 16}", f"file{i}.bin")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(os.urandom(file_size + (size - file_size * count if i == count - 1 else 0)))
+
+
+def main():
+    args = get_args()
+    work_dir = tempfile.mkdtemp(prefix="bt-create-")
+    try:
+        for size in map(int, args.sizes.split(",")):
+            for count in map(int, args.files.split(",")):
+                directory = os.path.join(work_dir, f"{size}-{count}")
+                make_files(directory, size * 2 ** 20, count)
+                files = creator.collect_files(directory)
+                total_length = sum(f.length for f in files)
+                piece_length = args.piece_length * 1024 if args.piece_length else creator.piece_length_for(total_length)
+                for workers in map(int, args.workers.split(",")):
+                    start = time.perf_counter()
+                    creator.hash_pieces(files, piece_length, workers)
+                    elapsed = time.perf_counter() - start
+                    print(json.dumps({"size_mib": size, "files": count, "piece_kib": piece_length // 1024,
+                                      "workers": workers, "seconds": round(elapsed, 3),
+                                      "mib_per_s": round(total_length / elapsed / 2 ** 20, 1)}), flush=True)
+                shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Рій на 127.0.0.1: HTTP-трекер, N сідерів та M лічерів в одному процесі.
+
+Для кожного сценарію (розмір куска x кількість файлів) вимірюється:
+    - сумарна швидкість лічерів, MiB/s, та час до завершення кожного лічера;
+    - процесорний час на 1 GiB завантажених даних;
+    - пікова пам'ять процесу (RSS);
+    - затримка event loop: наскільки пізніше запланованого прокидається задача, яка спить по 10 ms.
+Кожен сценарій виконується в окремому процесі, щоб пікова пам'ять не залежала від попередніх.
+Результати друкуються як JSON рядки, --output зберігає їх у файл, --baseline порівнює з попереднім файлом.
+
+    $ python3 -m benchmarks.loopback --size 16 --piece-lengths 16,256 --files 1,8 --output before.json
+    $ python3 -m benchmarks.loopback --size 16 --piece-lengths 16,256 --files 1,8 --baseline before.json
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+
+from bittorrentclient.session import Session
+from bittorrentclient.torrentfile import TorrentFile
+from .swarm import make_torrent, TrackerStandIn
+
+
+LAG_PERIOD = 0.01
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=16, help="size of torrent, MiB")
+    parser.add_argument("--piece-lengths", default="16,256,1024", help="comma separated piece lengths, KiB")
+    parser.add_argument("--files", default="1,8", help="comma separated counts of files in torrent")
+    parser.add_argument("--seeders", type=int, default=1, help="count of seeders")
+    parser.add_argument("--leechers", type=int, default=2, help="count of leechers")
+    parser.add_argument("--timeout", type=int, default=300, help="max time of one scenario, s")
+    parser.add_argument("--output", help="file to save results as JSON")
+    parser.add_argument("--baseline", help="JSON file of previous run to compare with")
+    return parser.parse_args()
+
+
+class LagMonitor:
+    """Вимірювання затримки event loop"""
+    def __init__(self, period: float = LAG_PERIOD):
+        self._period = period
+        self._task: asyncio.Task | None = None
+        self.samples: list[float] = list()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self._period)
+            self.samples.append(loop.time() - start - self._period)
+
+    def summary(self) -> dict:
+        samples = sorted(self.samples) or [0.]
+        return {"loop_lag_mean_ms": round(statistics.mean(samples) * 1000, 2),
+                "loop_lag_p99_ms": round(samples[int(len(samples) * 0.99)] * 1000, 2),
+                "loop_lag_max_ms": round(samples[-1] * 1000, 2)}
+
+
+async def run_swarm(torrent_path: str, seed_dir: str, work_dir: str, seeders: int, leechers: int,
+                    timeout: int) -> dict:
+    torrent = TorrentFile.open(torrent_path)
+    tracker = TrackerStandIn()
+    await tracker.start()
+    sessions = list()
+    for i in range(seeders):
+        session = Session(b"-PY0001-%012d" % i, port=0, host="127.0.0.1", to_download=False,
+                          tracker_timeout=2)
+        await session.start()
+        session.add_torrent(torrent, seed_dir)
+        sessions.append(session)
+    await asyncio.sleep(0.5)
+
+    lag = LagMonitor()
+    lag.start()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    pending = dict()
+    for i in range(leechers):
+        destination = os.path.join(work_dir, f"leech{i}")
+        os.makedirs(destination)
+        session = Session(b"-PY0001-%012d" % (seeders + i), port=0, host="127.0.0.1", to_upload=True,
+                          tracker_timeout=2)
+        await session.start()
+        pending[session] = session.add_torrent(torrent, destination).loadmanager
+        sessions.append(session)
+    finished = list()
+    while pending and time.perf_counter() - start < timeout:
+        await asyncio.sleep(0.05)
+        for session, loadmanager in list(pending.items()):
+            if loadmanager.get_stat().left == 0:
+                finished.append(time.perf_counter() - start)
+                pending.pop(session)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    await lag.stop()
+
+    downloaded = torrent.length * len(finished)
+    for session in sessions:
+        await session.shutdown()
+    await tracker.stop()
+    return dict(mib_per_s=round(downloaded / elapsed / 2 ** 20, 2),
+                seconds=round(elapsed, 3),
+                first_complete_s=round(min(finished), 3) if finished else None,
+                last_complete_s=round(max(finished), 3) if finished else None,
+                complete=len(finished) == leechers,
+                cpu_s_per_gib=round(cpu / (downloaded / 2 ** 30), 2) if downloaded else None,
+                peak_rss_mib=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                **lag.summary())
+
+
+def run_scenario(size: int, piece_length: int, files: int, seeders: int, leechers: int, timeout: int) -> dict:
+    """Запуск одного сценарію в дочірньому процесі"""
+    work_dir = tempfile.mkdtemp(prefix="bt-loopback-")
+    try:
+        file_sizes = None
+        if files > 1:
+            file_sizes = [size // files] * (files - 1)
+            file_sizes.append(size - sum(file_sizes))
+        seed_dir = os.path.join(work_dir, "seed", "t")
+        torrent_path = make_torrent(seed_dir, "t", size, piece_length, file_sizes)
+        result = asyncio.run(run_swarm(torrent_path, seed_dir, work_dir, seeders, leechers, timeout))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return dict(size_mib=size / 2 ** 20, piece_kib=piece_length // 1024, files=files, seeders=seeders,
+                leechers=leechers, **result)
+
+
+def compare(result: dict, baseline: list[dict]) -> dict:
+    """Зміна основних показників відносно сценарію з тими ж параметрами у попередньому запуску"""
+    keys = ("size_mib", "piece_kib", "files", "seeders", "leechers")
+    old = next((b for b in baseline if all(b.get(k) == result[k] for k in keys)), None)
+    if old is None:
+        return dict()
+    change = dict()
+    for key in ("mib_per_s", "seconds", "cpu_s_per_gib", "peak_rss_mib", "loop_lag_p99_ms"):
+        if old.get(key) and result.get(key) is not None:
+            change[key] = f"{(result[key] - old[key]) / old[key] * 100:+.1f}%"
+    return {"change": change}
+
+
+def main():
+    args = get_args()
+    baseline = list()
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = list()
+    context = multiprocessing.get_context("spawn")
+    for piece_length in map(int, args.piece_lengths.split(",")):
+        for files in map(int, args.files.split(",")):
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+                result = executor.submit(run_scenario, args.size * 2 ** 20, piece_length * 1024, files,
+                                         args.seeders, args.leechers, args.timeout).result()
+            results.append(result)
+            print(json.dumps(dict(result, **compare(result, baseline))), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
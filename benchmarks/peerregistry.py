@@ -0,0 +1,77 @@
+"""Зберігання відомих пірів: попередній список Peer проти PeerRegistry.
+
+Адреси надходять пакетами по --batch, як відповіді трекерів, DHT та PEX. Для кожного способу вимірюється
+час додавання всіх адрес, час вибору кандидатів для з'єднання та пам'ять на один відомий пір (tracemalloc).
+Попередній спосіб має квадратичну складність, тому для нього кількість пірів обмежена --legacy-peers.
+Адреси в обох випадках приходять як Peer, як їх передають трекери, тож час додавання включає їх створення.
+
+    $ python3 -m benchmarks.peerregistry --peers 100000 --legacy-peers 5000
+"""
+import argparse
+import ipaddress
+import json
+import time
+import tracemalloc
+
+from bittorrentclient.peer import Peer
+from bittorrentclient.peerregistry import PeerRegistry
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peers", type=int, default=100000, help="count of known peers")
+    parser.add_argument("--legacy-peers", type=int, default=5000, help="count of known peers for list storage")
+    parser.add_argument("--batch", type=int, default=200, help="addresses in one announce")
+    return parser.parse_args()
+
+
+def addresses(count: int) -> list[tuple[str, int]]:
+    return [(str(ipaddress.IPv4Address(0x0A000000 + i)), 6881 + i % 100) for i in range(count)]
+
+
+def legacy(batches: list[list[tuple[str, int]]]) -> tuple[list, float, float]:
+    known = list()
+    start = time.perf_counter()
+    for batch in batches:
+        peers = [Peer(ip, port) for ip, port in batch]
+        known.extend(list(filter(lambda a: a not in known, peers)))
+    added = time.perf_counter() - start
+    start = time.perf_counter()
+    unconnected = list(filter(lambda a: not a.connected, known))[:10]
+    return known, added, time.perf_counter() - start
+
+
+def registry(batches: list[list[tuple[str, int]]]) -> tuple[PeerRegistry, float, float]:
+    known = PeerRegistry()
+    start = time.perf_counter()
+    for batch in batches:
+        known.add((p.ip, p.port) for p in [Peer(ip, port) for ip, port in batch])
+    added = time.perf_counter() - start
+    start = time.perf_counter()
+    known.take(10)
+    return known, added, time.perf_counter() - start
+
+
+def measure(name: str, func, count: int, batch: int) -> dict:
+    items = addresses(count)
+    batches = [items[i:i + batch] + items[max(i - batch, 0):i] for i in range(0, count, batch)]  # з повторами
+    known, added, take = func(batches)
+    del known
+    tracemalloc.start()  # пам'ять окремим проходом, бо tracemalloc сповільнює виконання
+    base = tracemalloc.get_traced_memory()[0]
+    known, *_ = func(batches)
+    memory = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return dict(storage=name, peers=len(known), add_s=round(added, 3), take_ms=round(take * 1000, 3),
+                bytes_per_peer=round(memory / len(known)))
+
+
+def main():
+    args = get_args()
+    print(json.dumps(measure("list", legacy, args.legacy_peers, args.batch)), flush=True)
+    print(json.dumps(measure("registry", registry, args.legacy_peers, args.batch)), flush=True)
+    print(json.dumps(measure("registry", registry, args.peers, args.batch)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Збирання кусків з блоків: попередній спосіб проти пулу буферів, через пару з'єднаних сокетів.
+
+Сідер відповідає на запити блоків по 16 KiB. Клієнт запитує кусок за куском та перевіряє хеш.
+    - legacy: як було раніше - read() по 16 KiB, buffer += data, зрізи та struct.unpack для кожного
+      повідомлення, piece += block;
+    - pooled: Peer.listen з readexactly, блоки копіюються в буфер з BufferPool на свій зсув.
+Для кожного режиму: швидкість, процесорний час на 1 GiB та пік виділеної пам'яті за tracemalloc.
+Пам'ять вимірюється окремим проходом, бо tracemalloc сповільнює роботу.
+
+    $ python3 -m benchmarks.piecebuffers --size 64 --piece-lengths 256,1024,4096
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import struct
+import time
+import tracemalloc
+
+from bittorrentclient.buffers import BufferPool
+from bittorrentclient.peer import Peer
+
+
+BLOCK = 2 ** 14
+INFO_HASH = bytes(20)
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=64, help="size of data, MiB")
+    parser.add_argument("--piece-lengths", default="256,1024,4096", help="comma separated piece lengths, KiB")
+    return parser.parse_args()
+
+
+async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, data: bytes, piece_length: int,
+                handshake: bool) -> None:
+    """Сідер: відповідь на кожен запит блоку повідомленням piece"""
+    if handshake:
+        await reader.readexactly(68)
+    try:
+        while True:
+            message = await reader.readexactly(int.from_bytes(await reader.readexactly(4)))
+            if message and message[0] == 6:
+                index, begin, length = struct.unpack("!iii", message[1:])
+                offset = index * piece_length + begin
+                writer.write(struct.pack("!ibii", 9 + length, 7, index, begin) + data[offset:offset + length])
+                await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+
+def blocks_of(length: int) -> list[tuple[int, int]]:
+    return [(begin, min(BLOCK, length - begin)) for begin in range(0, length, BLOCK)]
+
+
+async def legacy(reader, writer, hashes: list[bytes], size: int, piece_length: int) -> None:
+    buffer = bytes()
+    for index, digest in enumerate(hashes):
+        length = min(piece_length, size - index * piece_length)
+        writer.write(b"".join(struct.pack("!iB3i", 13, 6, index, begin, block) for begin, block in blocks_of(length)))
+        piece = b""
+        while len(piece) < length:
+            data = await reader.read(2 ** 14)
+            buffer += data
+            while len(buffer) >= 4:
+                message_len = int.from_bytes(buffer[:4])
+                if not len(buffer) >= message_len + 4:
+                    break
+                message = buffer[5:4 + message_len]
+                _, _, block = struct.unpack(f"!ii{message_len - 9}s", message)
+                piece += block
+                buffer = buffer[4 + message_len:]
+        assert hashlib.sha1(piece).digest() == digest
+
+
+async def pooled(reader, writer, hashes: list[bytes], size: int, piece_length: int) -> None:
+    peer = Peer("127.0.0.1", 0)
+    await peer.accept(reader, writer, INFO_HASH, len(hashes), os.urandom(20))
+    listener = asyncio.create_task(peer.listen())
+    pool = BufferPool()
+    for index, digest in enumerate(hashes):
+        length = min(piece_length, size - index * piece_length)
+        buffer = pool.acquire(length)
+        view = memoryview(buffer)
+        await asyncio.gather(*[peer.request(index, begin, block, view[begin:begin + block])
+                               for begin, block in blocks_of(length)])
+        assert hashlib.sha1(buffer).digest() == digest
+        pool.release(buffer)
+    await peer.disconnect()
+    await listener
+
+
+async def run(mode: str, data: bytes, piece_length: int) -> dict:
+    """Швидкість та процесорний час одного проходу"""
+    hashes = [hashlib.sha1(data[i:i + piece_length]).digest() for i in range(0, len(data), piece_length)]
+    client_sock, seeder_sock = socket.socketpair()
+    reader, writer = await asyncio.open_connection(sock=client_sock)
+    seeder_reader, seeder_writer = await asyncio.open_connection(sock=seeder_sock)
+    seeder = asyncio.create_task(serve(seeder_reader, seeder_writer, data, piece_length, mode == "pooled"))
+    cpu = time.process_time()
+    start = time.perf_counter()
+    await (legacy if mode == "legacy" else pooled)(reader, writer, hashes, len(data), piece_length)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    writer.close()
+    await asyncio.gather(seeder, return_exceptions=True)
+    seeder_writer.close()
+    return dict(mode=mode, mib_per_s=round(len(data) / elapsed / 2 ** 20, 1),
+                cpu_s_per_gib=round(cpu / (len(data) / 2 ** 30), 2))
+
+
+def peak_allocated(mode: str, data: bytes, piece_length: int) -> int:
+    """Пік пам'яті, виділеної під час проходу понад уже виділену до нього"""
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        asyncio.run(run(mode, data, piece_length))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline
+
+
+def main():
+    args = get_args()
+    data = os.urandom(args.size * 2 ** 20)
+    for piece_length in map(int, args.piece_lengths.split(",")):
+        for mode in ("legacy", "pooled"):
+            result = asyncio.run(run(mode, data, piece_length * 1024))
+            peak = peak_allocated(mode, data, piece_length * 1024)
+            print(json.dumps(dict(piece_kib=piece_length, **result, peak_alloc_kib=peak // 1024)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
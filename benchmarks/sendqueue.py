@@ -0,0 +1,147 @@
+"""Надсилання повідомлень пірам через черги: N пар з'єднаних Peer на 127.0.0.1.
+
+Фаза have: завершується --pieces кусків, після кожного have надсилається всім пірам, як у LoadManager._send_haves.
+Кожен have надсилається двічі, щоб перевірити відкидання надлишкових.
+Вимірюється швидкість доставки (повідомлень/с), кількість записів у сокет,
+скільки задач було створено за фазу та пікова кількість задач event loop.
+Фаза upload: кожному піру надсилається --blocks блоків по 16 KiB, вимірюється швидкість
+та пікова кількість байтів у черзі надсилання (обмежена peer.SEND_QUEUE_LIMIT).
+
+    $ python3 -m benchmarks.sendqueue --peers 50 --pieces 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bittorrentclient import metrics
+from bittorrentclient.peer import Peer
+
+
+INFO_HASH = bytes(20)
+BLOCK = 2 ** 14
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peers", type=int, default=50, help="count of connected peers")
+    parser.add_argument("--pieces", type=int, default=2000, help="count of completed pieces (have messages per peer)")
+    parser.add_argument("--blocks", type=int, default=256, help="count of 16 KiB blocks uploaded to each peer")
+    return parser.parse_args()
+
+
+class TaskCounter:
+    """Підрахунок створених задач через task factory та пікової кількості задач"""
+    def __init__(self):
+        self.created = 0
+        self.peak = 0
+
+    def install(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        def factory(loop, coro, **kwargs):
+            self.created += 1
+            return asyncio.Task(coro, loop=loop, **kwargs)
+        loop.set_task_factory(factory)
+
+    def sample(self) -> None:
+        self.peak = max(self.peak, len(asyncio.all_tasks()))
+
+    def reset(self) -> None:
+        self.created = 0
+        self.peak = len(asyncio.all_tasks())
+
+
+async def connect_pairs(count: int, pieces: int) -> tuple[list[Peer], list[Peer], asyncio.Server]:
+    """Пари (наш пір, віддалений пір), обидва боки слухають з'єднання"""
+    remote = list()
+
+    async def handle(reader, writer):
+        await reader.readexactly(68)
+        peer = Peer(*writer.get_extra_info("peername")[:2])
+        if await peer.accept(reader, writer, INFO_HASH, pieces, os.urandom(20)):
+            remote.append(peer)
+            asyncio.create_task(peer.listen())
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    local = list()
+    for _ in range(count):
+        peer = Peer("127.0.0.1", port)
+        if await peer.connect(INFO_HASH, pieces, os.urandom(20)):
+            local.append(peer)
+            asyncio.create_task(peer.listen())
+    while len(remote) < len(local):
+        await asyncio.sleep(0.01)
+    return local, remote, server
+
+
+async def haves_phase(local: list[Peer], remote: list[Peer], pieces: int, tasks: TaskCounter) -> dict:
+    messages, batches = metrics.MESSAGES_SENT.samples(), metrics.SEND_BATCHES.samples()
+    messages, batches = sum(v for _, v in messages), sum(v for _, v in batches)
+    tasks.reset()
+    start = time.perf_counter()
+    for index in range(pieces):
+        for _ in range(2):
+            for peer in local:
+                peer.have(index)
+        tasks.sample()
+        if index % 16 == 0:
+            await asyncio.sleep(0)  # куски завершуються між іншою роботою event loop
+    while not all(peer.bitfield.has(pieces - 1) for peer in remote):  # have йдуть по порядку в одному з'єднанні
+        tasks.sample()
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    delivered = all(peer.bitfield.count_available_blocks() == pieces for peer in remote)
+    sent = sum(v for _, v in metrics.MESSAGES_SENT.samples()) - messages
+    writes = sum(v for _, v in metrics.SEND_BATCHES.samples()) - batches
+    return dict(have_messages=sent, have_delivered=delivered, have_seconds=round(elapsed, 3),
+                have_messages_per_s=round(sent / elapsed), have_socket_writes=writes,
+                have_messages_per_write=round(sent / writes, 1) if writes else None,
+                have_tasks_created=tasks.created, have_peak_tasks=tasks.peak)
+
+
+async def upload_phase(local: list[Peer], blocks: int, tasks: TaskCounter) -> dict:
+    data = os.urandom(BLOCK)
+    peak_queued = 0
+
+    async def upload(peer: Peer) -> None:
+        nonlocal peak_queued
+        for i in range(blocks):
+            await peer.send_piece(data, i, 0)
+            peak_queued = max(peak_queued, peer.send_queued_bytes)
+
+    tasks.reset()
+    start = time.perf_counter()
+    await asyncio.gather(*[upload(peer) for peer in local])
+    while any(peer.send_queued_bytes for peer in local):
+        tasks.sample()
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    size = BLOCK * blocks * len(local)
+    return dict(upload_mib_per_s=round(size / elapsed / 2 ** 20, 2), upload_seconds=round(elapsed, 3),
+                upload_peak_queued_kib=peak_queued // 1024, upload_peak_tasks=tasks.peak)
+
+
+async def run(peers: int, pieces: int, blocks: int) -> dict:
+    tasks = TaskCounter()
+    tasks.install()
+    local, remote, server = await connect_pairs(peers, pieces)
+    result = dict(peers=len(local), pieces=pieces)
+    result.update(await haves_phase(local, remote, pieces, tasks))
+    result.update(await upload_phase(local, blocks, tasks))
+    for peer in local + remote:
+        await peer.disconnect()
+    server.close()
+    await server.wait_closed()
+    return result
+
+
+def main():
+    args = get_args()
+    print(json.dumps(asyncio.run(run(args.peers, args.pieces, args.blocks))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Масштабування сумарної швидкості ShardedSession від 1 до N процесів на 127.0.0.1.
+
+    $ python3 -m benchmarks.sharding --max-workers 4 --torrents 8 --size 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from bittorrentclient.sharding import ShardedSession
+from .swarm import make_torrent, TrackerStandIn
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count(), help="max count of processes")
+    parser.add_argument("--torrents", type=int, default=8, help="count of torrents")
+    parser.add_argument("--size", type=int, default=32, help="size of every torrent, MiB")
+    parser.add_argument("--piece-length", type=int, default=256, help="piece length, KiB")
+    parser.add_argument("--timeout", type=int, default=300, help="max time of one run, s")
+    return parser.parse_args()
+
+
+async def run_once(workers: int, torrents: list[str], seed_dirs: list[str], work_dir: str, timeout: int,
+                   total_length: int) -> dict:
+    tracker = TrackerStandIn()
+    await tracker.start()
+    common = dict(port=0, host="127.0.0.1", max_connections=1000, report_period=0.2)
+    seeder = ShardedSession(workers, b"-PY0001-000000000001", to_download=False, **common)
+    leecher = ShardedSession(workers, b"-PY0001-000000000002", to_upload=False, **common)
+    await seeder.start()
+    await leecher.start()
+    for torrent, seed_dir in zip(torrents, seed_dirs):
+        seeder.add_torrent_file(torrent, seed_dir)
+    await asyncio.sleep(1)
+
+    start = time.perf_counter()
+    for i, torrent in enumerate(torrents):
+        destination = os.path.join(work_dir, f"leech{workers}", str(i))
+        os.makedirs(destination)
+        leecher.add_torrent_file(torrent, destination)
+    while time.perf_counter() - start < timeout:
+        await asyncio.sleep(0.1)
+        stat = leecher.get_stat()
+        if stat.length == total_length and stat.left == 0:
+            break
+    elapsed = time.perf_counter() - start
+    stat = leecher.get_stat()
+
+    await leecher.shutdown()
+    await seeder.shutdown()
+    await tracker.stop()
+    shutil.rmtree(os.path.join(work_dir, f"leech{workers}"), ignore_errors=True)
+    return {"workers": workers, "seconds": round(elapsed, 3), "bytes": stat.length - stat.left,
+            "mib_per_s": round((stat.length - stat.left) / elapsed / 2 ** 20, 2), "complete": stat.left == 0}
+
+
+async def main():
+    args = get_args()
+    work_dir = tempfile.mkdtemp(prefix="bt-sharding-")
+    try:
+        torrents, seed_dirs = list(), list()
+        for i in range(args.torrents):
+            seed_dir = os.path.join(work_dir, "seed", f"t{i}")
+            torrents.append(make_torrent(seed_dir, f"t{i}", args.size * 2 ** 20, args.piece_length * 1024))
+            seed_dirs.append(seed_dir)
+        results = list()
+        for workers in range(1, args.max_workers + 1):
+            result = await run_once(workers, torrents, seed_dirs, work_dir, args.timeout,
+                                    args.torrents * args.size * 2 ** 20)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+        base = results[0]["mib_per_s"] or 1
+        print(json.dumps({"scaling": [round(r["mib_per_s"] / base, 2) for r in results]}))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
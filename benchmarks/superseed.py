@@ -0,0 +1,106 @@
+"""Суперсідування на 127.0.0.1: один сід-джерело та N лічерів, з --super-seed та без нього.
+
+Для кожного режиму вимірюється:
+    - скільки байтів віддало джерело до появи в рої повної копії (кожен кусок є хоча б в одного лічера);
+    - скільки байтів віддало джерело, поки всі лічери не завершили завантаження, у розмірах торенту;
+    - час до повної копії в рої та до завершення всіх лічерів.
+Кожен режим виконується в окремому процесі. Результати друкуються як JSON рядки.
+
+    $ python3 -m benchmarks.superseed --size 16 --piece-length 64 --leechers 4
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from bittorrentclient.session import Session
+from bittorrentclient.torrentfile import TorrentFile
+from .swarm import make_torrent, TrackerStandIn
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=16, help="size of torrent, MiB")
+    parser.add_argument("--piece-length", type=int, default=64, help="piece length, KiB")
+    parser.add_argument("--leechers", type=int, default=4, help="count of leechers")
+    parser.add_argument("--upload-rate", type=int, default=0,
+                        help="upload limit of origin, KiB/s, to make it the bottleneck like a real uplink")
+    parser.add_argument("--timeout", type=int, default=300, help="max time of one mode, s")
+    return parser.parse_args()
+
+
+async def run_swarm(torrent_path: str, seed_dir: str, work_dir: str, leechers: int, super_seed: bool,
+                    upload_rate: int, timeout: int) -> dict:
+    torrent = TorrentFile.open(torrent_path)
+    tracker = TrackerStandIn()
+    await tracker.start()
+    origin = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", to_download=False, tracker_timeout=2,
+                     upload_rate=upload_rate, super_seed=super_seed)
+    await origin.start()
+    origin_manager = origin.add_torrent(torrent, seed_dir).loadmanager
+    await asyncio.sleep(0.5)
+
+    sessions = list()
+    managers = list()
+    start = time.perf_counter()
+    for i in range(leechers):
+        destination = os.path.join(work_dir, f"leech{i}")
+        os.makedirs(destination)
+        session = Session(b"-PY0001-%012d" % (i + 1), port=0, host="127.0.0.1", tracker_timeout=2)
+        await session.start()
+        managers.append(session.add_torrent(torrent, destination).loadmanager)
+        sessions.append(session)
+
+    full_copy: tuple[float, int] | None = None
+    while time.perf_counter() - start < timeout:
+        await asyncio.sleep(0.05)
+        bitfields = [m.filesmanager.bitfield for m in managers]
+        if full_copy is None and all(any(b.has(i) for b in bitfields) for i in range(torrent.pieces_count)):
+            full_copy = (time.perf_counter() - start, origin_manager.get_stat().uploaded)
+        if all(m.get_stat().left == 0 for m in managers):
+            break
+    elapsed = time.perf_counter() - start
+    uploaded = origin_manager.get_stat().uploaded
+    complete = all(m.get_stat().left == 0 for m in managers)
+
+    for session in sessions + [origin]:
+        await session.shutdown()
+    await tracker.stop()
+    return dict(full_copy_s=round(full_copy[0], 3) if full_copy else None,
+                origin_mib_to_full_copy=round(full_copy[1] / 2 ** 20, 2) if full_copy else None,
+                complete_s=round(elapsed, 3) if complete else None,
+                origin_mib=round(uploaded / 2 ** 20, 2),
+                origin_copies=round(uploaded / torrent.length, 2),
+                complete=complete)
+
+
+def run_mode(size: int, piece_length: int, leechers: int, super_seed: bool, upload_rate: int, timeout: int) -> dict:
+    """Запуск одного режиму в дочірньому процесі"""
+    work_dir = tempfile.mkdtemp(prefix="bt-superseed-")
+    try:
+        seed_dir = os.path.join(work_dir, "seed", "t")
+        torrent_path = make_torrent(seed_dir, "t", size, piece_length)
+        result = asyncio.run(run_swarm(torrent_path, seed_dir, work_dir, leechers, super_seed, upload_rate, timeout))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return dict(size_mib=size / 2 ** 20, piece_kib=piece_length // 1024, leechers=leechers,
+                super_seed=super_seed, **result)
+
+
+def main():
+    args = get_args()
+    context = multiprocessing.get_context("spawn")
+    for super_seed in (False, True):
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+            result = executor.submit(run_mode, args.size * 2 ** 20, args.piece_length * 1024, args.leechers,
+                                     super_seed, args.upload_rate * 1024, args.timeout).result()
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
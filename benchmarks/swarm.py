@@ -0,0 +1,87 @@
+"""Допоміжні засоби для бенчмарків на 127.0.0.1: синтетичні торенти та заміна HTTP-трекера"""
+import hashlib
+import os
+import struct
+import typing
+import urllib.parse
+
+from aiohttp import web
+
+from bittorrentclient.bencoder import BenCoder
+
+
+def make_torrent(directory: str, name: str, size: int, piece_length: int,
+                 file_sizes: typing.Sequence[int] | None = None,
+                 announce: str = "http://127.0.0.1:8999/announce") -> str:
+    """Створення випадкових даних у directory та .torrent файлу для них поруч з directory.
+    Якщо задано file_sizes, створюється багатофайловий торент (сума розмірів має дорівнювати size)."""
+    os.makedirs(directory, exist_ok=True)
+    data = os.urandom(size)
+    pieces = b"".join(hashlib.sha1(data[i:i + piece_length]).digest() for i in range(0, size, piece_length))
+    if file_sizes:
+        info = {"files": list(), "name": name, "piece length": piece_length, "pieces": pieces}
+        offset = 0
+        for i, file_size in enumerate(file_sizes):
+            path = [f"dir{i % 3}", f"file{i}.bin"]
+            info["files"].append({"length": file_size, "path": path})
+            os.makedirs(os.path.join(directory, path[0]), exist_ok=True)
+            with open(os.path.join(directory, *path), "wb") as f:
+                f.write(data[offset:offset + file_size])
+            offset += file_size
+    else:
+        info = {"length": size, "name": name, "piece length": piece_length, "pieces": pieces}
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+    torrent_path = directory.rstrip(os.path.sep) + ".torrent"
+    with open(torrent_path, "wb") as f:
+        f.write(BenCoder.encode({"announce": announce, "info": info}))
+    return torrent_path
+
+
+class TrackerStandIn:
+    """Мінімальний HTTP-трекер: повертає всіх пірів торенту, які оголошувались, у compact форматі"""
+    def __init__(self, host: str = "127.0.0.1", port: int = 8999, interval: int = 1):
+        self._host = host
+        self._port = port
+        self._interval = interval
+        self._swarms: dict[bytes, set[tuple[str, int]]] = dict()
+        self._runner: web.AppRunner | None = None
+        self.announces = 0
+
+    @property
+    def announce_url(self) -> str:
+        return f"http://{self._host}:{self._port}/announce"
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    async def start(self) -> None:
+        """Якщо port дорівнює 0, після запуску в port записується вибраний системою"""
+        app = web.Application()
+        app.router.add_get("/announce", self._announce)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        if not self._port:
+            self._port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _announce(self, request: web.Request) -> web.Response:
+        self.announces += 1
+        query = urllib.parse.parse_qs(request.rel_url.raw_query_string, keep_blank_values=True, encoding="latin-1")
+        info_hash = query["info_hash"][0].encode("latin-1")
+        address = (request.remote, int(query["port"][0]))
+        swarm = self._swarms.setdefault(info_hash, set())
+        if query.get("event", [""])[0] == "stopped":
+            swarm.discard(address)
+            return web.Response(body=BenCoder.encode({"interval": self._interval, "peers": b""}))
+        peers = b"".join(bytes(map(int, ip.split("."))) + struct.pack("!H", port)
+                         for ip, port in swarm if (ip, port) != address)
+        swarm.add(address)
+        return web.Response(body=BenCoder.encode({"interval": self._interval, "peers": peers}))
@@ -0,0 +1,183 @@
+"""Порівняння TCP та uTP на 127.0.0.1 з доданою затримкою в обидва боки.
+
+Для кожного транспорту вимірюється:
+    - затримка: медіанний час обміну повідомленнями по 68 байт (як handshake);
+    - швидкість: завантаження блоків по 16 KiB з чергою запитів --queue, як у протоколі BitTorrent;
+    - швидкість одного суцільного потоку даних.
+
+    $ python3 -m benchmarks.utp --delay 20 --size 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import struct
+import time
+
+from bittorrentclient.utp import UTPSocket, SOCKET_BUFFER
+
+
+BLOCK = 16384
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=20, help="added delay in each direction, ms")
+    parser.add_argument("--size", type=int, default=32, help="size of transferred data, MiB")
+    parser.add_argument("--queue", type=int, default=16, help="count of outstanding block requests")
+    parser.add_argument("--pings", type=int, default=100, help="count of ping-pong exchanges")
+    parser.add_argument("--loss", type=float, default=0, help="share of dropped datagrams, only for uTP")
+    return parser.parse_args()
+
+
+class UDPRelay(asyncio.DatagramProtocol):
+    """Пересилання датаграм між одним клієнтом та target із затримкою та втратами"""
+    def __init__(self, target: tuple[str, int], delay: float, loss: float = 0):
+        self._target = target
+        self._delay = delay
+        self._loss = loss
+        self._client: tuple[str, int] | None = None
+        self._transport: asyncio.DatagramTransport | None = None
+        self.port = 0
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=("127.0.0.1", 0))
+        self.port = self._transport.get_extra_info("sockname")[1]
+        self._transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+
+    def stop(self) -> None:
+        self._transport.close()
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        if self._loss and int.from_bytes(os.urandom(2), "big") < self._loss * 0x10000:
+            return
+        if addr != self._target:
+            self._client = addr
+        destination = self._client if addr == self._target else self._target
+        if destination:
+            asyncio.get_running_loop().call_later(self._delay, self._transport.sendto, data, destination)
+
+
+class TCPRelay:
+    """Пересилання TCP потоку до target із затримкою в обидва боки"""
+    def __init__(self, target: tuple[str, int], delay: float):
+        self._target = target
+        self._delay = delay
+        self._server: asyncio.AbstractServer | None = None
+        self.port = 0
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        self._server.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        target_reader, target_writer = await asyncio.open_connection(*self._target)
+        await asyncio.gather(self._pump(reader, target_writer), self._pump(target_reader, writer))
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        while data := await reader.read(65536):
+            loop.call_later(self._delay, writer.write, data)
+        loop.call_later(self._delay, writer.close)
+
+
+async def serve(reader: asyncio.StreamReader, writer) -> None:
+    """Сервер: 'p' - відповісти тим самим, 'r' - надіслати блок, 's' - прийняти потік вказаної довжини"""
+    block = os.urandom(BLOCK)
+    try:
+        while command := await reader.read(1):
+            if command == b"p":
+                writer.write(b"p" + await reader.readexactly(67))
+            elif command == b"r":
+                await reader.readexactly(12)
+                writer.write(block)
+            elif command == b"s":
+                length = struct.unpack("!Q", await reader.readexactly(8))[0]
+                while length:
+                    length -= len(await reader.read(min(length, 1 << 16)))
+                writer.write(b"s")
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    writer.close()
+
+
+async def measure(reader: asyncio.StreamReader, writer, args) -> dict:
+    pings = list()
+    for _ in range(args.pings):
+        start = time.perf_counter()
+        writer.write(b"p" + bytes(67))
+        await writer.drain()
+        await reader.readexactly(68)
+        pings.append(time.perf_counter() - start)
+
+    blocks = args.size * 2 ** 20 // BLOCK
+    start = time.perf_counter()
+    sent = 0
+    for _ in range(min(args.queue, blocks)):
+        writer.write(b"r" + bytes(12))
+        sent += 1
+    await writer.drain()
+    for _ in range(blocks):
+        await reader.readexactly(BLOCK)
+        if sent < blocks:
+            writer.write(b"r" + bytes(12))
+            sent += 1
+    requests_time = time.perf_counter() - start
+
+    data = os.urandom(1 << 20)
+    start = time.perf_counter()
+    writer.write(b"s" + struct.pack("!Q", args.size * 2 ** 20))
+    for _ in range(args.size):
+        writer.write(data)
+        await writer.drain()
+    await reader.readexactly(1)
+    stream_time = time.perf_counter() - start
+
+    writer.close()
+    return {"ping_ms": round(statistics.median(pings) * 1000, 2),
+            "requests_mib_per_s": round(args.size / requests_time, 2),
+            "stream_mib_per_s": round(args.size / stream_time, 2)}
+
+
+async def run_tcp(args) -> dict:
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    relay = TCPRelay(("127.0.0.1", server.sockets[0].getsockname()[1]), args.delay / 1000)
+    await relay.start()
+    reader, writer = await asyncio.open_connection("127.0.0.1", relay.port)
+    result = await measure(reader, writer, args)
+    relay.stop()
+    server.close()
+    return dict(transport="tcp", **result)
+
+
+async def run_utp(args) -> dict:
+    server = UTPSocket(0, "127.0.0.1", serve)
+    client = UTPSocket(0, "127.0.0.1")
+    await server.start()
+    await client.start()
+    relay = UDPRelay(("127.0.0.1", server.port), args.delay / 1000, args.loss)
+    await relay.start()
+    reader, writer = await client.open_connection("127.0.0.1", relay.port)
+    result = await measure(reader, writer, args)
+    await client.stop()
+    await server.stop()
+    relay.stop()
+    return dict(transport="utp", window=writer.transport.window, **result)
+
+
+async def main():
+    args = get_args()
+    for runner in (run_tcp, run_utp):
+        result = await runner(args)
+        print(json.dumps(dict(delay_ms=args.delay, **result)), flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,30 +3,73 @@ import asyncio
 import os.path
 import random
 import signal
+import sys
 
-from .torrentfile import TorrentFile
+from .torrentfile import TorrentFile, BadTorrentFile
 from .bencoder import BenCoderEncodeError
-from .loadmanager import LoadManager
-from .tracker import TrackerManager
-from .ui import UI
+from .peercache import PeerCache, DEFAULT_CACHE_PATH
+from .banlist import BanList, DEFAULT_BANS_PATH
+from .dht import DHTNode, DEFAULT_STATE_PATH
+from .lsd import LocalDiscovery, LSD_GROUP, LSD_PORT
+from .session import Session
+from .sharding import ShardedSession
+from .magnet import Magnet, BadMagnetLink
+from .filesmanager import PRIORITIES
+from .headless import HeadlessUI
+from . import creator, checker
 
 
 def get_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("torrent", help="the torrent file")
+    parser.add_argument("torrent", help="the torrent file, magnet link or folder with torrent files")
     parser.add_argument("destination", help="folder, where torrent files will be downloaded")
     parser.add_argument("--no-upload", action="store_true", default=False, help="don't upload")
     parser.add_argument("--no-download", action="store_true", default=False, help="don't download")
-    parser.add_argument("-m", "--max-connections", type=int, default=10, help="max count of peers")
+    parser.add_argument("-m", "--max-connections", type=int, default=10, help="max count of peers per torrent")
+    parser.add_argument("--max-session-connections", type=int, default=200, help="max count of peers for all torrents")
+    parser.add_argument("--upload-rate", type=int, default=0, help="upload limit for all torrents, KiB/s")
+    parser.add_argument("--download-rate", type=int, default=0, help="download limit for all torrents, KiB/s")
+    parser.add_argument("--disk-threads", type=int, default=4, help="count of threads for disk operations")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="count of processes, torrents are shared between them")
+    parser.add_argument("-p", "--port", type=int, default=10101, help="port for incoming connections")
     parser.add_argument("--peer-connection-timeout", type=int, default=10, help="peer connect timeout")
-    parser.add_argument("--piece-receive-timeout", type=int, default=5, help="receive piece timeout")
+    parser.add_argument("--piece-receive-timeout", type=int, default=5, help="max timeout of one block request, s (the actual timeout follows peer RTT)")
     parser.add_argument("--tracker-connection-timeout", type=int, default=5, help="tracker connect timeout")
+    parser.add_argument("--peer-cache", default=DEFAULT_CACHE_PATH, help="file with known peers for fast start")
+    parser.add_argument("--no-peer-cache", action="store_true", default=False, help="don't use peer cache")
+    parser.add_argument("--ban-list", default=DEFAULT_BANS_PATH, help="file with peers banned for corrupted data")
+    parser.add_argument("--no-ban-list", action="store_true", default=False, help="don't remember banned peers")
+    parser.add_argument("--ban-threshold", type=int, default=3, help="failed pieces with peer's data before ban")
+    parser.add_argument("--dht", action="store_true", default=False, help="find peers through DHT too")
+    parser.add_argument("--dht-port", type=int, default=6881, help="UDP port of DHT node")
+    parser.add_argument("--utp", action="store_true", default=False, help="use uTP for peer connections too")
+    parser.add_argument("--lsd", action="store_true", default=False, help="find peers in local network (BEP 14)")
+    parser.add_argument("--lsd-interface", default="0.0.0.0", help="address of interface for LSD multicast")
+    parser.add_argument("--lsd-group", default=f"{LSD_GROUP}:{LSD_PORT}", help="multicast group of LSD, HOST:PORT")
+    parser.add_argument("--super-seed", action="store_true", default=False,
+                        help="announce pieces one by one until the swarm has a full copy (BEP 16)")
+    parser.add_argument("--web-seed-connections", type=int, default=4, help="parallel HTTP requests to one web seed")
+    parser.add_argument("--dht-state", default=DEFAULT_STATE_PATH, help="file with DHT node id and routing table")
+    parser.add_argument("--metrics-port", type=int, default=None, help="port of Prometheus metrics endpoint on 127.0.0.1")
+    parser.add_argument("--metrics-log", default=None, help="file to append metrics as JSON lines")
+    parser.add_argument("--diagnostics", default=None, help="file to append loop lag, slow callbacks and hot sections")
+    parser.add_argument("--diagnostics-profile", action="store_true", default=False,
+                        help="save cProfile profile next to diagnostics file")
+    parser.add_argument("--headless", action="store_true", default=False,
+                        help="no pseudo graphical interface, progress is logged as JSON lines")
+    parser.add_argument("--progress-log", default=None, help="file for JSON lines in headless mode, stdout by default")
+    parser.add_argument("--progress-period", type=float, default=10, help="period of progress lines, s")
+    parser.add_argument("-f", "--file-priority", action="append", default=list(), metavar="INDEX=PRIORITY",
+                        help=f"priority of a file in multi-file torrent: {', '.join(PRIORITIES)}")
+    parser.add_argument("--check-only", action="store_true", default=False,
+                        help="only check data in destination against the torrent and exit (status 2 if it does not match)")
+    parser.add_argument("--hash-workers", type=int, default=None, help="count of hashing processes for --check-only")
 
     return parser.parse_args()
 
 
 async def run():
-    global loadmanager, track_manager, ui, tasks
+    global session, ui, tasks
     args = get_args()
 
     torrent_path = args.torrent
@@ -37,39 +80,96 @@ async def run():
     peer_con_timeout = args.peer_connection_timeout
     piece_receive_timeout = args.piece_receive_timeout
     track_con_timeout = args.tracker_connection_timeout
-
-    try:
-        torrent = TorrentFile.open(torrent_path)
-    except FileNotFoundError:
-        print("Torrent file not found")
-        exit(1)
-    except BenCoderEncodeError:
-        print("Torrent file are spoiled")
-        exit(1)
+    peer_cache = PeerCache(args.peer_cache) if not args.no_peer_cache else None
+    ban_list_path = args.ban_list if not args.no_ban_list else None
+
+    file_priorities = dict()
+    for item in args.file_priority:
+        index, _, priority = item.partition("=")
+        if not index.isdigit() or priority not in PRIORITIES:
+            print(f"Wrong file priority: {item}")
+            exit(1)
+        file_priorities[int(index)] = PRIORITIES[priority]
+
+    torrent = None
+    magnet = torrent_path.startswith("magnet:")
+    if magnet:
+        try:
+            Magnet.parse(torrent_path)
+        except BadMagnetLink:
+            print("Magnet link is spoiled")
+            exit(1)
+    elif not os.path.isdir(torrent_path):
+        try:
+            torrent = TorrentFile.open(torrent_path)
+        except FileNotFoundError:
+            print("Torrent file not found")
+            exit(1)
+        except (BenCoderEncodeError, BadTorrentFile):
+            print("Torrent file are spoiled")
+            exit(1)
+        if any(index >= torrent.countFiles for index in file_priorities):
+            print("Torrent has no file with such index")
+            exit(1)
 
     if not os.path.exists(destination_path):
         print("Desination folder not exist")
         exit(1)
 
-    ui = UI()
+    if args.check_only:
+        if torrent is None:
+            print("Only a torrent file can be checked")
+            exit(1)
+        exit(checker.main(torrent, destination_path, args.hash_workers))
+
+    if args.headless:
+        ui = HeadlessUI(args.progress_log, args.progress_period)
+    else:
+        from .ui import UI  # curses потрібен лише для псевдографічного інтерфейсу
+        ui = UI()
     ui.set_static_info(torrent_path, destination_path, max_count_peers)
     ui.set_speed_ava(to_download, to_upload)
 
     peer_id = b"-PY0001-" + bytes([random.randint(48, 57) for _ in range(12)])
-    loadmanager = LoadManager(torrent, destination_path, peer_id, log_func=ui.print, max_connections=max_count_peers,
-                              peer_connect_timeout= peer_con_timeout, piece_receive_timeout=piece_receive_timeout)
-    track_manager = TrackerManager(torrent, peer_id, timeout=track_con_timeout, log_func=ui.print)
-    track_manager.reg_clb_peers(loadmanager.update_peers)
-    track_manager.reg_clb_info(loadmanager.get_stat)
+    lsd_group, _, lsd_port = args.lsd_group.rpartition(":")
+    lsd = (args.lsd_interface, lsd_group, int(lsd_port)) if args.lsd else None
+    session_kwargs = dict(port=args.port, max_connections=args.max_session_connections,
+                          max_connections_per_torrent=max_count_peers, upload_rate=args.upload_rate * 1024,
+                          download_rate=args.download_rate * 1024, disk_threads=args.disk_threads,
+                          to_upload=to_upload, to_download=to_download, peer_connect_timeout=peer_con_timeout,
+                          piece_receive_timeout=piece_receive_timeout, tracker_timeout=track_con_timeout,
+                          utp=args.utp, web_seed_connections=args.web_seed_connections,
+                          super_seed=args.super_seed,
+                          metrics_port=args.metrics_port, metrics_path=args.metrics_log,
+                          diagnostics_path=args.diagnostics, diagnostics_profile=args.diagnostics_profile,
+                          log_func=ui.print)
+    if args.workers > 1:
+        session = ShardedSession(args.workers, peer_id, peer_cache_path=None if args.no_peer_cache else args.peer_cache,
+                                 ban_list_path=ban_list_path, ban_threshold=args.ban_threshold,
+                                 dht_port=args.dht_port if args.dht else None, dht_state_path=args.dht_state,
+                                 lsd=lsd, **session_kwargs)
+    else:
+        dht = DHTNode(args.dht_port, state_path=args.dht_state, log_func=ui.print) if args.dht else None
+        lsd_node = LocalDiscovery(*lsd, log_func=ui.print) if lsd else None
+        ban_list = BanList(ban_list_path, threshold=args.ban_threshold)
+        session = Session(peer_id, peer_cache=peer_cache, ban_list=ban_list, dht=dht, lsd=lsd_node,
+                          **session_kwargs)
+    await session.start()
 
     tasks = list()
 
-    asyncio.Task(ui.render(loadmanager.get_stat))
-    tasks.append(asyncio.Task(track_manager.run()))
-    if to_download:
-        tasks.append(asyncio.Task(loadmanager.start_download()))
-    if to_upload:
-        tasks.append(asyncio.Task(loadmanager.start_upload()))
+    asyncio.Task(ui.render(session.get_stat))
+    if magnet and args.workers > 1:
+        session.add_magnet(torrent_path, destination_path, file_priorities)
+    elif magnet:
+        tasks.append(asyncio.Task(session.add_magnet(torrent_path, destination_path, file_priorities)))
+    elif torrent and args.workers > 1:
+        session.add_torrent_file(torrent_path, destination_path, file_priorities)
+    elif torrent:
+        session.add_torrent(torrent, destination_path, torrent_path, file_priorities)
+    else:
+        tasks.append(asyncio.Task(session.watch_directory(torrent_path, destination_path)))
+
 
 class ShutdownException(SystemExit):
     pass
@@ -80,13 +180,18 @@ def sigint_clb():
 
 
 def main():
+    if sys.argv[1:2] == ["create"]:
+        creator.main(sys.argv[2:])
+        return
     loop = asyncio.get_event_loop()
     loop.add_signal_handler(signal.SIGINT, sigint_clb)
+    loop.add_signal_handler(signal.SIGTERM, sigint_clb)
 
     async def shutdown():
-        await loadmanager.shutdown()
-        await track_manager.stop()
-        await asyncio.gather(*tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await session.shutdown()
         ui.shutdown()
 
     try:
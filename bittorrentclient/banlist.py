@@ -0,0 +1,72 @@
+import json
+import os
+import time
+
+
+DEFAULT_BANS_PATH = os.path.join(os.path.expanduser("~"), ".bittorrentclient", "bans.json")
+
+
+class BanList:
+    """Піри, що надсилали зіпсовані дані. Для кожного ip рахуються куски, які не пройшли перевірку хешу
+    через його блоки, після threshold таких кусків ip блокується для всіх торентів сесії.
+    Заблоковані ip зберігаються у файлі між запусками (якщо задано path) та забуваються через max_age"""
+    def __init__(self, path: str | None = DEFAULT_BANS_PATH, threshold: int = 3, max_age: int = 30 * 24 * 3600):
+        self._path = path
+        self._threshold = threshold
+        self._max_age = max_age
+        self._failures: dict[str, int] = dict()
+        self._banned: dict[str, float] = dict()  # ip -> час блокування
+
+    def __contains__(self, ip: str) -> bool:
+        return ip in self._banned
+
+    @property
+    def threshold(self) -> int:
+        return self._threshold
+
+    @property
+    def banned_count(self) -> int:
+        return len(self._banned)
+
+    def failures(self, ip: str) -> int:
+        return self._failures.get(ip, 0)
+
+    def hash_failed(self, ip: str) -> bool:
+        """Кусок з блоками від ip не пройшов перевірку. Повертає True, якщо ip щойно заблоковано"""
+        if ip in self._banned:
+            return False
+        self._failures[ip] = self._failures.get(ip, 0) + 1
+        if self._failures[ip] < self._threshold:
+            return False
+        self.ban(ip)
+        return True
+
+    def ban(self, ip: str) -> None:
+        self._banned[ip] = time.time()
+        self._failures.pop(ip, None)
+        if self._path: self.save()
+
+    def load(self) -> None:
+        if not self._path:
+            return
+        try:
+            with open(self._path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if isinstance(data, dict):
+            self._banned.update({ip: t for ip, t in data.items() if isinstance(t, (int, float))})
+        self._expire()
+
+    def save(self) -> None:
+        self._expire()
+        directory = os.path.dirname(self._path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._banned, f)
+        os.replace(tmp_path, self._path)
+
+    def _expire(self) -> None:
+        border = time.time() - self._max_age
+        self._banned = {ip: t for ip, t in self._banned.items() if t >= border}
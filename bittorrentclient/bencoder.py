@@ -5,6 +5,20 @@ class BenCoder:
     @classmethod
     def decode(cls, data: bytes, info_loc=False):
         """Decodint torrent files. info_loc parameter is using to get location info part for cumputing hash"""
+        location, result, _ = cls.__decode(data)
+        if info_loc:
+            return location, result
+        return result
+
+    @classmethod
+    def decode_prefix(cls, data: bytes) -> tuple[object, int]:
+        """Декодування першого об'єкта, за яким йдуть сирі дані (повідомлення ut_metadata).
+        Повертає об'єкт та його довжину в байтах"""
+        _, result, end = cls.__decode(data)
+        return result, end
+
+    @classmethod
+    def __decode(cls, data: bytes):
 
         result = None
         stack = list()
@@ -49,7 +63,7 @@ class BenCoder:
                 o = word
                 current_index = index_end + length_word + 1
 
-            if o and len(stack):
+            if o is not None and len(stack):
                 if isinstance(stack[-1], dict):
                     if isinstance(o, dict) or isinstance(o, list):
                         key = cls.__encode_ascii(key)
@@ -66,18 +80,19 @@ class BenCoder:
                 elif isinstance(stack[-1], list):
                     stack[-1].append(cls.__encode_ascii(o))
 
-            if result is None:
+            if result is None and stack:
                 result = stack[0]
+            if not stack:  # перший об'єкт закінчився
+                break
 
-        if info_loc:
-            return (info_start, info_end,), result
-        return result
+        return (info_start, info_end,), result, current_index
 
     @classmethod
     def encode(cls, data):
         '''Кодування обєктів пітону в бенкод формат'''
         if isinstance(data, dict):
-            encoded_part = [cls.encode(key) + cls.encode(data[key]) for key in data]
+            keys = sorted(data, key=lambda k: k.encode() if isinstance(k, str) else bytes(k))  # ключі мають бути впорядковані
+            encoded_part = [cls.encode(key) + cls.encode(data[key]) for key in keys]
             encoded_part = b''.join(encoded_part)
             return b'd' + encoded_part + b'e'
         elif isinstance(data, str) or isinstance(data, bytes) or isinstance(data, bytearray):
@@ -54,6 +54,12 @@ class BitField:
         offset = index % 8
         self._bits[i] |= (1 << (7-offset))
 
+    def fill(self) -> None:
+        """Встановлення всіх бітів, використовується для have_all"""
+        self._bits = bytearray(b"\xff" * (len(self._bits) - 1))
+        if self._bits_count:
+            self._bits.append(255 & (0xff00 >> (self._bits_count % 8)) or 255)
+
     def copy(self, other: typing.Self):
         if not len(other) == ceil(len(self)/8):
             raise Exception("Other bitfield is not same size")
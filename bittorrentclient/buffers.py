@@ -0,0 +1,38 @@
+from . import metrics
+
+
+class BufferPool:
+    """Пул bytearray буферів для збирання кусків. Блоки записуються в буфер на свій зсув через memoryview,
+    перевірка хешу та запис на диск працюють з тим самим буфером без копіювання.
+    Звільнені буфери повторно використовуються для кусків того ж розміру, зберігається не більше max_idle"""
+    def __init__(self, max_idle: int = 16):
+        self._max_idle = max_idle
+        self._idle: dict[int, list[bytearray]] = dict()
+        self._idle_count = 0
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, size: int) -> bytearray:
+        idle = self._idle.get(size)
+        if idle:
+            self._idle_count -= 1
+            self.reused += 1
+            metrics.PIECE_BUFFERS.inc(labels=("reused",))
+            return idle.pop()
+        self.allocated += 1
+        metrics.PIECE_BUFFERS.inc(labels=("allocated",))
+        return bytearray(size)
+
+    def release(self, buffer: bytearray) -> None:
+        if self._idle_count >= self._max_idle:
+            return
+        self._idle.setdefault(len(buffer), list()).append(buffer)
+        self._idle_count += 1
+
+    @property
+    def idle(self) -> int:
+        return self._idle_count
+
+    def clear(self) -> None:
+        self._idle = dict()
+        self._idle_count = 0
@@ -0,0 +1,157 @@
+import dataclasses
+import hashlib
+import os
+import time
+import typing
+from math import ceil
+
+from . import merkle
+from .bitfield import BitField
+from .creator import READ_SIZE, split_pieces, run_tasks
+from .filesmanager import FilesManager
+from .torrentfile import TorrentFile
+
+# частина куска: (шлях на диску або None для доповнення, зсув у файлі, довжина)
+Segment = tuple[str | None, int, int]
+
+
+@dataclasses.dataclass()
+class FileCheck:
+    path: str
+    length: int
+    valid_bytes: int = 0  # байтів файлу в кусках, що пройшли перевірку
+    missing: bool = False
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing and self.valid_bytes == self.length
+
+
+@dataclasses.dataclass()
+class CheckResult:
+    pieces_count: int
+    valid_pieces: int
+    length: int
+    seconds: float
+    files: list[FileCheck]
+
+    @property
+    def complete(self) -> bool:
+        """Всі куски вірні і всі файли на місці, зокрема порожні"""
+        return self.valid_pieces == self.pieces_count and all(f.complete for f in self.files)
+
+    @property
+    def gib_per_s(self) -> float:
+        return self.length / max(self.seconds, 1e-9) / 2 ** 30
+
+
+def check_range(pieces: typing.Sequence[list[Segment]], hashes: typing.Sequence[bytes],
+                sizes: typing.Sequence[tuple[int, int]] | None) -> list[bool]:
+    """Перевірка послідовних кусків. Файли читаються по черзі з великим буфером, тож для сусідніх кусків
+    читання послідовне. sizes - для v2: (байтів файлу в куску, листків у куску), тоді hashes - SHA-256 кусків"""
+    result = list()
+    opened: tuple[str, typing.BinaryIO] | None = None
+    broken: set[str] = set()  # відсутні файли
+    buffer = bytearray(max((sum(length for *_, length in segments) for segments in pieces), default=0))
+    view = memoryview(buffer)
+    try:
+        for n, segments in enumerate(pieces):
+            filled = 0
+            valid = True
+            for path, offset, length in segments:
+                if path is None:
+                    view[filled:filled + length] = bytes(length)
+                    filled += length
+                    continue
+                if path in broken:
+                    valid = False
+                    break
+                if opened is None or opened[0] != path:
+                    if opened: opened[1].close()
+                    opened = None
+                    try:
+                        opened = path, open(path, "rb", buffering=READ_SIZE)
+                    except OSError:
+                        broken.add(path)
+                        valid = False
+                        break
+                f = opened[1]
+                if f.tell() != offset: f.seek(offset)
+                count = f.readinto(view[filled:filled + length])
+                filled += count
+                if count != length:  # файл коротший
+                    valid = False
+                    break
+            if valid and sizes is None:
+                valid = hashlib.sha1(view[:filled]).digest() == hashes[n]
+            elif valid:
+                size, piece_leaves = sizes[n]
+                leaves = merkle.block_hashes(view[:size])
+                valid = merkle.root(leaves + [merkle.ZERO] * (piece_leaves - len(leaves)), piece_leaves) == hashes[n]
+            result.append(valid)
+    finally:
+        if opened: opened[1].close()
+    return result
+
+
+def check(torrent: TorrentFile, destination: str, workers: int | None = None,
+          progress: typing.Callable[[int], None] | None = None) -> CheckResult:
+    """Перевірка даних торенту в destination без з'єднань з мережею. Розкладка кусків по файлах - з FilesManager,
+    діапазони кусків перевіряються паралельно, як при створенні торенту (creator.split_pieces).
+    progress викликається з кількістю перевірених байтів"""
+    files = torrent.files
+    padding = torrent.padding_files
+    piece_length = torrent.piece_length
+    length = sum(size for size, _ in files)
+    manager = FilesManager(length, BitField(ceil(length / piece_length)), piece_length, destination, files,
+                           padding=padding)
+    tree = torrent.merkle if not torrent.pieces else None  # для гібридів достатньо SHA-1, він покриває і доповнення
+    ranges, workers = split_pieces(length, piece_length, workers)
+    file_segments: list[list[tuple[int, int]]] = list()  # для кожного куска: (номер файлу, довжина частини)
+    tasks = list()
+    for first, last in ranges:
+        pieces, hashes, sizes = list(), list(), list()
+        for index in range(first, last):
+            segments = manager.segments(index)
+            file_segments.append([(n, size) for n, _, _, size in segments])
+            pieces.append([(None if n in padding else os.path.join(destination, files[n][1]), offset, size)
+                           for n, offset, _, size in segments])
+            if tree is None:
+                hashes.append(torrent.pieces[index * 20:index * 20 + 20])
+            else:
+                file_tree, piece = tree.piece(index)
+                hashes.append(file_tree.piece_hash(piece))
+                sizes.append((file_tree.piece_size(piece), file_tree.piece_leaves))
+        tasks.append((pieces, hashes, sizes if tree else None))
+
+    start = time.perf_counter()
+    results: list[bool] = list()
+    for (_, last), valid in zip(ranges, run_tasks(check_range, tasks, workers)):
+        results.extend(valid)
+        if progress: progress(min(last * piece_length, length))
+    seconds = time.perf_counter() - start
+
+    report = [FileCheck(path, size, missing=not os.path.isfile(os.path.join(destination, path)))
+              for n, (size, path) in enumerate(files) if n not in padding]
+    checks = dict(zip((n for n in range(len(files)) if n not in padding), report))
+    for index, valid in enumerate(results):
+        if not valid: continue
+        for n, size in file_segments[index]:
+            if n in checks: checks[n].valid_bytes += size
+    return CheckResult(len(results), sum(results), length, seconds, report)
+
+
+def main(torrent: TorrentFile, destination: str, workers: int | None = None) -> int:
+    """Режим --check-only: звіт по файлах та швидкість. Повертає код виходу: 0 - всі дані вірні, 2 - ні"""
+    def progress(done: int) -> None:
+        print(f"\rChecked {done / 2 ** 20:.0f} MiB", end="", flush=True)
+
+    result = check(torrent, destination, workers, progress)
+    print()
+    for f in result.files:
+        state = "missing" if f.missing else f"{f.valid_bytes / f.length * 100 if f.length else 100:.1f}%"
+        print(f"{state:>8}  {f.path}")
+    print(f"{result.valid_pieces}/{result.pieces_count} pieces valid, "
+          f"{sum(f.complete for f in result.files)}/{len(result.files)} files complete")
+    print(f"Checked {result.length / 2 ** 30:.2f} GiB in {result.seconds:.2f} s, {result.gib_per_s:.2f} GiB/s")
+    return 0 if result.complete else 2
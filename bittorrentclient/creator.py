@@ -0,0 +1,223 @@
+import argparse
+import concurrent.futures
+import dataclasses
+import hashlib
+import multiprocessing
+import os
+import time
+import typing
+
+from .bencoder import BenCoder
+
+
+MIN_PIECE_LENGTH = 1 << 14
+MAX_PIECE_LENGTH = 1 << 24
+TARGET_PIECES = 1500  # бажана кількість кусків: торент-файл невеликий, а куски не надто великі
+READ_SIZE = 1 << 23  # послідовне читання великими блоками
+TASK_SIZE = 1 << 26  # байтів даних в одному завданні процесу
+PARALLEL_SIZE = 1 << 30  # менші дані швидше хешувати в одному процесі, ніж запускати інші
+CREATED_BY = "BitTorrent1.0-client"
+
+
+class CreateError(Exception):
+    pass
+
+
+@dataclasses.dataclass()
+class SourceFile:
+    path: str  # шлях на диску
+    parts: list[str]  # шлях у торенті відносно кореневої папки
+    length: int
+
+
+def collect_files(path: str) -> list[SourceFile]:
+    """Файли для торенту: сам файл або всі файли папки в сталому (відсортованому) порядку.
+    Символьні посилання пропускаються"""
+    if os.path.isfile(path):
+        return [SourceFile(path, [os.path.basename(path)], os.path.getsize(path))]
+    if not os.path.isdir(path):
+        raise CreateError(f"{path} not found")
+    files = list()
+    for directory, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in sorted(names):
+            file_path = os.path.join(directory, name)
+            if os.path.islink(file_path) or not os.path.isfile(file_path):
+                continue
+            parts = os.path.relpath(file_path, path).split(os.sep)
+            files.append(SourceFile(file_path, parts, os.path.getsize(file_path)))
+    if not files:
+        raise CreateError(f"{path} has no files")
+    return files
+
+
+def piece_length_for(total_length: int) -> int:
+    """Степінь двійки, з якою кусків виходить близько TARGET_PIECES, в межах 16 KiB - 16 MiB"""
+    piece_length = MIN_PIECE_LENGTH
+    while piece_length < MAX_PIECE_LENGTH and total_length / piece_length > TARGET_PIECES:
+        piece_length <<= 1
+    return piece_length
+
+
+def hash_range(files: typing.Sequence[tuple[str, int]], piece_length: int, first: int, last: int) -> bytes:
+    """SHA-1 кусків з first по last (не включно). Дані всіх файлів розглядаються як один потік,
+    тож кусок на межі файлів хешується з кінця одного та початку наступного"""
+    start = first * piece_length
+    end = min(last * piece_length, sum(length for _, length in files))
+    digests = list()
+    current = hashlib.sha1()
+    filled = 0  # байтів поточного куска
+    offset = 0  # початок файлу в потоці
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    for path, length in files:
+        if offset + length <= start or not length:
+            offset += length
+            continue
+        if offset >= end:
+            break
+        position = max(start - offset, 0)
+        stop = min(end - offset, length)
+        with open(path, "rb", buffering=0) as f:
+            f.seek(position)
+            while position < stop:
+                count = f.readinto(view[:min(READ_SIZE, stop - position)])
+                if not count:
+                    raise CreateError(f"{path} was changed during hashing")
+                position += count
+                chunk = view[:count]
+                while chunk:
+                    part = min(piece_length - filled, len(chunk))
+                    current.update(chunk[:part])
+                    filled += part
+                    chunk = chunk[part:]
+                    if filled == piece_length:
+                        digests.append(current.digest())
+                        current = hashlib.sha1()
+                        filled = 0
+        offset += length
+    if filled:
+        digests.append(current.digest())  # останній кусок торенту коротший
+    return b"".join(digests)
+
+
+def split_pieces(total_length: int, piece_length: int, workers: int | None = None) -> tuple[list[tuple[int, int]], int]:
+    """Послідовні діапазони кусків (перший, наступний після останнього) по TASK_SIZE байтів та кількість процесів
+    для них: workers або всі ядра, якщо даних більше PARALLEL_SIZE. Якщо робота одна, процес - один"""
+    if workers is None:
+        workers = (os.cpu_count() or 1) if total_length >= PARALLEL_SIZE else 1
+    pieces_count = -(-total_length // piece_length)
+    per_task = max(1, TASK_SIZE // piece_length)
+    if pieces_count <= per_task:
+        workers = 1
+    else:  # щоб всі процеси мали роботу до кінця
+        per_task = max(1, min(per_task, pieces_count // (workers * 4)))
+    ranges = [(i, min(i + per_task, pieces_count)) for i in range(0, pieces_count, per_task)]
+    return ranges, max(1, min(workers, len(ranges)))
+
+
+def run_tasks(func: typing.Callable, tasks: typing.Sequence[tuple], workers: int) -> typing.Iterator:
+    """Результати func(*task) в порядку tasks. При workers > 1 завдання виконуються в окремих процесах"""
+    if workers == 1:
+        yield from (func(*task) for task in tasks)
+        return
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as executor:
+        futures = [executor.submit(func, *task) for task in tasks]
+        try:
+            yield from (future.result() for future in futures)
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def hash_pieces(files: typing.Sequence[SourceFile], piece_length: int, workers: int | None = None,
+                progress: typing.Callable[[int], None] | None = None) -> bytes:
+    """Хеші всіх кусків, діапазони кусків хешуються паралельно (split_pieces).
+    progress викликається з кількістю готових байтів"""
+    total_length = sum(f.length for f in files)
+    sources = [(f.path, f.length) for f in files]
+    ranges, workers = split_pieces(total_length, piece_length, workers)
+    tasks = [(sources, piece_length, first, last) for first, last in ranges]
+    result = list()
+    for (_, last), digests in zip(ranges, run_tasks(hash_range, tasks, workers)):
+        result.append(digests)
+        if progress: progress(min(last * piece_length, total_length))
+    return b"".join(result)
+
+
+def make_metainfo(path: str, files: typing.Sequence[SourceFile], piece_length: int, pieces: bytes,
+                  trackers: typing.Sequence[typing.Sequence[str]] = (), comment: str | None = None,
+                  private: bool = False) -> dict:
+    """Словник торент-файлу. trackers - рівні (tiers) announce-list, announce - перший трекер першого рівня"""
+    name = os.path.basename(os.path.normpath(path))
+    info = {"name": name, "piece length": piece_length, "pieces": pieces}
+    if os.path.isfile(path):
+        info["length"] = files[0].length
+    else:
+        info["files"] = [{"length": f.length, "path": f.parts} for f in files]
+    if private:
+        info["private"] = 1
+    metainfo = {"info": info, "created by": CREATED_BY, "creation date": int(time.time())}
+    tiers = [list(tier) for tier in trackers if tier]
+    if tiers:
+        metainfo["announce"] = tiers[0][0]
+        if len(tiers) > 1 or len(tiers[0]) > 1:
+            metainfo["announce-list"] = tiers
+    if comment:
+        metainfo["comment"] = comment
+    return metainfo
+
+
+def create(path: str, trackers: typing.Sequence[typing.Sequence[str]] = (), piece_length: int | None = None,
+           workers: int | None = None, comment: str | None = None, private: bool = False,
+           progress: typing.Callable[[int], None] | None = None) -> bytes:
+    """Бенкодований торент-файл для файлу або папки path"""
+    files = collect_files(path)
+    total_length = sum(f.length for f in files)
+    if not total_length:
+        raise CreateError(f"{path} is empty")
+    piece_length = piece_length or piece_length_for(total_length)
+    if piece_length < MIN_PIECE_LENGTH or piece_length & (piece_length - 1):
+        raise CreateError("piece length must be a power of two not less than 16 KiB")
+    pieces = hash_pieces(files, piece_length, workers, progress)
+    return BenCoder.encode(make_metainfo(path, files, piece_length, pieces, trackers, comment, private))
+
+
+def get_args(argv: typing.Sequence[str]):
+    parser = argparse.ArgumentParser(prog="start.py create", description="create a torrent file")
+    parser.add_argument("path", help="file or folder to share")
+    parser.add_argument("-o", "--output", default=None, help="torrent file, PATH.torrent by default")
+    parser.add_argument("-t", "--tracker", action="append", default=list(), metavar="URL[,URL...]",
+                        help="tier of announce-list, trackers of one tier are separated by commas")
+    parser.add_argument("--piece-length", type=int, default=None, help="piece length, KiB (chosen by size by default)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="count of hashing processes, all cores by default")
+    parser.add_argument("--comment", default=None, help="comment of the torrent")
+    parser.add_argument("--private", action="store_true", default=False, help="private torrent (no DHT and PEX)")
+    return parser.parse_args(argv)
+
+
+def main(argv: typing.Sequence[str]) -> None:
+    args = get_args(argv)
+    output = args.output or os.path.normpath(args.path) + ".torrent"
+    trackers = [[url.strip() for url in tier.split(",") if url.strip()] for tier in args.tracker]
+    piece_length = args.piece_length * 1024 if args.piece_length else None
+
+    start = time.perf_counter()
+
+    def progress(done: int) -> None:
+        print(f"\rHashed {done / 2 ** 20:.0f} MiB", end="", flush=True)
+
+    try:
+        data = create(args.path, trackers, piece_length, args.workers, args.comment, args.private, progress)
+    except (CreateError, OSError) as e:
+        print(f"Torrent is not created: {e}")
+        exit(1)
+    elapsed = time.perf_counter() - start
+    print()
+    with open(output, "wb") as f:
+        f.write(data)
+    info = BenCoder.decode(data)["info"]
+    total_length = info.get("length") or sum(f["length"] for f in info["files"])
+    print(f"{output}: {total_length} bytes, {len(info['pieces']) // 20} pieces of {info['piece length'] // 1024} KiB")
+    print(f"Hashed in {elapsed:.2f} s, {total_length / max(elapsed, 1e-9) / 2 ** 20:.1f} MiB/s")
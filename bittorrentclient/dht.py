@@ -0,0 +1,463 @@
+import asyncio
+import dataclasses
+import hashlib
+import ipaddress
+import json
+import os
+import random
+import socket
+import struct
+import time
+import typing
+
+from .bencoder import BenCoder
+from .peer import Peer
+from .pex import compact_peers, parse_compact_peers
+
+
+K = 8  # розмір k-bucket
+ALPHA = 3  # кількість паралельних запитів при пошуку
+BOOTSTRAP_NODES = [("router.bittorrent.com", 6881), ("dht.transmissionbt.com", 6881), ("router.utorrent.com", 6881)]
+DEFAULT_STATE_PATH = os.path.join(os.path.expanduser("~"), ".bittorrentclient", "dht.json")
+
+
+class DHTError(Exception):
+    pass
+
+
+def _bytes(value) -> bytes:
+    """BenCoder декодує байти, які можна прочитати як текст, у str"""
+    return value.encode() if isinstance(value, str) else value
+
+
+def _is_id(value) -> bool:
+    return isinstance(value, bytes) and len(value) == 20
+
+
+def _valid_response(response: dict) -> bool:
+    """Поля відповіді, які використовуються, мають очікувані типи. Інакше відповідь відкидається"""
+    if "nodes" in response and not isinstance(_bytes(response["nodes"]), bytes):
+        return False
+    if "token" in response and not isinstance(_bytes(response["token"]), bytes):
+        return False
+    values = response.get("values", list())
+    return isinstance(values, list) and all(isinstance(_bytes(value), bytes) for value in values)
+
+
+def distance(a: bytes, b: bytes) -> int:
+    return int.from_bytes(a, "big") ^ int.from_bytes(b, "big")
+
+
+@dataclasses.dataclass()
+class Node:
+    id: bytes
+    ip: str
+    port: int
+    last_seen: float = 0
+    failures: int = 0
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.ip, self.port
+
+    def compact(self) -> bytes:
+        return self.id + ipaddress.IPv4Address(self.ip).packed + struct.pack("!H", self.port)
+
+    @classmethod
+    def parse_compact(cls, data: bytes) -> list[typing.Self]:
+        return [cls(id=data[i:i + 20], ip=str(ipaddress.IPv4Address(data[i + 20:i + 24])),
+                    port=struct.unpack("!H", data[i + 24:i + 26])[0])
+                for i in range(0, len(data) - len(data) % 26, 26)]
+
+
+class RoutingTable:
+    """Таблиця маршрутизації з 160 k-bucket за довжиною XOR-відстані до власного id"""
+    def __init__(self, own_id: bytes, k: int = K):
+        self._own_id = own_id
+        self._k = k
+        self._buckets: list[list[Node]] = [list() for _ in range(160)]
+
+    def _bucket(self, node_id: bytes) -> list[Node]:
+        return self._buckets[max(distance(self._own_id, node_id).bit_length() - 1, 0)]
+
+    def add(self, node: Node) -> bool:
+        if node.id == self._own_id or len(node.id) != 20 or not node.port:
+            return False
+        bucket = self._bucket(node.id)
+        for i, known in enumerate(bucket):
+            if known.id == node.id:
+                known.ip, known.port, known.last_seen, known.failures = node.ip, node.port, time.time(), 0
+                bucket.append(bucket.pop(i))
+                return True
+        node.last_seen = time.time()
+        if len(bucket) < self._k:
+            bucket.append(node)
+            return True
+        bad = next((n for n in bucket if n.failures >= 2), None)  # замінюється лише вузол, що не відповідає
+        if bad is not None:
+            bucket.remove(bad)
+            bucket.append(node)
+            return True
+        return False
+
+    def fail(self, node_id: bytes) -> None:
+        bucket = self._bucket(node_id)
+        for known in bucket:
+            if known.id == node_id:
+                known.failures += 1
+                if known.failures >= 3: bucket.remove(known)
+                return
+
+    def closest(self, target: bytes, count: int = K) -> list[Node]:
+        return sorted(self.nodes(), key=lambda n: distance(n.id, target))[:count]
+
+    def nodes(self) -> list[Node]:
+        return [node for bucket in self._buckets for node in bucket]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+
+class TokenStore:
+    """Токени для announce_peer. Секрет змінюється кожні period секунд, попередній ще залишається дійсним"""
+    def __init__(self, period: float = 300):
+        self._period = period
+        self._secrets = [os.urandom(8), os.urandom(8)]
+        self._changed = time.time()
+
+    def _rotate(self) -> None:
+        if time.time() - self._changed >= self._period:
+            self._secrets = [os.urandom(8), self._secrets[0]]
+            self._changed = time.time()
+
+    def get(self, ip: str) -> bytes:
+        self._rotate()
+        return hashlib.sha1(self._secrets[0] + ip.encode()).digest()[:8]
+
+    def check(self, ip: str, token: bytes) -> bool:
+        self._rotate()
+        return any(hashlib.sha1(secret + ip.encode()).digest()[:8] == token for secret in self._secrets)
+
+
+class PeerStore:
+    """Піри, які оголосили себе через announce_peer"""
+    def __init__(self, max_age: float = 30 * 60, max_peers: int = 100):
+        self._max_age = max_age
+        self._max_peers = max_peers
+        self._peers: dict[bytes, dict[tuple[str, int], float]] = dict()
+
+    def add(self, info_hash: bytes, ip: str, port: int) -> None:
+        peers = self._peers.setdefault(info_hash, dict())
+        peers.pop((ip, port), None)
+        peers[(ip, port)] = time.time()
+        while len(peers) > self._max_peers:
+            peers.pop(next(iter(peers)))
+
+    def get(self, info_hash: bytes, count: int = 50) -> list[tuple[str, int]]:
+        border = time.time() - self._max_age
+        peers = self._peers.get(info_hash, dict())
+        for address in [a for a, t in peers.items() if t < border]:
+            peers.pop(address)
+        return list(peers)[-count:]
+
+
+class _DHTProtocol(asyncio.DatagramProtocol):
+    def __init__(self, node: 'DHTNode'):
+        self._node = node
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        self._node._datagram_received(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        pass
+
+
+class DHTNode:
+    """Вузол Mainline DHT (BEP 5). Підтримує ping, find_node, get_peers та announce_peer,
+    ітеративний пошук з ALPHA паралельними запитами та збереження таблиці маршрутизації між запусками."""
+    def __init__(self, port: int = 6881, host: str = "0.0.0.0", node_id: bytes | None = None,
+                 state_path: str | None = DEFAULT_STATE_PATH,
+                 bootstrap: typing.Sequence[tuple[str, int]] = tuple(BOOTSTRAP_NODES), query_timeout: float = 2,
+                 log_func: typing.Callable[[str], None] | None = None):
+        self._port = port
+        self._host = host
+        self._state_path = state_path
+        self._bootstrap_nodes = list(bootstrap)
+        self._query_timeout = query_timeout
+
+        self.node_id = node_id if node_id else os.urandom(20)
+        self._saved_nodes: list[tuple[str, int]] = list()
+        if state_path: self._load_state(keep_id=node_id is None)
+        self.table = RoutingTable(self.node_id)
+        self.tokens = TokenStore()
+        self.peers = PeerStore()
+
+        self._transport: asyncio.DatagramTransport | None = None
+        self._pending: dict[bytes, tuple[asyncio.Future, tuple[str, int]]] = dict()
+        self._transaction = random.randint(0, 0xffff)
+        self._maintainer: asyncio.Task | None = None
+        self._bootstrapped = asyncio.Event()
+
+        self._log_func = log_func if log_func else lambda a: a
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: _DHTProtocol(self),
+                                                                 local_addr=(self._host, self._port))
+        self._port = self._transport.get_extra_info("sockname")[1]
+        self._maintainer = asyncio.Task(self._maintain())
+
+    async def stop(self) -> None:
+        if self._maintainer:
+            self._maintainer.cancel()
+            await asyncio.gather(self._maintainer, return_exceptions=True)
+            self._maintainer = None
+        self._bootstrapped.set()  # ті, хто чекає bootstrap, не мають зависнути
+        if self._state_path: self.save_state()
+        for future, _ in self._pending.values():
+            future.cancel()
+        self._pending = dict()
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+    async def bootstrap(self) -> None:
+        """Заповнення таблиці через збережені та bootstrap вузли, потім пошук власного id"""
+        addresses = self._saved_nodes + self._bootstrap_nodes
+        try:
+            await asyncio.gather(*[self.add_node(ip, port) for ip, port in addresses], return_exceptions=True)
+            await self._lookup(self.node_id, "find_node")
+        finally:
+            self._bootstrapped.set()
+        self._log_func(f"DHT is bootstrapped, {len(self.table)} nodes")
+
+    async def wait_bootstrapped(self) -> None:
+        await self._bootstrapped.wait()
+
+    async def add_node(self, ip: str, port: int) -> bool:
+        """Додавання вузла з відомою лише адресою, наприклад з повідомлення port.
+        Ім'я хоста (bootstrap вузли) розв'язується асинхронно, sendto розв'язував би його блокуючи цикл"""
+        try:
+            ip = await self._resolve(ip, port)
+            response = await self.query((ip, port), "find_node", {"target": self.node_id})
+        except DHTError:
+            return False
+        for node in Node.parse_compact(_bytes(response.get("nodes", b""))):
+            self.table.add(node)
+        return True
+
+    @staticmethod
+    async def _resolve(host: str, port: int) -> str:
+        try:
+            ipaddress.IPv4Address(host)
+            return host
+        except ipaddress.AddressValueError:
+            pass
+        try:
+            addresses = await asyncio.get_running_loop().getaddrinfo(host, port, family=socket.AF_INET,
+                                                                      type=socket.SOCK_DGRAM)
+        except OSError as e:
+            raise DHTError(f"{host} is not resolved") from e
+        if not addresses:
+            raise DHTError(f"{host} is not resolved")
+        return addresses[0][4][0]
+
+    async def get_peers(self, info_hash: bytes) -> list[tuple[str, int]]:
+        _, peers = await self._lookup(info_hash, "get_peers")
+        return list(peers)
+
+    async def announce_peer(self, info_hash: bytes, port: int) -> list[tuple[str, int]]:
+        """Пошук пірів торенту та оголошення себе K найближчим вузлам"""
+        closest, peers = await self._lookup(info_hash, "get_peers")
+        args = lambda token: {"info_hash": info_hash, "port": port, "token": token, "implied_port": 0}
+        await asyncio.gather(*[self.query(node.address, "announce_peer", args(token))
+                               for node, token in closest if token], return_exceptions=True)
+        return list(peers)
+
+    async def query(self, address: tuple[str, int], method: str, args: dict) -> dict:
+        if not self._transport:
+            raise DHTError("DHT node is not started")
+        self._transaction = (self._transaction + 1) % 0x10000
+        transaction = struct.pack("!H", self._transaction)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[transaction] = (future, address)
+        message = {"t": transaction, "y": "q", "q": method, "a": dict(args, id=self.node_id)}
+        try:
+            self._transport.sendto(BenCoder.encode(message), address)
+            return await asyncio.wait_for(future, self._query_timeout)
+        except (asyncio.TimeoutError, OSError) as e:
+            raise DHTError(f"{method} to {address} failed") from e
+        finally:
+            self._pending.pop(transaction, None)
+
+    async def _lookup(self, target: bytes, method: str) -> tuple[list[tuple[Node, bytes | None]], set]:
+        """Ітеративний пошук вузлів, найближчих до target. Повертає K найближчих вузлів з токенами та пірів"""
+        shortlist = {node.id: node for node in self.table.closest(target)}
+        queried = set()
+        responded: list[tuple[Node, bytes | None]] = list()
+        peers = set()
+        while True:
+            candidates = [n for n in sorted(shortlist.values(), key=lambda n: distance(n.id, target))[:K]
+                          if n.id not in queried]
+            if not candidates:
+                break
+            batch = candidates[:ALPHA]
+            queried.update(n.id for n in batch)
+            key = "info_hash" if method == "get_peers" else "target"
+            results = await asyncio.gather(*[self.query(n.address, method, {key: target}) for n in batch],
+                                           return_exceptions=True)
+            for node, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    self.table.fail(node.id)
+                    continue
+                token = result.get("token")
+                responded.append((node, _bytes(token) if token is not None else None))
+                for new_node in Node.parse_compact(_bytes(result.get("nodes", b""))):
+                    if new_node.id != self.node_id: shortlist.setdefault(new_node.id, new_node)
+                for value in result.get("values", list()):
+                    peers.update(parse_compact_peers(_bytes(value)))
+        responded.sort(key=lambda nt: distance(nt[0].id, target))
+        return responded[:K], peers
+
+    def _datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        try:
+            message = BenCoder.decode(data)
+        except Exception:
+            return
+        if not isinstance(message, dict):
+            return
+        kind = message.get("y")
+        transaction = _bytes(message.get("t", b""))
+        if kind == "q":
+            self._on_query(message, transaction, addr)
+        elif kind in ("r", "e") and transaction in self._pending:
+            future, address = self._pending[transaction]
+            if future.done(): return
+            if kind == "e" or not isinstance(message.get("r"), dict):
+                future.set_exception(DHTError(str(message.get("e"))))
+                return
+            response = message["r"]
+            if not _valid_response(response):
+                future.set_exception(DHTError(f"Malformed response from {addr}"))
+                return
+            node_id = _bytes(response.get("id", b""))
+            if _is_id(node_id):
+                self.table.add(Node(node_id, addr[0], addr[1]))
+            future.set_result(response)
+
+    def _on_query(self, message: dict, transaction: bytes, addr: tuple[str, int]) -> None:
+        args = message.get("a")
+        method = message.get("q")
+        if not isinstance(args, dict):
+            return self._send_error(transaction, addr, 203, "Protocol Error")
+        node_id = _bytes(args.get("id", b""))
+        if not _is_id(node_id):
+            return self._send_error(transaction, addr, 203, "Protocol Error")
+        target = _bytes(args.get("target" if method == "find_node" else "info_hash", b""))
+        if method in ("find_node", "get_peers", "announce_peer") and not _is_id(target):
+            return self._send_error(transaction, addr, 203, "Protocol Error")
+        self.table.add(Node(node_id, addr[0], addr[1]))
+
+        response = {"id": self.node_id}
+        if method == "ping":
+            pass
+        elif method == "find_node":
+            response["nodes"] = b"".join(n.compact() for n in self.table.closest(target))
+        elif method == "get_peers":
+            response["token"] = self.tokens.get(addr[0])
+            values = self.peers.get(target)
+            if values:
+                response["values"] = [compact_peers([address]) for address in values]
+            response["nodes"] = b"".join(n.compact() for n in self.table.closest(target))
+        elif method == "announce_peer":
+            if not self.tokens.check(addr[0], _bytes(args.get("token", b""))):
+                return self._send_error(transaction, addr, 203, "Bad token")
+            port = addr[1] if args.get("implied_port") else args.get("port")
+            if not isinstance(port, int) or not 0 < port < 65536:
+                return self._send_error(transaction, addr, 203, "Bad port")
+            self.peers.add(target, addr[0], port)
+        else:
+            return self._send_error(transaction, addr, 204, "Method Unknown")
+        self._send({"t": transaction, "y": "r", "r": response}, addr)
+
+    def _send_error(self, transaction: bytes, addr: tuple[str, int], code: int, text: str) -> None:
+        self._send({"t": transaction, "y": "e", "e": [code, text]}, addr)
+
+    def _send(self, message: dict, addr: tuple[str, int]) -> None:
+        if self._transport: self._transport.sendto(BenCoder.encode(message), addr)
+
+    async def _maintain(self, period: float = 15 * 60) -> None:
+        """Bootstrap та періодичне оновлення таблиці пошуком випадкового id"""
+        try:
+            await self.bootstrap()
+        except Exception as e:
+            self._log_func(f"DHT bootstrap failed: {e!r}")
+        while True:
+            await asyncio.sleep(period)
+            try:
+                await self._lookup(os.urandom(20), "find_node")
+            except Exception as e:
+                self._log_func(f"DHT refresh failed: {e!r}")
+            if self._state_path: self.save_state()
+
+    def save_state(self) -> None:
+        directory = os.path.dirname(self._state_path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        data = {"id": self.node_id.hex(), "nodes": [[n.id.hex(), n.ip, n.port] for n in self.table.nodes()]}
+        tmp_path = self._state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._state_path)
+
+    def _load_state(self, keep_id: bool) -> None:
+        try:
+            with open(self._state_path, "r") as f:
+                data = json.load(f)
+            if keep_id: self.node_id = bytes.fromhex(data["id"])
+            self._saved_nodes = [(ip, port) for _, ip, port in data.get("nodes", list())]
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+
+
+class DHTTracker:
+    """Джерело пірів торенту з DHT, працює поряд з TrackerManager"""
+    def __init__(self, dht: DHTNode, info_hash: bytes, port: int, interval: float = 15 * 60,
+                 first_interval: float = 60, log_func: typing.Callable[[str], None] | None = None):
+        self._dht = dht
+        self._info_hash = info_hash
+        self._port = port
+        self._interval = interval
+        self._first_interval = first_interval
+        self._set_peers_clb: typing.Callable[[typing.Sequence[Peer]], None] | None = None
+        self._working = False
+        self._log_func = log_func if log_func else lambda a: a
+
+    def reg_clb_peers(self, clb: typing.Callable[[typing.Sequence[Peer]], None]) -> None:
+        self._set_peers_clb = clb
+
+    async def run(self) -> None:
+        self._working = True
+        await self._dht.wait_bootstrapped()
+        next_time, interval = 0., self._first_interval
+        while self._working:
+            if next_time < time.time():
+                try:
+                    peers = await self._dht.announce_peer(self._info_hash, self._port)
+                except DHTError:
+                    peers = list()
+                except Exception as e:
+                    self._log_func(f"DHT announce failed: {e!r}")
+                    peers = list()
+                if peers and self._set_peers_clb:
+                    self._set_peers_clb([Peer(ip, port) for ip, port in peers])
+                    self._log_func(f"DHT has given {len(peers)} peers")
+                    interval = self._interval  # поки пірів не знайдено, пошук повторюється частіше
+                next_time = time.time() + interval
+            await asyncio.sleep(1)
+
+    async def stop(self) -> None:
+        self._working = False
@@ -0,0 +1,177 @@
+import asyncio
+import cProfile
+import functools
+import inspect
+import json
+import statistics
+import threading
+import time
+import typing
+
+from .bencoder import BenCoder
+from .filesmanager import FilesManager
+from .loadmanager import LoadManager
+
+
+SLOW_CALLBACK = 0.05  # колбек event loop, який виконується довше, вважається повільним, с
+LAG_PERIOD = 0.01
+HOT_SECTIONS = ((LoadManager, "_verify_piece", "verify_piece"), (LoadManager, "_write_piece", "write_piece"),
+                (LoadManager, "_prioritize", "prioritize"), (FilesManager, "read_piece", "read_piece"),
+                (BenCoder, "decode", "bencoder_decode"))
+
+
+def _callback_name(handle: asyncio.Handle) -> str:
+    """Ім'я колбеку. Для кроку задачі - ім'я її корутини"""
+    callback = handle._callback
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        return owner.get_coro().__qualname__
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+class Diagnostics:
+    """Діагностика продуктивності процесу, вмикається лише за потреби.
+    Після start() вимірюється затримка event loop, записуються колбеки, довші за slow_callback,
+    та час виконання гарячих ділянок з HOT_SECTIONS. Кожні interval секунд у файл path дописується
+    JSON рядок зі зведенням за цей проміжок. Якщо profile=True, поруч зберігається профіль cProfile (path.prof).
+    Для вимірювань підміняються методи класів та Handle._run, stop() повертає оригінали,
+    тож вимкнена діагностика нічого не коштує"""
+    def __init__(self, path: str, interval: float = 10, slow_callback: float = SLOW_CALLBACK, profile: bool = False,
+                 log_func: typing.Callable[[str], None] | None = None):
+        self._path = path
+        self._interval = interval
+        self._slow_callback = slow_callback
+        self._profiler = cProfile.Profile() if profile else None
+        self._originals: list[tuple[object, str, object]] = list()
+        self._tasks: list[asyncio.Task] = list()
+
+        self._lag: list[float] = list()
+        self._sections: dict[str, list] = dict()
+        self._slow: dict[str, list] = dict()
+        self._lock = threading.Lock()  # read_piece та write_piece виконуються в потоках дискового пулу
+        self._window_start = time.time()
+
+        self._log_func = log_func if log_func else lambda a: a
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._originals)
+
+    async def start(self) -> None:
+        if self.enabled:
+            return
+        for owner, name, section in HOT_SECTIONS:
+            self._patch(owner, name, self._timed(owner.__dict__[name], section))
+        self._patch(asyncio.Handle, "_run", self._timed_handle(asyncio.Handle.__dict__["_run"]))
+        if self._profiler:
+            self._profiler.enable()
+        self._window_start = time.time()
+        self._tasks = [asyncio.Task(self._sample_lag()), asyncio.Task(self._dump_periodically())]
+        self._log_func(f"Diagnostics are written to {self._path}")
+
+    async def stop(self) -> None:
+        if not self.enabled:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = list()
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals = list()
+        if self._profiler:
+            self._profiler.disable()
+        self.dump()
+
+    def _patch(self, owner: object, name: str, replacement: object) -> None:
+        self._originals.append((owner, name, owner.__dict__[name]))
+        setattr(owner, name, replacement)
+
+    def _record(self, table: dict[str, list], name: str, duration: float) -> None:
+        with self._lock:
+            stat = table.get(name)
+            if stat is None:
+                table[name] = [1, duration, duration]
+            else:
+                stat[0] += 1
+                stat[1] += duration
+                stat[2] = max(stat[2], duration)
+
+    def _timed(self, original: object, section: str) -> object:
+        """Обгортка, яка вимірює час виконання функції, корутини або classmethod"""
+        is_classmethod = isinstance(original, classmethod)
+        func = original.__func__ if is_classmethod else original
+        record = self._record
+        sections = self._sections
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    record(sections, section, time.perf_counter() - started)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record(sections, section, time.perf_counter() - started)
+        for attribute in ("cache_info", "cache_clear"):  # для функцій з lru_cache
+            if hasattr(func, attribute): setattr(wrapper, attribute, getattr(func, attribute))
+        return classmethod(wrapper) if is_classmethod else wrapper
+
+    def _timed_handle(self, original: typing.Callable) -> typing.Callable:
+        threshold = self._slow_callback
+        record = self._record
+        slow = self._slow
+
+        def _run(handle: asyncio.Handle) -> None:
+            started = time.perf_counter()
+            original(handle)
+            duration = time.perf_counter() - started
+            if duration >= threshold:
+                record(slow, _callback_name(handle), duration)
+        return _run
+
+    async def _sample_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_PERIOD)
+            self._lag.append(loop.time() - start - LAG_PERIOD)
+
+    async def _dump_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            self.dump()
+
+    @staticmethod
+    def _summary(table: dict[str, list]) -> dict:
+        return {name: {"count": count, "total_ms": round(total * 1000, 3), "mean_ms": round(total / count * 1000, 3),
+                       "max_ms": round(longest * 1000, 3)}
+                for name, (count, total, longest) in sorted(table.items(), key=lambda item: -item[1][1])}
+
+    def dump(self) -> None:
+        """Запис зведення за проміжок з попереднього запису"""
+        lag = sorted(self._lag) or [0.]
+        with self._lock:
+            sections, slow = self._summary(self._sections), self._summary(self._slow)
+            self._sections.clear()
+            self._slow.clear()
+        record = {"time": round(time.time(), 3), "period": round(time.time() - self._window_start, 3),
+                  "loop_lag_ms": {"mean": round(statistics.mean(lag) * 1000, 3),
+                                  "p99": round(lag[int(len(lag) * 0.99)] * 1000, 3),
+                                  "max": round(lag[-1] * 1000, 3)},
+                  "sections": sections,
+                  "slow_callbacks": slow}
+        with open(self._path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        if self._profiler:
+            self._profiler.dump_stats(self._path + ".prof")  # dump_stats вимикає профілювання
+            if self.enabled: self._profiler.enable()
+        self._lag = list()
+        self._window_start = time.time()
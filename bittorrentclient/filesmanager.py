@@ -1,73 +1,119 @@
+import bisect
 import hashlib
+import itertools
 import os.path
 import typing
 from math import ceil
 from functools import lru_cache
 
+from . import metrics
 from .bitfield import BitField
 
+PRIORITY_SKIP = 0
+PRIORITY_LOW = 1
+PRIORITY_NORMAL = 4
+PRIORITY_HIGH = 7
+PRIORITIES = {"skip": PRIORITY_SKIP, "low": PRIORITY_LOW, "normal": PRIORITY_NORMAL, "high": PRIORITY_HIGH}
+PART_FILE = ".parts"
+
+
 class FilesManager:
     """Об'єкти цього класу надають можливість записувати певну кількість байтів за номером куску торент-файлів
-    та отримувати дані торент-файлів не зважаючи на структуру завантажувальних файлів"""
+    та отримувати дані торент-файлів не зважаючи на структуру завантажувальних файлів.
+    Файли з пріоритетом PRIORITY_SKIP не створюються: частини крайніх кусків, які їм належать, зберігаються
+    в partfile за тим самим зсувом, що й у торенті (розріджений файл).
+    Файли доповнення (padding) завжди пропускаються і не зберігаються зовсім, їх дані - нулі"""
     def __init__(self, full_length: int, bitfield: BitField, block_size: int, destination: str,
-                 files: typing.Sequence[tuple[int, str]]):
+                 files: typing.Sequence[tuple[int, str]], priorities: typing.Sequence[int] | None = None,
+                 partfile: str = PART_FILE, padding: typing.Collection[int] = ()):
         self._full_length = full_length
         self._bitfield = bitfield
         self._data_count_per_piece = block_size
         self._files = files
         self._destination = destination
+        self._partfile = partfile
+        self._offsets = list(itertools.accumulate((size for size, _ in files), initial=0))
+        self._padding = set(padding)
+        self._priorities = self._without_padding(priorities if priorities else [PRIORITY_NORMAL] * len(files))
+        self._piece_priorities: list[int] = list()
+        self._wanted_bytes: list[int] = list()
+        self._wanted = BitField(len(bitfield))
+        self._completed = 0
+        self._completed_bytes = 0
+        self._left = 0
+        self._update_pieces()
 
-    def write_block(self, data: bytes, block_index: int) -> None:
-        block_start_index = block_index * self._data_count_per_piece
-        block_end_index = block_start_index + self._data_count_per_piece
-
-        total = 0
-        for file_size, file in self._files:
-            file_start_index = total
-            file_end_index = total + file_size - 1
-
-            if file_start_index <= block_start_index <= block_end_index <= file_end_index:  # блок всередині файлу
-                self._write_data_file(file, data, block_start_index)
-            elif block_start_index <= file_start_index <= file_end_index <= block_end_index:  # файл всередині блоку
-                self._write_data_file(file,
-                                      data[file_start_index - block_start_index:file_end_index - block_start_index + 1],
-                                      file_start_index)
-            elif file_start_index <= block_start_index <= file_end_index <= block_end_index:  # файл починається до бло
-                self._write_data_file(file, data[:file_end_index - block_start_index + 1], block_start_index)
-            elif block_start_index <= file_start_index <= block_end_index <= file_end_index:  # файл починається в серд
-                self._write_data_file(file, data[file_start_index - block_start_index:], file_start_index)
-            total += file_size
-        self._bitfield.set(block_index)
+    def _segments(self, piece_index: int) -> typing.Iterator[tuple[int, int, int, int]]:
+        """Частини куска в різних файлах: (номер файлу, зсув у файлі, зсув у куску, довжина)"""
+        block_start_index = piece_index * self._data_count_per_piece
+        block_end_index = min(block_start_index + self._data_count_per_piece, self._full_length)
+
+        for n in range(max(bisect.bisect_right(self._offsets, block_start_index) - 1, 0), len(self._files)):
+            total = self._offsets[n]
+            if total >= block_end_index:
+                break
+            start = max(total, block_start_index)
+            end = min(total + self._files[n][0], block_end_index)
+            if start < end:
+                yield n, start - total, start - block_start_index, end - start
+
+    def segments(self, piece_index: int) -> list[tuple[int, int, int, int]]:
+        return list(self._segments(piece_index))
+
+    def _location(self, file_index: int, offset: int, priority: int | None = None) -> tuple[str, int]:
+        """Файл та зсув, де зберігаються дані файлу торенту. Для пропущених файлів - partfile"""
+        priority = self._priorities[file_index] if priority is None else priority
+        if priority == PRIORITY_SKIP:
+            return self._partfile, self._offsets[file_index] + offset
+        return self._files[file_index][1], offset
+
+    def write_block(self, data: bytes | bytearray, block_index: int) -> None:
+        view = memoryview(data)  # частини для різних файлів без копіювання
+        for n, file_offset, piece_offset, length in self._segments(block_index):
+            if n in self._padding: continue
+            self._write_data_file(*self._location(n, file_offset), view[piece_offset:piece_offset + length])
+        self._set_available(block_index)
+
+    def _set_available(self, index: int) -> None:
+        """Позначення куска завантаженим з оновленням лічильників"""
+        if self._bitfield.has(index):
+            return
+        self._bitfield.set(index)
+        self._completed += 1
+        self._completed_bytes += self.piece_size(index)
+        self._left -= self._wanted_bytes[index]
+
+    def piece_size(self, index: int) -> int:
+        return min(self._data_count_per_piece, self._full_length - index * self._data_count_per_piece)
+
+    def payload_size(self, index: int) -> int:
+        """Розмір куска без доповнення в кінці: блоки доповнення не завантажуються"""
+        size = self.piece_size(index)
+        for n, _, piece_offset, length in reversed(list(self._segments(index))):
+            if n not in self._padding: break
+            size = piece_offset
+        return size
 
-    @lru_cache(1000)
     def read_piece(self, piece_index: int) -> bytes:
-        res = b''
-        block_start_index = piece_index * self._data_count_per_piece
-        block_end_index = block_start_index + self._data_count_per_piece - 1
-
-        total = 0
-        for file_size, file in self._files:
-            file_start_index = total
-            file_end_index = total + file_size - 1
-
-            if file_start_index <= block_start_index <= block_end_index <= file_end_index:  # блок всередині файлу
-                res += self._read_data_file(file, block_start_index - file_start_index,
-                                            block_end_index - block_start_index + 1)
-            elif block_start_index <= file_start_index <= file_end_index <= block_end_index:  # файл всередині блоку
-                res += self._read_data_file(file, 0, file_size)
-            elif file_start_index <= block_start_index <= file_end_index <= block_end_index:  # файл починається до бло
-                res += self._read_data_file(file, block_start_index - file_start_index,
-                                            file_end_index - block_start_index + 1)
-            elif block_start_index <= file_start_index <= block_end_index <= file_end_index:  # файл починається в серд
-                res += self._read_data_file(file, 0, block_end_index - file_start_index)
-            total += file_size
-        return res
-
-    def _write_data_file(self, filepath: str, data: bytes, start_index: int) -> int:
-        paths = os.path.join(os.path.dirname(filepath))
-        if paths: os.makedirs(paths)
-        open_mode = "w+b" if not os.path.exists(os.path.join(self._destination, filepath)) else "r+b"
-        with open(os.path.join(self._destination, filepath), open_mode) as f:
+        """Кешуються лише перевірені куски: дані решти ще можуть бути перезаписані"""
+        if self._bitfield.has(piece_index):
+            return self._read_verified_piece(piece_index)
+        return self._read_piece(piece_index)
+
+    @lru_cache(1000)
+    def _read_verified_piece(self, piece_index: int) -> bytes:
+        return self._read_piece(piece_index)
+
+    def _read_piece(self, piece_index: int) -> bytes:
+        return b"".join(bytes(length) if n in self._padding
+                        else self._read_data_file(*self._location(n, file_offset), length)
+                        for n, file_offset, _, length in self._segments(piece_index))
+
+    def _write_data_file(self, filepath: str, start_index: int, data: bytes) -> int:
+        paths = os.path.dirname(os.path.join(self._destination, filepath))
+        if paths: os.makedirs(paths, exist_ok=True)
+        open(os.path.join(self._destination, filepath), "ab").close()  # створення без обрізання, запис може йти з кількох потоків
+        with open(os.path.join(self._destination, filepath), "r+b") as f:
             f.seek(start_index)
             return f.write(data)
 
@@ -80,20 +126,122 @@ class FilesManager:
     def bitfield(self):
         return self._bitfield
 
+    @property
+    def files(self) -> typing.Sequence[tuple[int, str]]:
+        return self._files
+
+    @property
+    def priorities(self) -> list[int]:
+        return list(self._priorities)
+
+    def set_priorities(self, priorities: typing.Sequence[int]) -> None:
+        """Зміна пріоритетів файлів. Вже завантажені дані файлів, які пропускаються або перестають
+        пропускатись, переносяться між partfile та самими файлами"""
+        priorities = self._without_padding(priorities)
+        for n, (old, new) in enumerate(zip(self._priorities, priorities)):
+            if (old == PRIORITY_SKIP) == (new == PRIORITY_SKIP):
+                continue
+            for index in self._file_pieces(n):
+                if not self._bitfield.has(index):
+                    continue
+                for m, file_offset, _, length in self._segments(index):
+                    if m != n: continue
+                    try:
+                        data = self._read_data_file(*self._location(n, file_offset, old), length)
+                    except FileNotFoundError:
+                        continue
+                    self._write_data_file(*self._location(n, file_offset, new), data)
+        self._priorities = priorities
+        self._update_pieces()
+
+    def _without_padding(self, priorities: typing.Sequence[int]) -> list[int]:
+        return [PRIORITY_SKIP if n in self._padding else priority for n, priority in enumerate(priorities)]
+
+    def _file_pieces(self, file_index: int) -> range:
+        start = self._offsets[file_index]
+        size = self._files[file_index][0]
+        if size == 0:
+            return range(0)
+        return range(start // self._data_count_per_piece, (start + size - 1) // self._data_count_per_piece + 1)
+
+    def _update_pieces(self) -> None:
+        """Пріоритет куска - найбільший з пріоритетів файлів, яким він належить"""
+        self._piece_priorities = [PRIORITY_SKIP] * len(self._bitfield)
+        self._wanted_bytes = [0] * len(self._bitfield)
+        self._wanted = BitField(len(self._bitfield))
+        for n, priority in enumerate(self._priorities):
+            if priority == PRIORITY_SKIP:
+                continue
+            for index in self._file_pieces(n):
+                self._piece_priorities[index] = max(self._piece_priorities[index], priority)
+                self._wanted.set(index)
+                self._wanted_bytes[index] += sum(length for m, _, _, length in self._segments(index) if m == n)
+        self._recount()
+
+    def _recount(self) -> None:
+        """Повний перерахунок лічильників, далі вони змінюються в _set_available"""
+        available = [i for i in range(len(self._bitfield)) if self._bitfield.has(i)]
+        self._completed = len(available)
+        self._completed_bytes = sum(self.piece_size(i) for i in available)
+        self._left = sum(self._wanted_bytes) - sum(self._wanted_bytes[i] for i in available)
+
+    def piece_priority(self, index: int) -> int:
+        return self._piece_priorities[index]
+
+    def complete(self) -> bool:
+        """Чи завантажено всі куски вибраних файлів"""
+        return self._left == 0
+
+    def interesting(self, bitfield: BitField) -> bool:
+        """Чи є в іншого бітового поля потрібні куски, яких ще немає"""
+        return any(w & ~h & o for w, h, o in zip(self._wanted.bits, self._bitfield.bits, bytes(bitfield)))
+
+    def left(self) -> int:
+        """Кількість байтів вибраних файлів, які ще не завантажено"""
+        return self._left
+
+    @property
+    def completed(self) -> int:
+        """Кількість завантажених кусків"""
+        return self._completed
+
+    @property
+    def completed_bytes(self) -> int:
+        return self._completed_bytes
+
     @classmethod
     def open(cls, destination: str, files: typing.Sequence[tuple[int, str]],
-             length_piece: int, pieces_hashes: bytes) -> typing.Self:
+             length_piece: int, pieces_hashes: bytes, priorities: typing.Sequence[int] | None = None,
+             partfile: str = PART_FILE, padding: typing.Collection[int] = (),
+             verify: typing.Callable[[int, bytes], bool] | None = None) -> typing.Self:
+        """verify(index, data) перевіряє кусок замість SHA-1 з pieces_hashes (для v2 торентів)"""
         full_length = sum([file[0] for file in files])
         bitfield = BitField(ceil(full_length / length_piece))
 
         obj = cls(full_length=full_length, bitfield=bitfield, block_size=length_piece,
-                  destination=destination, files=files)
+                  destination=destination, files=files, priorities=priorities, partfile=partfile, padding=padding)
+        if verify is None:
+            verify = lambda i, data: hashlib.sha1(data).digest() == pieces_hashes[i * 20: i * 20 + 20]
 
         for i in range(len(bitfield)):
             try:
                 data = obj.read_piece(i)
-                if hashlib.sha1(data[:]).digest() == pieces_hashes[i * 20: i * 20 + 20]:
-                    obj.bitfield.set(i)
+                if verify(i, data):
+                    obj._set_available(i)
             except FileNotFoundError:
                 pass
         return obj
+
+
+metrics.REGISTRY.counter("bt_piece_cache_hits_total", "Piece reads served from cache",
+                         func=lambda: FilesManager._read_verified_piece.cache_info().hits)
+metrics.REGISTRY.counter("bt_piece_cache_misses_total", "Piece reads from disk",
+                         func=lambda: FilesManager._read_verified_piece.cache_info().misses)
+
+
+def _cache_hit_ratio() -> float:
+    info = FilesManager._read_verified_piece.cache_info()
+    return info.hits / (info.hits + info.misses) if info.hits + info.misses else 0.
+
+
+metrics.REGISTRY.gauge("bt_piece_cache_hit_ratio", "Share of piece reads served from cache", func=_cache_hit_ratio)
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import sys
+import time
+import typing
+
+from .statistic import Statistic
+
+
+class HeadlessUI:
+    """Заміна псевдографічного інтерфейсу для роботи без терміналу (наприклад, як сервіс systemd).
+    Прогрес та повідомлення пишуться JSON рядками у файл або в stdout. Має той самий інтерфейс, що й UI"""
+    def __init__(self, path: str | None = None, period: float = 10):
+        self._period = period
+        self._file: typing.TextIO = open(path, "a", buffering=1) if path else sys.stdout
+        self._stat: Statistic = Statistic(0, 0, 0, 0, 0, 0, 0)
+        self._another_info = dict()
+        self._down_indicators = (False, False)
+        self._work = False
+
+    def set_static_info(self, torrent, destination_path, max_connections):
+        self._another_info["torrent"] = torrent
+        self._another_info["destination"] = destination_path
+        self._another_info["max_connections"] = max_connections
+        self._write("start", **self._another_info)
+
+    def set_speed_ava(self, download: bool, upload: bool):
+        self._down_indicators = (download, upload,)
+
+    async def render(self, update_getter, period=None):
+        """Запис прогресу кожні period секунд. Швидкість рахується за проміжок між записами"""
+        period = period if period else self._period
+        self._work = True
+        old_time = time.monotonic()
+        old_stat = update_getter()
+        while self._work:
+            await asyncio.sleep(period)
+            stat = update_getter()
+            now = time.monotonic()
+            elapsed = max(now - old_time, 1e-6)
+            self._write("progress", length=stat.length, left=stat.left,
+                        progress=round(1 - stat.left / stat.length, 4) if stat.length else 0.,
+                        completed_pieces=stat.completed_pieces, pieces=stat.pieces_count,
+                        downloaded=stat.downloaded, uploaded=stat.uploaded,
+                        download_rate=max(round((stat.downloaded - old_stat.downloaded) / elapsed), 0)
+                        if self._down_indicators[0] else None,
+                        upload_rate=max(round((stat.uploaded - old_stat.uploaded) / elapsed), 0)
+                        if self._down_indicators[1] else None,
+                        block_timeout_rate=round(stat.block_timeouts / stat.requested_blocks, 4)
+                        if stat.requested_blocks else 0.,
+                        block_rerequest_rate=round(stat.block_rerequests / stat.requested_blocks, 4)
+                        if stat.requested_blocks else 0.,
+                        hash_failures=stat.hash_failures, bad_blocks=stat.bad_blocks, banned_peers=stat.banned_peers,
+                        web_seed_bytes=stat.web_seed_bytes,
+                        peers=stat.peers_count, connected=stat.connected, interesting=stat.interesting,
+                        local_peers=stat.local_peers,
+                        time_to_metadata=stat.time_to_metadata, time_to_first_byte=stat.time_to_first_byte)
+            old_time, old_stat = now, stat
+            self._stat = stat
+
+    def shutdown(self):
+        if self._work:
+            self._write("stop")
+        self._work = False
+        if self._file is not sys.stdout and not self._file.closed:
+            self._file.close()
+
+    def print(self, data):
+        self._write("log", message=str(data))
+
+    def update(self, info: Statistic):
+        self._stat = info
+
+    def _write(self, event: str, **fields) -> None:
+        if self._file.closed:
+            return
+        self._file.write(json.dumps(dict(time=round(time.time(), 3), event=event, **fields)) + "\n")
+        self._file.flush()
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+
+class ConnectionBudget:
+    """Спільний ліміт кількості з'єднань з пірами для кількох торентів"""
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._used = 0
+
+    def acquire(self, count: int = 1) -> int:
+        """Резервування до count з'єднань. Повертає кількість, яку вдалося зарезервувати"""
+        count = max(0, min(count, self._limit - self._used))
+        self._used += count
+        return count
+
+    def release(self, count: int = 1) -> None:
+        self._used = max(0, self._used - count)
+
+    def set_limit(self, limit: int) -> None:
+        """Зменшення ліміту не закриває з'єднання одразу: їх закривають торенти, поки excess не стане 0"""
+        self._limit = limit
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    @property
+    def available(self) -> int:
+        return max(0, self._limit - self._used)
+
+    @property
+    def excess(self) -> int:
+        """Кількість з'єднань понад ліміт після його зменшення"""
+        return max(0, self._used - self._limit)
+
+
+class RateLimiter:
+    """Token bucket для обмеження швидкості у байтах за секунду. rate=0 означає без обмеження"""
+    def __init__(self, rate: int = 0):
+        self._rate = rate
+        self._tokens = float(rate)
+        self._last_time = time.monotonic()
+
+    async def consume(self, count: int) -> None:
+        if not self._rate:
+            return
+        self._refill()
+        self._tokens -= count
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self._rate)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(float(self._rate), self._tokens + (now - self._last_time) * self._rate)
+        self._last_time = now
+
+    def set_rate(self, rate: int) -> None:
+        self._rate = rate
+        self._tokens = min(self._tokens, float(rate))
+
+    @property
+    def rate(self) -> int:
+        return self._rate
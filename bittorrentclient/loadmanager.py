@@ -1,25 +1,58 @@
 import asyncio
+import collections
+import concurrent.futures
 import hashlib
 import itertools
 import queue
+import time
 import typing
 
-from .filesmanager import FilesManager
+from . import merkle
+from . import metrics
+from .filesmanager import FilesManager, PRIORITY_SKIP, PRIORITY_NORMAL, PRIORITY_HIGH
 from .torrentfile import TorrentFile
 from .statistic import Statistic
+from .limits import ConnectionBudget, RateLimiter
+from .buffers import BufferPool
+from .banlist import BanList
+from .peerregistry import PeerRegistry
+from .peer import Peer, PeerNotConnected, RequestRejected, allowed_fast_set
+from .pex import PeerExchange
+from .magnet import MetadataServer
+from .webseed import WebSeed
+from .superseed import SuperSeeder
 
 if typing.TYPE_CHECKING:
+    import aiohttp
     import peer
+    import dht
+    import utp
+
+
+MAX_BLOCK_TIMEOUTS = 3  # після стількох тайм-аутів поспіль блоки піра запитуються в інших
+
+
+class PieceSkipped(Exception):
+    pass
 
 
 class LoadManager:
     """Відповідає за завантаження та відвантаження контенту торенту.
     Стежить за підключенням до пірів, їх обслоговуванням."""
     def __init__(self, torrent: TorrentFile, destination: str, peer_id: bytes, max_connections: int = 10,
-                 log_func: typing.Callable[[str], None] = None, peer_connect_timeout=10, piece_receive_timeout=5):
+                 log_func: typing.Callable[[str], None] = None, peer_connect_timeout=10, piece_receive_timeout=5,
+                 connection_budget: 'ConnectionBudget | None' = None,
+                 upload_limiter: 'RateLimiter | None' = None, download_limiter: 'RateLimiter | None' = None,
+                 disk_executor: concurrent.futures.Executor | None = None, idle_period: float = 0.05,
+                 listen_port: int = 10101, pex_interval: float = 60, dht: 'dht.DHTNode | None' = None,
+                 utp_socket: 'utp.UTPSocket | None' = None, file_priorities: dict[int, int] | None = None,
+                 ban_list: BanList | None = None, http_session: 'aiohttp.ClientSession | None' = None,
+                 web_seed_connections: int = 4, super_seed: bool = False):
         self._info_hash = torrent.infoHash
         self._piece_len = torrent.piece_length
         self._pieces = torrent.pieces
+        self._pieces_count = torrent.pieces_count
+        self._merkle = torrent.merkle
         self._length = torrent.length
         self._peer_id = peer_id
 
@@ -28,58 +61,128 @@ class LoadManager:
         self._piece_receive_timeout = piece_receive_timeout
         self._connection_supporter: asyncio.Task | None = None
         self._interesting_supporter: asyncio.Task | None = None
-
-        self.filesmanager = FilesManager.open(destination, torrent.files, self._piece_len, torrent.pieces)
-        self._peers: ['peer.Peer'] = list()
-
-        self._connected_peers: list['peer.Peer'] = list()
-        self._interesting_peers: list['peer.Peer'] = list()
+        self._connection_budget = connection_budget if connection_budget else ConnectionBudget(max_connections)
+        self._upload_limiter = upload_limiter if upload_limiter else RateLimiter()
+        self._download_limiter = download_limiter if download_limiter else RateLimiter()
+        self._bans = ban_list if ban_list else BanList(path=None)
+        self._disk_executor = disk_executor
+        self._idle_period = idle_period
+        self._listen_port = listen_port
+        self._dht = dht
+        self._dht_tasks: set[asyncio.Task] = set()
+        self._utp_socket = utp_socket
+        self._metadata = MetadataServer(torrent.info_bytes) if torrent.info_bytes else None
+        self.time_to_metadata: float | None = None
+
+        priorities = [(file_priorities or dict()).get(i, PRIORITY_NORMAL) for i in range(len(torrent.files))]
+        self.filesmanager = FilesManager.open(destination, torrent.files, self._piece_len, torrent.pieces,
+                                              priorities=priorities, partfile=f".{self._info_hash.hex()}.parts",
+                                              padding=torrent.padding_files,
+                                              verify=self._merkle.verify if self._merkle else None)
+        self._registry = PeerRegistry()
         self._listhening_tasks: dict['peer.Peer', asyncio.Task] = dict()
+        self._seen_peers: dict[tuple[str, int], tuple[float, float]] = dict()
 
         self._queue_pieces = queue.PriorityQueue(len(self.filesmanager.bitfield))
+        self._pieces_changed = asyncio.Event()  # у черзі з'явились куски або кусок завантажено
+        self._peers_changed = asyncio.Event()  # змінились куски чи choke якогось піра
         self._requested_task_per_peer: dict['peer.Peer', asyncio.Task] = dict()
-        self._requested_peers_per_num: dict[int, list['peer.Peer']] = dict()
+        self._writing_pieces: set[int] = set()
+        self._partial_pieces: dict[int, tuple[bytearray, dict[int, 'peer.Peer']]] = dict()
+        # куски, що не пройшли перевірку з блоками від кількох пірів: зсув -> (sha1 блоку, ip піра)
+        self._suspect_pieces: dict[int, dict[int, tuple[bytes, str]]] = dict()
+        self._leaf_hashes: dict[int, list[bytes]] = dict()  # v2: перевірені листки кусків, що не пройшли перевірку
+        self._hash_tasks: set[asyncio.Task] = set()
+        self._buffers = BufferPool(max_idle=max(2 * max_connections, 16))
+        self._deadlines: dict[int, float] = dict()
+        self._piece_events: dict[int, asyncio.Event] = dict()
+        self.time_to_first_byte: float | None = None
 
         self.upload_queue = asyncio.Queue(1000)
+        self._cancelled_uploads: set[tuple['peer.Peer', int, int, int]] = set()
 
         self._download_work = True
         self._upload_work = True
+        self._stopped = False  # після shutdown цикли завантаження та відвантаження не запускаються
 
         self._uploaded_bytes = 0
-        self._downloaded_bytes = self.filesmanager.bitfield.count_available_blocks() * self._piece_len
+        self._downloaded_bytes = self.filesmanager.completed_bytes
+        self._requested_blocks = 0
+        self._block_timeouts = 0
+        self._block_rerequests = 0
+        self._hash_failures = 0
+        self._bad_blocks = 0
+        self._banned_peers = 0
 
         self._log_func = log_func if log_func else lambda a: a
+        self._web_seeds = [WebSeed(url, torrent.name, torrent.files, torrent.single_file, torrent.pieces_count,
+                                   self.filesmanager.segments, torrent.padding_files, http_session,
+                                   web_seed_connections, log_func=self._log_func)
+                           for url in torrent.url_list]
+        self._super_seeder: SuperSeeder | None = None
+        if super_seed and self.filesmanager.bitfield.full():
+            self._super_seeder = SuperSeeder(self._pieces_count, lambda: self._registry.connected,
+                                             log_func=self._log_func)
+        elif super_seed:
+            self._log_func("Super-seeding needs all pieces, seeding normally")
+
+        self._pex = PeerExchange(lambda: self._registry.connected, self.update_peers, self.forget_peers,
+                                 interval=pex_interval, min_interval=min(pex_interval / 2, 30), log_func=self._log_func)
+        self._pex_task: asyncio.Task | None = None
+
+    @property
+    def info_hash(self) -> bytes:
+        return self._info_hash
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    @property
+    def connected_peers(self) -> list['peer.Peer']:
+        return self._registry.connected
 
     def _run(self) -> None:
         """Запуск задачі, яка підтримує підключення до пірів"""
         self._connection_supporter = asyncio.Task(
             self._support_connected_peers(timeout_to_connect=self._peer_connect_timeout,
                                           once_to_connect=self._max_connections))
+        self._pex_task = asyncio.Task(self._pex.run())
 
     async def start_download(self) -> None:
         """Початок завантаження торенту. Якщо торент завантажено, то завершення."""
+        if self._stopped:
+            return
         if not self._connection_supporter: self._run()
-        self._interesting_supporter = asyncio.Task(self._support_interesting())
+        if not self._interesting_supporter or self._interesting_supporter.done():
+            self._interesting_supporter = asyncio.Task(self._support_interesting())
+        self._peers_changed.set()
 
         peer_iter = self._interesting_iter()
         next_block_index = None
         self._download_work = True
         self._log_func("Start downloading")
         while self._download_work:
-            if self.filesmanager.bitfield.full():
+            if self.filesmanager.complete():
                 self._download_work = False
                 break
 
-            if not next_block_index:
+            if next_block_index is None:
                 if self._queue_pieces.empty():
+                    self._pieces_changed.clear()
                     self._prioritize()
-                    await asyncio.sleep(0)
+                    if self._queue_pieces.empty():
+                        await self._pieces_changed.wait()
                     continue
-                _, next_block_index = self._queue_pieces.get()
+                *_, next_block_index = self._queue_pieces.get()
 
             for peer in peer_iter:
                 await asyncio.sleep(0)
-                if peer is None: break
+                if peer is None:
+                    self._pieces_changed.clear()
+                    if not self._registry.interesting_count:
+                        await self._pieces_changed.wait()  # цікавий пір з'явиться разом з _prioritize
+                    break
                 task = self._requested_task_per_peer.get(peer)
                 if task is not None and (task.done() or task.cancelled()):
                     try:
@@ -89,14 +192,16 @@ class LoadManager:
                     self._requested_task_per_peer.pop(peer)
                 elif task is not None:
                     break
+                if self.filesmanager.bitfield.has(next_block_index) or next_block_index in self._writing_pieces:
+                    next_block_index = None  # кусок вже отримано: він був у черзі двічі або чекав на вільного піра
+                    break
 
-                if (peer in self._requested_peers_per_num.get(next_block_index, [])
-                        or not peer.bitfield.has(next_block_index)):
+                if (self._registry.is_requesting(next_block_index, peer) or peer.ip in self._bans
+                        or not peer.bitfield.has(next_block_index)
+                        or (peer.am_choked and next_block_index not in peer.allowed_fast)):
                     continue
                 self._requested_task_per_peer[peer] = asyncio.Task(self._request_piece(peer, next_block_index))
-                self._requested_peers_per_num[next_block_index] = (
-                    self._requested_peers_per_num.get(next_block_index, list()))
-                self._requested_peers_per_num[next_block_index].append(peer)
+                self._registry.add_request(next_block_index, peer)
                 next_block_index = None
                 break
         self._download_work = False
@@ -104,205 +209,659 @@ class LoadManager:
 
     async def start_upload(self) -> None:
         """Розпочати відвантаження контенту торенту іншим підключеним пірам"""
+        if self._stopped:
+            return
         if not self._connection_supporter: self._run()
         self._log_func("Start uploading")
         while self._upload_work:
-            if self.upload_queue.empty():
-                await asyncio.sleep(0)
+            item = await self.upload_queue.get()
+            if item is None:
+                break  # shutdown
+            peer, index, begin, length = item
+            if (peer, index, begin, length,) in self._cancelled_uploads:
+                self._cancelled_uploads.discard((peer, index, begin, length,))
+                if peer.supports_fast: peer.reject(index, begin, length)
                 continue
-            peer, index, begin, length = await self.upload_queue.get()
-            if not self.filesmanager.bitfield.has(index): continue
-            data = self.filesmanager.read_piece(index)
+            if not self.filesmanager.bitfield.has(index) or not peer.connected: continue
+            started = time.perf_counter()
+            data = await self._disk(self.filesmanager.read_piece, index)
+            metrics.DISK_READ_SECONDS.observe(time.perf_counter() - started)
             data = data[begin:begin + length]
 
+            await self._upload_limiter.consume(len(data))
             self._uploaded_bytes += len(data)
             await peer.send_piece(data, index, begin)
         self._log_func("Upload is stopped")
 
     async def _request_piece(self, peer: 'peer.Peer', piece_index: int):
         """Запит у піра куска з певним індексом.
+        Кожен блок чекається не довше за RTO піра (і не довше за piece_receive_timeout). Якщо блок не прийшов,
+        він запитується ще й у іншого піра, який має кусок, а решта блоків чекається далі.
+        Пір, що MAX_BLOCK_TIMEOUTS разів поспіль не надіслав жодного блоку, втрачає свої блоки на користь інших пірів.
+        Якщо кусок так і не отримано, отримані блоки зберігаються для наступної спроби.
+        Підозрілий кусок (не пройшов перевірку з блоками від кількох пірів) завантажується повністю в одного піра.
+        Для v2 торентів після невдалої перевірки відомі листки куска, тож блоки перевіряються одразу після отримання.
+        Блоки доповнення в кінці куска не запитуються.
         Якщо один кусок запитувався в різних пірів, то перша відповідь надсилає відміну іншим.
         Після отримання шматка, йде надсилання have-повідомлень іншим пірам."""
 
         block_size = 2 ** 14
-        requested_blocks = list()
-        if piece_index == len(self.filesmanager.bitfield) - 1:
-            piece_length = self._length % self._piece_len
-        else:
-            piece_length = self._piece_len
-        jobs = list()
-        for begin in range(int(piece_length / block_size)):
-            jobs.append(asyncio.create_task(peer.request(piece_index, begin * block_size, block_size)))
-            requested_blocks.append((piece_index, begin * block_size, block_size,))
-            # await asyncio.sleep(0)
-        if not (piece_length > 0 and (piece_length & (piece_length - 1)) == 0):
-            jobs.append(asyncio.create_task(
-                peer.request(piece_index, int(piece_length / block_size) * block_size, piece_length % block_size)))
-
-        piece = b""
-
-        done, pending = await asyncio.wait(jobs, timeout=self._piece_receive_timeout, return_when=asyncio.ALL_COMPLETED)
-        if pending:
-            for bl in requested_blocks:
-                await peer.cancel_piece(*bl)
-
-            for t in itertools.chain(pending, done):
-                try: await t
-                except asyncio.CancelledError: pass
-            tmp = self._requested_peers_per_num.get(piece_index)
-            if tmp: tmp.remove(peer)
-            return False
-
-        bad = False
-        for t in jobs:
-            if t.exception() is None:
-                piece += t.result()
-            else:
-                bad = True
-        if bad:
-            return None
-        self._downloaded_bytes += len(piece)
+        piece_length = self._piece_size(piece_index)
+        payload = self.filesmanager.payload_size(piece_index)
+        blocks = {begin: min(block_size, payload - begin) for begin in range(0, payload, block_size)}
+        buffer, received = self._partial_pieces.pop(piece_index, None) or (None, dict())
+        if buffer is None or piece_index in self._suspect_pieces:
+            if buffer is not None: self._buffers.release(buffer)
+            buffer, received = self._buffers.acquire(piece_length), dict()
+            buffer[payload:] = bytes(piece_length - payload)
+        try:
+            return await self._receive_piece(peer, piece_index, blocks, buffer, received)
+        finally:
+            if self._partial_pieces.get(piece_index, (None,))[0] is not buffer:
+                self._buffers.release(buffer)
+
+    async def _receive_piece(self, peer: 'peer.Peer', piece_index: int, blocks: dict[int, int], buffer: bytearray,
+                             received: dict[int, 'peer.Peer']):
+        """Отримання блоків куска у buffer на їх зсуви, received - вже отримані блоки та піри, що їх надіслали"""
+        view = memoryview(buffer)
+        await self._download_limiter.consume(sum(length for begin, length in blocks.items() if begin not in received))
+        jobs: dict[asyncio.Task, tuple['peer.Peer', int]] = dict()
+        tried: dict[int, set['peer.Peer']] = dict()
+        timeouts: dict['peer.Peer', int] = dict()
+
+        def request(owner: 'peer.Peer', begin: int) -> None:
+            into = view[begin:begin + blocks[begin]]
+            jobs[asyncio.create_task(owner.request(piece_index, begin, blocks[begin], into))] = (owner, begin)
+            tried.setdefault(begin, set()).add(owner)
+            self._requested_blocks += 1
+            metrics.BLOCK_REQUESTS.inc()
+
+        def rerequest(begin: int) -> bool:
+            """Запит блоку в іншого піра, у якого його ще не запитували"""
+            if piece_index in self._suspect_pieces: return False
+            helper = self._helper_peer(piece_index, tried.get(begin, set()))
+            if helper is None: return False
+            request(helper, begin)
+            self._block_rerequests += 1
+            metrics.BLOCK_REREQUESTS.inc()
+            return True
+
+        for begin in blocks:
+            if begin not in received: request(peer, begin)
+
+        failed = False
+        dropped: list[asyncio.Task] = list()
+        try:
+            while jobs and len(received) < len(blocks) and not failed:
+                outstanding = collections.Counter(begin for _, begin in jobs.values())
+                # перший блок, який ще не запитано повторно
+                head_owner, head = min(jobs.values(), key=lambda job: (outstanding[job[1]] > 1, job[1]))
+                done, _ = await asyncio.wait(jobs, timeout=min(head_owner.rto, self._piece_receive_timeout),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if self.filesmanager.bitfield.has(piece_index) or piece_index in self._writing_pieces:
+                    break  # кусок отримано від іншого піра
+                if not done:
+                    head_owner.request_timed_out()
+                    self._block_timeouts += 1
+                    metrics.BLOCK_TIMEOUTS.inc()
+                    timeouts[head_owner] = timeouts.get(head_owner, 0) + 1
+                    if timeouts[head_owner] < MAX_BLOCK_TIMEOUTS:
+                        if head not in received: rerequest(head)
+                        continue
+                    # пір не відповідає: решта його блоків запитується в інших
+                    for task, (owner, begin) in list(jobs.items()):
+                        if owner is not head_owner: continue
+                        jobs.pop(task)
+                        owner.cancel_piece(piece_index, begin, blocks[begin])
+                        dropped.append(task)
+                        if not any(b == begin for _, b in jobs.values()) and not rerequest(begin):
+                            failed = True
+                    continue
 
-        del jobs
-        if not hashlib.sha1(piece).digest() == self._pieces[piece_index * 20: piece_index * 20 + 20]:
+                for task in done:
+                    owner, begin = jobs.pop(task)
+                    if task.cancelled() or task.exception() is not None:
+                        if (begin not in received and not any(b == begin for _, b in jobs.values())
+                                and not rerequest(begin)):
+                            failed = True
+                        continue
+                    timeouts[owner] = 0
+                    self._downloaded_bytes += blocks[begin]  # дубль блоку теж отримано з мережі
+                    if begin in received: continue
+                    if not self._block_valid(piece_index, begin, view[begin:begin + blocks[begin]]):
+                        self._bad_blocks += 1
+                        self._blame(owner.ip)
+                        if not any(b == begin for _, b in jobs.values()) and not rerequest(begin):
+                            failed = True
+                        continue
+                    received[begin] = owner
+                    for other, (owner2, begin2) in list(jobs.items()):
+                        if begin2 != begin: continue
+                        jobs.pop(other)
+                        owner2.cancel_piece(piece_index, begin, blocks[begin])
+                        dropped.append(other)
+        finally:
+            for task, (owner, begin) in jobs.items():
+                owner.cancel_piece(piece_index, begin, blocks[begin])
+                task.cancel()
+            await asyncio.gather(*jobs, *dropped, return_exceptions=True)
+
+        if len(received) < len(blocks):
+            stored = self._partial_pieces.get(piece_index)
+            if (received and not self.filesmanager.bitfield.has(piece_index) and piece_index not in self._suspect_pieces
+                    and (stored is None or len(stored[1]) < len(received))):
+                if stored: self._buffers.release(stored[0])
+                self._partial_pieces[piece_index] = (buffer, received)
+            self._registry.remove_request(piece_index, peer)
+            return None if failed else False
+
+        if not self._verify_piece(piece_index, buffer):
+            self._registry.remove_request(piece_index, peer)  # інакше кусок більше не запитується в цього піра
+            if not await self._locate_bad_blocks(piece_index, blocks, buffer, received):
+                self._hash_failed(piece_index, blocks, buffer, received)
             return False
+        if piece_index in self._suspect_pieces:
+            self._resolve_suspect(piece_index, blocks, buffer)
 
-        if self.filesmanager.bitfield.has(piece_index):
-            self._requested_peers_per_num.pop(piece_index)
+        if self.filesmanager.bitfield.has(piece_index) or piece_index in self._writing_pieces:
+            self._registry.pop_requests(piece_index)
             return False
 
-        self.filesmanager.bitfield.set(piece_index)
-        self.filesmanager.write_block(piece, piece_index)
+        await self._write_piece(piece_index, buffer)
         self._log_func(f"Piece {piece_index} got from {peer.ip}:{peer.port}")
-        for peer2 in self._requested_peers_per_num.pop(piece_index):
+        self._deadlines.pop(piece_index, None)
+        self._leaf_hashes.pop(piece_index, None)
+        event = self._piece_events.pop(piece_index, None)
+        if event: event.set()
+        for peer2 in self._registry.pop_requests(piece_index):
             if peer2 == peer: continue
-            [asyncio.Task(peer2.cancel_piece(*block)) for block in requested_blocks]
+            [peer2.cancel_piece(piece_index, begin, length) for begin, length in blocks.items()]
 
         self._send_haves(piece_index)
         return True
 
+    def _block_valid(self, piece_index: int, begin: int, block: memoryview) -> bool:
+        """Перевірка блоку за листком, якщо листки куска вже відомі"""
+        leaves = self._leaf_hashes.get(piece_index)
+        return leaves is None or merkle.sha256(block) == leaves[begin // merkle.BLOCK_SIZE]
+
+    async def _locate_bad_blocks(self, piece_index: int, blocks: dict[int, int], buffer: bytearray,
+                                 received: dict[int, 'peer.Peer']) -> bool:
+        """v2: зіпсовані блоки знаходяться за листками куска, невдача зараховується пірам, що їх надіслали.
+        Правильні блоки зберігаються для наступної спроби, тож повторно завантажуються лише зіпсовані.
+        Повертає False, якщо листки отримати не вдалося"""
+        leaves = await self._fetch_leaves(piece_index)
+        if leaves is None:
+            return False
+        self._hash_failures += 1
+        self._suspect_pieces.pop(piece_index, None)
+        view = memoryview(buffer)
+        for begin in [b for b in received if not self._block_valid(piece_index, b, view[b:b + blocks[b]])]:
+            self._bad_blocks += 1
+            self._blame(received.pop(begin).ip)
+        if self.filesmanager.bitfield.has(piece_index) or piece_index in self._writing_pieces:
+            return True
+        stored = self._partial_pieces.get(piece_index)
+        if stored is not None and stored[0] is not buffer:
+            self._buffers.release(stored[0])
+        self._partial_pieces[piece_index] = (buffer, received)
+        return True
+
+    async def _fetch_leaves(self, piece_index: int) -> list[bytes] | None:
+        """Листки куска від пірів з підтримкою v2, перевірені за хешем куска з piece layers"""
+        if self._merkle is None:
+            return None
+        if piece_index in self._leaf_hashes:
+            return self._leaf_hashes[piece_index]
+        tree, piece = self._merkle.piece(piece_index)
+        if tree.piece_leaves == 1:
+            leaves = [tree.piece_hash(piece)]
+        else:
+            leaves = None
+            candidates = [p for p in self._registry.connected
+                          if p.supports_v2 and p.bitfield.has(piece_index) and p.ip not in self._bans]
+            for helper in sorted(candidates, key=lambda p: p.rto):
+                try:
+                    hashes = await asyncio.wait_for(
+                        helper.request_hashes(tree.root, 0, piece * tree.piece_leaves, tree.piece_leaves),
+                        self._piece_receive_timeout)
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling(): raise
+                    continue  # пір від'єднався
+                except (asyncio.TimeoutError, RequestRejected, PeerNotConnected):
+                    continue
+                if tree.verify_leaves(piece, hashes[:tree.piece_leaves]):
+                    leaves = hashes[:tree.piece_leaves]
+                    break
+                self._blame(helper.ip)
+            if leaves is None:
+                return None
+        self._leaf_hashes[piece_index] = leaves
+        return leaves
+
+    def _hash_request(self, peer: 'peer.Peer', pieces_root: bytes, base_layer: int, index: int, length: int,
+                      proof_layers: int) -> None:
+        task = asyncio.create_task(self._send_hashes(peer, pieces_root, base_layer, index, length, proof_layers))
+        self._hash_tasks.add(task)
+        task.add_done_callback(self._hash_tasks.discard)
+
+    async def _send_hashes(self, peer: 'peer.Peer', pieces_root: bytes, base_layer: int, index: int, length: int,
+                           proof_layers: int) -> None:
+        """Відповідь на запит хешів. Рівні від рівня кусків є з piece layers, нижчі рахуються з даних куска"""
+        valid = base_layer >= 0 and index >= 0 and length > 0 and proof_layers >= 0
+        tree = self._merkle.file(pieces_root) if valid else None
+        hashes = None
+        if tree is not None:
+            leaves = None
+            piece = tree.piece_of(base_layer, index)
+            if piece is not None and piece < tree.pieces:
+                piece_index = self._merkle.first_piece(pieces_root) + piece
+                if self.filesmanager.bitfield.has(piece_index):
+                    leaves = tree.leaves(piece, await self._disk(self.filesmanager.read_piece, piece_index))
+            hashes = tree.proof(base_layer, index, length, proof_layers, leaves)
+        if hashes is None:
+            peer.reject_hashes(pieces_root, base_layer, index, length, proof_layers)
+        else:
+            peer.send_hashes(pieces_root, base_layer, index, length, proof_layers, hashes)
+
+    def _hash_failed(self, piece_index: int, blocks: dict[int, int], buffer: bytearray,
+                     received: dict[int, 'peer.Peer']) -> None:
+        """Кусок не пройшов перевірку. Якщо всі блоки надіслав один пір, невдача зараховується йому.
+        Інакше кусок стає підозрілим і запам'ятовуються хеші його блоків, щоб після завантаження
+        від одного піра знайти тих, чиї блоки відрізнялися"""
+        self._hash_failures += 1
+        ips = {owner.ip for owner in received.values()}
+        if len(ips) == 1:
+            self._blame(ips.pop())
+        elif piece_index not in self._suspect_pieces:
+            view = memoryview(buffer)
+            self._suspect_pieces[piece_index] = {
+                begin: (hashlib.sha1(view[begin:begin + length]).digest(), received[begin].ip)
+                for begin, length in blocks.items()}
+            self._log_func(f"Piece {piece_index} from {len(ips)} peers is corrupted, retrying from one peer")
+
+    def _resolve_suspect(self, piece_index: int, blocks: dict[int, int], buffer: bytearray) -> None:
+        """Підозрілий кусок пройшов перевірку: винні піри, чиї блоки не збігаються з правильними"""
+        view = memoryview(buffer)
+        suspect = self._suspect_pieces.pop(piece_index)
+        for ip in {ip for begin, (digest, ip) in suspect.items()
+                   if hashlib.sha1(view[begin:begin + blocks[begin]]).digest() != digest}:
+            self._blame(ip)
+
+    def _blame(self, ip: str) -> None:
+        """Невдача перевірки через дані піра. Після BanList.threshold невдач ip блокується,
+        з'єднання з ним закриває _support_connected_peers"""
+        banned = self._bans.hash_failed(ip)
+        self._log_func(f"Peer {ip} sent corrupted data" + (", banned" if banned else ""))
+        if banned:
+            self._banned_peers += 1
+            metrics.PEER_BANS.inc()
+
+    def _helper_peer(self, piece_index: int, exclude: set['peer.Peer']) -> 'peer.Peer | None':
+        """Пір для повторного запиту блоку: має кусок, не душить нас, найменше зайнятий та з меншим RTT"""
+        candidates = [p for p in self._registry.connected + self._web_connections()
+                      if p not in exclude and p.connected and p.bitfield.has(piece_index) and p.ip not in self._bans
+                      and (not p.am_choked or piece_index in p.allowed_fast)]
+        return min(candidates, key=lambda p: (not p.local, p.outstanding_requests, p.rto), default=None)
+
+    def _verify_piece(self, piece_index: int, piece: bytes | bytearray) -> bool:
+        """Перевірка куска за його хешем з торент-файлу: корінь Merkle піддерева куска для v2, SHA-1 для v1"""
+        started = time.perf_counter()
+        if self._merkle is not None:
+            valid = self._merkle.verify(piece_index, piece)
+        else:
+            valid = hashlib.sha1(piece).digest() == self._pieces[piece_index * 20: piece_index * 20 + 20]
+        metrics.PIECE_HASH_SECONDS.observe(time.perf_counter() - started)
+        metrics.PIECES_VERIFIED.inc(labels=("ok",) if valid else ("failed",))
+        return valid
+
+    async def _write_piece(self, piece_index: int, piece: bytes | bytearray) -> None:
+        self._writing_pieces.add(piece_index)
+        started = time.perf_counter()
+        try:
+            await self._disk(self.filesmanager.write_block, piece, piece_index)
+        finally:
+            self._writing_pieces.discard(piece_index)
+        metrics.DISK_WRITE_SECONDS.observe(time.perf_counter() - started)
+
+    def _piece_size(self, piece_index: int) -> int:
+        return self.filesmanager.piece_size(piece_index)
+
+    async def _disk(self, func: typing.Callable, *args):
+        """Виконання дискової операції у спільному пулі потоків, якщо він заданий"""
+        if self._disk_executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._disk_executor, func, *args)
+
     async def _support_interesting(self) -> None:
-        """Аналізування всіх підключених пірів в пошуку пірів, які мають цікаву інформація."""
-        tasks = list()
+        """Аналізування підключених пірів в пошуку пірів, які мають цікаву інформацію.
+        Прокидається, коли змінюється стан якогось піра (have, bitfield, choke) або завантажено кусок"""
         while True:
-            for peer in self._connected_peers:
-                if self.filesmanager.bitfield.count_missing_blocks(peer._bitfield):
+            await self._peers_changed.wait()
+            self._peers_changed.clear()
+            for peer in self._registry.connected:
+                if self.filesmanager.interesting(peer.bitfield):
                     if not peer.am_interesting:
-                        tasks.append(asyncio.Task(peer.interested()))
-                    elif peer.am_interesting and not peer.am_choked and peer not in self._interesting_peers:
-                        self._interesting_peers.append(peer)
+                        await peer.interested()
+                    if (not peer.am_choked or self._has_allowed_fast(peer)) \
+                            and not self._registry.is_interesting(peer):
+                        self._registry.set_interesting(peer, True)
                         self._prioritize()
-                else:
-                    if peer.am_interesting:
-                        tasks.append(asyncio.Task(peer.uninterested()))
-                        if peer in self._interesting_peers:  # TODO немає запитань до нього
-                            self._interesting_peers.remove(peer)
-            for peer in self._interesting_peers:
-                if not peer in self._connected_peers: self._interesting_peers.remove(peer)
-
-            for task in tasks:
-                if task.done():
-                    await task
-                    tasks.remove(task)
-            try:
-                await asyncio.sleep(0)
-                # await asyncio.sleep(1)
-                # print("INTERESTED:", self._interesting_peers)
-            except asyncio.CancelledError as e:
-                for task in tasks:
-                    task.cancel()
-                    try:
-                        await task
-                    except asyncio.CancelledError:
-                        pass
-                raise e
+                elif peer.am_interesting:
+                    await peer.uninterested()
+                    self._registry.set_interesting(peer, False)  # TODO немає запитань до нього
+
+    def _has_allowed_fast(self, peer: 'peer.Peer') -> bool:
+        """Чи є у піра потрібні куски, які він дозволив завантажувати без unchoke"""
+        return any(not self.filesmanager.bitfield.has(i) and peer.bitfield.has(i)
+                   and self.filesmanager.piece_priority(i) for i in peer.allowed_fast if i < len(self.filesmanager.bitfield))
+
+    def _web_connections(self) -> list['peer.Peer']:
+        """З'єднання HTTP дзеркал, які не заблоковані, для планувальника вони - піри з усіма кусками"""
+        return [c for seed in self._web_seeds if seed.ip not in self._bans for c in seed.connections]
 
     def _interesting_iter(self) -> typing.Iterable[typing.Union['peer.Peer', None]]:
-        """Циклічний ітератор по пірам, в яких зацікавлені у завантажені"""
+        """Циклічний ітератор по пірам, в яких зацікавлені у завантажені, та з'єднанням HTTP дзеркал.
+        Піри з локальної мережі в кожному колі йдуть першими"""
         while True:
-            if not self._interesting_peers: yield None
-            for p in self._interesting_peers:
+            interesting = sorted(self._registry.interesting, key=lambda p: not p.local) + self._web_connections()
+            if not interesting: yield None
+            for p in interesting:
                 yield p
 
     def _prioritize(self) -> None:
-        """Створення пріоритезованої черги кусків. Найбільш рідкісний кусок перший в черзі"""
+        """Створення пріоритезованої черги кусків. Першими йдуть куски з дедлайнами потокового читання
+        (найближчий дедлайн перший), далі за пріоритетом файлів, в межах пріоритету - запропоновані пірами,
+        далі найбільш рідкісні. Куски лише пропущених файлів не завантажуються"""
         self._queue_pieces = queue.PriorityQueue(len(self.filesmanager.bitfield))
-        counter = [[0, i] for i in range(len(self.filesmanager.bitfield))]
-        for ip in self._interesting_peers:
+        web_seeds = sum(seed.ip not in self._bans for seed in self._web_seeds)
+        counter = [[web_seeds, i] for i in range(len(self.filesmanager.bitfield))]
+        interesting = self._registry.interesting
+        for ip in interesting:
             for _, i in counter:
                 counter[i][0] += 1 if ip.bitfield.has(i) else 0
-        [self._queue_pieces.put(tuple(b)) for b in counter
-         if b[0] != 0 and not self.filesmanager.bitfield.has(b[1])]
+        suggested = set(itertools.chain.from_iterable(ip.suggested for ip in interesting))
+        for count, i in counter:
+            if count == 0 or self.filesmanager.bitfield.has(i):
+                continue
+            priority = self.filesmanager.piece_priority(i)
+            if i in self._deadlines:
+                self._queue_pieces.put((0, self._deadlines[i], i))
+            elif priority:
+                self._queue_pieces.put((1 + PRIORITY_HIGH - priority, 0 if i in suggested else count, i))
+        if not self._queue_pieces.empty():
+            self._pieces_changed.set()
+
+    def set_stream_position(self, offset: int, rate: float, window: float = 10, end: int | None = None) -> None:
+        """Позиція читання споживача в байтах від початку торенту. Кускам до end, які знадобляться протягом
+        window секунд при швидкості читання rate байт/с, призначаються дедлайни, і вони завантажуються першими.
+        Решта кусків завантажується як і раніше, від рідкісних"""
+        now = time.time()
+        end = self._length if end is None else min(end, self._length)
+        first = max(offset, 0) // self._piece_len
+        last = (min(int(offset + rate * window), end) - 1) // self._piece_len
+        deadlines = {i: now + max(i * self._piece_len - offset, 0) / rate for i in range(first, last + 1)
+                     if not self.filesmanager.bitfield.has(i)}
+        changed = deadlines.keys() != self._deadlines.keys()
+        self._deadlines = deadlines
+        if changed:  # порядок кусків у вікні від зсуву дедлайнів не змінюється
+            self._prioritize()
+
+    def set_file_priorities(self, file_priorities: dict[int, int]) -> bool:
+        """Зміна пріоритетів файлів за їх номерами. Повертає True, якщо треба знову запустити завантаження"""
+        priorities = self.filesmanager.priorities
+        for i, priority in file_priorities.items():
+            priorities[i] = priority
+        self.filesmanager.set_priorities(priorities)
+        self._prioritize()
+        self._peers_changed.set()
+        for index, event in list(self._piece_events.items()):
+            if self.filesmanager.piece_priority(index) == PRIORITY_SKIP:
+                event.set()  # кусок більше не завантажуватиметься, wait_piece завершується помилкою
+        return not self._download_work and not self.filesmanager.complete()
+
+    def clear_stream_position(self) -> None:
+        self._deadlines = dict()
+        self._prioritize()
+
+    async def wait_piece(self, index: int) -> None:
+        """Очікування, поки кусок буде завантажено, перевірено та записано.
+        Куски лише пропущених файлів не завантажуються, для них - PieceSkipped"""
+        while not self.filesmanager.bitfield.has(index):
+            if self.filesmanager.piece_priority(index) == PRIORITY_SKIP:
+                raise PieceSkipped(f"Piece {index} belongs only to skipped files")
+            event = self._piece_events.setdefault(index, asyncio.Event())
+            await event.wait()
+            if self._piece_events.get(index) is event and event.is_set():
+                self._piece_events.pop(index)
+
+    async def read(self, offset: int, length: int) -> bytes:
+        """Читання діапазону байтів торенту. Чекає, поки всі куски діапазону будуть перевірені"""
+        length = min(length, self._length - offset)
+        if length <= 0:
+            return b""
+        result = list()
+        for index in range(offset // self._piece_len, (offset + length - 1) // self._piece_len + 1):
+            await self.wait_piece(index)
+            data = await self._disk(self.filesmanager.read_piece, index)
+            start = max(offset - index * self._piece_len, 0)
+            result.append(data[start:offset + length - index * self._piece_len])
+        return b"".join(result)
 
     async def _connect_peer(self, peer: 'peer.Peer', timeout: int = 10):
-        k = await peer.connect(self._info_hash, int(len(self._pieces) / 20), self._peer_id, timeout=timeout)
-        if k:
-            self._connected_peers.append(peer)
-            self._listhening_tasks[peer] = asyncio.Task(peer.listen())
-            self._log_func(f"Peer {peer.ip}:{peer.port} connected")
-            if not self.filesmanager.bitfield.empty():
-                if self.filesmanager.bitfield.count_missing_blocks(peer.bitfield) == 0:
-                    await peer.send_bitfield(self.filesmanager.bitfield)
-            await peer.unchoke()
-            peer.reg_data_taker(self._upload_request)
+        """Спершу з'єднання через uTP (якщо увімкнено), якщо пір не відповідає - через TCP.
+        Пір, що вже не відповів через uTP, одразу з'єднується через TCP"""
+        k = False
+        if self._utp_socket and self._utp_socket.reachable(peer.ip, peer.port):
+            k = await peer.connect(self._info_hash, self._pieces_count, self._peer_id,
+                                   timeout=min(timeout, 3), dht=self._dht is not None,
+                                   opener=self._utp_socket.open_connection, v2=self._merkle is not None,
+                                   piece_length=self._piece_len, length=self._length)
+        if not k:
+            k = await peer.connect(self._info_hash, self._pieces_count, self._peer_id, timeout=timeout,
+                                   dht=self._dht is not None, v2=self._merkle is not None,
+                                   piece_length=self._piece_len, length=self._length)
+        metrics.PEER_CONNECTS.inc(labels=("outgoing", "ok" if k else "failed"))
+        if k and not await self._drop_duplicate(peer):
+            await self._on_peer_connected(peer)
+        elif k:
+            await peer.disconnect()
 
         return peer
 
+    async def accept_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                          peer_id: bytes, reserved: bytes = bytes(8)) -> bool:
+        """Прийняття вхідного з'єднання, handshake якого вже прочитано"""
+        ip, port = writer.get_extra_info("peername")[:2]
+        if ip in self._bans:
+            return False
+        if self._registry.connected_count >= self._max_connections or not self._connection_budget.acquire():
+            return False
+        peer = Peer(ip, port, peer_id)
+        if not await peer.accept(reader, writer, self._info_hash, self._pieces_count, self._peer_id,
+                                 reserved, dht=self._dht is not None, v2=self._merkle is not None,
+                                 piece_length=self._piece_len, length=self._length):
+            metrics.PEER_CONNECTS.inc(labels=("incoming", "failed"))
+            self._connection_budget.release()
+            return False
+        metrics.PEER_CONNECTS.inc(labels=("incoming", "ok"))
+        if await self._drop_duplicate(peer):
+            await peer.disconnect()
+            self._connection_budget.release()
+            return False
+        await self._on_peer_connected(peer)
+        return True
+
+    async def _drop_duplicate(self, peer: 'peer.Peer') -> bool:
+        """Перевірка, чи є вже з'єднання з тим самим peer id. Якщо обидві сторони з'єдналися одночасно,
+        залишається з'єднання, ініційоване стороною з меншим peer id. Повертає True, якщо треба відкинути нове."""
+        if peer.id == self._peer_id:
+            return True
+        existing = self._registry.by_id(peer.id)
+        if existing is None or not existing.connected:
+            return False
+        initiator = lambda p: p.id if p.incoming else self._peer_id
+        if initiator(peer) < initiator(existing):
+            await existing.disconnect()
+            return False
+        return True
+
+    async def _on_peer_connected(self, peer: 'peer.Peer') -> None:
+        if not peer.incoming: self._seen_peers[(peer.ip, peer.port)] = (time.time(), 0.)
+        self._registry.attach(peer)
+        self._listhening_tasks[peer] = asyncio.Task(peer.listen())
+        self._log_func(f"Peer {peer.ip}:{peer.port} connected")
+        peer.reg_data_taker(self._upload_request)
+        peer.reg_cancel_taker(self._upload_cancel)
+        peer.reg_state_taker(self._peer_state_changed)
+        self._peers_changed.set()
+        if self._merkle:
+            peer.reg_hash_request_taker(self._hash_request)
+        self._pex.attach(peer)
+        if peer.supports_dht:
+            peer.reg_port_taker(self._dht_node_found)
+            await peer.send_port(self._dht.port)
+        if self._metadata:
+            self._metadata.attach(peer)
+        if peer.supports_extensions:
+            fields = dict(p=self._listen_port, reqq=self.upload_queue.maxsize)
+            if self._metadata: fields["metadata_size"] = self._metadata.size
+            await peer.send_extension_handshake(**fields)
+        if self._super_seeder and self._super_seeder.active:
+            if peer.supports_fast: await peer.have_none()
+            self._super_seeder.attach(peer)  # куски оголошуються по одному
+        elif peer.supports_fast and self.filesmanager.bitfield.full():
+            await peer.have_all()
+        elif peer.supports_fast and self.filesmanager.bitfield.empty():
+            await peer.have_none()
+        elif not self.filesmanager.bitfield.empty():
+            if self.filesmanager.bitfield.count_missing_blocks(peer.bitfield) == 0:
+                await peer.send_bitfield(self.filesmanager.bitfield)
+        if peer.supports_fast and not (self._super_seeder and self._super_seeder.active):
+            for index in allowed_fast_set(self._info_hash, peer.ip, len(self.filesmanager.bitfield)):
+                if self.filesmanager.bitfield.has(index): await peer.send_allowed_fast(index)
+        await peer.unchoke()
+
+    def _peer_state_changed(self, peer: 'peer.Peer') -> None:
+        self._peers_changed.set()
+
+    def _dht_node_found(self, peer: 'peer.Peer', port: int) -> None:
+        """Пір повідомив порт свого DHT вузла"""
+        task = asyncio.create_task(self._dht.add_node(peer.ip, port))
+        self._dht_tasks.add(task)
+        task.add_done_callback(self._dht_tasks.discard)
+
     async def _disconnect_peer(self, peer: 'peer.Peer') -> None:
+        metrics.PEER_DISCONNECTS.inc()
+        if not peer.incoming: self._seen_peers[(peer.ip, peer.port)] = (time.time(), peer.rate)
+        self._connection_budget.release()
+        self._pex.detach(peer)
+        if self._super_seeder: self._super_seeder.detach(peer)
         if not peer.connected: await peer.disconnect()
         task = self._listhening_tasks.get(peer)
         if not (task is None):
             task.cancel()
             try:
                 await task
-            except asyncio.CancelledError:
+            except (asyncio.CancelledError, PeerNotConnected):  # з'єднання могло закритись до початку listen
                 pass
             self._listhening_tasks.pop(peer)
-        for l in self._requested_peers_per_num.values():
-            if peer in l:
-                l.remove(peer)
-
-        # print("PEER DISCONECTED", self._requested_peers_per_num)
+        self._registry.detach(peer)
         self._log_func(f"Peer {peer.ip}:{peer.port} disconnected")
 
     async def _support_connected_peers(self, timeout_to_connect: int = 10, once_to_connect=2) -> None:
         while True:
-            disconected_peers = list(filter(lambda p: not p.connected, self._connected_peers))
-            self._connected_peers = list(
-                filter(lambda p: p not in disconected_peers, self._connected_peers))  # remove disconnected
-
-            for dp in disconected_peers:
+            for dp in [p for p in self._registry.connected if not p.connected or p.ip in self._bans]:
+                if dp.connected: await dp.disconnect()  # заблокований пір
                 await self._disconnect_peer(dp)
-
-            if len(self._connected_peers) < len(self._peers) and len(self._connected_peers) < self._max_connections:
-                unconnected = list(filter(lambda a: not a.connected, self._peers))
-                # try_to_connect = unconnected[0:self._max_connections-len(self._connected_peers)]
-                try_to_connect = unconnected[0:once_to_connect]
-                try_to_connect = [asyncio.Task(self._connect_peer(p, timeout_to_connect)) for p in try_to_connect]
-
-                done, _ = await asyncio.wait(try_to_connect, return_when=asyncio.ALL_COMPLETED)
-                tried_connected = [await p for p in done]
-                # self._peers.append(p)
-                [(self._peers.remove(p)) for p in tried_connected if not p.connected]
-            # print(len(self._peers), len(self._connected_peers))
-            await asyncio.sleep(0)
-
-    def update_peers(self, peers: typing.Sequence['peer.Peer']):
-        new_peers = list(filter(lambda a: a not in self._peers, peers))
-        self._peers.extend(new_peers)
+            while self._connection_budget.excess and self._registry.connected_count:
+                # ліміт сесії зменшено (перерозподіл між процесами), першими закриваються найповільніші з'єднання
+                slowest = min(self._registry.connected, key=lambda p: p.rate)
+                self._log_func(f"Peer {slowest.ip}:{slowest.port} is disconnected to fit connection limit")
+                await slowest.disconnect()
+                await self._disconnect_peer(slowest)
+
+            connected = self._registry.connected_count
+            if connected >= self._max_connections and self._registry.idle_local_count:
+                # місце для піра з локальної мережі звільняє найповільніший віддалений пір
+                remote = [p for p in self._registry.connected if not p.local]
+                if remote:
+                    slowest = min(remote, key=lambda p: p.rate)
+                    self._log_func(f"Peer {slowest.ip}:{slowest.port} is replaced by a local peer")
+                    await slowest.disconnect()
+                    await self._disconnect_peer(slowest)
+                    connected -= 1
+            if self._registry.idle_count and connected < self._max_connections:
+                allowed = self._connection_budget.acquire(
+                    min(once_to_connect, self._max_connections - connected, self._registry.idle_count))
+                records = self._registry.take(allowed)
+                for record in [r for r in records if r.ip in self._bans]:
+                    self._registry.failed(record.address)
+                    self._connection_budget.release()
+                peers_to_connect = [Peer(record.ip, record.port) for record in records if record.ip not in self._bans]
+                try_to_connect = [asyncio.Task(self._connect_peer(p, timeout_to_connect)) for p in peers_to_connect]
+
+                if try_to_connect:
+                    results = await asyncio.gather(*try_to_connect, return_exceptions=True)
+                    for p, result in zip(peers_to_connect, results):
+                        if isinstance(result, Exception):  # помилка одного піра не зупиняє підтримку з'єднань
+                            self._log_func(f"Peer {p.ip}:{p.port} connection failed: {result!r}")
+                    failed = [p for p in peers_to_connect if not p.connected]
+                    for p in failed:
+                        self._registry.failed((p.ip, p.port))
+                    self._connection_budget.release(len(failed))
+            await asyncio.sleep(self._idle_period)
+
+    def update_peers(self, peers: typing.Sequence['peer.Peer'], local: bool = False):
+        """Додавання адрес пірів від трекерів, DHT, PEX, LSD та кешу. Зберігаються лише адреси, заблоковані пропускаються.
+        local - піри з локальної мережі: з ними з'єднання встановлюються першими і в них першими запитуються куски"""
+        self._registry.add(((p.ip, p.port) for p in peers if p.ip not in self._bans), local=local)
+
+    def forget_peers(self, peers: typing.Sequence['peer.Peer']):
+        """Видалення непідключених пірів зі списку відомих"""
+        self._registry.forget((p.ip, p.port) for p in peers)
+
+    def known_good_peers(self) -> list[tuple[str, int, float, float]]:
+        """Піри, з якими було з'єднання, у вигляді (ip, port, last_seen, rate)"""
+        for peer in self._registry.connected:
+            if not peer.incoming: self._seen_peers[(peer.ip, peer.port)] = (time.time(), peer.rate)
+        return [(ip, port, last_seen, rate) for (ip, port), (last_seen, rate) in self._seen_peers.items()]
 
     def _upload_request(self, peer: 'peer.Peer', index: int, begin: int, lenght: int):
-        if self.upload_queue.full(): return
+        if self.upload_queue.full() or not self._upload_work or not self.filesmanager.bitfield.has(index) \
+                or self._super_seeder and not self._super_seeder.allowed(peer, index):
+            if peer.supports_fast: peer.reject(index, begin, lenght)
+            return
+        self._cancelled_uploads.discard((peer, index, begin, lenght,))
         self.upload_queue.put_nowait((peer, index, begin, lenght,))
 
+    def _upload_cancel(self, peer: 'peer.Peer', index: int, begin: int, lenght: int):
+        """Пір відмовився від запиту, який ще в черзі на відвантаження"""
+        self._cancelled_uploads.add((peer, index, begin, lenght,))
+
     def _send_haves(self, index: int) -> None:
-        for peer in self._connected_peers:
-            if peer.bitfield.has(index): continue
-            asyncio.Task(peer.have(index))
+        """have ставиться в черги надсилання пірів без окремих задач, надлишкові have відкидає сам пір"""
+        for peer in self._registry.connected:
+            peer.have(index)
+        self._peers_changed.set()  # піри, в яких більше нічого брати, стають нецікавими
+        self._pieces_changed.set()
 
     async def shutdown(self) -> None:
+        self._stopped = True
         self._download_work = False
         self._upload_work = False
+        self._pieces_changed.set()
+        while not self.upload_queue.empty():  # запити в черзі вже не будуть обслужені
+            self.upload_queue.get_nowait()
+        self.upload_queue.put_nowait(None)
+        await asyncio.gather(*[seed.close() for seed in self._web_seeds])
+        if self._pex_task:
+            self._pex_task.cancel()
+            try:
+                await self._pex_task
+            except asyncio.CancelledError:
+                pass
+            self._pex_task = None
         if self._interesting_supporter:
             self._interesting_supporter.cancel()
             try:
@@ -323,20 +882,30 @@ class LoadManager:
             for task in self._listhening_tasks.values():
                 try:
                     await task
-                except asyncio.CancelledError:
+                except (asyncio.CancelledError, PeerNotConnected):
                     pass
 
-            await asyncio.gather(*[cp.disconnect() for cp in self._connected_peers])
+            connected = self._registry.connected
+            await asyncio.gather(*[cp.disconnect() for cp in connected])
+            self._connection_budget.release(len(connected))
+            for cp in connected:
+                self._registry.detach(cp)
 
     def get_stat(self) -> Statistic:
         uploaded = self._uploaded_bytes
         downloaded = self._downloaded_bytes
-        left = self._length - self._piece_len * self.filesmanager.bitfield.count_available_blocks() \
-            if not self.filesmanager.bitfield.full() else 0
-        connected = len(self._connected_peers)
-        interesting = len(self._interesting_peers)
-        peers_count = len(self._peers)
+        left = self.filesmanager.left()
+        connected = self._registry.connected_count
+        interesting = self._registry.interesting_count
+        peers_count = len(self._registry)
         length = self._length
         return Statistic(uploaded=uploaded, downloaded=downloaded, left=left, connected=connected,
-                         interesting=interesting, length=length, peers_count=peers_count)
+                         interesting=interesting, length=length, peers_count=peers_count,
+                         time_to_metadata=self.time_to_metadata, time_to_first_byte=self.time_to_first_byte,
+                         completed_pieces=self.filesmanager.completed, pieces_count=len(self.filesmanager.bitfield),
+                         requested_blocks=self._requested_blocks, block_timeouts=self._block_timeouts,
+                         block_rerequests=self._block_rerequests, hash_failures=self._hash_failures,
+                         banned_peers=self._banned_peers, bad_blocks=self._bad_blocks,
+                         web_seed_bytes=sum(seed.downloaded for seed in self._web_seeds),
+                         local_peers=self._registry.local_count)
 
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import socket
+import time
+import typing
+
+from .peer import Peer
+
+LSD_GROUP = "239.192.152.143"
+LSD_PORT = 6771
+MAX_MESSAGE = 1400  # щоб оголошення вміщалось в один кадр
+MIN_INTERVAL = 60.  # торент оголошується не частіше разу на хвилину (BEP 14)
+
+
+def build_message(group: str, lsd_port: int, port: int, info_hashes: typing.Sequence[bytes], cookie: str) -> bytes:
+    lines = ["BT-SEARCH * HTTP/1.1", f"Host: {group}:{lsd_port}", f"Port: {port}"]
+    lines += [f"Infohash: {info_hash.hex()}" for info_hash in info_hashes]
+    lines.append(f"cookie: {cookie}")
+    return ("\r\n".join(lines) + "\r\n\r\n\r\n").encode()
+
+
+def parse_message(data: bytes) -> tuple[int, list[bytes], str | None] | None:
+    """Порт, info hash-і та cookie з оголошення, None - не оголошення BEP 14"""
+    try:
+        lines = data.decode("ascii").split("\r\n")
+    except UnicodeDecodeError:
+        return None
+    if not lines or not lines[0].startswith("BT-SEARCH * HTTP/"):
+        return None
+    port, info_hashes, cookie = None, list(), None
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        name, value = name.strip().lower(), value.strip()
+        if name == "port" and value.isdigit():
+            port = int(value)
+        elif name == "infohash" and len(value) == 40:
+            try:
+                info_hashes.append(bytes.fromhex(value))
+            except ValueError:
+                pass
+        elif name == "cookie":
+            cookie = value
+    if port is None or not 0 < port < 65536 or not info_hashes:
+        return None
+    return port, info_hashes, cookie
+
+
+class LocalDiscovery(asyncio.DatagramProtocol):
+    """Пошук пірів у локальній мережі (Local Service Discovery, BEP 14). Торенти сесії оголошуються
+    UDP повідомленнями на multicast групу раз на interval, оголошення інших хостів передаються
+    зареєстрованим callback-ам торентів. Почувши оголошення свого торенту, вузол відповідає власним
+    (не частіше MIN_INTERVAL), тож новий хост одразу дізнається про інших. Свої повідомлення
+    відкидаються за cookie, тож кілька сесій можуть працювати на одному хості (та на loopback для тестів)"""
+    def __init__(self, interface: str = "0.0.0.0", group: str = LSD_GROUP, lsd_port: int = LSD_PORT,
+                 interval: float = 5 * 60, ttl: int = 1, log_func: typing.Callable[[str], None] | None = None):
+        self._interface = interface
+        self._group = group
+        self._lsd_port = lsd_port
+        self._interval = interval
+        self._ttl = ttl
+        self._port = 0
+        self._cookie = os.urandom(8).hex()
+        self._transport: asyncio.DatagramTransport | None = None
+        self._torrents: dict[bytes, typing.Callable[[typing.Sequence[Peer]], None]] = dict()
+        self._announced: dict[bytes, float] = dict()  # info hash -> час останнього оголошення
+        self._replied: dict[bytes, float] = dict()  # info hash -> час останньої відповіді на чуже оголошення
+        self._task: asyncio.Task | None = None
+        self._log_func = log_func if log_func else lambda a: a
+
+    async def start(self, port: int) -> None:
+        """port - порт вхідних з'єднань сесії, який оголошується"""
+        self._port = port
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: self, sock=self._socket())
+        self._task = asyncio.create_task(self._run())
+
+    def _socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("", self._lsd_port))
+        interface = socket.inet_aton(self._interface)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(self._group) + interface)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, interface)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self._ttl)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sock.setblocking(False)
+        return sock
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+    def add(self, info_hash: bytes, clb: typing.Callable[[typing.Sequence[Peer]], None]) -> None:
+        """Торент оголошується при наступній перевірці, clb отримує знайдених у мережі пірів"""
+        self._torrents[info_hash] = clb
+
+    def remove(self, info_hash: bytes) -> None:
+        self._torrents.pop(info_hash, None)
+        self._announced.pop(info_hash, None)
+        self._replied.pop(info_hash, None)
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            due = [h for h in self._torrents if now - self._announced.get(h, -self._interval) >= self._interval]
+            self.announce(due)
+            await asyncio.sleep(1)
+
+    def announce(self, info_hashes: typing.Sequence[bytes]) -> None:
+        """Оголошення торентів, кілька info hash-ів в одному повідомленні"""
+        if not self._transport or not info_hashes:
+            return
+        now = time.monotonic()
+        batch: list[bytes] = list()
+        for info_hash in info_hashes:
+            self._announced[info_hash] = now
+            if batch and len(build_message(self._group, self._lsd_port, self._port, batch + [info_hash],
+                                           self._cookie)) > MAX_MESSAGE:
+                self._send(batch)
+                batch = list()
+            batch.append(info_hash)
+        self._send(batch)
+
+    def _send(self, info_hashes: list[bytes]) -> None:
+        if not info_hashes: return
+        message = build_message(self._group, self._lsd_port, self._port, info_hashes, self._cookie)
+        try:
+            self._transport.sendto(message, (self._group, self._lsd_port))
+        except OSError as e:
+            self._log_func(f"LSD announce failed: {e}")
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        parsed = parse_message(data)
+        if parsed is None:
+            return
+        port, info_hashes, cookie = parsed
+        if cookie == self._cookie:
+            return
+        now = time.monotonic()
+        reply = list()
+        for info_hash in info_hashes:
+            clb = self._torrents.get(info_hash)
+            if clb is None: continue
+            clb([Peer(addr[0], port)])
+            if now - self._replied.get(info_hash, -MIN_INTERVAL) >= MIN_INTERVAL:
+                self._replied[info_hash] = now
+                reply.append(info_hash)
+        self.announce(reply)
+
+    def error_received(self, exc: Exception) -> None:
+        self._log_func(f"LSD socket error: {exc}")
@@ -0,0 +1,298 @@
+import asyncio
+import base64
+import dataclasses
+import hashlib
+import math
+import time
+import typing
+import urllib.parse
+
+from .bencoder import BenCoder
+from .peer import Peer
+from .statistic import Statistic
+
+if typing.TYPE_CHECKING:
+    import peer
+
+
+METADATA_PIECE = 16384
+MAX_METADATA_SIZE = 1 << 24
+LEFT_UNKNOWN = METADATA_PIECE  # поки метаданих немає, трекерам повідомляється ненульовий left
+
+
+class BadMagnetLink(Exception):
+    pass
+
+
+class MetadataRejected(Exception):
+    pass
+
+
+@dataclasses.dataclass()
+class Magnet:
+    """Розібране magnet посилання. Має ті ж поля, що й TorrentFile, які потрібні TrackerManager"""
+    info_hash: bytes
+    name: str | None = None
+    trackers: list[str] = dataclasses.field(default_factory=list)
+    peers: list[Peer] = dataclasses.field(default_factory=list)
+
+    @property
+    def infoHash(self) -> bytes:
+        return self.info_hash
+
+    @property
+    def announce(self) -> str | None:
+        return self.trackers[0] if self.trackers else None
+
+    @property
+    def announce_list(self) -> list[list[str]]:
+        return [[tracker] for tracker in self.trackers]
+
+    @classmethod
+    def parse(cls, uri: str) -> typing.Self:
+        parsed = urllib.parse.urlsplit(uri)
+        if parsed.scheme != "magnet":
+            raise BadMagnetLink("It is not magnet link")
+        query = urllib.parse.parse_qs(parsed.query)
+        info_hash = None
+        for xt in query.get("xt", list()):
+            if not xt.startswith("urn:btih:"): continue
+            value = xt.removeprefix("urn:btih:")
+            try:
+                if len(value) == 40: info_hash = bytes.fromhex(value)
+                elif len(value) == 32: info_hash = base64.b32decode(value.upper())
+            except ValueError:
+                continue
+        if info_hash is None:
+            raise BadMagnetLink("Magnet link has no BitTorrent info hash")
+        peers = list()
+        for address in query.get("x.pe", list()):
+            host, _, port = address.rpartition(":")
+            if host and port.isdigit(): peers.append(Peer(host.strip("[]"), int(port)))
+        return cls(info_hash=info_hash, name=query.get("dn", [None])[0], trackers=query.get("tr", list()),
+                   peers=peers)
+
+
+class MetadataFetcher:
+    """Отримання info словника за magnet посиланням через ut_metadata (BEP 9).
+    Кожен пір завантажує ще не отриманий шматок метаданих по 16 KiB, тож різні шматки йдуть від різних пірів
+    паралельно. Коли всі шматки отримані, метадані перевіряються за info hash.
+    Розмір метаданих задає перший пір, піри з іншим розміром відкладаються і повертаються в кандидати,
+    коли не залишиться жодного піра, що віддає поточний розмір."""
+    def __init__(self, magnet: Magnet, peer_id: bytes, max_connections: int = 20, listen_port: int = 10101,
+                 peer_connect_timeout: int = 10, request_timeout: float = 10, dht: bool = False,
+                 log_func: typing.Callable[[str], None] | None = None):
+        self._info_hash = magnet.info_hash
+        self._peer_id = peer_id
+        self._max_connections = max_connections
+        self._listen_port = listen_port
+        self._peer_connect_timeout = peer_connect_timeout
+        self._request_timeout = request_timeout
+        self._dht = dht
+
+        self._known: dict[tuple[str, int], Peer] = dict()
+        self._candidates: list[Peer] = list()
+        self._connected: set['peer.Peer'] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+
+        self._size: int | None = None
+        self._serving: dict[int, int] = dict()  # розмір метаданих -> кількість пірів, що його віддають
+        self._parked: list[Peer] = list()  # піри з іншим розміром, чекають, поки піри з self._size не зникнуть
+        self._pieces: dict[int, bytes] = dict()
+        self._requested: dict[int, int] = dict()
+        self._waiters: dict[tuple['peer.Peer', int], asyncio.Future] = dict()
+        self._sources: dict[int, str] = dict()  # ip піра, від якого отримано шматок
+        self._banned: set[str] = set()  # піри, чиї шматки не пройшли перевірку за info hash
+        self._result: asyncio.Future | None = None
+        self._started = 0.
+        self.time_to_metadata: float | None = None
+
+        self._log_func = log_func if log_func else lambda a: a
+        self.update_peers(magnet.peers)
+
+    @property
+    def peers(self) -> list[Peer]:
+        """Всі відомі піри, передаються LoadManager після отримання метаданих"""
+        return [Peer(ip, port) for ip, port in self._known]
+
+    def update_peers(self, peers: typing.Sequence[Peer]) -> None:
+        for p in peers:
+            if p is None or (p.ip, p.port) in self._known or p.ip in self._banned: continue
+            self._known[(p.ip, p.port)] = p
+            self._candidates.append(p)
+        self._wakeup.set()
+
+    def get_stat(self) -> Statistic:
+        return Statistic(uploaded=0, downloaded=0, left=LEFT_UNKNOWN, peers_count=len(self._known),
+                         connected=len(self._connected), interesting=0, length=0)
+
+    async def fetch(self) -> bytes:
+        """Завантаження метаданих. Повертає закодований info словник"""
+        self._started = time.time()
+        self._result = asyncio.get_running_loop().create_future()
+        try:
+            while not self._result.done():
+                while self._candidates and len(self._tasks) < self._max_connections:
+                    task = asyncio.create_task(self._serve_peer(self._candidates.pop(0)))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._task_done)
+                self._wakeup.clear()
+                waiter = asyncio.ensure_future(self._wakeup.wait())
+                await asyncio.wait([self._result, waiter], return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+            return self._result.result()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._wakeup.set()
+
+    async def _serve_peer(self, peer: 'peer.Peer') -> None:
+        if not await peer.connect(self._info_hash, 0, self._peer_id, timeout=self._peer_connect_timeout,
+                                  dht=self._dht):
+            return
+        self._connected.add(peer)
+        handshake = asyncio.get_running_loop().create_future()
+        peer.reg_extension_handshake_taker(lambda p: handshake.done() or handshake.set_result(None))
+        peer.reg_extension_taker("ut_metadata", self._on_message)
+        listener = asyncio.create_task(peer.listen())
+        try:
+            if not peer.supports_extensions:
+                return
+            await peer.send_extension_handshake(p=self._listen_port)
+            await asyncio.wait_for(handshake, self._request_timeout)
+            size = peer.extension_handshake.get("metadata_size")
+            if "ut_metadata" not in peer.extensions or not isinstance(size, int) or \
+                    not 0 < size <= MAX_METADATA_SIZE:
+                return
+            if self._size != size and self._serving.get(self._size):
+                self._parked.append(peer)
+                return
+            if self._size != size:
+                # попередній розмір більше ніхто не віддає, отримані для нього шматки не потрібні
+                self._size = size
+                self._pieces = dict()
+                self._sources = dict()
+                self._log_func(f"Metadata size is {size} bytes")
+            self._serving[size] = self._serving.get(size, 0) + 1
+            try:
+                await self._fetch_pieces(peer, size)
+            finally:
+                self._serving[size] -= 1
+                if not self._serving[size] and not self._result.done():
+                    self._candidates += [p for p in self._parked if p.ip not in self._banned]
+                    self._parked = list()
+                    self._wakeup.set()
+        except (asyncio.TimeoutError, MetadataRejected):
+            return
+        finally:
+            listener.cancel()
+            await peer.disconnect()
+            await asyncio.gather(listener, return_exceptions=True)
+            self._connected.discard(peer)
+
+    async def _fetch_pieces(self, peer: 'peer.Peer', size: int) -> None:
+        while not self._result.done() and peer.connected and self._size == size and peer.ip not in self._banned:
+            index = self._next_piece()
+            if index is None:
+                return
+            self._requested[index] = self._requested.get(index, 0) + 1
+            try:
+                data = await self._request(peer, index)
+            finally:
+                self._requested[index] -= 1
+            if len(data) != min(METADATA_PIECE, size - index * METADATA_PIECE):
+                return  # пір надсилає шматки не того розміру, що оголосив
+            self._store(peer, index, data)
+
+    def _next_piece(self) -> int | None:
+        """Шматок, який ще не отримано і який запитано у найменшої кількості пірів"""
+        missing = [i for i in range(math.ceil(self._size / METADATA_PIECE)) if i not in self._pieces]
+        if not missing:
+            return None
+        return min(missing, key=lambda i: self._requested.get(i, 0))
+
+    async def _request(self, peer: 'peer.Peer', index: int) -> bytes:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[(peer, index)] = future
+        try:
+            await peer.send_extension("ut_metadata", BenCoder.encode({"msg_type": 0, "piece": index}))
+            return await asyncio.wait_for(future, self._request_timeout)
+        finally:
+            self._waiters.pop((peer, index), None)
+
+    def _on_message(self, peer: 'peer.Peer', payload: bytes) -> None:
+        try:
+            header, offset = BenCoder.decode_prefix(payload)
+        except Exception:
+            return
+        if not isinstance(header, dict):
+            return
+        future = self._waiters.get((peer, header.get("piece")))
+        if future is None or future.done():
+            return
+        if header.get("msg_type") == 1:
+            future.set_result(payload[offset:])
+        elif header.get("msg_type") == 2:
+            future.set_exception(MetadataRejected())
+
+    def _store(self, peer: 'peer.Peer', index: int, data: bytes) -> None:
+        if self._result.done() or self._size is None:
+            return
+        if len(data) != min(METADATA_PIECE, self._size - index * METADATA_PIECE):
+            return
+        self._pieces[index] = data
+        self._sources[index] = peer.ip
+        if len(self._pieces) < math.ceil(self._size / METADATA_PIECE):
+            return
+        info = b"".join(self._pieces[i] for i in range(len(self._pieces)))
+        if hashlib.sha1(info).digest() == self._info_hash:
+            self.time_to_metadata = time.time() - self._started
+            self._log_func(f"Metadata is received in {self.time_to_metadata:.2f} s")
+            self._result.set_result(info)
+        else:
+            # який шматок зіпсовано невідомо, тож блокуються всі піри, що їх надіслали
+            bad = set(self._sources.values())
+            self._banned |= bad
+            self._known = {address: p for address, p in self._known.items() if address[0] not in bad}
+            self._log_func(f"Metadata hash is wrong, {len(bad)} peers are banned, fetching again")
+            self._pieces = dict()
+            self._sources = dict()
+            self._size = None
+            self._parked = list()
+            self._candidates = self.peers
+
+
+class MetadataServer:
+    """Відповіді на запити ut_metadata від пірів, яким потрібні метадані торенту"""
+    def __init__(self, info_bytes: bytes):
+        self._info_bytes = info_bytes
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def size(self) -> int:
+        return len(self._info_bytes)
+
+    def attach(self, peer: 'peer.Peer') -> None:
+        peer.reg_extension_taker("ut_metadata", self._on_message)
+
+    def _on_message(self, peer: 'peer.Peer', payload: bytes) -> None:
+        try:
+            header, _ = BenCoder.decode_prefix(payload)
+        except Exception:
+            return
+        if not isinstance(header, dict) or header.get("msg_type") != 0 or not isinstance(header.get("piece"), int):
+            return
+        index = header["piece"]
+        data = self._info_bytes[index * METADATA_PIECE:(index + 1) * METADATA_PIECE] if index >= 0 else b""
+        if data:
+            message = BenCoder.encode({"msg_type": 1, "piece": index, "total_size": self.size}) + data
+        else:
+            message = BenCoder.encode({"msg_type": 2, "piece": index})
+        task = asyncio.create_task(peer.send_extension("ut_metadata", message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
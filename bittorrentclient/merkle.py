@@ -0,0 +1,168 @@
+import hashlib
+import typing
+from functools import lru_cache
+from math import ceil
+
+BLOCK_SIZE = 1 << 14  # листки дерева - SHA-256 блоків по 16 KiB
+HASH_SIZE = 32
+ZERO = bytes(HASH_SIZE)  # листок доповнення
+MAX_HASHES = 512  # найбільше хешів в одному запиті (BEP 52)
+
+
+def sha256(data: bytes | bytearray | memoryview) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def block_hashes(data: bytes | bytearray | memoryview) -> list[bytes]:
+    """Листки для даних: SHA-256 кожного блоку, останній може бути коротшим"""
+    view = memoryview(data)
+    return [sha256(view[i:i + BLOCK_SIZE]) for i in range(0, len(view), BLOCK_SIZE)]
+
+
+def next_pow2(n: int) -> int:
+    return 1 << max(n - 1, 0).bit_length()
+
+
+@lru_cache(64)
+def pad_hash(layer: int) -> bytes:
+    """Корінь піддерева з 2 ** layer листків доповнення"""
+    node = ZERO
+    for _ in range(layer):
+        node = sha256(node + node)
+    return node
+
+
+def layers(nodes: typing.Sequence[bytes], width: int, pad: bytes = ZERO) -> list[list[bytes]]:
+    """Рівні дерева від nodes до кореня. nodes доповнюються pad до width вузлів (степінь двійки)"""
+    layer = list(nodes) + [pad] * (width - len(nodes))
+    result = [layer]
+    while len(layer) > 1:
+        layer = [sha256(layer[i] + layer[i + 1]) for i in range(0, len(layer), 2)]
+        result.append(layer)
+    return result
+
+
+def root(nodes: typing.Sequence[bytes], width: int, pad: bytes = ZERO) -> bytes:
+    return layers(nodes, width, pad)[-1][0]
+
+
+class BadHashes(Exception):
+    pass
+
+
+class FileHashes:
+    """Merkle дерево одного файлу v2 торенту (BEP 52). З торент-файлу відомі корінь (pieces root)
+    та рівень кусків (piece layers), з них будуються всі рівні вище рівня кусків.
+    Рівень 0 - листки. Файл не довший за кусок має один кусок, хеш якого - корінь."""
+    def __init__(self, pieces_root: bytes, length: int, piece_length: int, piece_layer: bytes | None = None):
+        self.root = pieces_root
+        self.length = length
+        self.piece_length = piece_length
+        self.pieces = ceil(length / piece_length)
+        self.width = next_pow2(ceil(length / BLOCK_SIZE))  # листків у дереві
+        self.depth = self.width.bit_length() - 1
+        self.piece_leaves = min(piece_length // BLOCK_SIZE, self.width)
+        self.base = self.piece_leaves.bit_length() - 1  # рівень хешів кусків
+        if self.pieces > 1:
+            if piece_layer is None or len(piece_layer) != self.pieces * HASH_SIZE:
+                raise BadHashes("wrong piece layer")
+            nodes = [piece_layer[i:i + HASH_SIZE] for i in range(0, len(piece_layer), HASH_SIZE)]
+            self._layers = layers(nodes, self.width >> self.base, pad_hash(self.base))
+            if self._layers[-1][0] != pieces_root:
+                raise BadHashes("piece layer does not match pieces root")
+        else:
+            self._layers = [[pieces_root]]
+
+    def piece_hash(self, piece: int) -> bytes:
+        return self._layers[0][piece]
+
+    def piece_size(self, piece: int) -> int:
+        """Байтів файлу в куску, доповнення після кінця файлу не хешується"""
+        return min(self.piece_length, self.length - piece * self.piece_length)
+
+    def leaves(self, piece: int, data: bytes | bytearray | memoryview) -> list[bytes]:
+        """Листки куска з його даних, доповнені до piece_leaves"""
+        leaves = block_hashes(memoryview(data)[:self.piece_size(piece)])
+        return leaves + [ZERO] * (self.piece_leaves - len(leaves))
+
+    def verify_piece(self, piece: int, data: bytes | bytearray | memoryview) -> bool:
+        return root(self.leaves(piece, data), self.piece_leaves) == self.piece_hash(piece)
+
+    def verify_leaves(self, piece: int, leaves: typing.Sequence[bytes]) -> bool:
+        """Чи є leaves листками куска (разом з доповненням)"""
+        return len(leaves) == self.piece_leaves and root(leaves, self.piece_leaves) == self.piece_hash(piece)
+
+    def piece_of(self, base_layer: int, index: int) -> int | None:
+        """Кусок, дані якого потрібні для вузлів рівня нижче рівня кусків, None - дані не потрібні"""
+        if base_layer >= self.base or base_layer < 0 or index < 0:
+            return None
+        return (index << base_layer) // self.piece_leaves
+
+    def proof(self, base_layer: int, index: int, length: int, proof_layers: int,
+              leaves: typing.Sequence[bytes] | None = None) -> list[bytes] | None:
+        """Вузли рівня base_layer з index по index + length та хеші-дядьки ще для proof_layers рівнів,
+        як у повідомленні hashes. Для рівнів нижче рівня кусків потрібні leaves куска piece_of(...),
+        запитані вузли мають лежати в межах цього куска. None - запит некоректний або не може бути виконаний"""
+        if (length < 1 or length & (length - 1) or length > MAX_HASHES or index < 0 or index % length
+                or not 0 <= base_layer <= self.depth or index + length > self.width >> base_layer):
+            return None
+        top = base_layer + length.bit_length() - 1  # рівень кореня піддерева запитаних вузлів
+        if top > self.depth:
+            return None
+        below: list[list[bytes]] = list()  # рівні куска нижче рівня кусків
+        offset = 0  # номер першого вузла куска на рівні 0
+        if base_layer < self.base:
+            if leaves is None or len(leaves) != self.piece_leaves or top > self.base:
+                return None
+            below = layers(leaves, self.piece_leaves)
+            offset = self.piece_of(base_layer, index) * self.piece_leaves
+
+        def node(layer: int, i: int) -> bytes:
+            if layer >= self.base:
+                return self._layers[layer - self.base][i]
+            return below[layer][i - (offset >> layer)]
+
+        result = [node(base_layer, i) for i in range(index, index + length)]
+        for layer in range(top, min(top + proof_layers, self.depth)):
+            result.append(node(layer, (index >> (layer - base_layer)) ^ 1))
+        return result
+
+
+class MerklePieces:
+    """Хеші кусків v2 торенту. Кожен файл починається з нового куска, тож кусок належить одному файлу"""
+    def __init__(self, files: typing.Sequence[tuple[int, bytes | None]], piece_length: int,
+                 piece_layers: dict[bytes, bytes]):
+        """files - (довжина, pieces root) у порядку розміщення, для доповнення та порожніх файлів root - None"""
+        if piece_length < BLOCK_SIZE or piece_length & (piece_length - 1):
+            raise BadHashes("piece length must be a power of two not less than 16 KiB")
+        self._files: dict[bytes, FileHashes] = dict()
+        self._pieces: list[tuple[FileHashes, int]] = list()
+        self._first: dict[bytes, int] = dict()
+        offset = 0
+        for length, pieces_root in files:
+            if pieces_root is not None and length:
+                if offset % piece_length:
+                    raise BadHashes("file is not aligned to piece")
+                tree = FileHashes(pieces_root, length, piece_length, piece_layers.get(pieces_root))
+                self._files[pieces_root] = tree
+                self._first[pieces_root] = len(self._pieces)
+                self._pieces.extend((tree, i) for i in range(tree.pieces))
+            offset += length
+
+    def __len__(self) -> int:
+        return len(self._pieces)
+
+    def file(self, pieces_root: bytes) -> FileHashes | None:
+        return self._files.get(pieces_root)
+
+    def piece(self, index: int) -> tuple[FileHashes, int]:
+        """Дерево файлу та номер куска в ньому"""
+        return self._pieces[index]
+
+    def first_piece(self, pieces_root: bytes) -> int:
+        """Номер першого куска файлу в торенті"""
+        return self._first[pieces_root]
+
+    def verify(self, index: int, data: bytes | bytearray | memoryview) -> bool:
+        tree, piece = self._pieces[index]
+        return tree.verify_piece(piece, data)
@@ -0,0 +1,222 @@
+import asyncio
+import bisect
+import json
+import time
+import typing
+
+from aiohttp import web
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+Labels = tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _format_labels(names: Labels, values: Labels, extra: tuple[str, str] | None = None) -> str:
+    pairs = list(zip(names, values))
+    if extra: pairs.append(extra)
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Метрика з необов'язковими мітками. Значення для кожного набору міток зберігаються окремо.
+    Якщо задано func, значення обчислюються лише під час експорту: func повертає число або
+    послідовність пар (мітки, значення), тож на гарячих шляхах немає жодних витрат"""
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Labels = (),
+                 func: typing.Callable[[], float | typing.Iterable[tuple[Labels, float]]] | None = None):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._func = func
+        self._values: dict[Labels, float] = dict()
+
+    def samples(self) -> list[tuple[Labels, float]]:
+        if self._func is None:
+            return list(self._values.items())
+        value = self._func()
+        if isinstance(value, (int, float)):
+            return [((), value)]
+        return list(value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+    def snapshot(self) -> list[dict]:
+        return [{"labels": dict(zip(self.label_names, labels)), "value": value} for labels, value in self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, labels: Labels = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self._values[labels] = value
+
+    def inc(self, amount: float = 1, labels: Labels = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, labels: Labels = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    """Розподіл значень за кошиками. Для кожного набору міток: лічильники кошиків, сума та кількість"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Labels = (), buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self._buckets = tuple(buckets)
+        self._states: dict[Labels, list] = dict()
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        state = self._states.get(labels)
+        if state is None:
+            state = self._states[labels] = [[0] * (len(self._buckets) + 1), 0., 0]
+        state[0][bisect.bisect_left(self._buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (counts, total, count) in list(self._states.items()):
+            cumulative = 0
+            for bound, bucket in zip(self._buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+    def snapshot(self) -> list[dict]:
+        return [{"labels": dict(zip(self.label_names, labels)), "count": count, "sum": round(total, 6),
+                 "buckets": dict(zip([repr(b) for b in self._buckets] + ["+Inf"], counts))}
+                for labels, (counts, total, count) in list(self._states.items())]
+
+
+class Registry:
+    """Набір метрик процесу. Повторне створення метрики з тим самим ім'ям повертає наявну"""
+    def __init__(self):
+        self._metrics: dict[str, Metric] = dict()
+
+    def _add(self, metric: Metric) -> Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Labels = (), func=None) -> Counter:
+        return self._add(Counter(name, help, labels, func))
+
+    def gauge(self, name: str, help: str, labels: Labels = (), func=None) -> Gauge:
+        return self._add(Gauge(name, help, labels, func))
+
+    def histogram(self, name: str, help: str, labels: Labels = (),
+                  buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def remove(self, name: str) -> None:
+        self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """Текстовий формат Prometheus"""
+        lines = list()
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+
+REGISTRY = Registry()
+
+PEER_CONNECTS = REGISTRY.counter("bt_peer_connects_total", "Peer connection attempts", ("direction", "result"))
+PEER_DISCONNECTS = REGISTRY.counter("bt_peer_disconnects_total", "Closed peer connections")
+PEER_BANS = REGISTRY.counter("bt_peer_bans_total", "Peers banned for pieces failing hash check")
+PAYLOAD_RECEIVED = REGISTRY.counter("bt_payload_received_bytes_total", "Bytes of requested blocks received from peers")
+PAYLOAD_SENT = REGISTRY.counter("bt_payload_sent_bytes_total", "Bytes of blocks sent to peers")
+WEB_SEED_REQUESTS = REGISTRY.counter("bt_web_seed_requests_total", "HTTP range requests to web seeds")
+WEB_SEED_RECEIVED = REGISTRY.counter("bt_web_seed_received_bytes_total", "Bytes of blocks received from web seeds")
+PIECES_VERIFIED = REGISTRY.counter("bt_pieces_verified_total", "Pieces checked against their hash", ("result",))
+PIECE_HASH_SECONDS = REGISTRY.histogram("bt_piece_hash_seconds", "Time of piece hash check")
+DISK_WRITE_SECONDS = REGISTRY.histogram("bt_disk_write_seconds", "Time of piece write")
+DISK_READ_SECONDS = REGISTRY.histogram("bt_disk_read_seconds", "Time of piece read for upload")
+MESSAGES_SENT = REGISTRY.counter("bt_peer_messages_sent_total", "Messages sent to peers")
+SEND_BATCHES = REGISTRY.counter("bt_peer_send_batches_total", "Socket writes of batched messages to peers")
+BLOCK_REQUESTS = REGISTRY.counter("bt_block_requests_total", "Blocks requested from peers")
+BLOCK_TIMEOUTS = REGISTRY.counter("bt_block_timeouts_total", "Block requests not answered within peer RTO")
+BLOCK_REREQUESTS = REGISTRY.counter("bt_block_rerequests_total", "Blocks requested again from another peer")
+BLOCK_RTT_SECONDS = REGISTRY.histogram("bt_block_rtt_seconds", "Time from block becoming first in peer queue to arrival")
+PIECE_BUFFERS = REGISTRY.counter("bt_piece_buffers_total", "Piece buffers taken from pool", ("source",))
+TRACKER_SECONDS = REGISTRY.histogram("bt_tracker_request_seconds", "Time of tracker announce", ("result",))
+
+
+class MetricsExporter:
+    """Експорт метрик: HTTP endpoint /metrics у текстовому форматі Prometheus (якщо задано port)
+    та JSON рядки у файл path кожні interval секунд"""
+    def __init__(self, registry: Registry = REGISTRY, port: int | None = None, host: str = "127.0.0.1",
+                 path: str | None = None, interval: float = 10,
+                 log_func: typing.Callable[[str], None] | None = None):
+        self._registry = registry
+        self._port = port
+        self._host = host
+        self._path = path
+        self._interval = interval
+        self._runner: web.AppRunner | None = None
+        self._writer: asyncio.Task | None = None
+        self._log_func = log_func if log_func else lambda a: a
+
+    @property
+    def port(self) -> int | None:
+        return self._port
+
+    async def start(self) -> None:
+        if self._port is not None:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self._host, self._port)
+            await site.start()
+            if not self._port:
+                self._port = site._server.sockets[0].getsockname()[1]
+            self._log_func(f"Metrics are available at http://{self._host}:{self._port}/metrics")
+        if self._path:
+            self._writer = asyncio.Task(self._write_periodically())
+
+    async def stop(self) -> None:
+        if self._writer:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+            self.write()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self._registry.render(), content_type="text/plain")
+
+    async def _write_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            self.write()
+
+    def write(self) -> None:
+        with open(self._path, "a") as f:
+            f.write(json.dumps({"time": round(time.time(), 3), "metrics": self._registry.snapshot()}) + "\n")
@@ -1,15 +1,60 @@
 import asyncio
+import hashlib
+import ipaddress
 import time
 import struct
 import typing
 
+from . import metrics
+from .bencoder import BenCoder
 from .bitfield import BitField
 
 
+FAST_EXTENSION = (7, 0x04)  # BEP 6: байт та біт у reserved
+EXTENSION_PROTOCOL = (5, 0x10)  # BEP 10
+DHT_SUPPORT = (7, 0x01)  # BEP 5
+V2_SUPPORT = (7, 0x10)  # BEP 52: повідомлення hash request, hashes, hash reject
+EXTENSIONS = {"ut_pex": 1, "ut_metadata": 2}  # розширення, які підтримує клієнт, та їх номери повідомлень
+CLIENT_VERSION = "PY0001"
+INITIAL_RTO = 1.  # тайм-аут блоку до першого виміру RTT, с
+MIN_RTO = 0.5
+MAX_RTO = 60.
+MAX_MESSAGE_LENGTH = 1 << 22  # довші повідомлення вважаються помилкою протоколу
+MAX_REQUEST_LENGTH = 1 << 17  # найбільший блок, який можна запитати (request, cancel, reject)
+SEND_QUEUE_LIMIT = 1 << 20  # скільки байтів може чекати в черзі на надсилання, перш ніж send_piece почне чекати
+# довжина повідомлень з фіксованим розміром без байта типу: choke, unchoke, interested, uninterested, have,
+# request, cancel, port, suggest, have all, have none, reject, allowed fast
+PAYLOAD_LENGTHS = {0: 0, 1: 0, 2: 0, 3: 0, 4: 4, 6: 12, 8: 12, 9: 2, 0x0D: 4, 0x0E: 0, 0x0F: 0, 0x10: 12, 0x11: 4}
+INDEXED_MESSAGES = frozenset((4, 5, 6, 8, 0x0D, 0x10, 0x11))  # мають сенс, лише коли відома кількість кусків
+STATE_MESSAGES = frozenset((0, 1, 4, 5, 0x0E, 0x11))  # choke, unchoke, have, bitfield, have all, allowed fast
+
+
 class PeerNotConnected(Exception):
     pass
 
 
+class RequestRejected(Exception):
+    pass
+
+
+def allowed_fast_set(info_hash: bytes, ip: str, pieces_count: int, k: int = 10) -> set[int]:
+    """Канонічний набір allowed fast кусків для піра з адресою ip (BEP 6)"""
+    result = set()
+    if not pieces_count:
+        return result
+    k = min(k, pieces_count)
+    try:
+        x = int(ipaddress.IPv4Address(ip)).to_bytes(4, "big")[:3] + b"\x00" + info_hash
+    except ipaddress.AddressValueError:
+        return result
+    while len(result) < k:
+        x = hashlib.sha1(x).digest()
+        for i in range(5):
+            if len(result) >= k: break
+            result.add(int.from_bytes(x[i * 4:i * 4 + 4], "big") % pieces_count)
+    return result
+
+
 class Peer:
     def __init__(self, ip: str, port: int, peer_id=None):
         self._ip = ip.strip()
@@ -19,6 +64,8 @@ class Peer:
         self._stream_reader: asyncio.StreamReader | None = None
         self._stream_writer: asyncio.StreamWriter | None = None
         self._connected = False
+        self._incoming = False
+        self.local = False  # пір з локальної мережі
 
         self._am_choking = True
         self._am_interested = False
@@ -26,13 +73,43 @@ class Peer:
         self._peer_interested = False
 
         self._keep_aliver_task: asyncio.Task | None = None
+        self._sender_task: asyncio.Task | None = None
+        self._send_queue: list[bytes] = list()
+        self._send_queued_bytes = 0
+        self._send_wakeup = asyncio.Event()
+        self._send_space = asyncio.Event()
+        self._haves_sent: set[int] = set()
         self._last_message_time = 0
+        self._connected_time = 0
+        self._downloaded_bytes = 0
 
         self._bitfield: BitField | None = None
-
-        self._requested_blocks: dict[tuple[int, int], tuple[int, asyncio.Future]] = dict()
+        self._piece_length = 0
+        self._length = 0
+        self._reserved = bytes(8)
+        self._dht = False
+        self._v2 = False
+        self._allowed_fast: set[int] = set()
+        self._suggested: set[int] = set()
+
+        self._requested_blocks: dict[tuple[int, int], tuple[int, asyncio.Future, float, memoryview | None]] = dict()
+        self._srtt: float | None = None
+        self._rttvar = 0.
+        self._backoff = 1
+        self._last_block_time = 0.
+        self._requested_hashes: dict[tuple[bytes, int, int, int], asyncio.Future] = dict()
+
+        self._extensions: dict[str, int] = dict()
+        self._extension_handshake: dict = dict()
+        self._extension_takers: dict[str, typing.Callable] = dict()
+        self._extension_handshake_clb: typing.Callable | None = None
 
         self._data_taker_clb: typing.Callable | None = None
+        self._cancel_clb: typing.Callable | None = None
+        self._port_clb: typing.Callable | None = None
+        self._have_clb: typing.Callable | None = None
+        self._state_clb: typing.Callable | None = None
+        self._hash_request_clb: typing.Callable | None = None
 
     @property
     def ip(self):
@@ -50,10 +127,95 @@ class Peer:
     def connected(self):
         return self._connected
 
+    @property
+    def incoming(self):
+        return self._incoming
+
     @property
     def bitfield(self):
         return self._bitfield
 
+    @property
+    def supports_fast(self) -> bool:
+        """Обидві сторони підтримують Fast Extension"""
+        byte, mask = FAST_EXTENSION
+        return bool(self._reserved[byte] & mask)
+
+    @property
+    def supports_extensions(self) -> bool:
+        """Обидві сторони підтримують Extension Protocol"""
+        byte, mask = EXTENSION_PROTOCOL
+        return bool(self._reserved[byte] & mask)
+
+    @property
+    def supports_dht(self) -> bool:
+        """Пір запускає DHT вузол, і наш DHT увімкнено"""
+        byte, mask = DHT_SUPPORT
+        return self._dht and bool(self._reserved[byte] & mask)
+
+    @property
+    def supports_v2(self) -> bool:
+        """Обидві сторони обмінюються хешами Merkle дерев v2 торенту"""
+        byte, mask = V2_SUPPORT
+        return self._v2 and bool(self._reserved[byte] & mask)
+
+    @property
+    def extensions(self) -> dict[str, int]:
+        """Розширення піра з його extension handshake"""
+        return self._extensions
+
+    @property
+    def extension_handshake(self) -> dict:
+        return self._extension_handshake
+
+    @property
+    def listen_port(self) -> int | None:
+        """Порт, на якому пір приймає з'єднання. Для вхідних з'єднань відомий лише з extension handshake"""
+        port = self._extension_handshake.get("p")
+        if isinstance(port, int) and 0 < port < 65536: return port
+        return None if self._incoming else self._port
+
+    @property
+    def allowed_fast(self) -> set[int]:
+        """Куски, які можна запитувати у піра, навіть коли він нас заглушив"""
+        return self._allowed_fast
+
+    @property
+    def suggested(self) -> set[int]:
+        return self._suggested
+
+    @property
+    def downloaded(self):
+        return self._downloaded_bytes
+
+    @property
+    def outstanding_requests(self) -> int:
+        """Кількість запитаних у піра блоків, на які ще немає відповіді"""
+        return len(self._requested_blocks)
+
+    @property
+    def rto(self) -> float:
+        """Тайм-аут очікування блоку, як RTO у TCP (RFC 6298): SRTT + 4 * RTTVAR.
+        RTT тут - час від моменту, коли блок став першим в черзі запитів піра, до його отримання.
+        Кожен тайм-аут подвоює значення до наступного отриманого блоку"""
+        rto = INITIAL_RTO if self._srtt is None else max(self._srtt + 4 * self._rttvar, MIN_RTO)
+        return min(rto * self._backoff, MAX_RTO)
+
+    @property
+    def srtt(self) -> float | None:
+        return self._srtt
+
+    @property
+    def send_queued_bytes(self) -> int:
+        """Кількість байтів, що чекають у черзі на надсилання"""
+        return self._send_queued_bytes
+
+    @property
+    def rate(self) -> float:
+        """Середня швидкість отримання даних від піра за час з'єднання, байт/с"""
+        if not self._connected_time: return 0.
+        return self._downloaded_bytes / max(time.time() - self._connected_time, 1.)
+
     @property
     def am_choking(self):
         return self._am_choking
@@ -70,50 +232,42 @@ class Peer:
     def am_interested(self):
         return self._peer_interested
 
-    async def connect(self, info_hash: bytes, pieces_count: int, peer_id: bytes, timeout: int = 3) -> bool:
-        async def _keep_aliver():
-            await asyncio.sleep(5)
-            while True:
-                if time.time() - self._last_message_time >= 10 and not self.am_choked:
-                    await self.keep_alive()
-                await asyncio.sleep(1)
-
+    async def connect(self, info_hash: bytes, pieces_count: int, peer_id: bytes, timeout: int = 3,
+                      dht: bool = False, opener: typing.Callable[[str, int], typing.Awaitable] | None = None,
+                      v2: bool = False, piece_length: int = 0, length: int = 0) -> bool:
+        """opener(ip, port) повертає пару reader, writer, як asyncio.open_connection (за замовчуванням TCP).
+        piece_length та length торенту потрібні для перевірки меж блоків у запитах піра"""
         del self._stream_writer
         del self._stream_reader
         self._stream_writer = self._stream_reader = None
+        opener = opener if opener else asyncio.open_connection
         try:
             self._stream_reader, self._stream_writer = \
-                await asyncio.wait_for(asyncio.open_connection(self.ip, self.port), timeout)
+                await asyncio.wait_for(opener(self.ip, self.port), timeout)
         except:
             return False
 
-        pstr = bytearray(b"BitTorrent protocol")
-        reversed = bytearray(8)
-        handshake = struct.pack(f"!B{len(pstr)}s8s20s20s",
-                                len(pstr), pstr, reversed,
-                                info_hash, peer_id)
-
+        self._dht = dht
+        self._v2 = v2
+        handshake = self._handshake(info_hash, peer_id, dht, v2)
 
         try:
             await self._safe_write(handshake)
-            r = await self._stream_reader.read(len(handshake))
+            r = await asyncio.wait_for(self._read_handshake(), timeout)
+            _, r_pstr, r_reversed, r_info_hash, r_peer_id = struct.unpack(f"!B{len(r) - 49}s8s20s20s", r)
         except:
+            r = None
+        if r is None:
+            try:
+                self._stream_writer.close()
+            except:
+                pass
             return False
 
-        if not r:
-            return False
-
-        _, r_pstr, r_reversed, r_info_hash, r_peer_id = struct.unpack(f"!B{len(r) - 49}s8s20s20s", r)
-
         if info_hash == r_info_hash and (self._peer_id is None or self._peer_id == r_peer_id):
-            self._connected = True
             self._peer_id = r_peer_id
-            self._bitfield = BitField(pieces_count)
-            self._am_choking = self._peer_choking = True
-            self._am_interested = self._peer_interested = False
-            self._keep_aliver_task = asyncio.create_task(_keep_aliver())
-            self._last_message_time = time.time()
-
+            self._reserved = r_reversed
+            self._on_connected(pieces_count, piece_length, length)
             return True
 
         try:
@@ -123,6 +277,77 @@ class Peer:
             pass
         return False
 
+    async def _read_handshake(self) -> bytes:
+        """Handshake піра цілком: обрізаний (uTP може віддати його частинами) - PeerNotConnected"""
+        try:
+            pstrlen = await self._stream_reader.readexactly(1)
+            return pstrlen + await self._stream_reader.readexactly(pstrlen[0] + 48)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            raise PeerNotConnected() from e
+
+    async def accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, info_hash: bytes,
+                     pieces_count: int, peer_id: bytes, reserved: bytes = bytes(8), dht: bool = False,
+                     v2: bool = False, piece_length: int = 0, length: int = 0) -> bool:
+        """Обслуговування вхідного з'єднання, handshake від піра вже прочитано"""
+        self._stream_reader, self._stream_writer = reader, writer
+        self._reserved = reserved
+        self._incoming = True
+        self._dht = dht
+        self._v2 = v2
+        try:
+            await self._safe_write(self._handshake(info_hash, peer_id, dht, v2))
+        except:
+            return False
+        if self._stream_writer.is_closing():
+            return False
+        self._on_connected(pieces_count, piece_length, length)
+        return True
+
+    @staticmethod
+    def _handshake(info_hash: bytes, peer_id: bytes, dht: bool = False, v2: bool = False) -> bytes:
+        pstr = bytearray(b"BitTorrent protocol")
+        reversed = bytearray(8)
+        reversed[FAST_EXTENSION[0]] |= FAST_EXTENSION[1]
+        reversed[EXTENSION_PROTOCOL[0]] |= EXTENSION_PROTOCOL[1]
+        if dht: reversed[DHT_SUPPORT[0]] |= DHT_SUPPORT[1]
+        if v2: reversed[V2_SUPPORT[0]] |= V2_SUPPORT[1]
+        return struct.pack(f"!B{len(pstr)}s8s20s20s",
+                           len(pstr), pstr, reversed,
+                           info_hash, peer_id)
+
+    def _on_connected(self, pieces_count: int, piece_length: int = 0, length: int = 0) -> None:
+        self._connected = True
+        self._bitfield = BitField(pieces_count)
+        self._piece_length = piece_length
+        self._length = length
+        self._am_choking = self._peer_choking = True
+        self._am_interested = self._peer_interested = False
+        self._allowed_fast = set()
+        self._suggested = set()
+        self._extensions = dict()
+        self._extension_handshake = dict()
+        self._send_queue = list()
+        self._send_queued_bytes = 0
+        self._send_wakeup.clear()
+        self._send_space.set()
+        self._haves_sent = set()
+        self._keep_aliver_task = asyncio.create_task(self._keep_aliver())
+        self._sender_task = asyncio.create_task(self._sender())
+        self._last_message_time = time.time()
+        self._connected_time = time.time()
+        self._downloaded_bytes = 0
+        self._srtt = None
+        self._rttvar = 0.
+        self._backoff = 1
+        self._last_block_time = 0.
+
+    async def _keep_aliver(self) -> None:
+        await asyncio.sleep(5)
+        while True:
+            if time.time() - self._last_message_time >= 10 and not self.am_choked:
+                await self.keep_alive()
+            await asyncio.sleep(1)
+
     async def disconnect(self) -> None:
         if not self._connected:
             return None
@@ -130,76 +355,124 @@ class Peer:
         self._keep_aliver_task.cancel()
         try: await self._keep_aliver_task
         except asyncio.CancelledError: pass
+        if self._sender_task is not asyncio.current_task():
+            self._sender_task.cancel()
+            try: await self._sender_task
+            except asyncio.CancelledError: pass
+        self._send_queue = list()
+        self._send_queued_bytes = 0
+        self._send_space.set()  # розблокування send_piece, що чекають місця в черзі
         [i[1].cancel() for i in self._requested_blocks.values()]
+        [f.cancel() for f in self._requested_hashes.values()]
 
         try:
-            print("DISCON 131", self)
             if not self._stream_writer.is_closing():
                 self._stream_writer.close()
                 await self._stream_writer.wait_closed()
-                print("DISCON SUCCESS 135")
         except: pass
 
         self._peer_choking = self._am_choking = True
         self._am_interested = self._peer_interested = True
         self._last_message_time = 0
+        if self._state_clb: self._state_clb(self)
 
     async def listen(self) -> None:
         if not self._connected:
             raise PeerNotConnected()
 
-        buffer = bytes()
         while self._connected:
             try:
-                data = await self._stream_reader.read(2**14)
+                message_len = int.from_bytes(await self._stream_reader.readexactly(4))
+                if message_len > MAX_MESSAGE_LENGTH:
+                    raise ValueError("too long message")
+                data = await self._stream_reader.readexactly(message_len) if message_len else b""
             except:
                 await self.disconnect()
                 break
-            if not data:
-                await self.disconnect()
-                break
-            buffer += data
 
-            while len(buffer) >= 4:
-                message_len = int.from_bytes(buffer[:4])
-                if not len(buffer) >= message_len + 4:
-                    break
+            if message_len == 0:
+                continue  # keep-alive
 
-                if message_len == 0:
-                    pass  # TODO keep-alive
-                    buffer = buffer[4:]
-                    continue
-
-                message_id = buffer[4]
-                message = buffer[5:4 + message_len]
-                if message_id == 0:  # Choke
-                    self._peer_choking = True
-                elif message_id == 1:  # Unchoke
-                    self._peer_choking = False
-                elif message_id == 2:  # interested
-                    self._peer_interested = True
-                elif message_id == 3:  # uninterested
-                    self._peer_interested = False
-                elif message_id == 4:  # have
-                    index = struct.unpack('!i', message)[0]
-                    self._bitfield.set(index)
-                elif message_id == 5:  # bitfield
-                    try:
-                        self._bitfield.copy(message)
-                    except:
-                        self._connected = False
-                        break
-                elif message_id == 6:  # requests
-                    index, begin, length = struct.unpack(f'!iii', message)
-                    self._me_requested(index, begin, length)
-                elif message_id == 7:  # piece
-                    index, begin, block = struct.unpack(f'!ii{message_len-9}s', message)
-                    self._get_piece(index, begin, block)
-                elif message_id == 8:  # cancel
-                    pass
-                elif message_id == 9:  # port
-                    pass  # DHT. I can nothing to do now
-                buffer = buffer[4 + message_len:]
+            message_id = data[0]
+            message = memoryview(data)[1:]
+            if len(message) != PAYLOAD_LENGTHS.get(message_id, len(message)) or message_id == 7 and len(message) < 8:
+                await self.disconnect()  # порушення протоколу
+                break
+            if message_id == 0:  # Choke
+                self._peer_choking = True
+            elif message_id == 1:  # Unchoke
+                self._peer_choking = False
+            elif message_id == 2:  # interested
+                self._peer_interested = True
+            elif message_id == 3:  # uninterested
+                self._peer_interested = False
+            elif message_id in INDEXED_MESSAGES and not len(self._bitfield):
+                pass  # кількість кусків ще невідома (завантаження метаданих за magnet)
+            elif not self._valid_indexes(message_id, message):
+                await self.disconnect()  # кусок або блок за межами торенту
+                break
+            elif message_id == 4:  # have
+                index = struct.unpack('!i', message)[0]
+                self._bitfield.set(index)
+                if self._have_clb: self._have_clb(self, index)
+            elif message_id == 5:  # bitfield
+                try:
+                    self._bitfield.copy(bytes(message))
+                except:
+                    await self.disconnect()
+                    break
+                if self._have_clb: self._have_clb(self, None)
+            elif message_id == 6:  # requests
+                index, begin, length = struct.unpack(f'!iii', message)
+                self._me_requested(index, begin, length)
+            elif message_id == 7:  # piece
+                index, begin = struct.unpack_from('!ii', message)
+                self._get_piece(index, begin, message[8:])
+            elif message_id == 8:  # cancel
+                index, begin, length = struct.unpack(f'!iii', message)
+                if self._cancel_clb: self._cancel_clb(self, index, begin, length)
+            elif message_id == 9:  # port
+                if self._port_clb: self._port_clb(self, struct.unpack('!H', message)[0])
+            elif message_id == 20:  # extended
+                if self.supports_extensions and message: self._extended(message[0], bytes(message[1:]))
+            elif message_id in (21, 22, 23) and not self.supports_v2:
+                pass
+            elif message_id == 21:  # hash request
+                if self._hash_request_clb and len(message) == 48:
+                    self._hash_request_clb(self, *struct.unpack('!32s4i', message))
+            elif message_id == 22:  # hashes
+                self._got_hashes(message)
+            elif message_id == 23:  # hash reject
+                self._hashes_rejected(message)
+            elif not self.supports_fast:
+                pass
+            elif message_id == 0x0D:  # suggest piece
+                self._suggested.add(struct.unpack('!i', message)[0])
+            elif message_id == 0x0E:  # have all
+                self._bitfield.fill()
+                if self._have_clb: self._have_clb(self, None)
+            elif message_id == 0x0F:  # have none
+                pass
+            elif message_id == 0x10:  # reject request
+                index, begin, length = struct.unpack(f'!iii', message)
+                self._rejected(index, begin, length)
+            elif message_id == 0x11:  # allowed fast
+                self._allowed_fast.add(struct.unpack('!i', message)[0])
+            if message_id in STATE_MESSAGES and self._state_clb:
+                self._state_clb(self)
+
+    def _valid_indexes(self, message_id: int, message: memoryview) -> bool:
+        """Номер куска в межах торенту, а для request, cancel та reject - ще й блок у межах куска"""
+        if message_id in (4, 0x0D, 0x11):
+            return 0 <= struct.unpack('!i', message)[0] < len(self._bitfield)
+        if message_id not in (6, 8, 0x10):
+            return True
+        index, begin, length = struct.unpack('!iii', message)
+        if not 0 <= index < len(self._bitfield) or begin < 0 or not 0 < length <= MAX_REQUEST_LENGTH:
+            return False
+        if not self._piece_length:
+            return True
+        return begin + length <= min(self._piece_length, self._length - index * self._piece_length)
 
     def _me_requested(self, index:int, begin:int, lenght:int) -> None:
         if not self._data_taker_clb:
@@ -208,80 +481,268 @@ class Peer:
 
     async def send_piece(self, data: bytes, index: int, begin: int) -> None:
         query = struct.pack(f'!ibii{len(data)}s', 9+len(data), 7, index, begin, data)
-        await self._safe_write(query)
-        self._last_message_time = time.time()
+        while self._connected and self._send_queued_bytes >= SEND_QUEUE_LIMIT:
+            self._send_space.clear()
+            await self._send_space.wait()
+        metrics.PAYLOAD_SENT.inc(len(data))
+        self._send(query)
 
     async def keep_alive(self) -> None:
         query = bytearray(b"\x00\x00\x00\x00")
-        await self._safe_write(query)
-        self._last_message_time = time.time()
+        self._send(query)
 
-    async def have(self, index: int) -> None:
-        query = struct.pack(f'!ibi', 5, 4, index)
-        await self._safe_write(query)
-        self._last_message_time = time.time()
+    def have(self, index: int) -> bool:
+        """Постановка have в чергу. Не надсилається, якщо пір вже має кусок або have для нього вже надіслано"""
+        if index in self._haves_sent or (self._bitfield is not None and self._bitfield.has(index)):
+            return False
+        self._haves_sent.add(index)
+        self._send(struct.pack(f'!ibi', 5, 4, index))
+        return True
 
     async def interested(self) -> None:
         query = bytearray(b"\x00\x00\x00\x01\x02")
-        await self._safe_write(query)
+        self._send(query)
         self._am_interested = True
-        self._last_message_time = time.time()
 
     async def uninterested(self) -> None:
         query = bytearray(b"\x00\x00\x00\x01\x03")
-        await self._safe_write(query)
+        self._send(query)
         self._am_interested = False
-        self._last_message_time = time.time()
 
     async def choke(self) -> None:
         query = bytearray(b"\x00\x00\x00\x01\x00")
-        await self._safe_write(query)
+        self._send(query)
         self._am_choking = True
-        self._last_message_time = time.time()
 
     async def unchoke(self) -> None:
         query = bytearray(b"\x00\x00\x00\x01\x01")
-        await self._safe_write(query)
+        self._send(query)
         self._am_choking = False
-        self._last_message_time = time.time()
 
     async def send_bitfield(self, bitfield: BitField) -> None:
         byter = bitfield.bits
         query = struct.pack(f'!ib{len(byter)}s', 1 + len(byter), 5, bytes(byter))
-        await self._safe_write(query)
-        self._last_message_time = time.time()
+        self._send(query)
 
-    async def request(self, index: int, begin: int, length: int) -> bytes:
+    async def request(self, index: int, begin: int, length: int, into: memoryview | None = None) -> bytes | memoryview:
+        """Запит блоку. Якщо задано into, блок копіюється в нього і повертається into, інакше - bytes"""
+        if not self._connected:
+            raise PeerNotConnected()
         future = asyncio.get_running_loop().create_future()
-        self._requested_blocks[(index, begin,)] = (length, future,)
+        self._requested_blocks[(index, begin,)] = (length, future, time.monotonic(), into)
 
         query = struct.pack('!iB3i', 13, 6, index, begin, length)
-        await self._safe_write(query)
-        self._last_message_time = time.time()
+        self._send(query)
         return await future
 
-    async def cancel_piece(self, index:int, begin: int, length: int) -> None:
+    def cancel_piece(self, index:int, begin: int, length: int) -> None:
         if not (t := self._requested_blocks.get((index, begin,))): return
-        length_d, future = t
+        length_d, future, *_ = t
         if not length_d == length:
             raise Exception("Bad length")
         future.cancel()
         self._requested_blocks.pop((index, begin,))
 
         query = struct.pack('!iB3i', 13, 8, index, begin, length)
-        await self._safe_write(query)
-        self._last_message_time = time.time()
+        self._send(query)
+
+    async def have_all(self) -> None:
+        query = struct.pack('!ib', 1, 0x0E)
+        self._send(query)
+
+    async def have_none(self) -> None:
+        query = struct.pack('!ib', 1, 0x0F)
+        self._send(query)
+
+    async def suggest(self, index: int) -> None:
+        query = struct.pack('!ibi', 5, 0x0D, index)
+        self._send(query)
+
+    def reject(self, index: int, begin: int, length: int) -> None:
+        query = struct.pack('!iB3i', 13, 0x10, index, begin, length)
+        self._send(query)
+
+    async def send_allowed_fast(self, index: int) -> None:
+        query = struct.pack('!ibi', 5, 0x11, index)
+        self._send(query)
+
+    async def send_port(self, port: int) -> None:
+        query = struct.pack('!ibH', 3, 9, port)
+        self._send(query)
+
+    async def send_extension_handshake(self, **fields) -> None:
+        data = dict(fields, m=EXTENSIONS, v=CLIENT_VERSION)
+        payload = BenCoder.encode(data)
+        query = struct.pack(f'!ibb{len(payload)}s', 2 + len(payload), 20, 0, payload)
+        self._send(query)
+
+    async def send_extension(self, name: str, payload: bytes) -> bool:
+        """Надсилання повідомлення розширення, якщо пір його підтримує"""
+        ext_id = self._extensions.get(name)
+        if not ext_id:
+            return False
+        query = struct.pack(f'!ibb{len(payload)}s', 2 + len(payload), 20, ext_id, payload)
+        self._send(query)
+        return True
+
+    def reg_extension_handshake_taker(self, clb) -> None:
+        """clb(peer) викликається після отримання extension handshake"""
+        self._extension_handshake_clb = clb
+
+    def reg_extension_taker(self, name: str, clb) -> None:
+        """clb(peer, payload) викликається для кожного повідомлення розширення name"""
+        self._extension_takers[name] = clb
+
+    def _extended(self, ext_id: int, payload: bytes) -> None:
+        if ext_id == 0:  # extension handshake
+            try:
+                data = BenCoder.decode(payload)
+            except Exception:
+                return
+            if not isinstance(data, dict): return
+            self._extension_handshake = data
+            m = data.get("m")
+            if isinstance(m, dict):
+                for name, remote_id in m.items():
+                    if not isinstance(name, str) or not isinstance(remote_id, int): continue
+                    if remote_id: self._extensions[name] = remote_id
+                    else: self._extensions.pop(name, None)  # 0 означає вимкнення розширення
+            if self._extension_handshake_clb: self._extension_handshake_clb(self)
+            return
+        for name, local_id in EXTENSIONS.items():
+            if local_id == ext_id and (clb := self._extension_takers.get(name)):
+                clb(self, payload)
+
+    async def request_hashes(self, pieces_root: bytes, base_layer: int, index: int, length: int,
+                             proof_layers: int = 0) -> list[bytes]:
+        """Запит хешів рівня base_layer дерева файлу (BEP 52). Повертає length хешів та хеші-дядьки"""
+        if not self._connected:
+            raise PeerNotConnected()
+        key = (pieces_root, base_layer, index, length)
+        future = asyncio.get_running_loop().create_future()
+        self._requested_hashes[key] = future
+        self._send(struct.pack('!iB32s4i', 49, 21, pieces_root, base_layer, index, length, proof_layers))
+        try:
+            return await future
+        finally:
+            self._requested_hashes.pop(key, None)
+
+    def send_hashes(self, pieces_root: bytes, base_layer: int, index: int, length: int, proof_layers: int,
+                    hashes: list[bytes]) -> None:
+        query = struct.pack('!iB32s4i', 49 + 32 * len(hashes), 22, pieces_root, base_layer, index, length,
+                            proof_layers) + b"".join(hashes)
+        self._send(query)
+
+    def reject_hashes(self, pieces_root: bytes, base_layer: int, index: int, length: int, proof_layers: int) -> None:
+        query = struct.pack('!iB32s4i', 49, 23, pieces_root, base_layer, index, length, proof_layers)
+        self._send(query)
+
+    def _got_hashes(self, message: memoryview) -> None:
+        if len(message) < 48 or (len(message) - 48) % 32:
+            return
+        pieces_root, base_layer, index, length, _ = struct.unpack_from('!32s4i', message)
+        future = self._requested_hashes.get((pieces_root, base_layer, index, length))
+        if future is None or future.done() or len(message) - 48 < length * 32:
+            return
+        future.set_result([bytes(message[i:i + 32]) for i in range(48, len(message), 32)])
+
+    def _hashes_rejected(self, message: memoryview) -> None:
+        if len(message) != 48:
+            return
+        pieces_root, base_layer, index, length, _ = struct.unpack('!32s4i', message)
+        future = self._requested_hashes.get((pieces_root, base_layer, index, length))
+        if future is not None and not future.done():
+            future.set_exception(RequestRejected())
+
+    def reg_hash_request_taker(self, clb) -> None:
+        """clb(peer, pieces_root, base_layer, index, length, proof_layers) викликається для запиту хешів"""
+        self._hash_request_clb = clb
 
     def reg_data_taker(self, clb) -> None:
         self._data_taker_clb = clb
 
-    def _get_piece(self, index: int, begin: int, block: bytes) -> None:
+    def reg_cancel_taker(self, clb) -> None:
+        self._cancel_clb = clb
+
+    def reg_state_taker(self, clb) -> None:
+        """clb(peer) викликається, коли змінюються куски піра, його choke або allowed fast, та після від'єднання"""
+        self._state_clb = clb
+
+    def reg_have_taker(self, clb) -> None:
+        """clb(peer, index) викликається після have, clb(peer, None) - після бітового поля або have all"""
+        self._have_clb = clb
+
+    def reg_port_taker(self, clb) -> None:
+        """clb(peer, port) викликається, коли пір повідомляє порт свого DHT вузла"""
+        self._port_clb = clb
+
+    def _rejected(self, index: int, begin: int, length: int) -> None:
         if not (t := self._requested_blocks.get((index, begin,))): return
-        _, future = t
+        _, future, *_ = t
+        if not future.done(): future.set_exception(RequestRejected())
+        self._requested_blocks.pop((index, begin,))
 
-        future.set_result(block)
+    def _get_piece(self, index: int, begin: int, block: memoryview) -> None:
+        if not (t := self._requested_blocks.get((index, begin,))): return
+        length, future, sent, into = t
+        if len(block) != length:
+            return
+
+        now = time.monotonic()
+        self._rtt_sample(now - max(sent, self._last_block_time))
+        self._last_block_time = now
+        self._downloaded_bytes += len(block)
+        metrics.PAYLOAD_RECEIVED.inc(len(block))
+        if not future.done():
+            if into is not None:
+                into[:] = block
+                future.set_result(into)
+            else:
+                future.set_result(bytes(block))
         self._requested_blocks.pop((index, begin,))
 
+    def _rtt_sample(self, rtt: float) -> None:
+        metrics.BLOCK_RTT_SECONDS.observe(rtt)
+        if self._srtt is None:
+            self._srtt, self._rttvar = rtt, rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+        self._backoff = 1
+
+    def request_timed_out(self) -> None:
+        """Пір не надіслав блок за rto"""
+        self._backoff = min(self._backoff * 2, 64)
+
+    def _send(self, data: bytes) -> None:
+        """Постановка повідомлення в чергу на надсилання. Всі повідомлення, що накопичились
+        до наступного пробудження задачі _sender, записуються в сокет одним writelines"""
+        if not self._connected:
+            return
+        self._send_queue.append(data)
+        self._send_queued_bytes += len(data)
+        self._send_wakeup.set()
+        self._last_message_time = time.time()
+
+    async def _sender(self) -> None:
+        while True:
+            await self._send_wakeup.wait()
+            self._send_wakeup.clear()
+            batch, self._send_queue = self._send_queue, list()
+            if not batch: continue
+            size = sum(map(len, batch))
+            metrics.MESSAGES_SENT.inc(len(batch))
+            metrics.SEND_BATCHES.inc()
+            try:
+                self._stream_writer.writelines(batch)
+                await self._stream_writer.drain()
+            except:
+                await self.disconnect()
+                return
+            self._send_queued_bytes -= size
+            if self._send_queued_bytes < SEND_QUEUE_LIMIT:
+                self._send_space.set()
+
     async def _safe_write(self, data: bytes) -> None:
         # if self._stream_writer.is_closing():
         #     await self.disconnect()
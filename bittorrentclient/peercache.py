@@ -0,0 +1,99 @@
+import dataclasses
+import json
+import math
+import os
+import time
+import typing
+
+from .peer import Peer
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".bittorrentclient", "peers.json")
+
+
+@dataclasses.dataclass()
+class CachedPeer:
+    """Запис про піра, з яким вже було з'єднання у попередніх запусках"""
+    ip: str
+    port: int
+    last_seen: float
+    rate: float
+
+    def to_peer(self) -> Peer:
+        return Peer(self.ip, self.port)
+
+    @classmethod
+    def from_dict(cls, data) -> typing.Self | None:
+        """Запис з JSON, None - якщо поля відсутні або мають хибний тип"""
+        if not isinstance(data, dict):
+            return None
+        ip, port, last_seen, rate = (data.get(key) for key in ("ip", "port", "last_seen", "rate"))
+        numbers = (last_seen, rate)
+        if (not isinstance(ip, str) or type(port) is not int or not 0 < port < 65536
+                or not all(type(n) in (int, float) and math.isfinite(n) for n in numbers)):
+            return None
+        return cls(ip=ip, port=port, last_seen=float(last_seen), rate=float(rate))
+
+
+class PeerCache:
+    """Зберігає найкращих пірів для кожного info hash між запусками програми.
+    Записи старші за max_age відкидаються, на кожен торент зберігається не більше max_peers записів."""
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_peers: int = 50, max_torrents: int = 1000,
+                 max_age: int = 7 * 24 * 3600):
+        self._path = path
+        self._max_peers = max_peers
+        self._max_torrents = max_torrents
+        self._max_age = max_age
+        self._torrents: dict[str, list[CachedPeer]] = dict()
+
+    def load(self) -> None:
+        try:
+            with open(self._path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if not isinstance(data, dict):
+            return  # зіпсований кеш вважається порожнім
+        for info_hash, peers in data.items():
+            if not isinstance(peers, list):
+                continue
+            peers = [p for p in map(CachedPeer.from_dict, peers) if p is not None]  # зіпсовані записи відкидаються
+            if peers: self._torrents[info_hash] = peers
+        self._expire()
+
+    def save(self) -> None:
+        self._expire()
+        directory = os.path.dirname(self._path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        data = {info_hash: [dataclasses.asdict(p) for p in peers] for info_hash, peers in self._torrents.items()}
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path)
+
+    def get(self, info_hash: bytes) -> list[Peer]:
+        """Піри для швидкого старту, найкращі спочатку"""
+        self._expire()
+        return [p.to_peer() for p in self._torrents.get(info_hash.hex(), [])]
+
+    def update(self, info_hash: bytes, peers: typing.Iterable[tuple[str, int, float, float]]) -> None:
+        """Оновлення записів торенту кортежами (ip, port, last_seen, rate)"""
+        records = {(p.ip, p.port): p for p in self._torrents.get(info_hash.hex(), [])}
+        border = time.time() - self._max_age
+        for ip, port, last_seen, rate in peers:
+            if last_seen < border: continue
+            old = records.get((ip, port))
+            if old is None or old.last_seen <= last_seen:
+                records[(ip, port)] = CachedPeer(ip=ip, port=port, last_seen=last_seen, rate=rate)
+        best = sorted(records.values(), key=lambda p: (p.rate, p.last_seen), reverse=True)
+        self._torrents.pop(info_hash.hex(), None)
+        self._torrents[info_hash.hex()] = best[:self._max_peers]  # останній оновлений торент в кінці словника
+
+    def _expire(self) -> None:
+        border = time.time() - self._max_age
+        for info_hash in list(self._torrents):
+            peers = [p for p in self._torrents[info_hash] if p.last_seen >= border]
+            if peers: self._torrents[info_hash] = peers
+            else: self._torrents.pop(info_hash)
+        while len(self._torrents) > self._max_torrents:
+            self._torrents.pop(next(iter(self._torrents)))
@@ -0,0 +1,183 @@
+import itertools
+import typing
+
+if typing.TYPE_CHECKING:
+    import peer
+
+
+Address = tuple[str, int]
+
+
+class PeerRecord:
+    """Відомий пір, з яким ще немає з'єднання. Займає кілька десятків байтів замість повного Peer.
+    local - пір з локальної мережі (знайдений через LSD)"""
+    __slots__ = ("ip", "port", "local")
+
+    def __init__(self, ip: str, port: int, local: bool = False):
+        self.ip = ip
+        self.port = port
+        self.local = local
+
+    @property
+    def address(self) -> Address:
+        return self.ip, self.port
+
+    def __repr__(self) -> str:
+        return f"PeerRecord({self.ip!r}, {self.port})"
+
+
+class PeerRegistry:
+    """Піри торенту. Відомі адреси зберігаються як PeerRecord за ключем (ip, port), живі з'єднання - як Peer.
+    Для станів (вільні для з'єднання, підключені, цікаві) та запитаних кусків є окремі індекси,
+    тож додавання адрес, вибір кандидатів та від'єднання не проходять по всіх пірах"""
+    def __init__(self):
+        self._records: dict[Address, PeerRecord] = dict()
+        self._idle: dict[Address, PeerRecord] = dict()  # без з'єднання, в порядку надходження
+        self._idle_local: dict[Address, PeerRecord] = dict()  # частина _idle з локальної мережі
+        self._local_ips: set[str] = set()
+        self._connected: dict['peer.Peer', None] = dict()
+        self._ids: dict[bytes, 'peer.Peer'] = dict()
+        self._interesting: dict['peer.Peer', None] = dict()
+        self._requests: dict[int, dict['peer.Peer', None]] = dict()
+        self._requested_by: dict['peer.Peer', set[int]] = dict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    @property
+    def idle_local_count(self) -> int:
+        return len(self._idle_local)
+
+    @property
+    def connected_count(self) -> int:
+        return len(self._connected)
+
+    @property
+    def local_count(self) -> int:
+        """Підключені піри з локальної мережі"""
+        return sum(p.local for p in self._connected)
+
+    @property
+    def interesting_count(self) -> int:
+        return len(self._interesting)
+
+    @property
+    def connected(self) -> list['peer.Peer']:
+        return list(self._connected)
+
+    @property
+    def interesting(self) -> list['peer.Peer']:
+        return list(self._interesting)
+
+    def add(self, addresses: typing.Iterable[Address], local: bool = False) -> int:
+        """Додавання адрес. Вже відомі та підключені пропускаються. Повертає кількість нових.
+        Адреси з local=True позначаються локальними, навіть якщо вже відомі"""
+        connected = {(p.ip, p.listen_port) for p in self._connected} | {(p.ip, p.port) for p in self._connected}
+        added = 0
+        for ip, port in addresses:
+            address = (ip, port)
+            if local: self._mark_local(address)
+            if address in self._records or address in connected:
+                continue
+            record = PeerRecord(ip, port, local)
+            self._records[address] = record
+            self._idle[address] = record
+            if local: self._idle_local[address] = record
+            added += 1
+        return added
+
+    def _mark_local(self, address: Address) -> None:
+        self._local_ips.add(address[0])
+        record = self._records.get(address)
+        if record is not None and not record.local:
+            record.local = True
+            if address in self._idle: self._idle_local[address] = record
+        for peer in self._connected:
+            if peer.ip == address[0]: peer.local = True
+
+
+    def forget(self, addresses: typing.Iterable[Address]) -> None:
+        """Видалення адрес, з якими немає з'єднання"""
+        for address in addresses:
+            if self._idle.pop(address, None) is not None:
+                self._idle_local.pop(address, None)
+                self._records.pop(address, None)
+
+    def take(self, count: int) -> list[PeerRecord]:
+        """Перші count вільних записів для з'єднання, спершу локальні.
+        Вони залишаються відомими, але не вільними"""
+        taken: dict[Address, PeerRecord] = dict()
+        for record in itertools.chain(self._idle_local.values(), self._idle.values()):
+            if len(taken) >= count:
+                break
+            taken[record.address] = record
+        for address in taken:
+            del self._idle[address]
+            self._idle_local.pop(address, None)
+        return list(taken.values())
+
+    def failed(self, address: Address) -> None:
+        """З'єднатися не вдалося - адреса забувається"""
+        self._idle.pop(address, None)
+        self._idle_local.pop(address, None)
+        self._records.pop(address, None)
+
+    def attach(self, peer: 'peer.Peer') -> None:
+        if peer.ip in self._local_ips: peer.local = True
+        self._connected[peer] = None
+        if peer.id: self._ids[peer.id] = peer
+
+    def detach(self, peer: 'peer.Peer') -> None:
+        """Пір від'єднався: видалення з усіх індексів, адреса вихідного з'єднання знову вільна"""
+        self._connected.pop(peer, None)
+        self._interesting.pop(peer, None)
+        if self._ids.get(peer.id) is peer:
+            del self._ids[peer.id]
+        for index in self._requested_by.pop(peer, ()):
+            requesters = self._requests.get(index)
+            if requesters is not None:
+                requesters.pop(peer, None)
+                if not requesters: del self._requests[index]
+        record = self._records.get((peer.ip, peer.port))
+        if record is not None and not peer.incoming:
+            self._idle[record.address] = record
+            if record.local: self._idle_local[record.address] = record
+
+    def by_id(self, peer_id: bytes) -> 'peer.Peer | None':
+        return self._ids.get(peer_id)
+
+    def set_interesting(self, peer: 'peer.Peer', interesting: bool) -> None:
+        if interesting and peer in self._connected:
+            self._interesting[peer] = None
+        else:
+            self._interesting.pop(peer, None)
+
+    def is_interesting(self, peer: 'peer.Peer') -> bool:
+        return peer in self._interesting
+
+    def add_request(self, index: int, peer: 'peer.Peer') -> None:
+        self._requests.setdefault(index, dict())[peer] = None
+        self._requested_by.setdefault(peer, set()).add(index)
+
+    def remove_request(self, index: int, peer: 'peer.Peer') -> None:
+        requesters = self._requests.get(index)
+        if requesters is not None:
+            requesters.pop(peer, None)
+            if not requesters: del self._requests[index]
+        indexes = self._requested_by.get(peer)
+        if indexes is not None:
+            indexes.discard(index)
+
+    def is_requesting(self, index: int, peer: 'peer.Peer') -> bool:
+        return peer in self._requests.get(index, ())
+
+    def pop_requests(self, index: int) -> list['peer.Peer']:
+        """Піри, у яких запитано кусок, з видаленням індексу куска"""
+        requesters = list(self._requests.pop(index, ()))
+        for peer in requesters:
+            self._requested_by.get(peer, set()).discard(index)
+        return requesters
@@ -0,0 +1,109 @@
+import asyncio
+import ipaddress
+import struct
+import time
+import typing
+
+from .bencoder import BenCoder
+from .peer import Peer
+
+if typing.TYPE_CHECKING:
+    import peer
+
+
+FLAG_SEED = 0x02
+FLAG_REACHABLE = 0x10
+
+
+def compact_peers(addresses: typing.Iterable[tuple[str, int]]) -> bytes:
+    result = b""
+    for ip, port in addresses:
+        try:
+            result += ipaddress.IPv4Address(ip).packed + struct.pack("!H", port)
+        except ipaddress.AddressValueError:
+            continue
+    return result
+
+
+def parse_compact_peers(data: bytes) -> list[tuple[str, int]]:
+    return [(str(ipaddress.IPv4Address(data[i:i + 4])), struct.unpack("!H", data[i + 4:i + 6])[0])
+            for i in range(0, len(data) - len(data) % 6, 6)]
+
+
+class PeerExchange:
+    """Обмін списками пірів з підключеними пірами через ut_pex (BEP 11).
+    Кожному піру надсилаються лише зміни з попереднього повідомлення, не частіше ніж раз на interval.
+    Вхідні повідомлення від одного піра частіше ніж min_interval ігноруються."""
+    def __init__(self, get_connected: typing.Callable[[], typing.Iterable['peer.Peer']],
+                 update_peers: typing.Callable[[typing.Sequence['peer.Peer']], None],
+                 forget_peers: typing.Callable[[typing.Sequence['peer.Peer']], None] | None = None,
+                 interval: float = 60, min_interval: float = 30, max_added: int = 50,
+                 log_func: typing.Callable[[str], None] | None = None):
+        self._get_connected = get_connected
+        self._update_peers = update_peers
+        self._forget_peers = forget_peers if forget_peers else lambda a: a
+        self._interval = interval
+        self._min_interval = min_interval
+        self._max_added = max_added
+
+        self._sent: dict['peer.Peer', set[tuple[str, int]]] = dict()
+        self._last_received: dict['peer.Peer', float] = dict()
+        self.received_peers = 0
+
+        self._log_func = log_func if log_func else lambda a: a
+
+    def attach(self, peer: 'peer.Peer') -> None:
+        peer.reg_extension_taker("ut_pex", self._on_message)
+
+    def detach(self, peer: 'peer.Peer') -> None:
+        self._sent.pop(peer, None)
+        self._last_received.pop(peer, None)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.send_updates()
+
+    async def send_updates(self) -> None:
+        connected = [p for p in self._get_connected() if p.connected]
+        flags = dict()
+        for p in connected:
+            if p.listen_port is None: continue
+            flags[(p.ip, p.listen_port)] = (FLAG_SEED if p.bitfield and p.bitfield.full() else 0) | \
+                                           (0 if p.incoming else FLAG_REACHABLE)
+        for p in connected:
+            if "ut_pex" not in p.extensions: continue
+            current = {address for address in flags if address != (p.ip, p.listen_port)}
+            last = self._sent.get(p, set())
+            added = list(current - last)[:self._max_added]
+            dropped = list(last - current)[:self._max_added]
+            if not added and not dropped and p in self._sent: continue
+            message = {"added": compact_peers(added), "added.f": bytes(flags[a] for a in added),
+                       "dropped": compact_peers(dropped)}
+            if await p.send_extension("ut_pex", BenCoder.encode(message)):
+                self._sent[p] = (last | set(added)) - set(dropped)
+
+    def _on_message(self, peer: 'peer.Peer', payload: bytes) -> None:
+        now = time.time()
+        if now - self._last_received.get(peer, 0) < self._min_interval:
+            return
+        self._last_received[peer] = now
+        try:
+            data = BenCoder.decode(payload)
+        except Exception:
+            return
+        if not isinstance(data, dict):
+            return
+        added, dropped = data.get("added", b""), data.get("dropped", b"")
+        added = added.encode() if isinstance(added, str) else added  # BenCoder декодує текстові рядки
+        dropped = dropped.encode() if isinstance(dropped, str) else dropped
+        if not isinstance(added, bytes) or not isinstance(dropped, bytes):
+            return
+        added = parse_compact_peers(added)[:self._max_added]
+        dropped = parse_compact_peers(dropped)[:self._max_added]
+        if added:
+            self.received_peers += len(added)
+            self._update_peers([Peer(ip, port) for ip, port in added])
+            self._log_func(f"Peer {peer.ip}:{peer.port} has given {len(added)} peers")
+        if dropped:
+            self._forget_peers([Peer(ip, port) for ip, port in dropped])
@@ -0,0 +1,388 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import glob
+import os.path
+import socket
+import struct
+import typing
+
+import aiohttp
+
+from .bencoder import BenCoderEncodeError
+from .dht import DHTNode, DHTTracker
+from .lsd import LocalDiscovery
+from .diagnostics import Diagnostics
+from .limits import ConnectionBudget, RateLimiter
+from .loadmanager import LoadManager
+from .magnet import Magnet, MetadataFetcher
+from .metrics import REGISTRY, MetricsExporter
+from .peercache import PeerCache
+from .banlist import BanList
+from .statistic import Statistic
+from .streaming import TorrentStream, DEFAULT_RATE, DEFAULT_WINDOW
+from .torrentfile import TorrentFile, BadTorrentFile
+from .tracker import TrackerManager
+from .utp import UTPSocket
+
+
+HANDSHAKE_LENGTH = 68
+
+
+@dataclasses.dataclass()
+class SessionTorrent:
+    """Торент, який обслуговується сесією"""
+    torrent: TorrentFile
+    destination: str
+    loadmanager: LoadManager
+    track_manager: TrackerManager
+    path: str | None = None
+    dht_tracker: DHTTracker | None = None
+    tasks: list[asyncio.Task] = dataclasses.field(default_factory=list)
+
+
+class Session:
+    """Обслуговує багато торентів в одному event loop.
+    Торенти ділять один сокет для вхідних з'єднань, одну HTTP-сесію для трекерів,
+    загальний ліміт з'єднань та швидкості і один пул потоків для дискових операцій.
+    Якщо задано dht, всі торенти також шукають пірів через один DHT вузол.
+    Якщо задано lsd, публічні торенти оголошуються в локальній мережі (BEP 14), знайдені там піри мають перевагу.
+    Якщо utp=True, на тому ж номері порту відкривається UDP сокет для uTP з'єднань, і вихідні з'єднання
+    спершу пробують uTP. HTTP дзеркала торентів (url-list) ділять окрему keep-alive HTTP-сесію,
+    до кожного дзеркала не більше web_seed_connections з'єднань.
+    Якщо super_seed=True, повністю завантажені торенти роздаються суперсідуванням (BEP 16), поки в рої не буде
+    повної копії."""
+    def __init__(self, peer_id: bytes, port: int = 10101, host: str | None = None, max_connections: int = 200,
+                 max_connections_per_torrent: int = 10, upload_rate: int = 0, download_rate: int = 0,
+                 disk_threads: int = 4, to_upload: bool = True, to_download: bool = True,
+                 peer_connect_timeout: int = 10, piece_receive_timeout: int = 5, tracker_timeout: int = 5,
+                 pex_interval: float = 60, peer_cache: PeerCache | None = None, ban_list: BanList | None = None,
+                 dht: DHTNode | None = None, lsd: LocalDiscovery | None = None, web_seed_connections: int = 4,
+                 super_seed: bool = False,
+                 utp: bool = False, metrics_port: int | None = None, metrics_path: str | None = None,
+                 metrics_interval: float = 10, diagnostics_path: str | None = None, diagnostics_profile: bool = False,
+                 log_func: typing.Callable[[str], None] | None = None):
+        self._peer_id = peer_id
+        self._port = port
+        self._host = host
+        self._max_connections_per_torrent = max_connections_per_torrent
+        self._to_upload = to_upload
+        self._to_download = to_download
+        self._peer_connect_timeout = peer_connect_timeout
+        self._piece_receive_timeout = piece_receive_timeout
+        self._tracker_timeout = tracker_timeout
+        self._pex_interval = pex_interval
+        self._peer_cache = peer_cache
+        self._ban_list = ban_list if ban_list else BanList(path=None)
+        self._dht = dht
+        self._lsd = lsd
+        self._utp = utp
+        self._web_seed_connections = web_seed_connections
+        self._super_seed = super_seed
+        self._utp_socket: UTPSocket | None = None
+        self._metrics: MetricsExporter | None = None
+        self._metric_names: list[str] = list()
+        self._diagnostics = Diagnostics(diagnostics_path, profile=diagnostics_profile, log_func=log_func) \
+            if diagnostics_path else None
+        if metrics_port is not None or metrics_path:
+            self._metrics = MetricsExporter(REGISTRY, port=metrics_port, path=metrics_path, interval=metrics_interval,
+                                            log_func=log_func)
+
+        self.connection_budget = ConnectionBudget(max_connections)
+        self.upload_limiter = RateLimiter(upload_rate)
+        self.download_limiter = RateLimiter(download_rate)
+        self._disk_executor = concurrent.futures.ThreadPoolExecutor(max_workers=disk_threads,
+                                                                    thread_name_prefix="disk")
+
+        self._torrents: dict[bytes, SessionTorrent] = dict()
+        self._magnets: dict[bytes, MetadataFetcher] = dict()
+        self._server: asyncio.AbstractServer | None = None
+        self._http_session: aiohttp.ClientSession | None = None
+        self._web_session: aiohttp.ClientSession | None = None  # для дзеркал, без загального тайм-ауту запиту
+        self._service_tasks: list[asyncio.Task] = list()
+
+        self._log_func = log_func if log_func else lambda a: a
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    @property
+    def max_connections_per_torrent(self) -> int:
+        return self._max_connections_per_torrent
+
+    @property
+    def dht(self) -> DHTNode | None:
+        return self._dht
+
+    @property
+    def torrents(self) -> list[SessionTorrent]:
+        return list(self._torrents.values())
+
+    async def start(self) -> None:
+        """Відкриття сокету для вхідних з'єднань та спільної HTTP-сесії"""
+        if self._diagnostics:
+            await self._diagnostics.start()
+        self._http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self._tracker_timeout))
+        self._web_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=self._web_seed_connections),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self._peer_connect_timeout, sock_read=60))
+        self._server = await asyncio.start_server(self._handle_incoming, host=self._host, port=self._port)
+        if not self._port:
+            sockets = [s for s in self._server.sockets if s.family == socket.AF_INET] or self._server.sockets
+            self._port = sockets[0].getsockname()[1]
+        if self._utp:
+            self._utp_socket = UTPSocket(self._port, self._host, self._handle_incoming,
+                                         max_incoming=self.connection_budget.limit)
+            await self._utp_socket.start()
+        self._ban_list.load()
+        if self._peer_cache:
+            self._peer_cache.load()
+            self._service_tasks.append(asyncio.Task(self._save_peer_cache()))
+        if self._dht:
+            await self._dht.start()
+            self._log_func(f"DHT node is listening on port {self._dht.port}")
+        if self._lsd:
+            await self._lsd.start(self._port)
+        if self._metrics:
+            self._register_metrics()
+            await self._metrics.start()
+        self._log_func(f"Session is listening on port {self._port}")
+
+    def add_torrent(self, torrent: TorrentFile, destination: str, path: str | None = None,
+                    file_priorities: dict[int, int] | None = None) -> SessionTorrent:
+        """Додавання торенту до сесії та запуск його завантаження і відвантаження.
+        file_priorities задає пріоритети файлів за їх номерами, решта файлів - PRIORITY_NORMAL"""
+        if torrent.infoHash in self._torrents:
+            return self._torrents[torrent.infoHash]
+
+        log_func = lambda a: self._log_func(f"[{torrent.name}] {a}")
+        loadmanager = LoadManager(torrent, destination, self._peer_id, log_func=log_func,
+                                  max_connections=self._max_connections_per_torrent,
+                                  peer_connect_timeout=self._peer_connect_timeout,
+                                  piece_receive_timeout=self._piece_receive_timeout,
+                                  connection_budget=self.connection_budget,
+                                  upload_limiter=self.upload_limiter, download_limiter=self.download_limiter,
+                                  disk_executor=self._disk_executor, listen_port=self._port,
+                                  pex_interval=self._pex_interval, dht=self._dht,
+                                  utp_socket=self._utp_socket, file_priorities=file_priorities,
+                                  ban_list=self._ban_list, http_session=self._web_session,
+                                  web_seed_connections=self._web_seed_connections, super_seed=self._super_seed)
+        track_manager = TrackerManager(torrent, self._peer_id, timeout=self._tracker_timeout, log_func=log_func,
+                                       port=self._port, session=self._http_session)
+        track_manager.reg_clb_peers(loadmanager.update_peers)
+        track_manager.reg_clb_info(loadmanager.get_stat)
+
+        st = SessionTorrent(torrent=torrent, destination=destination, loadmanager=loadmanager,
+                            track_manager=track_manager, path=path)
+        if self._peer_cache:
+            loadmanager.update_peers(self._peer_cache.get(torrent.infoHash))
+        st.tasks.append(asyncio.Task(track_manager.run()))
+        if self._dht:
+            st.dht_tracker = DHTTracker(self._dht, torrent.infoHash, self._port, log_func=log_func)
+            st.dht_tracker.reg_clb_peers(loadmanager.update_peers)
+            st.tasks.append(asyncio.Task(st.dht_tracker.run()))
+        if self._lsd and not torrent.private:
+            self._lsd.add(torrent.infoHash, lambda peers: loadmanager.update_peers(peers, local=True))
+        if self._to_download:
+            st.tasks.append(asyncio.Task(loadmanager.start_download()))
+        if self._to_upload:
+            st.tasks.append(asyncio.Task(loadmanager.start_upload()))
+        self._torrents[torrent.infoHash] = st
+        self._log_func(f"Torrent {torrent.name} added")
+        return st
+
+    async def add_magnet(self, uri: str, destination: str,
+                         file_priorities: dict[int, int] | None = None) -> SessionTorrent | None:
+        """Отримання метаданих за magnet посиланням від пірів та додавання торенту.
+        Поки метадані завантажуються, піри шукаються так само, як для звичайного торенту."""
+        magnet = Magnet.parse(uri)
+        if magnet.info_hash in self._torrents:
+            return self._torrents[magnet.info_hash]
+        if magnet.info_hash in self._magnets:
+            return None
+        name = magnet.name or magnet.info_hash.hex()
+        log_func = lambda a: self._log_func(f"[{name}] {a}")
+        fetcher = MetadataFetcher(magnet, self._peer_id, max_connections=self._max_connections_per_torrent,
+                                  listen_port=self._port, peer_connect_timeout=self._peer_connect_timeout,
+                                  dht=self._dht is not None, log_func=log_func)
+        self._magnets[magnet.info_hash] = fetcher
+        track_manager = TrackerManager(magnet, self._peer_id, timeout=self._tracker_timeout, log_func=log_func,
+                                       port=self._port, session=self._http_session)
+        track_manager.reg_clb_peers(fetcher.update_peers)
+        track_manager.reg_clb_info(fetcher.get_stat)
+        tasks = [asyncio.Task(track_manager.run())]
+        dht_tracker = None
+        if self._dht:
+            dht_tracker = DHTTracker(self._dht, magnet.info_hash, self._port, first_interval=10, log_func=log_func)
+            dht_tracker.reg_clb_peers(fetcher.update_peers)
+            tasks.append(asyncio.Task(dht_tracker.run()))
+        if self._lsd:
+            self._lsd.add(magnet.info_hash, fetcher.update_peers)
+        if self._peer_cache:
+            fetcher.update_peers(self._peer_cache.get(magnet.info_hash))
+        self._log_func(f"Fetching metadata for {name}")
+        try:
+            info_bytes = await fetcher.fetch()
+        finally:
+            self._magnets.pop(magnet.info_hash, None)
+            await track_manager.stop()
+            if dht_tracker: await dht_tracker.stop()
+            if self._lsd: self._lsd.remove(magnet.info_hash)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            torrent = TorrentFile.from_info(info_bytes, magnet.trackers)
+        except (BenCoderEncodeError, BadTorrentFile, KeyError, TypeError):
+            self._log_func(f"Metadata for {name} is spoiled")
+            return None
+        st = self.add_torrent(torrent, destination, file_priorities=file_priorities)
+        st.loadmanager.time_to_metadata = fetcher.time_to_metadata
+        st.loadmanager.update_peers(fetcher.peers)
+        return st
+
+    def add_torrent_file(self, path: str, destination: str,
+                         file_priorities: dict[int, int] | None = None) -> SessionTorrent | None:
+        try:
+            torrent = TorrentFile.open(path)
+        except (FileNotFoundError, BenCoderEncodeError, BadTorrentFile):
+            self._log_func(f"Torrent file {path} is spoiled")
+            return None
+        return self.add_torrent(torrent, destination, path, file_priorities)
+
+    def set_file_priorities(self, info_hash: bytes, file_priorities: dict[int, int]) -> None:
+        """Зміна пріоритетів файлів торенту. Якщо торент вже завантажено, а вибрано нові файли,
+        завантаження запускається знову"""
+        st = self._torrents[info_hash]
+        if st.loadmanager.set_file_priorities(file_priorities) and self._to_download:
+            st.tasks.append(asyncio.Task(st.loadmanager.start_download()))
+
+    def open_stream(self, info_hash: bytes, file_index: int = 0, rate: float = DEFAULT_RATE,
+                    window: float = DEFAULT_WINDOW) -> TorrentStream:
+        """Потокове читання файлу торенту, поки він завантажується. Куски попереду позиції читання
+        завантажуються першими"""
+        st = self._torrents[info_hash]
+        return TorrentStream(st.loadmanager, file_index, rate=rate, window=window)
+
+    async def remove_torrent(self, info_hash: bytes) -> None:
+        st = self._torrents.pop(info_hash, None)
+        if st is None:
+            return
+        if self._lsd: self._lsd.remove(info_hash)
+        await st.loadmanager.shutdown()
+        await st.track_manager.stop()
+        if st.dht_tracker: await st.dht_tracker.stop()
+        for task in st.tasks:
+            task.cancel()  # цикл, що чекає мережу чи DHT, не має затримувати видалення
+        await asyncio.gather(*st.tasks, return_exceptions=True)
+        self._remember_peers(st)
+        self._log_func(f"Torrent {st.torrent.name} removed")
+
+    async def watch_directory(self, directory: str, destination: str, period: float = 5) -> None:
+        """Стеження за папкою з .torrent файлами. Нові файли додаються, видалені - прибираються з сесії"""
+        while True:
+            paths = set(glob.glob(os.path.join(directory, "*.torrent")))
+            known = {st.path: info_hash for info_hash, st in self._torrents.items() if st.path}
+            for path in paths - known.keys():
+                self.add_torrent_file(path, destination)
+            for path in known.keys() - paths:
+                await self.remove_torrent(known[path])
+            await asyncio.sleep(period)
+
+    async def _handle_incoming(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Маршрутизація вхідного з'єднання до торенту за info hash з handshake"""
+        try:
+            data = await asyncio.wait_for(reader.readexactly(HANDSHAKE_LENGTH), self._peer_connect_timeout)
+            pstr_len, pstr, reserved, info_hash, peer_id = struct.unpack("!B19s8s20s20s", data)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, struct.error):
+            writer.close()
+            return
+        st = self._torrents.get(info_hash)
+        if pstr_len != 19 or pstr != b"BitTorrent protocol" or st is None \
+                or not await st.loadmanager.accept_peer(reader, writer, peer_id, reserved):
+            writer.close()
+
+    def _remember_peers(self, st: SessionTorrent) -> None:
+        if self._peer_cache:
+            self._peer_cache.update(st.torrent.infoHash, st.loadmanager.known_good_peers())
+
+    async def _save_peer_cache(self, period=60) -> None:
+        """Періодичне збереження кешу пірів"""
+        while True:
+            await asyncio.sleep(period)
+            for st in self._torrents.values():
+                self._remember_peers(st)
+            self._peer_cache.save()
+
+    def get_stat(self) -> Statistic:
+        """Сумарна статистика по всіх торентах сесії"""
+        return Statistic.sum(st.loadmanager.get_stat() for st in self._torrents.values())
+
+    def _register_metrics(self) -> None:
+        """Метрики торентів та пірів обчислюються лише під час експорту"""
+        def per_torrent(func):
+            return lambda: [((st.torrent.name,), func(st.loadmanager)) for st in self._torrents.values()]
+
+        def per_peer(func):
+            return lambda: [((st.torrent.name, f"{p.ip}:{p.port}"), func(p)) for st in self._torrents.values()
+                            for p in st.loadmanager.connected_peers]
+
+        self._metric_names = ["bt_torrents", "bt_torrent_left_bytes", "bt_torrent_connected_peers",
+                              "bt_upload_queue_depth", "bt_peer_download_rate_bytes", "bt_peer_outstanding_requests",
+                              "bt_peer_rto_seconds", "bt_session_connections"]
+        REGISTRY.gauge("bt_torrents", "Torrents in session", func=lambda: len(self._torrents))
+        REGISTRY.gauge("bt_torrent_left_bytes", "Bytes of selected files to download", ("torrent",),
+                       func=per_torrent(lambda lm: lm.get_stat().left))
+        REGISTRY.gauge("bt_torrent_connected_peers", "Connected peers", ("torrent",),
+                       func=per_torrent(lambda lm: len(lm.connected_peers)))
+        REGISTRY.gauge("bt_upload_queue_depth", "Block requests waiting for upload", ("torrent",),
+                       func=per_torrent(lambda lm: lm.upload_queue.qsize()))
+        REGISTRY.gauge("bt_peer_download_rate_bytes", "Average download rate from peer", ("torrent", "peer"),
+                       func=per_peer(lambda p: round(p.rate, 1)))
+        REGISTRY.gauge("bt_peer_outstanding_requests", "Requested blocks without answer", ("torrent", "peer"),
+                       func=per_peer(lambda p: p.outstanding_requests))
+        REGISTRY.gauge("bt_peer_rto_seconds", "Current block request timeout of peer", ("torrent", "peer"),
+                       func=per_peer(lambda p: round(p.rto, 3)))
+        REGISTRY.gauge("bt_session_connections", "Connections in use from session budget",
+                       func=lambda: self.connection_budget.used)
+
+    async def shutdown(self) -> None:
+        for task in self._service_tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._service_tasks = list()
+
+        for info_hash in list(self._torrents):
+            await self.remove_torrent(info_hash)
+        if self._peer_cache:
+            self._peer_cache.save()
+
+        if self._dht:
+            await self._dht.stop()
+        if self._lsd:
+            await self._lsd.stop()
+        if self._metrics:
+            await self._metrics.stop()
+            for name in self._metric_names:
+                REGISTRY.remove(name)
+        if self._utp_socket:
+            await self._utp_socket.stop()
+            self._utp_socket = None
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._http_session:
+            await self._http_session.close()
+            self._http_session = None
+        if self._web_session:
+            await self._web_session.close()
+            self._web_session = None
+        self._disk_executor.shutdown(wait=True)
+        if self._diagnostics:
+            await self._diagnostics.stop()
@@ -0,0 +1,270 @@
+import asyncio
+import dataclasses
+import glob
+import hashlib
+import multiprocessing
+import os.path
+import queue
+import typing
+
+from .bencoder import BenCoderEncodeError
+from .dht import DHTNode
+from .lsd import LocalDiscovery
+from .magnet import Magnet
+from .peercache import PeerCache
+from .banlist import BanList
+from .session import Session
+from .statistic import Statistic
+from .torrentfile import TorrentFile, BadTorrentFile
+
+
+def shard_of(info_hash: bytes, shards: int) -> int:
+    """Номер процесу, який обслуговує торент"""
+    return int.from_bytes(info_hash[:4], "big") % shards
+
+
+def shard_peer_id(peer_id: bytes, index: int) -> bytes:
+    """peer_id процесу: префікс клієнта той самий, решта виводиться з peer_id та номера процесу.
+    Інакше процеси приймають з'єднання один з одним за з'єднання з собою, а трекери бачать одного піра"""
+    digest = hashlib.sha1(peer_id + index.to_bytes(4, "big")).digest()
+    return peer_id[:8] + b"%012d" % (int.from_bytes(digest[:8], "big") % 10 ** 12)
+
+
+def split_limit(limit: int, weights: typing.Sequence[int]) -> list[int]:
+    """Розподіл ліміту пропорційно вагам, сума частин не перевищує limit.
+    Кожна частина - хоча б 1, якщо ліміту вистачає на всіх, залишок від округлення
+    отримують частини з найбільшою дробовою частиною"""
+    if not weights:
+        return list()
+    minimum = 1 if limit >= len(weights) else 0
+    spare = max(0, limit - minimum * len(weights))
+    total = sum(weights)
+    shares = [divmod(spare * weight, total) for weight in weights]
+    parts = [minimum + share for share, _ in shares]
+    remainder = spare - sum(share for share, _ in shares)
+    for i in sorted(range(len(weights)), key=lambda i: shares[i][1], reverse=True)[:remainder]:
+        parts[i] += 1
+    return parts
+
+
+async def _worker(index: int, peer_id: bytes, port: int, session_kwargs: dict, peer_cache_path: str | None,
+                  ban_list_path: str | None, ban_threshold: int,
+                  dht_port: int | None, dht_state_path: str | None, lsd: tuple[str, str, int] | None,
+                  commands: multiprocessing.Queue, reports: multiprocessing.Queue, period: float) -> None:
+    log_func = lambda a: reports.put(("log", index, a))
+    peer_cache = PeerCache(f"{peer_cache_path}.{index}") if peer_cache_path else None
+    ban_list = BanList(f"{ban_list_path}.{index}" if ban_list_path else None, threshold=ban_threshold)
+    dht = None
+    if dht_port is not None:
+        dht = DHTNode(dht_port + index if dht_port else 0, log_func=log_func,
+                      state_path=f"{dht_state_path}.{index}" if dht_state_path else None)
+    lsd_node = None
+    if lsd is not None:
+        interface, group, lsd_port = lsd
+        lsd_node = LocalDiscovery(interface, group, lsd_port, log_func=log_func)
+    session = Session(peer_id, port=port, log_func=log_func, peer_cache=peer_cache, ban_list=ban_list, dht=dht,
+                      lsd=lsd_node, **session_kwargs)
+    await session.start()
+    reports.put(("port", index, session.port))
+
+    magnet_tasks: set[asyncio.Task] = set()
+    working = True
+    while working:
+        while True:
+            try:
+                command, *args = commands.get_nowait()
+            except queue.Empty:
+                break
+            if command == "add":
+                session.add_torrent_file(*args)
+            elif command == "magnet":
+                task = asyncio.create_task(session.add_magnet(*args))
+                magnet_tasks.add(task)
+                task.add_done_callback(magnet_tasks.discard)
+            elif command == "remove":
+                await session.remove_torrent(*args)
+            elif command == "limit":
+                session.connection_budget.set_limit(*args)
+            elif command == "stop":
+                working = False
+                break
+        if not working:
+            break
+        demand = sum(min(st.loadmanager.get_stat().peers_count, session.max_connections_per_torrent)
+                     for st in session.torrents)
+        reports.put(("stat", index, dataclasses.asdict(session.get_stat()), demand))
+        await asyncio.sleep(period)
+
+    for task in magnet_tasks:
+        task.cancel()
+    await asyncio.gather(*magnet_tasks, return_exceptions=True)
+    await session.shutdown()
+    reports.put(("stat", index, dataclasses.asdict(session.get_stat()), 0))
+    reports.put(("stopped", index, None))
+
+
+def _worker_main(*args) -> None:
+    asyncio.run(_worker(*args))
+
+
+@dataclasses.dataclass()
+class _Shard:
+    process: multiprocessing.Process
+    commands: multiprocessing.Queue
+    port: int = 0
+    stat: Statistic = dataclasses.field(default_factory=lambda: Statistic(0, 0, 0, 0, 0, 0, 0))
+    demand: int = 0
+    limit: int = 0
+    stopped: bool = False
+
+
+class ShardedSession:
+    """Розподіляє торенти за info hash між кількома процесами, кожен з яких має свою Session та event loop.
+    Збирає статистику з процесів та ділить між ними загальний ліміт з'єднань."""
+    def __init__(self, workers: int, peer_id: bytes, port: int = 10101, max_connections: int = 200,
+                 upload_rate: int = 0, download_rate: int = 0, report_period: float = 1,
+                 peer_cache_path: str | None = None, ban_list_path: str | None = None, ban_threshold: int = 3,
+                 dht_port: int | None = None, dht_state_path: str | None = None,
+                 lsd: tuple[str, str, int] | None = None, log_func: typing.Callable[[str], None] | None = None,
+                 **session_kwargs):
+        self._workers = workers
+        self._peer_id = peer_id
+        self._port = port
+        self._max_connections = max_connections
+        self._report_period = report_period
+        self._peer_cache_path = peer_cache_path
+        self._ban_list_path = ban_list_path
+        self._ban_threshold = ban_threshold
+        self._dht_port = dht_port
+        self._dht_state_path = dht_state_path
+        self._lsd = lsd  # (інтерфейс, група, порт), всі процеси слухають одну групу
+        self._session_kwargs = dict(session_kwargs, upload_rate=upload_rate // workers,
+                                    download_rate=download_rate // workers)
+
+        self._context = multiprocessing.get_context("spawn")
+        self._reports: multiprocessing.Queue = self._context.Queue()
+        self._shards: list[_Shard] = list()
+        self._paths: dict[str, bytes] = dict()
+        self._supervisor: asyncio.Task | None = None
+
+        self._log_func = log_func if log_func else lambda a: a
+
+    @property
+    def ports(self) -> list[int]:
+        return [shard.port for shard in self._shards]
+
+    async def start(self) -> None:
+        """Запуск процесів. Кожен процес слухає свій порт: port + номер процесу, так само порт DHT вузла
+        та порт метрик"""
+        for index in range(self._workers):
+            commands = self._context.Queue()
+            limit = self._max_connections // self._workers
+            kwargs = dict(self._session_kwargs, max_connections=limit)
+            if kwargs.get("metrics_port"):
+                kwargs["metrics_port"] += index
+            if kwargs.get("metrics_path"):
+                kwargs["metrics_path"] = f"{kwargs['metrics_path']}.{index}"
+            if kwargs.get("diagnostics_path"):
+                kwargs["diagnostics_path"] = f"{kwargs['diagnostics_path']}.{index}"
+            port = self._port + index if self._port else 0
+            process = self._context.Process(target=_worker_main, daemon=True,
+                                            args=(index, shard_peer_id(self._peer_id, index), port, kwargs, self._peer_cache_path,
+                                                  self._ban_list_path, self._ban_threshold,
+                                                  self._dht_port, self._dht_state_path, self._lsd, commands,
+                                                  self._reports, self._report_period))
+            process.start()
+            self._shards.append(_Shard(process=process, commands=commands, limit=limit))
+        while not all(shard.port for shard in self._shards):
+            if not all(shard.process.is_alive() for shard in self._shards):
+                raise RuntimeError("Worker process is failed to start")
+            await asyncio.sleep(0.05)
+            self._read_reports()
+        self._supervisor = asyncio.Task(self._supervise())
+
+    def add_torrent_file(self, path: str, destination: str,
+                         file_priorities: dict[int, int] | None = None) -> bytes | None:
+        try:
+            torrent = TorrentFile.open(path)
+        except (FileNotFoundError, BenCoderEncodeError, BadTorrentFile):
+            self._log_func(f"Torrent file {path} is spoiled")
+            return None
+        self._paths[path] = torrent.infoHash
+        self._shards[shard_of(torrent.infoHash, self._workers)].commands.put(("add", path, destination, file_priorities))
+        return torrent.infoHash
+
+    def add_magnet(self, uri: str, destination: str, file_priorities: dict[int, int] | None = None) -> bytes:
+        """Метадані отримує процес, якому належить info hash"""
+        info_hash = Magnet.parse(uri).info_hash
+        self._shards[shard_of(info_hash, self._workers)].commands.put(("magnet", uri, destination, file_priorities))
+        return info_hash
+
+    def remove_torrent(self, info_hash: bytes) -> None:
+        self._paths = {path: ih for path, ih in self._paths.items() if ih != info_hash}
+        self._shards[shard_of(info_hash, self._workers)].commands.put(("remove", info_hash))
+
+    async def watch_directory(self, directory: str, destination: str, period: float = 5) -> None:
+        """Стеження за папкою з .torrent файлами, так само як Session.watch_directory"""
+        while True:
+            paths = set(glob.glob(os.path.join(directory, "*.torrent")))
+            for path in paths - self._paths.keys():
+                self.add_torrent_file(path, destination)
+            for path in self._paths.keys() - paths:
+                self.remove_torrent(self._paths[path])
+            await asyncio.sleep(period)
+
+    async def _supervise(self) -> None:
+        while True:
+            self._read_reports()
+            self._rebalance()
+            await asyncio.sleep(self._report_period)
+
+    def _read_reports(self) -> None:
+        while True:
+            try:
+                kind, index, *data = self._reports.get_nowait()
+            except queue.Empty:
+                return
+            shard = self._shards[index] if index < len(self._shards) else None
+            if kind == "log":
+                self._log_func(f"<{index}> {data[0]}")
+            elif shard is None:
+                continue
+            elif kind == "port":
+                shard.port = data[0]
+            elif kind == "stat":
+                shard.stat = Statistic(**data[0])
+                shard.demand = data[1]
+            elif kind == "stopped":
+                shard.stopped = True
+
+    def _rebalance(self) -> None:
+        """Розподіл загального ліміту з'єднань пропорційно потребам процесів"""
+        weights = [max(shard.demand, shard.stat.connected, 1) for shard in self._shards]
+        for shard, limit in zip(self._shards, split_limit(self._max_connections, weights)):
+            if limit != shard.limit:
+                shard.limit = limit
+                shard.commands.put(("limit", limit))
+
+    def get_stat(self) -> Statistic:
+        """Сумарна статистика по всіх процесах"""
+        return Statistic.sum(shard.stat for shard in self._shards)
+
+    async def shutdown(self, timeout: float = 30) -> None:
+        if self._supervisor:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+            self._supervisor = None
+        for shard in self._shards:
+            shard.commands.put(("stop",))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not all(shard.stopped for shard in self._shards) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+            self._read_reports()
+        for shard in self._shards:
+            shard.process.join(0.1)
+            if shard.process.is_alive():
+                shard.process.terminate()
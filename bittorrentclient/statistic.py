@@ -1,4 +1,5 @@
 import dataclasses
+import typing
 
 
 @dataclasses.dataclass()
@@ -11,3 +12,29 @@ class Statistic:
     connected: int
     interesting: int
     length: int
+    time_to_metadata: float | None = None  # час отримання метаданих для magnet посилань, с
+    time_to_first_byte: float | None = None  # час до перших байтів потокового читання, с
+    completed_pieces: int = 0
+    pieces_count: int = 0
+    requested_blocks: int = 0
+    block_timeouts: int = 0  # блоки, не отримані за RTO піра
+    block_rerequests: int = 0  # повторні запити блоків в інших пірів
+    hash_failures: int = 0  # куски, що не пройшли перевірку хешу
+    banned_peers: int = 0
+    bad_blocks: int = 0  # блоки v2 торентів, що не збіглися з листками Merkle дерева
+    web_seed_bytes: int = 0  # отримано від HTTP дзеркал
+    local_peers: int = 0  # підключені піри з локальної мережі
+
+    @classmethod
+    def sum(cls, stats: typing.Iterable['Statistic']) -> 'Statistic':
+        """Сумарна статистика кількох торентів або процесів. Лічильники додаються,
+        для часів (поля, що можуть бути None) береться найбільший"""
+        stats = list(stats)
+        values = dict()
+        for field in dataclasses.fields(cls):
+            items = [getattr(s, field.name) for s in stats]
+            if field.default is None:
+                values[field.name] = max((item for item in items if item is not None), default=None)
+            else:
+                values[field.name] = sum(items)
+        return cls(**values)
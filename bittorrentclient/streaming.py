@@ -0,0 +1,101 @@
+import os
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    import loadmanager
+
+
+DEFAULT_RATE = 1 << 20  # очікувана швидкість читання споживача, байт/с
+DEFAULT_WINDOW = 10  # на скільки секунд читання вперед призначаються дедлайни
+
+
+class TorrentStream:
+    """Асинхронне читання одного файлу торенту від початку до кінця, поки торент ще завантажується.
+    read() чекає, поки куски, що покривають запитаний діапазон, будуть перевірені та записані на диск.
+    Кожне читання та seek передають позицію в LoadManager, тож куски на window секунд вперед
+    завантажуються за дедлайнами, а решта - від рідкісних.
+    Швидкість читання береться більшою з rate та виміряної швидкості споживача.
+    Куски пропущених файлів (пріоритет skip) не завантажуються, читання їх піднімає loadmanager.PieceSkipped."""
+    def __init__(self, loadmanager: 'loadmanager.LoadManager', file_index: int = 0, rate: float = DEFAULT_RATE,
+                 window: float = DEFAULT_WINDOW):
+        files = loadmanager.filesmanager.files
+        self._loadmanager = loadmanager
+        self._start = sum(size for size, _ in files[:file_index])
+        self._size, self._path = files[file_index]
+        self._rate = rate
+        self._window = window
+        self._position = 0
+        self._opened = time.time()
+        self._read_bytes = 0
+        self._first_read: float | None = None
+        self._closed = False
+        self.time_to_first_byte: float | None = None
+        self._update_position()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        self._update_position()
+        return self._position
+
+    async def read(self, size: int = -1) -> bytes:
+        """Читання до size байтів з поточної позиції. Порожній результат означає кінець файлу"""
+        if self._closed:
+            raise ValueError("read from closed stream")
+        if size < 0 or self._position + size > self._size:
+            size = self._size - self._position
+        if size <= 0:
+            return b""
+        self._update_position()
+        data = await self._loadmanager.read(self._start + self._position, size)
+        now = time.time()
+        if self.time_to_first_byte is None:
+            self.time_to_first_byte = now - self._opened
+            self._first_read = now
+            if self._loadmanager.time_to_first_byte is None:
+                self._loadmanager.time_to_first_byte = self.time_to_first_byte
+        self._read_bytes += len(data)
+        self._position += len(data)
+        self._update_position()
+        return data
+
+    def _update_position(self) -> None:
+        if self._closed:
+            return
+        rate = self._rate
+        if self._first_read is not None and time.time() - self._first_read > 1:
+            rate = max(rate, self._read_bytes / (time.time() - self._first_read))
+        self._loadmanager.set_stream_position(self._start + min(self._position, self._size), rate, self._window,
+                                              end=self._start + self._size)
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._loadmanager.clear_stream_position()
+
+    async def __aenter__(self) -> typing.Self:
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,132 @@
+import asyncio
+import random
+import typing
+
+if typing.TYPE_CHECKING:
+    import peer
+
+
+class SuperSeeder:
+    """Суперсідування (BEP 16) для першого сіда торенту. Замість бітового поля кожному піру оголошується
+    через have лише один кусок, який ще найменше поширений серед пірів і найменше разів пропонувався.
+    Новий кусок пір отримує, коли запропонований йому кусок з'являється в іншого піра, тобто пір передав
+    його далі. Якщо передати кусок нікому (всі підключені вже мають його), або за wait секунд після
+    завантаження кусок так і не поширився, пір отримує новий кусок одразу.
+    Віддаються лише куски, запропоновані піру. Коли кожен кусок з'явився хоча б в одного піра (в рої є
+    повна копія), суперсідування завершується, всім пірам оголошуються всі куски, далі - звичайне сідування"""
+    def __init__(self, pieces_count: int, get_connected: typing.Callable[[], typing.Iterable['peer.Peer']],
+                 wait: float = 30, log_func: typing.Callable[[str], None] | None = None):
+        self._pieces_count = pieces_count
+        self._get_connected = get_connected
+        self._wait = wait
+        self._offers = [0] * pieces_count  # скільки разів кусок пропонувався
+        self._availability = [0] * pieces_count  # у скількох підключених пірів є кусок
+        self._counted: dict['peer.Peer', bytearray] = dict()  # куски піра, враховані в _availability
+        self._seen = bytearray(pieces_count)  # кусок був у когось з пірів
+        self._missing = pieces_count
+        self._current: dict['peer.Peer', int] = dict()  # кусок, запропонований піру останнім
+        self._offered: dict['peer.Peer', set[int]] = dict()
+        self.active = pieces_count > 0
+        self._log_func = log_func if log_func else lambda a: a
+
+    def attach(self, peer: 'peer.Peer') -> None:
+        """Пір щойно підключився, бітове поле йому не надсилається"""
+        self._offered[peer] = set()
+        self._counted[peer] = bytearray(self._pieces_count)
+        self._count_bitfield(peer)
+        peer.reg_have_taker(self._on_have)
+        self._offer(peer)
+
+    def detach(self, peer: 'peer.Peer') -> None:
+        self._current.pop(peer, None)
+        self._offered.pop(peer, None)
+        counted = self._counted.pop(peer, None)
+        if counted is not None:
+            for i in range(self._pieces_count):
+                self._availability[i] -= counted[i]
+
+    def _count_bitfield(self, peer: 'peer.Peer') -> None:
+        """Узгодження лічильників з бітовим полем піра після його отримання"""
+        counted = self._counted.get(peer)
+        if counted is None or peer.bitfield is None:
+            return
+        for i in range(self._pieces_count):
+            has = peer.bitfield.has(i)
+            if has != counted[i]:
+                counted[i] = has
+                self._availability[i] += 1 if has else -1
+
+    def _count_have(self, peer: 'peer.Peer', index: int) -> None:
+        counted = self._counted.get(peer)
+        if counted is not None and 0 <= index < self._pieces_count and not counted[index]:
+            counted[index] = 1
+            self._availability[index] += 1
+
+    def allowed(self, peer: 'peer.Peer', index: int) -> bool:
+        """Чи можна віддати піру блок куска"""
+        return not self.active or index in self._offered.get(peer, ())
+
+    def _offer(self, peer: 'peer.Peer') -> None:
+        """Вибір куска, якого в піра немає: найменш поширений серед підключених, потім найменше пропонований"""
+        if not self.active or not peer.connected or peer not in self._offered:
+            return
+        bitfield = peer.bitfield
+        candidates = [i for i in range(self._pieces_count) if not bitfield.has(i)]
+        if not candidates:
+            self._current.pop(peer, None)
+            return
+        # куска немає в піра, тож _availability - кількість інших пірів, у яких він є
+        index = min(candidates, key=lambda i: (self._availability[i], self._offers[i], random.random()))
+        self._offers[index] += 1
+        self._current[peer] = index
+        self._offered[peer].add(index)
+        peer.have(index)
+
+    def _on_have(self, peer: 'peer.Peer', index: int | None) -> None:
+        """Пір повідомив про новий кусок (index) або надіслав бітове поле (None)"""
+        if not self.active:
+            return
+        if index is None:
+            self._count_bitfield(peer)
+            for i in range(self._pieces_count):
+                if peer.bitfield.has(i): self._mark_seen(i)
+        else:
+            self._count_have(peer, index)
+            self._mark_seen(index)
+        if not self.active:
+            return
+        for holder, current in list(self._current.items()):
+            if holder is not peer and (current == index or index is None and peer.bitfield.has(current)):
+                self._offer(holder)  # кусок передано іншому піру
+        current = self._current.get(peer)
+        if current is None or not peer.bitfield.has(current):
+            if peer not in self._current: self._offer(peer)
+            return
+        if index is None:
+            self._offer(peer)  # бітове поле прийшло після пропозиції, кусок у піра вже був
+        elif all(p.bitfield.has(current) for p in self._get_connected() if p is not peer and p.bitfield is not None):
+            self._offer(peer)  # передати кусок нікому
+        else:
+            asyncio.get_running_loop().call_later(self._wait, self._expire, peer, current)
+
+    def _expire(self, peer: 'peer.Peer', index: int) -> None:
+        if self._current.get(peer) == index:
+            self._offer(peer)
+
+    def _mark_seen(self, index: int) -> None:
+        if not 0 <= index < self._pieces_count or self._seen[index]:
+            return
+        self._seen[index] = 1
+        self._missing -= 1
+        if self._missing == 0:
+            self._finish()
+
+    def _finish(self) -> None:
+        self.active = False
+        self._current.clear()
+        self._offered.clear()
+        self._counted.clear()
+        self._log_func("Swarm has a full copy, super-seeding is finished")
+        for p in self._get_connected():
+            for i in range(self._pieces_count):
+                p.have(i)
@@ -1,22 +1,86 @@
 import datetime
 import hashlib
 import os
+import typing
+from math import ceil
 
 from .bencoder import BenCoder
+from .merkle import MerklePieces, BadHashes
+
+
+PAD_DIR = ".pad"  # файли доповнення (BEP 47) не створюються на диску
 
 
 class BadTorrentFile(Exception):
     pass
 
 
+def _raw(value) -> bytes:
+    """BenCoder декодує рядки, що є коректним UTF-8, у str - двійкові хеші повертаються в bytes"""
+    return value.encode() if isinstance(value, str) else value
+
+
+def _walk_file_tree(tree: dict, path: tuple = ()) -> typing.Iterator[tuple[tuple, dict]]:
+    """Файли з file tree (BEP 52) у порядку ключів: (шлях, {"length", "pieces root"})"""
+    for name, node in tree.items():
+        if not isinstance(node, dict):
+            raise BadTorrentFile
+        if "" in node:
+            yield path + (name,), node[""]
+        else:
+            yield from _walk_file_tree(node, path + (name,))
+
+
 class TorrentFile:
-    def __init__(self, data, infohash):
+    """Торент-файл v1, v2 (BEP 52) або гібридний. Для v2 та гібридних торентів кожен файл починається
+    з нового куска, між файлами стоять файли доповнення, тож files має ту ж розкладку, що й v1 частина.
+    Куски v2 перевіряються через merkle (SHA-256 дерева файлів), v1 - через pieces (SHA-1)"""
+    def __init__(self, data, infohash, info_bytes: bytes | None = None, piece_layers: dict | None = None):
         self._infohash = infohash
         self._data = data
-        if not self._data['info'].get('files'):
-            self._full_file_size = self._data['info']['length']
+        self._info_bytes = info_bytes
+        info = self._data['info']
+        self._files: list[tuple[int, str]] = list()
+        self._padding: set[int] = set()
+        roots: list[bytes | None] = list()
+        if info.get('meta version') == 2:
+            tree = {os.path.sep.join(path): (node.get('length', 0), _raw(node.get('pieces root')))
+                    for path, node in _walk_file_tree(info.get('file tree', dict()))}
+        else:
+            tree = dict()
+        if info.get('pieces') is None:  # лише v2: доповнення до межі куска після кожного файлу, крім останнього
+            for n, (path, (length, root)) in enumerate(tree.items()):
+                self._files.append((length, path))
+                roots.append(root)
+                tail = length % self.piece_length
+                if tail and n < len(tree) - 1:
+                    pad = self.piece_length - tail
+                    self._padding.add(len(self._files))
+                    self._files.append((pad, os.path.sep.join((PAD_DIR, str(pad)))))
+                    roots.append(None)
+        elif not info.get('files'):
+            self._files = [(info['length'], info['name'])]
+            roots = [tree.get(info['name'], (0, None))[1]]
         else:
-            self._full_file_size = sum([i['length'] for i in self._data['info']["files"]])
+            for i in info['files']:
+                path = os.path.sep.join(i['path'])
+                if 'p' in i.get('attr', ''):
+                    self._padding.add(len(self._files))
+                self._files.append((i['length'], path))
+                roots.append(tree.get(path, (0, None))[1] if len(self._files) - 1 not in self._padding else None)
+        self._full_file_size = sum(length for length, _ in self._files)
+
+        self._merkle = None
+        if tree and piece_layers is not None:  # без piece layers (гібрид за magnet) перевірка лише за v1 хешами
+            if any(length and root is None for n, ((length, _), root) in enumerate(zip(self._files, roots))
+                   if n not in self._padding):
+                raise BadTorrentFile
+            layers = {_raw(k): _raw(v) for k, v in piece_layers.items()}
+            try:
+                self._merkle = MerklePieces([(length, root) for (length, _), root in zip(self._files, roots)],
+                                            self.piece_length, layers)
+            except BadHashes:
+                raise BadTorrentFile
 
     @property
     def announce(self):
@@ -26,6 +90,18 @@ class TorrentFile:
     def announce_list(self):
         return self._data.get("announce-list")
 
+    @property
+    def private(self) -> bool:
+        """Приватний торент (BEP 27): піри лише від трекера"""
+        return self._data['info'].get('private') == 1
+
+    @property
+    def url_list(self) -> list[str]:
+        """HTTP дзеркала (BEP 19), url-list може бути рядком або списком"""
+        urls = self._data.get("url-list") or list()
+        if isinstance(urls, (str, bytes)): urls = [urls]
+        return [url for url in urls if isinstance(url, str) and url.startswith(("http://", "https://"))]
+
     @property
     def infoHash(self):
         return self._infohash
@@ -49,15 +125,22 @@ class TorrentFile:
 
     @property
     def countFiles(self):
-        return len(self._data['info'].get("files", [""]))
+        return len(self._files)
 
     @property
     def files(self):
-        if not self._data['info'].get('files'):
-            files = [(self._data['info']['length'], self._data['info']['name'],), ]
-        else:
-            files = [(i['length'], os.path.sep.join(i['path']),) for i in self._data['info']["files"]]
-        return files
+        return list(self._files)
+
+    @property
+    def single_file(self) -> bool:
+        """Однофайловий торент: дані - файл name, а не папка name з файлами"""
+        info = self._data['info']
+        return 'files' not in info and len(self._files) == 1 and self._files[0][1] == info['name']
+
+    @property
+    def padding_files(self) -> set[int]:
+        """Номери файлів доповнення, їх дані - нулі"""
+        return set(self._padding)
 
     @property
     def length(self):
@@ -68,8 +151,31 @@ class TorrentFile:
         return self._data['info']["piece length"]
 
     @property
-    def pieces(self):
-        return self._data['info']["pieces"]
+    def pieces(self) -> bytes:
+        """SHA-1 хеші кусків v1, для торентів лише v2 - порожні"""
+        return self._data['info'].get("pieces", b"")
+
+    @property
+    def pieces_count(self) -> int:
+        return ceil(self._full_file_size / self.piece_length)
+
+    @property
+    def meta_version(self) -> int:
+        return self._data['info'].get('meta version', 1)
+
+    @property
+    def hybrid(self) -> bool:
+        return self.meta_version == 2 and bool(self.pieces)
+
+    @property
+    def merkle(self) -> MerklePieces | None:
+        """Merkle дерева файлів v2 та гібридних торентів"""
+        return self._merkle
+
+    @property
+    def info_bytes(self) -> bytes | None:
+        """Закодований info словник, віддається іншим пірам через ut_metadata"""
+        return self._info_bytes
 
     @classmethod
     def open(cls, file: str):
@@ -77,9 +183,37 @@ class TorrentFile:
             data_encoded = f.read()
             info_loc, data = BenCoder.decode(data_encoded, True)
 
-        if not all((data.get("info"), data.get("announce"), data.get("info", dict()).get("piece length"),
-                    data.get("info", dict()).get("pieces"),)):
+        # торент без трекерів (announce) допустимий: піри знаходяться через DHT, PEX чи локальну мережу
+        if not isinstance(data, dict) or not cls._valid_info(data.get("info")):
+            raise BadTorrentFile
+
+        info_bytes = data_encoded[info_loc[0] - 1:info_loc[1] + 1]
+        try:
+            return cls(data, cls._info_hash(data["info"], info_bytes), info_bytes, data.get("piece layers", dict()))
+        except (KeyError, TypeError, AttributeError):
             raise BadTorrentFile
 
-        infohash = hashlib.sha1(data_encoded[info_loc[0] - 1:info_loc[1] + 1]).digest()
-        return cls(data, infohash)
+    @staticmethod
+    def _valid_info(info) -> bool:
+        return isinstance(info, dict) and bool(info.get("piece length")) and \
+            bool(info.get("pieces") or (info.get("meta version") == 2 and info.get("file tree")))
+
+    @staticmethod
+    def _info_hash(info: dict, info_bytes: bytes) -> bytes:
+        """SHA-1 info для v1 та гібридних торентів, для v2 - SHA-256, скорочений до 20 байтів"""
+        if info.get("pieces"):
+            return hashlib.sha1(info_bytes).digest()
+        return hashlib.sha256(info_bytes).digest()[:20]
+
+    @classmethod
+    def from_info(cls, info_bytes: bytes, trackers: list[str] | None = None):
+        """Торент з info словника, отриманого від пірів за magnet посиланням"""
+        info = BenCoder.decode(info_bytes)
+        # piece layers не входять в info, тож торент лише v2 за magnet посиланням не перевірити
+        if not cls._valid_info(info) or not info.get("pieces") or not info.get("name"):
+            raise BadTorrentFile
+        data = {"info": info}
+        if trackers:
+            data["announce"] = trackers[0]
+            data["announce-list"] = [[tracker] for tracker in trackers]
+        return cls(data, hashlib.sha1(info_bytes).digest(), info_bytes)
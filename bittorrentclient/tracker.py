@@ -3,10 +3,11 @@ import dataclasses
 import enum
 import random
 import typing
-from time import time
+from time import time, perf_counter
 
 import aiohttp
 
+from . import metrics
 from .bencoder import BenCoder
 from .peer import Peer
 
@@ -19,7 +20,7 @@ if typing.TYPE_CHECKING:
 def bin_to_rfc1738(bin: bytes) -> str:
     result = ""
     for char in bin:
-        if 48 <= char <= 57 or 65 <= char <= 90 or 97 <= char<= 122 or char == 0x7F or char in b"~$-_.+!*'(),":
+        if 48 <= char <= 57 or 65 <= char <= 90 or 97 <= char<= 122 or char in b"~-_.":
             result += chr(char)
         else:
             r = hex(char).removeprefix("0x")
@@ -42,6 +43,8 @@ class TrackResponse:
 
     @classmethod
     def de_dict(cls, data):
+        if isinstance(data.get("peers"), str):  # BenCoder декодує рядки, які можна прочитати як текст
+            data["peers"] = data["peers"].encode()
         if isinstance(data.get("peers"), bytes):
             b = bytearray(data.get("peers"))
             peers = list()
@@ -50,10 +53,10 @@ class TrackResponse:
                 port = int.from_bytes(bytes(b[index + 4:index + 6]), "big",
                                       signed=False)  # (b[index+4] << 8) + b[index+5]
                 peers.append((ip, port,))
-        elif isinstance(data.get("peers"), dict):
+        elif isinstance(data.get("peers"), list):
             peers = data.get("peers")
         else:
-            peers = None
+            peers = list()
         peers = [Peer.de_peer(i) for i in peers]
         return cls(failure=data.get('failure reason'),
                    warning=data.get('warning message'),
@@ -96,36 +99,44 @@ class CallbackSetterPeersNotSet(Exception):
 
 
 class TrackerManager:
-    def __init__(self, torrent: "torrentfile.TorrentFile", peer_id: bytes, compact=True, timeout=5, log_func=None):
+    def __init__(self, torrent: "torrentfile.TorrentFile", peer_id: bytes, compact=True, timeout=5, log_func=None,
+                 port: int = 10101, session: aiohttp.ClientSession | None = None):
         self.torrent = torrent
 
         if self.torrent.announce_list:
             self._trackers = [Tracker(urls=track_group) for track_group in self.torrent.announce_list]
-        else:
+        elif self.torrent.announce:
             self._trackers = [Tracker(urls=[self.torrent.announce,])]
+        else:
+            self._trackers = list()  # торент з magnet посилання без трекерів, пірів шукає DHT
 
         self._peer_id = peer_id
-        self._port = 10101
+        self._port = port
         self._compact = compact
 
         self._uploaded = 0
         self._downloaded = 0
-        self._left = self.torrent.length - self._downloaded
+        self._left = 0  # оновлюється з get_info перед кожним запитом
 
         self._set_peers_clb: typing.Callable[[typing.Sequence[Peer]], None] | None = None
         self._get_info_clb: typing.Callable[[], "statistic.Statistic"] | None = None
 
         self._working = False
+        self._stopped = False  # stop міг бути викликаний раніше, ніж запустився run
         self._timeout = timeout
-        self._session: aiohttp.ClientSession | None = None
+        self._session: aiohttp.ClientSession | None = session
+        self._own_session = session is None
 
         self._log_func = log_func if log_func else lambda a: a
 
     async def run(self) -> None:
         if not self._set_peers_clb or not self._get_info_clb:
             raise CallbackSetterPeersNotSet
-        timeout = aiohttp.ClientTimeout(total=self._timeout)
-        self._session = aiohttp.ClientSession(timeout=timeout)
+        if self._stopped:
+            return
+        if self._own_session:
+            timeout = aiohttp.ClientTimeout(total=self._timeout)
+            self._session = aiohttp.ClientSession(timeout=timeout)
 
         self._working = True
         while self._working:
@@ -134,7 +145,7 @@ class TrackerManager:
                     info = self._get_info_clb()
                     self._uploaded = info.uploaded
                     self._downloaded = info.downloaded
-                    self._left = self.torrent.length - self._downloaded
+                    self._left = info.left
 
                     await self._regular_service_tracker(tracker)
             await asyncio.sleep(1)
@@ -172,16 +183,20 @@ class TrackerManager:
             params["event"] = event.value
 
         url = tracker.get_url() + "?" + '&'.join([f"{name}={value}" for name, value in params.items()])
+        started = perf_counter()
         try:
-            async with self._session.get(url) as resp:
+            async with self._session.get(url, timeout=aiohttp.ClientTimeout(total=self._timeout)) as resp:
                 if not resp.status == 200:
+                    metrics.TRACKER_SECONDS.observe(perf_counter() - started, ("error",))
                     return None
                 r = await resp.content.read()
 
                 resp_dicted = BenCoder.decode(r)
                 tr = TrackResponse.de_dict(resp_dicted)
         except:
+            metrics.TRACKER_SECONDS.observe(perf_counter() - started, ("error",))
             return None
+        metrics.TRACKER_SECONDS.observe(perf_counter() - started, ("ok",))
         return tr
 
     def reg_clb_peers(self, clb: typing.Callable[[typing.Sequence[Peer]], None]) -> None:
@@ -196,11 +211,12 @@ class TrackerManager:
         await asyncio.gather(*[self._send_request(track, TrackerRequestEvent.COMPLETED) for track in tracks])
 
     async def stop(self) -> None:
+        self._stopped = True
         self._working = False
         self._log_func("Tracker manager is stopping")
         tracks = self._trackers[:]
         await asyncio.gather(*[self._send_request(track, TrackerRequestEvent.STOPPED) for track in tracks])
-        if self._session:
+        if self._session and self._own_session:
             await self._session.close()
             self._session = None
 
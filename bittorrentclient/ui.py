@@ -113,8 +113,12 @@ class UI:
             self.screen.hline(7, 0, curses.ACS_S1, curses.COLS)
             self.screen.addstr(8, 0, f"All peers: {self._stat.peers_count}")
             self.screen.addstr(8, 20, f"Max count of peers: {self._another_info.get('max_connections', '...')}")
+            if self._stat.time_to_first_byte is not None:
+                self.screen.addstr(8, 46, f"TTFB: {self._stat.time_to_first_byte:.1f}s")
             self.screen.addstr(9, 0, f"Connected: {self._stat.connected}")
             self.screen.addstr(9, 20, f"Interesting: {self._stat.interesting}")
+            if self._stat.time_to_metadata is not None:
+                self.screen.addstr(9, 40, f"Metadata: {self._stat.time_to_metadata:.1f}s")
             self.screen.hline(10, 0, curses.ACS_S1, curses.COLS)
 
             for i, line in enumerate(self.to_print[-(curses.LINES - 12):]):
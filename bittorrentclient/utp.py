@@ -0,0 +1,619 @@
+import asyncio
+import collections
+import dataclasses
+import os
+import socket
+import struct
+import time
+import typing
+
+
+ST_DATA, ST_FIN, ST_STATE, ST_RESET, ST_SYN = range(5)
+VERSION = 1
+HEADER = struct.Struct("!BBHIIIHH")
+EXTENSION_SACK = 1
+
+MSS = 1400  # корисне навантаження одного пакета
+MIN_WINDOW = MSS
+TARGET_DELAY = 100_000  # LEDBAT: допустима затримка черги, мкс
+MAX_CWND_INCREASE = 3000  # LEDBAT: максимальний приріст вікна за RTT, байт
+RECV_WINDOW = 1 << 20
+SEND_BUFFER = 1 << 18  # після цього drain() чекає
+SOCKET_BUFFER = 1 << 21  # буфери UDP сокета, щоб пачки пакетів не губилися в ядрі
+REORDER_LIMIT = 4096  # скільки пакетів наперед приймається не по порядку
+MIN_RTO = 0.5
+MAX_RTO = 30.
+MAX_TIMEOUTS = 6
+DELAYED_ACK = 0.01  # час, через який підтверджується одиночний пакет
+MAX_INCOMING = 200  # вхідних з'єднань на сокет, на решту SYN відповідь ST_RESET
+MAX_INCOMING_PER_ADDRESS = 4
+UNREACHABLE_TTL = 3600.  # стільки секунд адреса, що не відповіла на SYN, не пробується через uTP
+
+
+class UTPError(ConnectionError):
+    pass
+
+
+def _now_us() -> int:
+    return (time.perf_counter_ns() // 1000) & 0xffffffff
+
+
+def _seq_less(a: int, b: int) -> bool:
+    """a < b за модулем 2**16"""
+    return 0 < (b - a) & 0xffff < 0x8000
+
+
+@dataclasses.dataclass()
+class _Packet:
+    kind: int
+    seq: int
+    payload: bytes
+    sent: float = 0.
+    transmissions: int = 0
+    lost: bool = False
+
+
+class UTPStreamWriter:
+    """Замінник asyncio.StreamWriter для uTP з'єднання"""
+    def __init__(self, connection: 'UTPConnection'):
+        self._connection = connection
+
+    @property
+    def transport(self) -> 'UTPConnection':
+        return self._connection
+
+    def write(self, data: bytes) -> None:
+        self._connection.write(data)
+
+    def writelines(self, data: typing.Iterable[bytes]) -> None:
+        self._connection.write(b"".join(data))
+
+    async def drain(self) -> None:
+        await self._connection.drain()
+
+    def can_write_eof(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def is_closing(self) -> bool:
+        return self._connection.closing
+
+    async def wait_closed(self) -> None:
+        await self._connection.wait_closed()
+
+    def get_extra_info(self, name: str, default=None):
+        if name == "peername":
+            return self._connection.address
+        if name == "sockname":
+            return self._connection.sockname
+        return default
+
+
+class UTPConnection:
+    """Одне uTP з'єднання (BEP 29): надійна доставка з SACK та LEDBAT керуванням вікном.
+    Дані віддаються через звичайний asyncio.StreamReader, який керує вікном прийому через pause/resume_reading."""
+    def __init__(self, utp_socket: 'UTPSocket', address: tuple[str, int], recv_id: int, send_id: int, seq_nr: int):
+        self._socket = utp_socket
+        self.address = address
+        self.recv_id = recv_id
+        self.send_id = send_id
+        self._seq_nr = seq_nr
+        self._ack_nr = 0
+        self._state = "syn_sent"
+        self._loop = asyncio.get_running_loop()
+
+        self.reader = asyncio.StreamReader(limit=RECV_WINDOW // 2)
+        self.reader.set_transport(self)
+        self.writer = UTPStreamWriter(self)
+        self._reading_paused = False
+
+        self._send_buffer = bytearray()
+        self._in_flight: collections.OrderedDict[int, _Packet] = collections.OrderedDict()
+        self._bytes_in_flight = 0
+        self._lost_count = 0  # пакети, які після таймауту чекають повторної передачі
+        self._peer_window = RECV_WINDOW
+        self._reorder: dict[int, bytes] = dict()
+        self._eof_seq: int | None = None
+        self._eof_received = False
+        self._fin_sent = False
+        self._closing = False
+
+        self._max_window = 2 * MSS
+        self._slow_start = True
+        self._window_limited = False
+        self._base_delays: collections.deque[list[int]] = collections.deque(maxlen=3)  # [хвилина, мінімум]
+        self._reply_micro = 0
+        self._last_ack = None
+        self._dup_acks = 0
+        self._last_cut = 0.
+
+        self._rtt: float | None = None
+        self._rtt_var = 0.
+        self._rto = 1.
+        self._timeouts = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._unacked = 0
+        self._ack_scheduled = False
+        self._ack_timer: asyncio.TimerHandle | None = None
+
+        self._connected = self._loop.create_future()
+        self._closed = self._loop.create_future()
+        self._drain_waiter: asyncio.Future | None = None
+
+    @property
+    def closing(self) -> bool:
+        return self._closing or self._state == "closed"
+
+    @property
+    def sockname(self) -> tuple[str, int]:
+        return self._socket.sockname
+
+    @property
+    def window(self) -> int:
+        return int(self._max_window)
+
+    @property
+    def rtt(self) -> float | None:
+        return self._rtt
+
+    # керування потоком з боку StreamReader
+    def pause_reading(self) -> None:
+        self._reading_paused = True
+
+    def resume_reading(self) -> None:
+        if self._reading_paused:
+            self._reading_paused = False
+            self._send_state()
+
+    def write(self, data: bytes) -> None:
+        if self.closing:
+            return
+        self._send_buffer += data
+        self._flush()
+
+    async def drain(self) -> None:
+        if self._state == "closed":
+            raise UTPError("uTP connection is closed")
+        if len(self._send_buffer) < SEND_BUFFER:
+            return
+        if self._drain_waiter is None or self._drain_waiter.done():
+            self._drain_waiter = self._loop.create_future()
+        await self._drain_waiter
+
+    def close(self) -> None:
+        if self.closing:
+            return
+        self._closing = True
+        if self._state == "syn_sent":
+            self._finalize()
+        else:
+            self._flush()
+
+    async def wait_closed(self) -> None:
+        await asyncio.shield(self._closed)
+
+    async def wait_connected(self) -> None:
+        await self._connected
+
+    def _send_syn(self) -> None:
+        packet = _Packet(ST_SYN, self._seq_nr, b"")
+        self._seq_nr = (self._seq_nr + 1) & 0xffff
+        self._in_flight[packet.seq] = packet
+        self._transmit(packet)
+
+    def _transmit(self, packet: _Packet) -> None:
+        packet.sent = time.monotonic()
+        packet.transmissions += 1
+        if packet.lost:
+            packet.lost = False
+            self._lost_count -= 1
+        self._bytes_in_flight += len(packet.payload)
+        self._send(packet.kind, packet.seq, packet.payload)
+        if self._timer is None:
+            self._timer = self._loop.call_later(self._rto, self._on_timeout)
+
+    def _send(self, kind: int, seq: int, payload: bytes = b"") -> None:
+        sack = self._sack() if kind == ST_STATE else None
+        header = HEADER.pack(kind << 4 | VERSION, EXTENSION_SACK if sack else 0,
+                             self.recv_id if kind == ST_SYN else self.send_id, _now_us(), self._reply_micro,
+                             0 if self._reading_paused else RECV_WINDOW, seq, self._ack_nr)
+        if sack:
+            header += struct.pack("!BB", 0, len(sack)) + sack
+        self._socket.sendto(header + payload, self.address)
+        self._unacked = 0  # кожен пакет несе ack_nr
+        if self._ack_timer:
+            self._ack_timer.cancel()
+            self._ack_timer = None
+
+    def _send_state(self) -> None:
+        if self._state != "closed":
+            self._send(ST_STATE, self._seq_nr)
+
+    def _send_delayed_ack(self) -> None:
+        self._ack_scheduled = False
+        self._ack_timer = None
+        if self._unacked: self._send_state()
+
+    def _schedule_ack(self) -> None:
+        """Відкладене підтвердження: кожен другий пакет, пакети не по порядку та FIN підтверджуються одразу
+        (одним ST_STATE на ітерацію event loop), одиночний пакет - через DELAYED_ACK або разом з нашими даними"""
+        self._unacked += 1
+        if self._unacked >= 2 or self._reorder or self._eof_received:
+            if not self._ack_scheduled:
+                self._ack_scheduled = True
+                self._loop.call_soon(self._send_delayed_ack)
+        elif self._ack_timer is None:
+            self._ack_timer = self._loop.call_later(DELAYED_ACK, self._send_delayed_ack)
+
+    def _sack(self) -> bytes | None:
+        if not self._reorder:
+            return None
+        mask = bytearray(4)
+        for i in range(32):
+            if (self._ack_nr + 2 + i) & 0xffff in self._reorder:
+                mask[i // 8] |= 1 << (i % 8)
+        return bytes(mask)
+
+    def _flush(self) -> None:
+        if self._state != "connected":
+            return
+        window = min(self._max_window, self._peer_window)
+        self._window_limited = False
+        for packet in self._in_flight.values() if self._lost_count else ():
+            if not packet.lost: continue
+            if self._bytes_in_flight and self._bytes_in_flight + len(packet.payload) > window:
+                self._window_limited = True
+                return
+            self._transmit(packet)
+        while self._send_buffer:
+            size = min(MSS, len(self._send_buffer))
+            if self._bytes_in_flight and self._bytes_in_flight + size > window:
+                self._window_limited = True
+                break
+            packet = _Packet(ST_DATA, self._seq_nr, bytes(self._send_buffer[:size]))
+            del self._send_buffer[:size]
+            self._seq_nr = (self._seq_nr + 1) & 0xffff
+            self._in_flight[packet.seq] = packet
+            self._transmit(packet)
+        if len(self._send_buffer) < SEND_BUFFER and self._drain_waiter and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+        if self._closing and not self._send_buffer and not self._fin_sent:
+            self._fin_sent = True
+            packet = _Packet(ST_FIN, self._seq_nr, b"")
+            self._seq_nr = (self._seq_nr + 1) & 0xffff
+            self._in_flight[packet.seq] = packet
+            self._transmit(packet)
+
+    def _received(self, kind: int, timestamp: int, timestamp_diff: int, wnd_size: int, seq: int, ack_nr: int,
+                  sack: bytes | None, payload: bytes) -> None:
+        if self._state == "closed":
+            return
+        if timestamp: self._reply_micro = (_now_us() - timestamp) & 0xffffffff
+        self._peer_window = wnd_size
+        if kind == ST_RESET:
+            self._finalize(UTPError("uTP connection is reset"))
+            return
+        if kind == ST_SYN:
+            self._send_state()
+            return
+        if self._state == "syn_sent":
+            if kind != ST_STATE:
+                return
+            self._ack_nr = (seq - 1) & 0xffff
+            self._state = "connected"
+            if not self._connected.done(): self._connected.set_result(None)
+        self._on_ack(ack_nr, timestamp_diff, sack, kind == ST_STATE)
+        if kind in (ST_DATA, ST_FIN):
+            self._on_data(seq, payload, kind == ST_FIN)
+        if self._state != "closed":
+            self._flush()
+            self._check_closed()
+
+    def _on_ack(self, ack_nr: int, delay: int, sack: bytes | None, pure: bool) -> None:
+        """pure - пакет без даних; лише такі рахуються як повторні підтвердження"""
+        acked = list()
+        while self._in_flight:
+            seq = next(iter(self._in_flight))
+            if _seq_less(ack_nr, seq): break
+            acked.append(self._in_flight.pop(seq))
+        sacked = 0
+        if sack:
+            for i in range(len(sack) * 8):
+                if sack[i // 8] & (1 << (i % 8)):
+                    sacked += 1
+                    packet = self._in_flight.pop((ack_nr + 2 + i) & 0xffff, None)
+                    if packet: acked.append(packet)
+
+        if acked:
+            self._dup_acks = 0
+        elif pure and ack_nr == self._last_ack and self._in_flight:
+            self._dup_acks += 1
+        self._last_ack = ack_nr
+
+        lost = self._in_flight.get((ack_nr + 1) & 0xffff)
+        if lost and not lost.lost and (self._dup_acks == 3 or sacked >= 3) \
+                and time.monotonic() - lost.sent > (self._rtt or 0):
+            self._on_loss()
+            self._dup_acks = 0
+            self._bytes_in_flight -= len(lost.payload)
+            self._transmit(lost)  # швидка повторна передача
+
+        if not acked:
+            return
+        now = time.monotonic()
+        bytes_acked = 0
+        for packet in acked:
+            if packet.lost: self._lost_count -= 1
+            else: self._bytes_in_flight -= len(packet.payload)
+            bytes_acked += len(packet.payload)
+            if packet.transmissions == 1: self._update_rtt(now - packet.sent)
+        self._timeouts = 0
+        if bytes_acked: self._update_window(bytes_acked, delay)
+
+        if self._timer: self._timer.cancel()
+        self._timer = self._loop.call_later(self._rto, self._on_timeout) if self._in_flight else None
+
+    def _update_rtt(self, sample: float) -> None:
+        if self._rtt is None:
+            self._rtt, self._rtt_var = sample, sample / 2
+        else:
+            self._rtt_var += (abs(self._rtt - sample) - self._rtt_var) / 4
+            self._rtt += (sample - self._rtt) / 8
+        self._rto = min(max(self._rtt + 4 * self._rtt_var, MIN_RTO), MAX_RTO)
+
+    def _update_window(self, bytes_acked: int, delay: int) -> None:
+        """LEDBAT: вікно росте, поки затримка черги нижча за TARGET_DELAY, і зменшується, коли вища.
+        Вікно не росте, якщо відправник не впирався в нього (передавати було нічого)."""
+        minute = int(time.monotonic() // 60)
+        if not self._base_delays or self._base_delays[-1][0] != minute:
+            self._base_delays.append([minute, delay])
+        else:
+            self._base_delays[-1][1] = min(self._base_delays[-1][1], delay)
+        queuing_delay = delay - min(d for _, d in self._base_delays)
+        off_target = (TARGET_DELAY - queuing_delay) / TARGET_DELAY
+        if off_target > 0 and not self._window_limited:
+            return
+        if self._slow_start and queuing_delay < TARGET_DELAY * 0.9:
+            self._max_window += bytes_acked
+        else:
+            self._slow_start = False
+            window_factor = min(bytes_acked, self._max_window) / max(self._max_window, bytes_acked)
+            self._max_window += MAX_CWND_INCREASE * off_target * window_factor
+        self._max_window = min(max(self._max_window, MIN_WINDOW), RECV_WINDOW)
+
+    def _on_loss(self) -> None:
+        now = time.monotonic()
+        self._slow_start = False
+        if now - self._last_cut > (self._rtt or MIN_RTO):
+            self._max_window = max(self._max_window / 2, MIN_WINDOW)
+            self._last_cut = now
+
+    def _on_timeout(self) -> None:
+        self._timer = None
+        if self._state == "closed":
+            return
+        if not self._in_flight:
+            if self._send_buffer and not self._peer_window:
+                self._peer_window = MSS  # проба нульового вікна
+                self._flush()
+            return
+        self._timeouts += 1
+        if self._timeouts > MAX_TIMEOUTS or (self._state == "syn_sent" and self._timeouts > 2):
+            self._finalize(UTPError("uTP connection is timed out"))
+            return
+        self._slow_start = False
+        self._max_window = MIN_WINDOW
+        self._rto = min(self._rto * 2, MAX_RTO)
+        for packet in self._in_flight.values():
+            if not packet.lost: self._bytes_in_flight -= len(packet.payload)
+            packet.lost = True
+        self._lost_count = len(self._in_flight)
+        first = next(iter(self._in_flight.values()))
+        self._transmit(first)
+        self._flush()
+
+    def _on_data(self, seq: int, payload: bytes, fin: bool) -> None:
+        """Пакети після FIN відкидаються: їх дані вже не можуть потрапити в reader після feed_eof"""
+        if self._eof_seq is not None and _seq_less(self._eof_seq, seq):
+            self._schedule_ack()
+            return
+        if fin and self._eof_seq is None:
+            self._eof_seq = seq
+            for later in [s for s in self._reorder if _seq_less(seq, s)]:
+                self._reorder.pop(later)
+        if seq == (self._ack_nr + 1) & 0xffff:
+            self._deliver(seq, payload)
+            while (next_seq := (self._ack_nr + 1) & 0xffff) in self._reorder:
+                self._deliver(next_seq, self._reorder.pop(next_seq))
+        elif _seq_less(self._ack_nr, seq) and (seq - self._ack_nr) & 0xffff < REORDER_LIMIT:
+            self._reorder[seq] = payload
+        self._schedule_ack()
+
+    def _deliver(self, seq: int, payload: bytes) -> None:
+        if self._eof_received:
+            return
+        self._ack_nr = seq
+        if payload: self.reader.feed_data(payload)
+        if seq == self._eof_seq:
+            self._eof_received = True
+            self.reader.feed_eof()
+
+    def _check_closed(self) -> None:
+        """З'єднання закрите, коли обидві сторони надіслали FIN і всі пакети підтверджені.
+        Якщо інша сторона не закриває з'єднання, воно закривається через MAX_RTO після підтвердження нашого FIN."""
+        if not self._fin_sent or self._in_flight:
+            return
+        if self._eof_received:
+            self._send_state()
+            self._finalize()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(MAX_RTO, self._finalize)
+
+    def _finalize(self, exc: Exception | None = None) -> None:
+        if self._state == "closed":
+            return
+        self._state = "closed"
+        self._closing = True
+        for timer in (self._timer, self._ack_timer):
+            if timer: timer.cancel()
+        self._timer = self._ack_timer = None
+        self._socket._forget(self)
+        if exc is None: exc = UTPError("uTP connection is closed")
+        if not self._connected.done(): self._connected.set_exception(exc)
+        if self._drain_waiter and not self._drain_waiter.done(): self._drain_waiter.set_exception(exc)
+        if not self.reader.at_eof(): self.reader.feed_eof()
+        if not self._closed.done(): self._closed.set_result(None)
+
+
+class UTPSocket(asyncio.DatagramProtocol):
+    """Один UDP сокет, через який йдуть усі uTP з'єднання. З'єднання розрізняються за адресою та connection id.
+    Для вхідних з'єднань викликається handler(reader, writer), як у asyncio.start_server.
+    Вхідних з'єднань не більше max_incoming і MAX_INCOMING_PER_ADDRESS з однієї адреси, решта SYN скидаються.
+    Адреси, що не відповіли на наш SYN, запам'ятовуються, щоб не чекати тайм-ауту uTP для них знову."""
+    def __init__(self, port: int = 10101, host: str | None = None,
+                 handler: typing.Callable[[asyncio.StreamReader, UTPStreamWriter], typing.Awaitable] | None = None,
+                 max_incoming: int = MAX_INCOMING):
+        self._port = port
+        self._host = host
+        self._handler = handler
+        self._max_incoming = max_incoming
+        self._transport: asyncio.DatagramTransport | None = None
+        self._connections: dict[tuple[tuple[str, int], int], UTPConnection] = dict()
+        self._incoming: collections.Counter[tuple[str, int]] = collections.Counter()
+        self._incoming_keys: set[tuple[tuple[str, int], int]] = set()
+        self._unreachable: dict[tuple[str, int], float] = dict()
+        self._handler_tasks: set[asyncio.Task] = set()
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    @property
+    def sockname(self) -> tuple[str, int]:
+        return self._transport.get_extra_info("sockname")[:2] if self._transport else ("", self._port)
+
+    @property
+    def connections(self) -> list[UTPConnection]:
+        return list(self._connections.values())
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: self,
+                                                                 local_addr=(self._host or "0.0.0.0", self._port))
+        self._port = self._transport.get_extra_info("sockname")[1]
+        sock = self._transport.get_extra_info("socket")
+        for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+            except OSError:
+                pass
+
+    async def stop(self) -> None:
+        connections = list(self._connections.values())
+        for connection in connections:
+            connection.close()
+        if connections:
+            await asyncio.wait([asyncio.ensure_future(c.wait_closed()) for c in connections], timeout=1)
+        for connection in list(self._connections.values()):
+            connection._finalize()
+        for task in self._handler_tasks:
+            task.cancel()
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+    def reachable(self, host: str, port: int) -> bool:
+        """False, якщо адреса недавно не відповіла на SYN: тоді краще одразу з'єднуватись через TCP"""
+        failed = self._unreachable.get((host, port))
+        if failed is None:
+            return True
+        if time.monotonic() - failed > UNREACHABLE_TTL:
+            self._unreachable.pop((host, port))
+            return True
+        return False
+
+    async def open_connection(self, host: str, port: int,
+                              timeout: float = 3) -> tuple[asyncio.StreamReader, UTPStreamWriter]:
+        """Аналог asyncio.open_connection для uTP"""
+        if not self._transport:
+            raise UTPError("uTP socket is not started")
+        address = (host, port)
+        recv_id = int.from_bytes(os.urandom(2), "big")
+        while (address, recv_id) in self._connections or (address, (recv_id + 1) & 0xffff) in self._connections:
+            recv_id = (recv_id + 2) & 0xffff
+        connection = UTPConnection(self, address, recv_id, (recv_id + 1) & 0xffff, 1)
+        self._connections[(address, recv_id)] = connection
+        connection._send_syn()
+        try:
+            await asyncio.wait_for(connection.wait_connected(), timeout)
+        except (asyncio.TimeoutError, UTPError) as e:
+            connection._finalize()
+            self._unreachable[address] = time.monotonic()
+            raise UTPError(f"uTP connect to {host}:{port} failed") from e
+        self._unreachable.pop(address, None)
+        return connection.reader, connection.writer
+
+    def sendto(self, data: bytes, address: tuple[str, int]) -> None:
+        if self._transport: self._transport.sendto(data, address)
+
+    def _forget(self, connection: UTPConnection) -> None:
+        key = (connection.address, connection.recv_id)
+        if self._connections.get(key) is connection:
+            self._connections.pop(key)
+            if key in self._incoming_keys:
+                self._incoming_keys.discard(key)
+                self._incoming[connection.address] -= 1
+                if not self._incoming[connection.address]: del self._incoming[connection.address]
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        if len(data) < HEADER.size:
+            return
+        type_ver, extension, conn_id, timestamp, timestamp_diff, wnd_size, seq, ack_nr = HEADER.unpack_from(data)
+        kind, version = type_ver >> 4, type_ver & 0x0f
+        if version != VERSION or kind > ST_SYN:
+            return
+        offset, sack = HEADER.size, None
+        while extension:
+            if len(data) < offset + 2: return
+            next_extension, length = data[offset], data[offset + 1]
+            if extension == EXTENSION_SACK: sack = data[offset + 2:offset + 2 + length]
+            offset += 2 + length
+            extension = next_extension
+        payload = data[offset:]
+        address = addr[:2]
+
+        if kind == ST_SYN:
+            connection = self._connections.get((address, (conn_id + 1) & 0xffff))
+            if connection is None:
+                if not self._handler:
+                    return
+                if len(self._incoming_keys) >= self._max_incoming \
+                        or self._incoming[address] >= MAX_INCOMING_PER_ADDRESS:
+                    self.sendto(HEADER.pack(ST_RESET << 4 | VERSION, 0, conn_id, _now_us(), 0, 0,
+                                            int.from_bytes(os.urandom(2), "big"), seq), address)
+                    return
+                connection = UTPConnection(self, address, (conn_id + 1) & 0xffff, conn_id,
+                                           int.from_bytes(os.urandom(2), "big"))
+                connection._ack_nr = seq
+                connection._state = "connected"
+                connection._connected.set_result(None)
+                self._connections[(address, connection.recv_id)] = connection
+                self._incoming_keys.add((address, connection.recv_id))
+                self._incoming[address] += 1
+                task = asyncio.create_task(self._handler(connection.reader, connection.writer))
+                self._handler_tasks.add(task)
+                task.add_done_callback(self._handler_tasks.discard)
+            connection._received(kind, timestamp, timestamp_diff, wnd_size, seq, ack_nr, sack, payload)
+            return
+
+        connection = self._connections.get((address, conn_id))
+        if connection is not None:
+            connection._received(kind, timestamp, timestamp_diff, wnd_size, seq, ack_nr, sack, payload)
+        elif kind != ST_RESET:
+            self.sendto(HEADER.pack(ST_RESET << 4 | VERSION, 0, conn_id, _now_us(), 0, 0,
+                                    int.from_bytes(os.urandom(2), "big"), seq), address)
+
+    def error_received(self, exc: Exception) -> None:
+        pass
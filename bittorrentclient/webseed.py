@@ -0,0 +1,266 @@
+import asyncio
+import time
+import typing
+import urllib.parse
+
+import aiohttp
+
+from . import metrics
+from .bitfield import BitField
+from .peer import INITIAL_RTO, MIN_RTO, MAX_RTO
+
+MIN_RETRY = 5.  # пауза після помилки дзеркала, подвоюється з кожною помилкою поспіль
+MAX_RETRY = 300.
+
+
+class WebSeedError(Exception):
+    pass
+
+
+class WebSeed:
+    """HTTP дзеркало торенту (BEP 19, url-list). Має всі куски, дані отримуються Range запитами
+    через спільну keep-alive сесію aiohttp. Для планувальника LoadManager дзеркало представлене
+    connections з'єднаннями (WebSeedConnection), кожне з яких поводиться як пір, тож дзеркало
+    завантажує кілька кусків паралельно. Запити блоків одного куска, зроблені разом, об'єднуються
+    в один Range запит на кожен файл, блоки віддаються по мірі отримання тіла відповіді"""
+    def __init__(self, url: str, name: str, files: typing.Sequence[tuple[int, str]], single_file: bool,
+                 pieces_count: int,
+                 segments: typing.Callable[[int], typing.Sequence[tuple[int, int, int, int]]],
+                 padding: typing.Collection[int] = (), session: aiohttp.ClientSession | None = None,
+                 connections: int = 4, log_func: typing.Callable | None = None):
+        parsed = urllib.parse.urlsplit(url)
+        self.url = url
+        self.ip = url  # ключ для блокування: інші дзеркала та піри того ж хоста не страждають
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self._urls = self._file_urls(url, name, files, single_file)
+        self._segments = segments
+        self._padding = set(padding)
+        self._session = session
+        self._own_session = session is None
+        self.bitfield = BitField(pieces_count)
+        for i in range(pieces_count):
+            self.bitfield.set(i)
+        self.connections = [WebSeedConnection(self, n) for n in range(connections)]
+        # запитані блоки, які ще чекають на Range запит, та блоки запитів, що виконуються
+        self._queued: dict[int, dict[int, tuple[int, asyncio.Future, memoryview | None]]] = dict()
+        self._inflight: dict[tuple[int, int], asyncio.Future] = dict()
+        self._flush_scheduled = False
+        self._fetches: set[asyncio.Task] = set()
+        self._srtt: float | None = None
+        self._rttvar = 0.
+        self._backoff = 1
+        self._errors = 0
+        self._retry_at = 0.
+        self._downloaded_bytes = 0
+        self._log_func = log_func if log_func else lambda a: a
+
+    @staticmethod
+    def _file_urls(url: str, name: str, files: typing.Sequence[tuple[int, str]], single_file: bool) -> list[str]:
+        """URL кожного файлу: для однофайлового торенту url вказує на файл (або на папку з ним, якщо
+        закінчується на /), для багатофайлового - на папку, в якій лежить папка name"""
+        if single_file:
+            return [url + urllib.parse.quote(name) if url.endswith("/") else url]
+        base = (url if url.endswith("/") else url + "/") + urllib.parse.quote(name) + "/"
+        return [base + "/".join(urllib.parse.quote(part) for part in path.replace("\\", "/").split("/"))
+                for _, path in files]
+
+    @property
+    def available(self) -> bool:
+        """Чи можна робити запити: після помилок дзеркало деякий час не використовується"""
+        return time.monotonic() >= self._retry_at
+
+    @property
+    def downloaded(self) -> int:
+        return self._downloaded_bytes
+
+    @property
+    def outstanding_requests(self) -> int:
+        return sum(len(blocks) for blocks in self._queued.values()) + len(self._inflight)
+
+    @property
+    def rto(self) -> float:
+        """Тайм-аут блоку, як у Peer.rto. RTT - час від початку Range запиту (або від попереднього блоку) до блоку"""
+        rto = INITIAL_RTO if self._srtt is None else max(self._srtt + 4 * self._rttvar, MIN_RTO)
+        return min(rto * self._backoff, MAX_RTO)
+
+    def request_timed_out(self) -> None:
+        self._backoff = min(self._backoff * 2, 64)
+
+    async def request(self, index: int, begin: int, length: int, into: memoryview | None = None) -> bytes | memoryview:
+        """Запит блоку, як Peer.request. Запити, зроблені до наступної ітерації циклу подій, об'єднуються"""
+        if not self.available:
+            raise WebSeedError(f"{self.url} is not available")
+        future = asyncio.get_running_loop().create_future()
+        self._queued.setdefault(index, dict())[begin] = (length, future, into)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        return await future
+
+    def cancel_piece(self, index: int, begin: int, length: int) -> None:
+        blocks = self._queued.get(index, dict())
+        future = blocks.pop(begin, (None, None, None))[1] or self._inflight.pop((index, begin), None)
+        if not blocks: self._queued.pop(index, None)
+        if future is not None: future.cancel()
+
+    def _flush(self) -> None:
+        """Запуск Range запитів для накопичених блоків: кожна неперервна послідовність блоків куска - один запит"""
+        self._flush_scheduled = False
+        queued, self._queued = self._queued, dict()
+        for index, blocks in queued.items():
+            run: list[tuple[int, int, asyncio.Future, memoryview | None]] = list()
+            for begin in sorted(blocks):
+                length, future, into = blocks[begin]
+                if run and run[-1][1] != begin:
+                    self._start_fetch(index, run)
+                    run = list()
+                run.append((begin, begin + length, future, into))
+            if run: self._start_fetch(index, run)
+
+    def _start_fetch(self, index: int, targets: list[tuple[int, int, asyncio.Future, memoryview | None]]) -> None:
+        for begin, _, future, _ in targets:
+            self._inflight[(index, begin)] = future
+        task = asyncio.create_task(self._fetch(index, targets))
+        self._fetches.add(task)
+        task.add_done_callback(self._fetches.discard)
+
+    async def _fetch(self, index: int, targets: list[tuple[int, int, asyncio.Future, memoryview | None]]) -> None:
+        """targets - неперервні блоки куска в порядку зсувів: (початок, кінець, future, into).
+        Якщо into немає, блок збирається в окремий буфер"""
+        start, end = targets[0][0], targets[-1][1]
+        buffers = {begin: bytearray(stop - begin) for begin, stop, _, into in targets if into is None}
+        position = start  # зсув у куску, до якого отримано дані
+        head = 0  # номер першого неготового блоку
+        last = time.monotonic()
+
+        def put(chunk: bytes | memoryview) -> None:
+            nonlocal position, head, last
+            view = memoryview(chunk)
+            while view and head < len(targets):
+                begin, stop, future, into = targets[head]
+                part = min(len(view), stop - position)
+                if not future.done():  # буфер відміненого блоку вже може належати іншому куску
+                    target = into if into is not None else memoryview(buffers[begin])
+                    target[position - begin:position - begin + part] = view[:part]
+                view = view[part:]
+                position += part
+                if position == stop:
+                    now = time.monotonic()
+                    self._rtt_sample(now - last)
+                    last = now
+                    self._downloaded_bytes += stop - begin
+                    metrics.WEB_SEED_RECEIVED.inc(stop - begin)
+                    if not future.done():
+                        future.set_result(into if into is not None else bytes(buffers[begin]))
+                    self._inflight.pop((index, begin), None)
+                    head += 1
+
+        try:
+            for n, file_offset, piece_offset, length in self._segments(index):
+                lo, hi = max(piece_offset, start), min(piece_offset + length, end)
+                if lo >= hi:
+                    continue
+                if all(future.done() for *_, future, _ in targets[head:]):
+                    break  # всі блоки відмінено
+                if n in self._padding:
+                    put(bytes(hi - lo))
+                    continue
+                await self._get(self._urls[n], file_offset + lo - piece_offset, hi - lo, put)
+            self._errors = 0
+        except (aiohttp.ClientError, asyncio.TimeoutError, WebSeedError) as e:
+            self._errors += 1
+            self._retry_at = time.monotonic() + min(MIN_RETRY * 2 ** (self._errors - 1), MAX_RETRY)
+            self._log_func(f"Web seed {self.url} failed: {e!r}")
+            for *_, future, _ in targets[head:]:
+                if not future.done(): future.set_exception(WebSeedError(str(e)))
+        finally:
+            for begin, _, future, _ in targets[head:]:
+                self._inflight.pop((index, begin), None)
+                if not future.done(): future.cancel()
+
+    async def _get(self, url: str, offset: int, length: int, put: typing.Callable[[bytes], None]) -> None:
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+        metrics.WEB_SEED_REQUESTS.inc()
+        async with self._session.get(url, headers=headers) as resp:
+            if resp.status == 200 and offset == 0 and resp.content_length == length:
+                pass  # сервер віддав весь файл, який і був запитаний
+            elif resp.status != 206:
+                raise WebSeedError(f"HTTP {resp.status} for {url}")
+            received = 0
+            async for chunk in resp.content.iter_any():
+                chunk = chunk[:length - received]
+                received += len(chunk)
+                put(chunk)
+                if received == length:
+                    break
+            if received < length:
+                raise WebSeedError(f"short response for {url}")
+
+    def _rtt_sample(self, rtt: float) -> None:
+        if self._srtt is None:
+            self._srtt, self._rttvar = rtt, rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+        self._backoff = 1
+
+    async def close(self) -> None:
+        for task in list(self._fetches):
+            task.cancel()
+        await asyncio.gather(*self._fetches, return_exceptions=True)
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class WebSeedConnection:
+    """Одне з паралельних з'єднань дзеркала, для планувальника - як пір, що має всі куски та не душить нас"""
+    connected = True
+    incoming = False
+    supports_fast = False
+    supports_v2 = False
+    local = False
+    allowed_fast: frozenset[int] = frozenset()
+    suggested: frozenset[int] = frozenset()
+
+    def __init__(self, seed: WebSeed, number: int):
+        self.seed = seed
+        self.number = number
+
+    @property
+    def ip(self) -> str:
+        return self.seed.ip
+
+    @property
+    def port(self) -> int:
+        return self.seed.port
+
+    @property
+    def bitfield(self) -> BitField:
+        return self.seed.bitfield
+
+    @property
+    def am_choked(self) -> bool:
+        return not self.seed.available
+
+    @property
+    def outstanding_requests(self) -> int:
+        return self.seed.outstanding_requests
+
+    @property
+    def rto(self) -> float:
+        return self.seed.rto
+
+    def request_timed_out(self) -> None:
+        self.seed.request_timed_out()
+
+    async def request(self, index: int, begin: int, length: int, into: memoryview | None = None) -> bytes | memoryview:
+        return await self.seed.request(index, begin, length, into)
+
+    def cancel_piece(self, index: int, begin: int, length: int) -> None:
+        self.seed.cancel_piece(index, begin, length)
+
+    def __repr__(self) -> str:
+        return f"WebSeedConnection({self.seed.url!r}, {self.number})"
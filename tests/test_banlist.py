@@ -0,0 +1,52 @@
+import json
+import os
+
+from bittorrentclient import banlist
+from bittorrentclient.banlist import BanList
+
+
+def test_threshold():
+    bans = BanList(path=None, threshold=3)
+    assert [bans.hash_failed("1.1.1.1") for _ in range(3)] == [False, False, True]
+    assert "1.1.1.1" in bans and bans.banned_count == 1
+    assert not bans.hash_failed("1.1.1.1")  # вже заблокований
+    assert bans.hash_failed("2.2.2.2") is False and bans.failures("2.2.2.2") == 1
+    assert "2.2.2.2" not in bans
+
+
+def test_persistence(tmp_path):
+    path = os.path.join(tmp_path, "dir", "bans.json")
+    bans = BanList(path, threshold=1)
+    assert bans.hash_failed("1.1.1.1")
+    bans.ban("2.2.2.2")
+    restored = BanList(path)
+    restored.load()
+    assert "1.1.1.1" in restored and "2.2.2.2" in restored and restored.banned_count == 2
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_expiry(tmp_path, monkeypatch):
+    path = os.path.join(tmp_path, "bans.json")
+    now = 1_000_000.
+    monkeypatch.setattr(banlist.time, "time", lambda: now)
+    bans = BanList(path, threshold=1, max_age=100)
+    bans.ban("1.1.1.1")
+    now += 60
+    bans.ban("2.2.2.2")
+    now += 50
+    restored = BanList(path, max_age=100)
+    restored.load()
+    assert "1.1.1.1" not in restored and "2.2.2.2" in restored
+    restored.save()
+    with open(path) as f:
+        assert json.load(f) == {"2.2.2.2": 1_000_060.}
+
+
+def test_spoiled_file(tmp_path):
+    path = os.path.join(tmp_path, "bans.json")
+    for content in ("not json", "[1, 2]", json.dumps({"1.1.1.1": "x"})):
+        with open(path, "w") as f:
+            f.write(content)
+        bans = BanList(path)
+        bans.load()
+        assert bans.banned_count == 0
@@ -0,0 +1,34 @@
+import os
+
+from bittorrentclient import checker, creator
+from bittorrentclient.torrentfile import TorrentFile
+
+
+def make(tmp_path) -> tuple[TorrentFile, str]:
+    """Багатофайловий торент з порожнім файлом, дані лежать одразу в destination"""
+    source = os.path.join(tmp_path, "data")
+    os.makedirs(source)
+    for name, size in (("a.bin", 100_000), ("empty", 0), ("b.bin", 5000)):
+        with open(os.path.join(source, name), "wb") as f:
+            f.write(os.urandom(size))
+    torrent_path = os.path.join(tmp_path, "t.torrent")
+    with open(torrent_path, "wb") as f:
+        f.write(creator.create(source, [["http://127.0.0.1:1/announce"]], 1 << 15))
+    return TorrentFile.open(torrent_path), source
+
+
+def test_complete(tmp_path):
+    torrent, destination = make(tmp_path)
+    result = checker.check(torrent, destination, workers=1)
+    assert result.complete
+    assert all(f.complete for f in result.files)
+
+
+def test_missing_empty_file(tmp_path):
+    torrent, destination = make(tmp_path)
+    os.remove(os.path.join(destination, "empty"))
+    result = checker.check(torrent, destination, workers=1)
+    empty = next(f for f in result.files if f.path.endswith("empty"))
+    assert empty.missing and not empty.complete
+    assert result.valid_pieces == result.pieces_count
+    assert not result.complete
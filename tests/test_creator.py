@@ -0,0 +1,73 @@
+import hashlib
+import os
+
+import pytest
+
+from bittorrentclient import creator
+from bittorrentclient.torrentfile import TorrentFile
+
+PIECE_LENGTH = 1 << 14
+FILE_SIZES = [10_000, 0, 1, PIECE_LENGTH, 3 * PIECE_LENGTH + 7, 0, 50_001]  # куски перетинають межі файлів
+
+
+def make_files(tmp_path) -> tuple[str, list[creator.SourceFile], bytes]:
+    """Папка з файлами FILE_SIZES, файли в порядку collect_files та всі дані одним потоком"""
+    source = os.path.join(tmp_path, "data")
+    os.makedirs(source)
+    for i, size in enumerate(FILE_SIZES):
+        with open(os.path.join(source, f"f{i}.bin"), "wb") as f:
+            f.write(os.urandom(size))
+    files = creator.collect_files(source)
+    data = b""
+    for source_file in files:
+        with open(source_file.path, "rb") as f:
+            data += f.read()
+    return source, files, data
+
+
+def reference(data: bytes, piece_length: int = PIECE_LENGTH) -> bytes:
+    return b"".join(hashlib.sha1(data[i:i + piece_length]).digest() for i in range(0, len(data), piece_length))
+
+
+def test_hash_range_across_files(tmp_path):
+    _, files, data = make_files(tmp_path)
+    sources = [(f.path, f.length) for f in files]
+    expected = reference(data)
+    pieces_count = len(expected) // 20
+    for first in range(pieces_count):
+        for last in range(first + 1, pieces_count + 1):
+            assert creator.hash_range(sources, PIECE_LENGTH, first, last) == expected[first * 20:last * 20]
+
+
+@pytest.mark.parametrize("total_length, piece_length, workers", [
+    (1, 1 << 14, None), (1 << 20, 1 << 14, 1), (100 * 2 ** 20 + 1, 1 << 14, 4), (5 * 2 ** 30, 1 << 18, 3),
+    (2 ** 30, 1 << 24, 8),
+])
+def test_split_pieces(total_length, piece_length, workers):
+    """Діапазони йдуть підряд без пропусків та перекриттів і покривають всі куски"""
+    ranges, used = creator.split_pieces(total_length, piece_length, workers)
+    assert ranges[0][0] == 0 and ranges[-1][1] == -(-total_length // piece_length)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(first < last for first, last in ranges)
+    assert 1 <= used <= len(ranges)
+    if workers:
+        assert used <= workers
+
+
+def test_parallel_hashing(tmp_path, monkeypatch):
+    """Хеші з кількох процесів збігаються з хешуванням в одному процесі"""
+    _, files, data = make_files(tmp_path)
+    monkeypatch.setattr(creator, "TASK_SIZE", PIECE_LENGTH)
+    ranges, workers = creator.split_pieces(len(data), PIECE_LENGTH, 2)
+    assert len(ranges) > 1 and workers == 2
+    assert creator.hash_pieces(files, PIECE_LENGTH, 2) == reference(data)
+
+
+def test_trackerless_torrent(tmp_path):
+    source, _, data = make_files(tmp_path)
+    torrent_path = os.path.join(tmp_path, "t.torrent")
+    with open(torrent_path, "wb") as f:
+        f.write(creator.create(source, piece_length=PIECE_LENGTH, workers=1))
+    torrent = TorrentFile.open(torrent_path)
+    assert torrent.announce is None and not torrent.announce_list
+    assert torrent.length == len(data)
@@ -0,0 +1,119 @@
+"""Кластер DHT вузлів на 127.0.0.1: bootstrap, get_peers та announce_peer.
+
+    $ python3 -m pytest tests/test_dht.py
+"""
+import asyncio
+import os
+
+from bittorrentclient.bencoder import BenCoder
+from bittorrentclient.dht import DHTNode, DHTError
+
+NODES = 16
+
+
+async def start_cluster(count: int) -> list[DHTNode]:
+    """Перший вузол - bootstrap для решти, таблиці заповнюються пошуком власного id"""
+    boot = DHTNode(0, "127.0.0.1", state_path=None, bootstrap=[], query_timeout=1)
+    await boot.start()
+    nodes = [boot]
+    for _ in range(count - 1):
+        node = DHTNode(0, "127.0.0.1", state_path=None, bootstrap=[("127.0.0.1", boot.port)], query_timeout=1)
+        await node.start()
+        nodes.append(node)
+    await asyncio.wait_for(asyncio.gather(*[node.wait_bootstrapped() for node in nodes[1:]]), 10)
+    return nodes
+
+
+async def stop_cluster(nodes: list[DHTNode]) -> None:
+    for node in nodes:
+        await node.stop()
+
+
+def test_bootstrap():
+    async def run():
+        nodes = await start_cluster(NODES)
+        try:
+            sizes = [len(node.table) for node in nodes]
+            assert all(size > 0 for size in sizes), sizes
+        finally:
+            await stop_cluster(nodes)
+    asyncio.run(run())
+
+
+def test_announce_and_get_peers():
+    async def run():
+        nodes = await start_cluster(NODES)
+        try:
+            info_hash = os.urandom(20)
+            assert await nodes[3].get_peers(info_hash) == []
+            await nodes[3].announce_peer(info_hash, 5555)
+            await nodes[7].announce_peer(info_hash, 6666)
+            found = set(await nodes[-1].get_peers(info_hash))
+            assert found == {("127.0.0.1", 5555), ("127.0.0.1", 6666)}
+            assert ("127.0.0.1", 5555) in await nodes[7].announce_peer(info_hash, 6666)
+        finally:
+            await stop_cluster(nodes)
+    asyncio.run(run())
+
+
+def test_announce_needs_token():
+    """announce_peer без токена з get_peers відхиляється, пір не зберігається"""
+    async def run():
+        nodes = await start_cluster(3)
+        try:
+            info_hash = os.urandom(20)
+            target = ("127.0.0.1", nodes[1].port)
+            args = {"info_hash": info_hash, "port": 7777, "token": b"bad", "implied_port": 0}
+            try:
+                await nodes[2].query(target, "announce_peer", args)
+            except DHTError:
+                pass  # вузол відповідає помилкою протоколу
+            assert nodes[1].peers.get(info_hash) == []
+        finally:
+            await stop_cluster(nodes)
+    asyncio.run(run())
+
+
+class MalformedNode(asyncio.DatagramProtocol):
+    """Відповідає на будь-який запит відповіддю з полями неправильних типів"""
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        query = BenCoder.decode(data)
+        response = {"id": b"m" * 20, "nodes": 5, "values": [7], "token": ["x"]}
+        self.transport.sendto(BenCoder.encode({"t": query["t"], "y": "r", "r": response}), addr)
+
+
+def test_malformed_replies():
+    """Відповіді з неправильними типами відкидаються, bootstrap завершується, stop не піднімає помилку"""
+    async def run():
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(MalformedNode,
+                                                                                 local_addr=("127.0.0.1", 0))
+        bad_port = transport.get_extra_info("sockname")[1]
+        node = DHTNode(0, "127.0.0.1", state_path=None, bootstrap=[("127.0.0.1", bad_port)], query_timeout=1)
+        await node.start()
+        try:
+            await asyncio.wait_for(node.wait_bootstrapped(), 5)
+            assert len(node.table) == 0
+            assert await node.get_peers(os.urandom(20)) == []
+        finally:
+            await node.stop()
+            transport.close()
+    asyncio.run(run())
+
+
+def test_bootstrap_by_hostname():
+    async def run():
+        boot = DHTNode(0, "127.0.0.1", state_path=None, bootstrap=[], query_timeout=1)
+        await boot.start()
+        node = DHTNode(0, "127.0.0.1", state_path=None, bootstrap=[("localhost", boot.port), ("invalid.", 1)],
+                       query_timeout=1)
+        await node.start()
+        try:
+            await asyncio.wait_for(node.wait_bootstrapped(), 5)
+            assert len(node.table) == 1
+        finally:
+            await node.stop()
+            await boot.stop()
+    asyncio.run(run())
@@ -0,0 +1,25 @@
+import json
+import threading
+
+from bittorrentclient.diagnostics import Diagnostics
+
+
+def test_records_from_threads_are_not_lost(tmp_path):
+    """Гарячі ділянки, що виконуються в дисковому пулі, записуються паралельно з dump()"""
+    path = str(tmp_path / "diag.jsonl")
+    diagnostics = Diagnostics(path)
+    threads_count, records = 4, 20000
+
+    def work(n: int) -> None:
+        for i in range(records):
+            diagnostics._record(diagnostics._sections, f"section{(n + i) % 50}", 0.001)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        diagnostics.dump()
+    diagnostics.dump()
+    with open(path) as f:
+        dumps = [json.loads(line) for line in f]
+    assert sum(s["count"] for d in dumps for s in d["sections"].values()) == threads_count * records
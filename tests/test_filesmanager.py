@@ -0,0 +1,84 @@
+import hashlib
+import os
+import random
+
+from bittorrentclient.filesmanager import FilesManager, PRIORITY_SKIP, PRIORITY_NORMAL, PRIORITY_HIGH, PART_FILE
+
+PIECE_LENGTH = 1000
+FILES = [(2500, "a.bin"), (1200, "d/b.bin"), (2301, "c.bin")]  # куски 2 та 3 спільні для b.bin з сусідами
+LENGTH = sum(size for size, _ in FILES)
+
+
+def open_manager(tmp_path, data: bytes, priorities: list[int]) -> FilesManager:
+    hashes = b"".join(hashlib.sha1(data[i:i + PIECE_LENGTH]).digest() for i in range(0, len(data), PIECE_LENGTH))
+    return FilesManager.open(str(tmp_path), FILES, PIECE_LENGTH, hashes, priorities)
+
+
+def write_wanted(manager: FilesManager, data: bytes) -> None:
+    for index in range(len(manager.bitfield)):
+        if manager.piece_priority(index) != PRIORITY_SKIP:
+            manager.write_block(data[index * PIECE_LENGTH:(index + 1) * PIECE_LENGTH], index)
+
+
+def read_file(tmp_path, name: str) -> bytes:
+    with open(os.path.join(tmp_path, name), "rb") as f:
+        return f.read()
+
+
+def test_skipped_file_is_not_created(tmp_path):
+    data = os.urandom(LENGTH)
+    manager = open_manager(tmp_path, data, [PRIORITY_NORMAL, PRIORITY_SKIP, PRIORITY_HIGH])
+    assert manager.left() == 2500 + 2301
+    assert [manager.piece_priority(i) for i in range(len(manager.bitfield))] == \
+        [PRIORITY_NORMAL] * 2 + [PRIORITY_NORMAL, PRIORITY_HIGH] + [PRIORITY_HIGH] * 3
+    write_wanted(manager, data)
+    assert manager.left() == 0 and manager.complete()
+    assert manager.completed == len(manager.bitfield) and manager.completed_bytes == LENGTH  # останній кусок короткий
+    assert not os.path.exists(os.path.join(tmp_path, "d"))
+    assert read_file(tmp_path, "a.bin") == data[:2500]
+    assert read_file(tmp_path, "c.bin") == data[3700:]
+    assert read_file(tmp_path, PART_FILE)[2500:3700].strip(b"\0")  # частини b.bin з кусків 2 та 3
+
+    reopened = open_manager(tmp_path, data, [PRIORITY_NORMAL, PRIORITY_SKIP, PRIORITY_HIGH])
+    assert reopened.completed == len(reopened.bitfield) and reopened.left() == 0
+
+
+def test_unskipped_file_takes_data_from_partfile(tmp_path):
+    data = os.urandom(LENGTH)
+    manager = open_manager(tmp_path, data, [PRIORITY_NORMAL, PRIORITY_SKIP, PRIORITY_NORMAL])
+    write_wanted(manager, data)
+    manager.set_priorities([PRIORITY_NORMAL] * 3)
+    assert manager.left() == 0 and manager.complete()  # b.bin повністю лежить у крайніх кусках 2 та 3
+    assert read_file(tmp_path, "d/b.bin") == data[2500:3700]
+    manager.set_priorities([PRIORITY_SKIP, PRIORITY_NORMAL, PRIORITY_NORMAL])
+    assert read_file(tmp_path, PART_FILE)[:2500] == data[:2500]
+    assert manager.left() == 0
+
+
+def test_left_counts_only_selected_bytes(tmp_path):
+    data = os.urandom(LENGTH)
+    manager = open_manager(tmp_path, data, [PRIORITY_SKIP, PRIORITY_NORMAL, PRIORITY_SKIP])
+    assert manager.left() == 1200
+    manager.write_block(data[2000:3000], 2)
+    assert manager.left() == 700  # байти a.bin в куску 2 не рахуються
+    manager.set_priorities([PRIORITY_SKIP, PRIORITY_NORMAL, PRIORITY_NORMAL])
+    assert manager.left() == 700 + 2301
+    manager.set_priorities([PRIORITY_SKIP, PRIORITY_SKIP, PRIORITY_SKIP])
+    assert manager.left() == 0 and manager.complete()
+
+
+def test_counters_match_recount(tmp_path):
+    """Лічильники, що змінюються з кожним записаним куском, збігаються з повним перерахунком"""
+    rng = random.Random(3)
+    data = os.urandom(LENGTH)
+    manager = open_manager(tmp_path, data, [PRIORITY_NORMAL] * 3)
+    pieces = list(range(len(manager.bitfield)))
+    rng.shuffle(pieces)
+    for index in pieces:
+        if rng.random() < 0.3:
+            manager.set_priorities([rng.choice([PRIORITY_SKIP, PRIORITY_NORMAL]) for _ in FILES])
+        manager.write_block(data[index * PIECE_LENGTH:(index + 1) * PIECE_LENGTH], index)
+        counters = manager.completed, manager.completed_bytes, manager.left()
+        manager._recount()
+        assert counters == (manager.completed, manager.completed_bytes, manager.left())
+    assert manager.completed_bytes == LENGTH and manager.left() == 0
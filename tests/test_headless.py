@@ -0,0 +1,42 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from bittorrentclient.headless import HeadlessUI
+from bittorrentclient.statistic import Statistic
+
+
+def test_progress_lines(tmp_path):
+    async def run():
+        path = os.path.join(tmp_path, "progress.jsonl")
+        ui = HeadlessUI(path, period=0.05)
+        ui.set_static_info("t.torrent", "/tmp", 10)
+        ui.set_speed_ava(True, False)
+        stats = iter([Statistic(0, 0, 1000, 0, 0, 0, 1000), Statistic(0, 400, 600, 2, 1, 1, 1000)])
+        last = [None]
+
+        def getter():
+            last[0] = next(stats, last[0])
+            return last[0]
+
+        task = asyncio.create_task(ui.render(getter))
+        await asyncio.sleep(0.12)
+        ui.print("message")
+        ui.shutdown()
+        await task
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert [line["event"] for line in lines][:2] == ["start", "progress"]
+        assert lines[1]["left"] == 600 and lines[1]["progress"] == 0.4
+        assert lines[1]["download_rate"] > 0 and lines[1]["upload_rate"] is None
+        assert lines[-2:] == [dict(lines[-2], event="log", message="message"), dict(lines[-1], event="stop")]
+    asyncio.run(run())
+
+
+def test_no_curses_import():
+    code = "import sys, bittorrentclient, bittorrentclient.headless; print('_curses' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == "False"
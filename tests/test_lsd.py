@@ -0,0 +1,58 @@
+"""Пошук пірів у локальній мережі (BEP 14) на 127.0.0.1: дві сесії без трекера знаходять одна одну.
+
+    $ python3 -m pytest tests/test_lsd.py
+"""
+import asyncio
+import os
+import time
+
+from bittorrentclient.lsd import LocalDiscovery, LSD_GROUP, build_message, parse_message
+from bittorrentclient.session import Session
+from bittorrentclient.torrentfile import TorrentFile
+from benchmarks.swarm import make_torrent
+
+LSD_PORT = 16771  # не заважати справжнім клієнтам у мережі
+
+
+def test_message_roundtrip():
+    info_hashes = [os.urandom(20), os.urandom(20)]
+    data = build_message(LSD_GROUP, LSD_PORT, 10101, info_hashes, "abc")
+    assert parse_message(data) == (10101, info_hashes, "abc")
+
+
+def test_message_rejected():
+    assert parse_message(b"GET / HTTP/1.1\r\n\r\n") is None
+    assert parse_message(b"BT-SEARCH * HTTP/1.1\r\nPort: 10101\r\n\r\n") is None  # без info hash
+    assert parse_message(b"BT-SEARCH * HTTP/1.1\r\nPort: 0\r\nInfohash: " + b"a" * 40 + b"\r\n\r\n") is None
+    assert parse_message(b"\xff\xfe") is None
+
+
+def test_download_without_tracker(tmp_path):
+    """Трекер недоступний, лічер знаходить сіда через оголошення і позначає його локальним"""
+    async def run():
+        seed_dir = os.path.join(tmp_path, "seed")
+        torrent = TorrentFile.open(make_torrent(seed_dir, "t", 3 * 2 ** 20 + 777, 2 ** 18,
+                                                announce="http://127.0.0.1:1/announce"))
+        seed = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", to_download=False, tracker_timeout=1,
+                       lsd=LocalDiscovery("127.0.0.1", lsd_port=LSD_PORT))
+        await seed.start()
+        destination = os.path.join(tmp_path, "leech")
+        os.makedirs(destination)
+        leecher = Session(b"-PY0001-%012d" % 1, port=0, host="127.0.0.1", tracker_timeout=1,
+                          lsd=LocalDiscovery("127.0.0.1", lsd_port=LSD_PORT))
+        await leecher.start()
+        try:
+            seed.add_torrent(torrent, seed_dir)
+            manager = leecher.add_torrent(torrent, destination).loadmanager
+            start = time.monotonic()
+            while manager.get_stat().left and time.monotonic() - start < 30:
+                await asyncio.sleep(0.1)
+            stat = manager.get_stat()
+            assert stat.left == 0
+            assert stat.local_peers == 1
+        finally:
+            await leecher.shutdown()
+            await seed.shutdown()
+        with open(os.path.join(seed_dir, "t"), "rb") as a, open(os.path.join(destination, "t"), "rb") as b:
+            assert a.read() == b.read()
+    asyncio.run(run())
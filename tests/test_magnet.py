@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import os
+
+from bittorrentclient.bencoder import BenCoder
+from bittorrentclient.magnet import Magnet, MetadataFetcher, METADATA_PIECE
+from bittorrentclient.peer import Peer
+
+
+def test_bad_metadata_bans_sources():
+    """Піри, чиї шматки дали хибний хеш, більше не використовуються, інші піри лишаються кандидатами"""
+    async def run():
+        info = os.urandom(METADATA_PIECE + 100)
+        honest, liar, other = Peer("127.0.0.1", 6881), Peer("127.0.0.2", 6881), Peer("127.0.0.3", 6881)
+        fetcher = MetadataFetcher(Magnet(hashlib.sha1(info).digest(), peers=[honest, liar, other]),
+                                  b"-PY0001-%012d" % 0)
+        fetcher._result = asyncio.get_running_loop().create_future()
+
+        fetcher._size = len(info)
+        fetcher._store(liar, 0, info[:METADATA_PIECE])
+        fetcher._store(liar, 1, bytes(100))
+        assert not fetcher._result.done()
+        assert [p.ip for p in fetcher.peers] == ["127.0.0.1", "127.0.0.3"]
+        fetcher.update_peers([Peer("127.0.0.2", 6882)])
+        assert [p.ip for p in fetcher.peers] == ["127.0.0.1", "127.0.0.3"]
+
+        fetcher._size = len(info)
+        fetcher._store(other, 1, info[METADATA_PIECE:])
+        fetcher._store(honest, 0, info[:METADATA_PIECE])
+        assert fetcher._result.result() == info
+    asyncio.run(run())
+
+
+class FakePeer:
+    """Пір з ut_metadata без мережі: оголошує size і відповідає шматками info або мовчить"""
+    def __init__(self, ip: str, info: bytes, size: int, delay: float = 0, silent: bool = False):
+        self.ip, self.port = ip, 6881
+        self._info = info
+        self._delay = delay
+        self._silent = silent
+        self.connected = False
+        self.supports_extensions = True
+        self.extensions = {"ut_metadata": 2}
+        self.extension_handshake = {"metadata_size": size}
+        self.connects = 0
+
+    async def connect(self, *args, **kwargs) -> bool:
+        await asyncio.sleep(self._delay)
+        self.connected = True
+        self.connects += 1
+        return True
+
+    def reg_extension_handshake_taker(self, func):
+        self._on_handshake = func
+
+    def reg_extension_taker(self, name, func):
+        self._on_message = func
+
+    async def listen(self):
+        await asyncio.Event().wait()
+
+    async def send_extension_handshake(self, **kwargs):
+        self._on_handshake(self)
+
+    async def send_extension(self, name, payload):
+        index = BenCoder.decode(payload)["piece"]
+        if not self._silent:
+            data = self._info[index * METADATA_PIECE:(index + 1) * METADATA_PIECE]
+            self._on_message(self, BenCoder.encode({"msg_type": 1, "piece": index}) + data)
+
+    async def disconnect(self):
+        self.connected = False
+
+
+def test_peers_with_other_size_are_retried():
+    """Перший пір оголошує хибний розмір і мовчить: після його таймауту відкладений чесний пір повертається"""
+    async def run():
+        info = os.urandom(3 * METADATA_PIECE + 5)
+        liar = FakePeer("127.0.0.2", info, 100, silent=True)
+        honest = FakePeer("127.0.0.1", info, len(info), delay=0.05)
+        fetcher = MetadataFetcher(Magnet(hashlib.sha1(info).digest()), b"-PY0001-%012d" % 0, request_timeout=0.3)
+        fetcher.update_peers([liar, honest])
+        assert await asyncio.wait_for(fetcher.fetch(), 5) == info
+        assert honest.connects == 2 and liar.connects == 1
+    asyncio.run(run())
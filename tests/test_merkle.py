@@ -0,0 +1,216 @@
+"""Торенти v2 та гібридні (BEP 52): розбір, перевірка кусків і відповіді на запити хешів порівнюються
+з деревами, побудованими тут напряму за специфікацією.
+
+    $ python3 -m pytest tests/test_merkle.py
+"""
+import asyncio
+import hashlib
+import os
+import struct
+import time
+
+import pytest
+
+from bittorrentclient.bencoder import BenCoder
+from bittorrentclient.loadmanager import LoadManager
+from bittorrentclient.merkle import BLOCK_SIZE
+from bittorrentclient.peer import Peer
+from bittorrentclient.session import Session
+from bittorrentclient.torrentfile import TorrentFile
+
+PIECE_LENGTH = 4 * BLOCK_SIZE
+FILE_SIZES = {"a.bin": 5 * PIECE_LENGTH + 100, "b.bin": 3000, "c.bin": 2 * PIECE_LENGTH}
+
+
+def sha256(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def reference_layers(data: bytes) -> list[list[bytes]]:
+    """Всі рівні дерева файлу від листків до кореня, листки доповнені нулями до степені двійки"""
+    leaves = [sha256(data[i:i + BLOCK_SIZE]) for i in range(0, len(data), BLOCK_SIZE)]
+    width = 1
+    while width < len(leaves):
+        width *= 2
+    layer = leaves + [bytes(32)] * (width - len(leaves))
+    result = [layer]
+    while len(layer) > 1:
+        layer = [sha256(layer[i] + layer[i + 1]) for i in range(0, len(layer), 2)]
+        result.append(layer)
+    return result
+
+
+def make_v2(root: str, hybrid: bool) -> tuple[str, dict[str, bytes], bytes]:
+    """Багатофайловий торент v2 або гібридний. Повертає шлях торенту, дані файлів та всі дані одним потоком
+    з доповненням до межі куска після кожного файлу, крім останнього"""
+    source = os.path.join(root, "data")
+    os.makedirs(source)
+    contents = {name: os.urandom(size) for name, size in FILE_SIZES.items()}
+    file_tree, piece_layers, files, stream = dict(), dict(), list(), b""
+    base = (PIECE_LENGTH // BLOCK_SIZE).bit_length() - 1
+    for n, (name, data) in enumerate(contents.items()):
+        with open(os.path.join(source, name), "wb") as f:
+            f.write(data)
+        layers = reference_layers(data)
+        file_tree[name] = {"": {"length": len(data), "pieces root": layers[-1][0]}}
+        if len(data) > PIECE_LENGTH:
+            pieces = -(-len(data) // PIECE_LENGTH)
+            piece_layers[layers[-1][0]] = b"".join(layers[base][:pieces])
+        files.append({"length": len(data), "path": [name]})
+        stream += data
+        if n < len(contents) - 1 and len(data) % PIECE_LENGTH:
+            pad = PIECE_LENGTH - len(data) % PIECE_LENGTH
+            files.append({"attr": "p", "length": pad, "path": [".pad", str(pad)]})
+            stream += bytes(pad)
+    info = {"name": "data", "piece length": PIECE_LENGTH, "meta version": 2, "file tree": file_tree}
+    if hybrid:
+        info["files"] = files
+        info["pieces"] = b"".join(hashlib.sha1(stream[i:i + PIECE_LENGTH]).digest()
+                                  for i in range(0, len(stream), PIECE_LENGTH))
+    torrent_path = os.path.join(root, "t.torrent")
+    with open(torrent_path, "wb") as f:
+        f.write(BenCoder.encode({"announce": "http://127.0.0.1:1/announce", "info": info,
+                                 "piece layers": piece_layers}))
+    return torrent_path, contents, stream
+
+
+@pytest.mark.parametrize("hybrid", [False, True])
+def test_parse(tmp_path, hybrid):
+    torrent_path, contents, stream = make_v2(str(tmp_path), hybrid)
+    torrent = TorrentFile.open(torrent_path)
+    assert torrent.meta_version == 2 and torrent.hybrid == hybrid
+    assert torrent.length == len(stream)
+    assert torrent.pieces_count == -(-len(stream) // PIECE_LENGTH)
+    assert [length for length, path in torrent.files if not path.startswith(".pad")] == list(FILE_SIZES.values())
+    with open(torrent_path, "rb") as f:
+        info = BenCoder.encode(BenCoder.decode(f.read())["info"])
+    assert torrent.infoHash == (hashlib.sha1(info).digest() if hybrid else sha256(info)[:20])
+    merkle = torrent.merkle
+    for index in range(torrent.pieces_count):
+        piece = stream[index * PIECE_LENGTH:(index + 1) * PIECE_LENGTH]
+        assert merkle.verify(index, piece)
+        assert not merkle.verify(index, bytes([piece[0] ^ 1]) + piece[1:])
+
+
+def test_proof_matches_reference(tmp_path):
+    torrent_path, contents, _ = make_v2(str(tmp_path), False)
+    data = contents["a.bin"]
+    layers = reference_layers(data)
+    tree = TorrentFile.open(torrent_path).merkle.file(layers[-1][0])
+    depth = len(layers) - 1
+    checked = 0
+    for base_layer in range(depth + 1):
+        length = 1
+        while length <= len(layers[base_layer]):
+            top = base_layer + length.bit_length() - 1
+            for index in range(0, len(layers[base_layer]), length):
+                leaves = None
+                if base_layer < tree.base:
+                    if top > tree.base:
+                        continue
+                    piece = (index << base_layer) // tree.piece_leaves
+                    leaves = layers[0][piece * tree.piece_leaves:(piece + 1) * tree.piece_leaves]
+                for proof_layers in range(depth + 1):
+                    expected = layers[base_layer][index:index + length]
+                    expected += [layers[layer][(index >> (layer - base_layer)) ^ 1]
+                                 for layer in range(top, min(top + proof_layers, depth))]
+                    assert tree.proof(base_layer, index, length, proof_layers, leaves) == expected
+                    checked += 1
+            length *= 2
+    assert checked > 100
+    assert tree.proof(0, 0, 1, 0) is None  # нижче рівня кусків без листків
+    assert tree.proof(-1, 0, 1, 0) is None
+    assert tree.proof(tree.base, -1, 1, 0) is None
+
+
+class HashesRecorder:
+    def __init__(self):
+        self.sent, self.rejected = list(), list()
+
+    def send_hashes(self, *args):
+        self.sent.append(args)
+
+    def reject_hashes(self, *args):
+        self.rejected.append(args)
+
+
+def test_bad_hash_request_is_rejected(tmp_path):
+    """Від'ємні рівень чи номер вузла в запиті хешів відхиляються, а не ламають відповідь"""
+    async def run():
+        torrent_path, contents, _ = make_v2(str(tmp_path), False)
+        torrent = TorrentFile.open(torrent_path)
+        manager = LoadManager(torrent, os.path.join(tmp_path, "data"), b"-PY0001-%012d" % 0)
+        pieces_root = reference_layers(contents["a.bin"])[-1][0]
+        peer = HashesRecorder()
+        for base_layer, index, length, proof_layers in ((-1, 0, 1, 0), (-40, 0, 1, 0), (0, -4, 4, 0),
+                                                        (2, -1, 1, 0), (2, 0, 1, -1), (2, 0, -2, 0)):
+            await manager._send_hashes(peer, pieces_root, base_layer, index, length, proof_layers)
+        assert len(peer.rejected) == 6 and not peer.sent
+        await manager._send_hashes(peer, pieces_root, 2, 0, 4, 0)
+        assert len(peer.sent) == 1
+    asyncio.run(run())
+
+
+async def start_corrupting_proxy(port: int, index: int, begin: int) -> asyncio.Server:
+    """Проксі до сіда на port, що один раз псує блок (index, begin) у повідомленні piece.
+    Інші повідомлення, зокрема хеші, проходять без змін"""
+    async def pipe(reader, writer, corrupt: bool):
+        try:
+            if corrupt:
+                writer.write(await reader.readexactly(68))  # handshake
+            while data := await (reader.readexactly(4) if corrupt else reader.read(1 << 16)):
+                if corrupt:
+                    message = bytearray(await reader.readexactly(int.from_bytes(data, "big")))
+                    if message[:9] == bytes([7]) + struct.pack("!ii", index, begin) and not corrupted:
+                        message[9] ^= 1
+                        corrupted.append(True)
+                    data += message
+                writer.write(data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(reader, writer):
+        seed_reader, seed_writer = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.gather(pipe(reader, seed_writer, False), pipe(seed_reader, writer, True))
+
+    corrupted = list()
+    return await asyncio.start_server(serve, "127.0.0.1", 0)
+
+
+def test_corrupted_block_is_refetched_alone(tmp_path):
+    """Кусок з одним зіпсованим блоком не проходить перевірку, за листками від сіда знаходиться зіпсований блок,
+    і повторно запитується лише він"""
+    async def run():
+        torrent_path, contents, _ = make_v2(str(tmp_path), False)
+        torrent = TorrentFile.open(torrent_path)
+        destination = os.path.join(tmp_path, "leech")
+        os.makedirs(destination)
+        seed = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", tracker_timeout=1, to_download=False)
+        leecher = Session(b"-PY0001-%012d" % 1, port=0, host="127.0.0.1", tracker_timeout=1)
+        await seed.start()
+        await leecher.start()
+        proxy = await start_corrupting_proxy(seed.port, 0, BLOCK_SIZE)
+        try:
+            seed.add_torrent(torrent, os.path.join(tmp_path, "data"))
+            manager = leecher.add_torrent(torrent, destination).loadmanager
+            manager.update_peers([Peer("127.0.0.1", proxy.sockets[0].getsockname()[1])])
+            start = time.monotonic()
+            while manager.get_stat().left and time.monotonic() - start < 30:
+                await asyncio.sleep(0.05)
+            stat = manager.get_stat()
+            assert stat.left == 0
+            assert stat.hash_failures == 1 and stat.bad_blocks == 1
+            blocks = sum(-(-size // BLOCK_SIZE) for size in FILE_SIZES.values())  # доповнення не запитується
+            assert stat.requested_blocks == blocks + 1
+            assert stat.downloaded == sum(FILE_SIZES.values()) + BLOCK_SIZE  # без доповнення, зіпсований блок двічі
+        finally:
+            proxy.close()
+            await leecher.shutdown()
+            await seed.shutdown()
+        for name, data in contents.items():
+            with open(os.path.join(destination, name), "rb") as f:
+                assert f.read() == data
+    asyncio.run(run())
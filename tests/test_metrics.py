@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+
+import aiohttp
+
+from bittorrentclient.metrics import Registry, MetricsExporter
+
+
+def make_registry() -> Registry:
+    registry = Registry()
+    connects = registry.counter("bt_connects_total", "Connects", ("direction", "result"))
+    connects.inc(labels=("in", "ok"))
+    connects.inc(2, labels=("out", 'bad "quoted"\nline'))
+    registry.gauge("bt_ratio", "Ratio", func=lambda: 0.5)
+    registry.gauge("bt_rate", "Per peer rate", ("peer",), func=lambda: [(("a",), 10), (("b",), 20)])
+    latency = registry.histogram("bt_latency_seconds", "Latency", buckets=(0.1, 1.))
+    for value in (0.05, 0.1, 0.5, 3.):
+        latency.observe(value)
+    return registry
+
+
+def test_render():
+    registry = make_registry()
+    assert registry.counter("bt_connects_total", "Other help") is registry.counter("bt_connects_total", "")
+    assert registry.render().splitlines() == [
+        "# HELP bt_connects_total Connects",
+        "# TYPE bt_connects_total counter",
+        'bt_connects_total{direction="in",result="ok"} 1',
+        'bt_connects_total{direction="out",result="bad \\"quoted\\" line"} 2',
+        "# HELP bt_ratio Ratio",
+        "# TYPE bt_ratio gauge",
+        "bt_ratio 0.5",
+        "# HELP bt_rate Per peer rate",
+        "# TYPE bt_rate gauge",
+        'bt_rate{peer="a"} 10',
+        'bt_rate{peer="b"} 20',
+        "# HELP bt_latency_seconds Latency",
+        "# TYPE bt_latency_seconds histogram",
+        'bt_latency_seconds_bucket{le="0.1"} 2',
+        'bt_latency_seconds_bucket{le="1.0"} 3',
+        'bt_latency_seconds_bucket{le="+Inf"} 4',
+        "bt_latency_seconds_sum 3.65",
+        "bt_latency_seconds_count 4",
+    ]
+
+
+def test_exporter(tmp_path):
+    async def run():
+        path = os.path.join(tmp_path, "metrics.jsonl")
+        exporter = MetricsExporter(make_registry(), port=0, path=path, interval=0.05)
+        await exporter.start()
+        try:
+            assert exporter.port
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{exporter.port}/metrics") as response:
+                    assert response.status == 200
+                    assert 'bt_rate{peer="b"} 20' in await response.text()
+            await asyncio.sleep(0.2)
+        finally:
+            await exporter.stop()
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) >= 2
+        metrics = lines[-1]["metrics"]
+        assert metrics["bt_ratio"] == [{"labels": {}, "value": 0.5}]
+        assert metrics["bt_latency_seconds"][0]["count"] == 4
+        assert metrics["bt_latency_seconds"][0]["buckets"] == {"0.1": 2, "1.0": 1, "+Inf": 1}
+    asyncio.run(run())
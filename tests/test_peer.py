@@ -0,0 +1,213 @@
+"""Перевірка повідомлень піра: порушення протоколу закривають з'єднання, а не вбивають listen(),
+вихідні повідомлення об'єднуються в черзі, а send_piece чекає, поки черга не звільниться,
+тайм-аут блоку рахується з RTT піра.
+
+    $ python3 -m pytest tests/test_peer.py
+"""
+import asyncio
+import struct
+
+import pytest
+
+from bittorrentclient import metrics
+from bittorrentclient.peer import Peer, FAST_EXTENSION, SEND_QUEUE_LIMIT, INITIAL_RTO
+
+INFO_HASH = b"i" * 20
+PIECES = 10
+PIECE_LENGTH = 1 << 15
+LENGTH = PIECES * PIECE_LENGTH - 1000  # останній кусок коротший
+
+
+def message(message_id: int, fmt: str = "", *values) -> bytes:
+    payload = bytes([message_id]) + struct.pack("!" + fmt, *values)
+    return struct.pack("!i", len(payload)) + payload
+
+
+async def talk(messages: list[bytes], timeout: float) -> tuple[Peer, list[tuple[int, int, int]], bool]:
+    """Пір з'єднується з сервером, який після handshake надсилає messages і тримає з'єднання відкритим.
+    listen() слухає не довше timeout секунд, далі пір від'єднується сам. Повертає пір, отримані запити
+    та чи був пір підключений до кінця timeout"""
+    async def serve(reader, writer):
+        handshake = await reader.readexactly(68)
+        reserved = bytearray(8)
+        reserved[FAST_EXTENSION[0]] |= FAST_EXTENSION[1]
+        writer.write(handshake[:20] + bytes(reserved) + INFO_HASH + b"r" * 20 + b"".join(messages))
+        await writer.drain()
+        await reader.read()
+
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    requests = list()
+    peer = Peer("127.0.0.1", server.sockets[0].getsockname()[1])
+    peer.reg_data_taker(lambda p, index, begin, length: requests.append((index, begin, length)))
+    try:
+        assert await peer.connect(INFO_HASH, PIECES, b"p" * 20, timeout=1, piece_length=PIECE_LENGTH, length=LENGTH)
+        listener = asyncio.create_task(peer.listen())
+        done, _ = await asyncio.wait([listener], timeout=timeout)
+        if not done:
+            await peer.disconnect()
+            await listener
+    finally:
+        server.close()
+    return peer, requests, not done
+
+
+@pytest.mark.parametrize("bad", [
+    message(4, "i", -1),  # have
+    message(4, "i", PIECES),
+    message(6, "iii", -1, 0, 1 << 14),  # request
+    message(6, "iii", 1 << 30, 0, 1 << 14),
+    message(6, "iii", 0, -16, 1 << 14),
+    message(6, "iii", 0, 0, 0),
+    message(6, "iii", 0, 0, 1 << 31 - 1),
+    message(6, "iii", 0, PIECE_LENGTH - 100, 1 << 14),  # блок виходить за кусок
+    message(6, "iii", PIECES - 1, 1 << 14, 1 << 14),  # останній кусок коротший
+    message(8, "iii", PIECES, 0, 1 << 14),  # cancel
+    message(0x10, "iii", 0, -1, 1 << 14),  # reject
+    message(0x0D, "i", -1),  # suggest
+    message(0x11, "i", -1),  # allowed fast
+    message(0x11, "i", PIECES),
+    message(4, "h", 1),  # неправильна довжина
+    message(6, "ii", 0, 0),
+    message(7, "h", 0),
+])
+def test_bad_message_disconnects(bad):
+    async def run():
+        peer, requests, alive = await talk([message(1), bad, message(6, "iii", 0, 0, 1 << 14)], 5)
+        assert not alive and not peer.connected
+        assert requests == []  # повідомлення після порушення не обробляються
+    asyncio.run(run())
+
+
+def test_valid_messages():
+    async def run():
+        valid = [message(4, "i", PIECES - 1), message(0x11, "i", 3), message(0x0D, "i", 2),
+                 message(6, "iii", 0, PIECE_LENGTH - (1 << 14), 1 << 14),
+                 message(6, "iii", PIECES - 1, 0, PIECE_LENGTH - 1000)]
+        peer, requests, alive = await talk(valid, 0.5)
+        assert alive
+        assert requests == [(0, PIECE_LENGTH - (1 << 14), 1 << 14), (PIECES - 1, 0, PIECE_LENGTH - 1000)]
+        assert peer.bitfield.has(PIECES - 1)
+        assert peer.allowed_fast == {3}
+        assert peer.suggested == {2}
+    asyncio.run(run())
+
+
+async def connect(received: bytearray, messages: list[bytes] = (),
+                  reading: asyncio.Event | None = None) -> tuple[Peer, asyncio.Server]:
+    """Пір, з'єднаний з сервером, який після handshake надсилає messages і складає отримане в received.
+    Якщо задано reading, сервер починає читати лише після його встановлення"""
+    async def serve(reader, writer):
+        handshake = await reader.readexactly(68)
+        writer.write(handshake[:20] + bytes(8) + INFO_HASH + b"r" * 20 + b"".join(messages))
+        await writer.drain()
+        if reading:
+            await reading.wait()
+        while data := await reader.read(1 << 16):
+            received.extend(data)
+
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    peer = Peer("127.0.0.1", server.sockets[0].getsockname()[1])
+    assert await peer.connect(INFO_HASH, PIECES, b"p" * 20, timeout=1, piece_length=PIECE_LENGTH, length=LENGTH)
+    return peer, server
+
+
+def parse(data: bytes) -> list[bytes]:
+    result = list()
+    while data:
+        length = int.from_bytes(data[:4], "big")
+        result.append(data[4:4 + length])
+        data = data[4 + length:]
+    return result
+
+
+def total(counter: metrics.Counter) -> float:
+    return sum(value for _, value in counter.samples())
+
+
+def test_haves_are_deduplicated_and_batched():
+    async def run():
+        received = bytearray()
+        peer, server = await connect(received, [message(4, "i", 5)])
+        listener = asyncio.create_task(peer.listen())
+        try:
+            await asyncio.sleep(0.1)
+            batches, sent = total(metrics.SEND_BATCHES), total(metrics.MESSAGES_SENT)
+            assert [peer.have(0), peer.have(0), peer.have(5), peer.have(1)] == [True, False, False, True]
+            await peer.interested()
+            await peer.unchoke()
+            await asyncio.sleep(0.1)
+            assert parse(bytes(received)) == [message(4, "i", 0)[4:], message(4, "i", 1)[4:], b"\x02", b"\x01"]
+            assert total(metrics.SEND_BATCHES) - batches == 1  # всі повідомлення одним записом
+            assert total(metrics.MESSAGES_SENT) - sent == 4
+        finally:
+            await peer.disconnect()
+            await listener
+            server.close()
+    asyncio.run(run())
+
+
+def test_send_piece_waits_for_queue():
+    async def run():
+        received, reading = bytearray(), asyncio.Event()
+        peer, server = await connect(received, reading=reading)
+        block = bytes(1 << 16)
+        count = 400  # більше, ніж вміщують буфери сокетів та черга
+
+        async def upload():
+            for i in range(count):
+                await peer.send_piece(block, i % PIECES, 0)
+
+        uploader = asyncio.create_task(upload())
+        try:
+            await asyncio.sleep(0.5)
+            assert not uploader.done()
+            assert SEND_QUEUE_LIMIT <= peer.send_queued_bytes < SEND_QUEUE_LIMIT + 2 * (len(block) + 13)
+            reading.set()
+            await asyncio.wait_for(uploader, 10)
+            start = asyncio.get_running_loop().time()
+            while len(received) < count * (len(block) + 13) and asyncio.get_running_loop().time() - start < 10:
+                await asyncio.sleep(0.05)
+            assert len(received) == count * (len(block) + 13) and peer.send_queued_bytes == 0
+        finally:
+            await peer.disconnect()
+            server.close()
+    asyncio.run(run())
+
+
+def test_rto_follows_rtt():
+    """RTO після першого виміру - SRTT + 4 * RTTVAR = 3 * RTT, подвоюється з кожним тайм-аутом
+    і повертається до виміряного з наступним блоком"""
+    async def serve(reader, writer):
+        handshake = await reader.readexactly(68)
+        writer.write(handshake[:20] + bytes(8) + INFO_HASH + b"r" * 20)
+        try:
+            while True:
+                request = await reader.readexactly(17)
+                index, begin, length = struct.unpack("!iii", request[5:])
+                await asyncio.sleep(0.2)
+                writer.write(struct.pack("!ibii", 9 + length, 7, index, begin) + bytes(length))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def run():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        peer = Peer("127.0.0.1", server.sockets[0].getsockname()[1])
+        assert await peer.connect(INFO_HASH, PIECES, b"p" * 20, timeout=1, piece_length=PIECE_LENGTH, length=LENGTH)
+        listener = asyncio.create_task(peer.listen())
+        try:
+            assert peer.srtt is None and peer.rto == INITIAL_RTO
+            assert await asyncio.wait_for(peer.request(0, 0, 1 << 14), 3) == bytes(1 << 14)
+            assert 0.15 < peer.srtt < 0.5
+            measured = peer.rto
+            assert measured == pytest.approx(3 * peer.srtt)
+            peer.request_timed_out()
+            peer.request_timed_out()
+            assert peer.rto == pytest.approx(4 * measured)
+            await peer.request(0, 1 << 14, 1 << 14)
+            assert peer.rto < 2 * measured
+        finally:
+            await peer.disconnect()
+            await listener
+            server.close()
+    asyncio.run(run())
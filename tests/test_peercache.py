@@ -0,0 +1,48 @@
+import json
+import os
+import time
+
+from bittorrentclient.peercache import PeerCache
+
+
+def test_roundtrip(tmp_path):
+    path = os.path.join(tmp_path, "peers.json")
+    info_hash = os.urandom(20)
+    cache = PeerCache(path)
+    cache.update(info_hash, [("127.0.0.1", 6881, time.time(), 10.), ("127.0.0.2", 6882, time.time(), 20.)])
+    cache.save()
+    loaded = PeerCache(path)
+    loaded.load()
+    assert [(p.ip, p.port) for p in loaded.get(info_hash)] == [("127.0.0.2", 6882), ("127.0.0.1", 6881)]
+
+
+def test_spoiled_cache_is_empty(tmp_path):
+    path = os.path.join(tmp_path, "peers.json")
+    for data in ('[1, 2]', 'null', '42', '"peers"', '{"aa": 5}', '{broken'):
+        with open(path, "w") as f:
+            f.write(data)
+        cache = PeerCache(path)
+        cache.load()
+        assert cache.get(bytes.fromhex("aa")) == []
+
+
+def test_spoiled_entries_are_dropped(tmp_path):
+    """Записи з хибними типами полів відкидаються, решта записів торенту лишається"""
+    path = os.path.join(tmp_path, "peers.json")
+    now = time.time()
+    good = {"ip": "127.0.0.1", "port": 6881, "last_seen": now, "rate": 1.5}
+    bad = [{"ip": "127.0.0.2", "port": 6882, "last_seen": "x", "rate": 1.},
+           {"ip": 5, "port": 1, "last_seen": now, "rate": 0},
+           {"ip": "127.0.0.3", "port": "6881", "last_seen": now, "rate": 0},
+           {"ip": "127.0.0.4", "port": 0, "last_seen": now},
+           {"ip": "127.0.0.5", "port": 1, "last_seen": now, "rate": None},
+           {"ip": "127.0.0.6", "port": True, "last_seen": now, "rate": 0},
+           "peer", None, 7]
+    with open(path, "w") as f:
+        f.write(f'{{"aa": {json.dumps(bad + [good])}, "bb": {json.dumps(bad)}, "cc": 5, '
+                f'"dd": [{{"ip": "127.0.0.1", "port": 1, "last_seen": NaN, "rate": 0}}]}}')
+    cache = PeerCache(path)
+    cache.load()
+    assert [(p.ip, p.port) for p in cache.get(bytes.fromhex("aa"))] == [("127.0.0.1", 6881)]
+    for info_hash in ("bb", "cc", "dd"):
+        assert cache.get(bytes.fromhex(info_hash)) == []
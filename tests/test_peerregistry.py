@@ -0,0 +1,130 @@
+import random
+
+from bittorrentclient.peerregistry import PeerRegistry
+
+PIECES = 8
+
+
+class FakePeer:
+    def __init__(self, ip: str, port: int, incoming: bool = False):
+        self.ip = ip
+        self.port = port
+        self.listen_port = None if incoming else port
+        self.id = f"{ip}:{port}".encode()
+        self.incoming = incoming
+        self.local = False
+
+    def __repr__(self):
+        return f"FakePeer({self.ip!r}, {self.port})"
+
+
+def test_indexes_match_model():
+    """Випадкові add, take, failed, attach, detach та запити кусків порівнюються з простою моделлю на множинах"""
+    rng = random.Random(7)
+    registry = PeerRegistry()
+    known: set[tuple[str, int]] = set()
+    idle: dict[tuple[str, int], None] = dict()  # в порядку надходження
+    idle_local: dict[tuple[str, int], None] = dict()  # в порядку, в якому стали локальними
+    local: set[tuple[str, int]] = set()
+    taken: list[tuple[str, int]] = list()
+    connected: dict[FakePeer, None] = dict()
+    interesting: set[FakePeer] = set()
+    requests: dict[int, set[FakePeer]] = dict()
+    everyone: list[FakePeer] = list()
+
+    def address() -> tuple[str, int]:
+        return f"10.0.0.{rng.randrange(20)}", rng.randrange(6881, 6886)
+
+    for step in range(3000):
+        action = rng.random()
+        if action < 0.15:
+            addresses = [address() for _ in range(rng.randrange(1, 6))]
+            is_local = rng.random() < 0.2
+            busy = {(p.ip, p.port) for p in connected}
+            new = list(dict.fromkeys(a for a in addresses if a not in known and a not in busy))
+            assert registry.add(addresses, is_local) == len(new)
+            for a in addresses:
+                if a in new and a not in known:
+                    known.add(a)
+                    idle[a] = None
+                if is_local and a in known:
+                    if a in idle and a not in local: idle_local[a] = None
+                    local.add(a)
+        elif action < 0.3:
+            count = rng.randrange(4)
+            expected = list(dict.fromkeys(list(idle_local) + list(idle)))[:count]
+            assert [r.address for r in registry.take(count)] == expected
+            for a in expected:
+                del idle[a]
+                idle_local.pop(a, None)
+            taken += expected
+        elif action < 0.4 and taken:
+            a = taken.pop(rng.randrange(len(taken)))
+            registry.failed(a)
+            known.discard(a)
+            local.discard(a)
+        elif action < 0.55 and taken:
+            peer = FakePeer(*taken.pop(rng.randrange(len(taken))))
+            registry.attach(peer)
+            connected[peer] = None
+            everyone.append(peer)
+        elif action < 0.6:
+            peer = FakePeer(f"10.1.0.{rng.randrange(50)}", rng.randrange(40000, 60000), incoming=True)
+            registry.attach(peer)
+            connected[peer] = None
+            everyone.append(peer)
+        elif action < 0.7 and connected:
+            peer = rng.choice(list(connected))
+            registry.detach(peer)
+            del connected[peer]
+            interesting.discard(peer)
+            for requesters in requests.values():
+                requesters.discard(peer)
+            a = (peer.ip, peer.port)
+            if not peer.incoming and a in known:
+                idle[a] = None
+                if a in local: idle_local[a] = None
+        elif action < 0.8 and connected:
+            peer = rng.choice(list(connected))
+            value = rng.random() < 0.6
+            registry.set_interesting(peer, value)
+            (interesting.add if value else interesting.discard)(peer)
+        elif action < 0.9 and connected:
+            peer, index = rng.choice(list(connected)), rng.randrange(PIECES)
+            registry.add_request(index, peer)
+            requests.setdefault(index, set()).add(peer)
+        elif action < 0.95 and connected:
+            peer, index = rng.choice(list(connected)), rng.randrange(PIECES)
+            registry.remove_request(index, peer)
+            requests.get(index, set()).discard(peer)
+        else:
+            index = rng.randrange(PIECES)
+            assert set(registry.pop_requests(index)) == requests.pop(index, set())
+
+        assert len(registry) == len(known)
+        assert registry.idle_count == len(idle)
+        assert registry.idle_local_count == len(idle_local)
+        assert registry.connected == list(connected) and registry.connected_count == len(connected)
+        assert set(registry.interesting) == interesting and registry.interesting_count == len(interesting)
+        for index in range(PIECES):
+            for peer in everyone[-30:]:
+                assert registry.is_requesting(index, peer) == (peer in requests.get(index, ()))
+        for peer in everyone[-30:]:
+            assert (registry.by_id(peer.id) is peer) == (peer in connected)
+    assert len(everyone) > 100 and len(known) > 20
+
+
+def test_local_peers():
+    registry = PeerRegistry()
+    assert registry.add([("10.0.0.1", 1), ("10.0.0.2", 2)]) == 2
+    assert registry.add([("10.0.0.2", 2), ("10.0.0.3", 3)], local=True) == 1
+    assert registry.idle_local_count == 2
+    assert [r.address for r in registry.take(2)] == [("10.0.0.2", 2), ("10.0.0.3", 3)]
+    peer = FakePeer("10.0.0.2", 2)
+    registry.attach(peer)
+    assert peer.local and registry.local_count == 1
+    assert registry.add([("10.0.0.2", 2)]) == 0  # вже підключений
+    registry.detach(peer)
+    assert registry.idle_count == 2 and registry.idle_local_count == 1 and registry.local_count == 0
+    registry.forget([("10.0.0.1", 1), ("10.0.0.3", 3)])
+    assert len(registry) == 2  # 10.0.0.3 взято для з'єднання, тож не забувається
@@ -0,0 +1,68 @@
+"""Обмін пірами (BEP 11) на 127.0.0.1: трекер повідомляє лічерам лише сіда, один про одного вони дізнаються через PEX.
+
+    $ python3 -m pytest tests/test_pex.py
+"""
+import asyncio
+import os
+import struct
+import time
+import urllib.parse
+
+from aiohttp import web
+
+from bittorrentclient.bencoder import BenCoder
+from bittorrentclient.session import Session
+from bittorrentclient.torrentfile import TorrentFile
+from benchmarks.swarm import make_torrent, TrackerStandIn
+
+LEECHERS = 3
+
+
+class SeedOnlyTracker(TrackerStandIn):
+    """Перший, хто оголосився, - сід, решті повертається лише він"""
+    seed_port: int | None = None
+
+    async def _announce(self, request: web.Request) -> web.Response:
+        query = urllib.parse.parse_qs(request.rel_url.raw_query_string, encoding="latin-1")
+        port = int(query["port"][0])
+        if self.seed_port is None:
+            self.seed_port = port
+        peers = b"" if port == self.seed_port else bytes([127, 0, 0, 1]) + struct.pack("!H", self.seed_port)
+        return web.Response(body=BenCoder.encode({"interval": 600, "peers": peers}))
+
+
+def test_leechers_find_each_other(tmp_path):
+    async def run():
+        tracker = SeedOnlyTracker(port=0)
+        await tracker.start()
+        seed_dir = os.path.join(tmp_path, "seed")
+        torrent = TorrentFile.open(make_torrent(seed_dir, "t", 4 * 2 ** 20, 2 ** 18, announce=tracker.announce_url))
+        seed = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", to_download=False, pex_interval=1)
+        await seed.start()
+        seed.add_torrent(torrent, seed_dir)
+        await asyncio.sleep(0.5)
+
+        leechers = list()
+        managers = list()
+        try:
+            for i in range(LEECHERS):
+                destination = os.path.join(tmp_path, f"leech{i}")
+                os.makedirs(destination)
+                session = Session(b"-PY0001-%012d" % (i + 1), port=0, host="127.0.0.1", pex_interval=1)
+                await session.start()
+                leechers.append(session)
+                managers.append(session.add_torrent(torrent, destination).loadmanager)
+
+            start = time.monotonic()
+            while time.monotonic() - start < 30:
+                await asyncio.sleep(0.1)
+                if all(m.get_stat().peers_count > 1 and m.get_stat().left == 0 for m in managers):
+                    break
+            for manager in managers:
+                assert manager.get_stat().peers_count > 1  # від трекера лише сід, решта - через PEX
+                assert manager.get_stat().left == 0
+        finally:
+            for session in leechers + [seed]:
+                await session.shutdown()
+            await tracker.stop()
+    asyncio.run(run())
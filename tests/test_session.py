@@ -0,0 +1,123 @@
+import asyncio
+import os
+import struct
+import time
+
+from bittorrentclient.peer import Peer
+from bittorrentclient.session import Session
+from bittorrentclient.torrentfile import TorrentFile
+from benchmarks.swarm import make_torrent
+
+
+def test_shutdown_right_after_add(tmp_path):
+    """Цикли торенту, що ще не встигли запуститись, не стартують після shutdown"""
+    async def run():
+        torrent = TorrentFile.open(make_torrent(os.path.join(tmp_path, "seed"), "t", 2 ** 20, 2 ** 16,
+                                                announce="http://127.0.0.1:1/announce"))
+        destination = os.path.join(tmp_path, "leech")
+        os.makedirs(destination)
+        session = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", tracker_timeout=1)
+        await session.start()
+        session.add_torrent(torrent, destination)
+        await session.shutdown()
+    asyncio.run(asyncio.wait_for(run(), 10))
+
+
+def test_lowered_limit_sheds_connections(tmp_path):
+    """Після зменшення ліміту сесії зайві з'єднання закриваються, нові понад ліміт не приймаються"""
+    async def run():
+        seed_dir = os.path.join(tmp_path, "seed")
+        torrent = TorrentFile.open(make_torrent(seed_dir, "t", 2 ** 20, 2 ** 16, announce="http://127.0.0.1:1/announce"))
+        seed = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", to_download=False, tracker_timeout=1)
+        await seed.start()
+        seed.add_torrent(torrent, seed_dir)
+        leechers = list()
+        try:
+            for i in range(3):
+                destination = os.path.join(tmp_path, f"leech{i}")
+                os.makedirs(destination)
+                session = Session(b"-PY0001-%012d" % (i + 1), port=0, host="127.0.0.1", tracker_timeout=1)
+                await session.start()
+                leechers.append(session)
+                session.add_torrent(torrent, destination).loadmanager.update_peers([Peer("127.0.0.1", seed.port)])
+            start = time.monotonic()
+            while seed.get_stat().connected < 3 and time.monotonic() - start < 10:
+                await asyncio.sleep(0.05)
+            assert seed.get_stat().connected == 3
+
+            seed.connection_budget.set_limit(1)
+            start = time.monotonic()
+            while seed.get_stat().connected > 1 and time.monotonic() - start < 5:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.5)  # відключені лічери пробують з'єднатись знову
+            assert seed.get_stat().connected == 1
+            assert seed.connection_budget.used == 1
+        finally:
+            for session in leechers + [seed]:
+                await session.shutdown()
+    asyncio.run(run())
+
+
+async def start_lossy_seed(data: bytes, piece_length: int, pieces: int, lost_begin: int) -> tuple[asyncio.Server, list]:
+    """Сід, що має всі куски, але ніколи не відповідає на запити блоків зі зсувом lost_begin.
+    Повертає сервер та список відповідей (index, begin), на які він надіслав блок"""
+    served = list()
+
+    async def serve(reader, writer):
+        handshake = await reader.readexactly(68)
+        bitfield = bytes([0xFF] * (pieces // 8) + ([0xFF << (8 - pieces % 8) & 0xFF] if pieces % 8 else []))
+        writer.write(handshake[:20] + bytes(8) + handshake[28:48] + b"-XX0001-000000000000"
+                     + struct.pack("!ib", 1 + len(bitfield), 5) + bitfield + struct.pack("!ib", 1, 1))
+        try:
+            while True:
+                message = await reader.readexactly(int.from_bytes(await reader.readexactly(4), "big"))
+                if not message or message[0] != 6: continue
+                index, begin, length = struct.unpack("!iii", message[1:])
+                if begin == lost_begin: continue
+                start = index * piece_length + begin
+                writer.write(struct.pack("!ibii", 9 + length, 7, index, begin) + data[start:start + length])
+                served.append((index, begin))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    return await asyncio.start_server(serve, "127.0.0.1", 0), served
+
+
+def test_lost_block_is_rerequested_elsewhere(tmp_path):
+    """Блок, на який пір не відповів за RTO, запитується в іншого піра, і завантаження завершується"""
+    async def run():
+        size, piece_length = 4 * 2 ** 20, 2 ** 16
+        seed_dir = os.path.join(tmp_path, "seed")
+        torrent = TorrentFile.open(make_torrent(seed_dir, "t", size, piece_length, announce="http://127.0.0.1:1/announce"))
+        with open(os.path.join(seed_dir, "t"), "rb") as f:
+            data = f.read()
+        lossy, served = await start_lossy_seed(data, piece_length, size // piece_length, 2 ** 14)
+        seed = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", to_download=False, tracker_timeout=1)
+        # обмеження швидкості, щоб кусок із втраченим блоком не дістався іншому піру раніше за тайм-аут
+        leecher = Session(b"-PY0001-%012d" % 1, port=0, host="127.0.0.1", tracker_timeout=1, download_rate=2 ** 21)
+        await seed.start()
+        await leecher.start()
+        destination = os.path.join(tmp_path, "leech")
+        os.makedirs(destination)
+        try:
+            seed.add_torrent(torrent, seed_dir)
+            manager = leecher.add_torrent(torrent, destination).loadmanager
+            manager.update_peers([Peer("127.0.0.1", lossy.sockets[0].getsockname()[1])])
+            start = time.monotonic()
+            while not served and time.monotonic() - start < 5:
+                await asyncio.sleep(0.02)
+            manager.update_peers([Peer("127.0.0.1", seed.port)])  # поки чекається перший тайм-аут
+            while manager.get_stat().left and time.monotonic() - start < 30:
+                await asyncio.sleep(0.05)
+            stat = manager.get_stat()
+            assert stat.left == 0
+            assert stat.block_timeouts >= 1 and stat.block_rerequests >= 1
+            assert served and stat.hash_failures == 0
+        finally:
+            lossy.close()
+            await leecher.shutdown()
+            await seed.shutdown()
+        with open(os.path.join(destination, "t"), "rb") as f:
+            assert f.read() == data
+    asyncio.run(run())
@@ -0,0 +1,21 @@
+from bittorrentclient.sharding import split_limit, shard_peer_id
+
+
+def test_split_limit_within_global_limit():
+    assert split_limit(10, [1, 1, 1]) == [4, 3, 3]
+    assert split_limit(200, [1, 1000, 1000, 1000]) == [1, 67, 66, 66]
+    assert split_limit(5, [100, 1, 1]) == [3, 1, 1]
+    for limit in range(0, 50):
+        for weights in ([1], [1, 1], [3, 1, 7], [1] * 8, [100, 1, 1, 1, 1]):
+            parts = split_limit(limit, weights)
+            assert sum(parts) == limit
+            if limit >= len(weights):
+                assert min(parts) >= 1
+
+
+def test_shard_peer_ids_are_distinct():
+    peer_id = b"-PY0001-%012d" % 42
+    ids = [shard_peer_id(peer_id, index) for index in range(16)]
+    assert len(set(ids)) == len(ids) and peer_id not in ids
+    assert all(len(i) == 20 and i.startswith(b"-PY0001-") for i in ids)
+    assert ids == [shard_peer_id(peer_id, index) for index in range(16)]
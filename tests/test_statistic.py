@@ -0,0 +1,12 @@
+from bittorrentclient.statistic import Statistic
+
+
+def test_sum():
+    a = Statistic(uploaded=1, downloaded=2, left=3, peers_count=4, connected=5, interesting=6, length=7,
+                  time_to_metadata=0.5, local_peers=1)
+    b = Statistic(uploaded=10, downloaded=20, left=30, peers_count=40, connected=50, interesting=60, length=70,
+                  time_to_first_byte=2.0, hash_failures=3)
+    total = Statistic.sum([a, b])
+    assert total == Statistic(uploaded=11, downloaded=22, left=33, peers_count=44, connected=55, interesting=66,
+                              length=77, time_to_metadata=0.5, time_to_first_byte=2.0, hash_failures=3, local_peers=1)
+    assert Statistic.sum([]) == Statistic(0, 0, 0, 0, 0, 0, 0)
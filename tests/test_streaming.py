@@ -0,0 +1,58 @@
+"""Потокове читання файлу пропущеного торенту на 127.0.0.1: читання не чекає кусків, які не завантажуватимуться.
+
+    $ python3 -m pytest tests/test_streaming.py
+"""
+import asyncio
+import os
+
+import pytest
+
+from bittorrentclient.filesmanager import PRIORITY_SKIP
+from bittorrentclient.loadmanager import PieceSkipped
+from bittorrentclient.session import Session
+from bittorrentclient.torrentfile import TorrentFile
+from benchmarks.swarm import make_torrent
+
+PIECE_LENGTH = 2 ** 16
+
+
+async def start_leecher(tmp_path, file_priorities: dict[int, int]) -> tuple[Session, TorrentFile]:
+    """Торент з трьох файлів по 4 куски, пірів немає"""
+    torrent = TorrentFile.open(make_torrent(os.path.join(tmp_path, "seed"), "t", 12 * PIECE_LENGTH, PIECE_LENGTH,
+                                            file_sizes=[4 * PIECE_LENGTH] * 3,
+                                            announce="http://127.0.0.1:1/announce"))
+    destination = os.path.join(tmp_path, "leech")
+    os.makedirs(destination)
+    session = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", tracker_timeout=1)
+    await session.start()
+    session.add_torrent(torrent, destination, file_priorities=file_priorities)
+    return session, torrent
+
+
+def test_read_skipped_file(tmp_path):
+    async def run():
+        session, torrent = await start_leecher(tmp_path, {1: PRIORITY_SKIP})
+        try:
+            async with session.open_stream(torrent.infoHash, 1) as stream:
+                with pytest.raises(PieceSkipped):
+                    await asyncio.wait_for(stream.read(100), 5)
+        finally:
+            await session.shutdown()
+    asyncio.run(run())
+
+
+def test_file_skipped_while_reading(tmp_path):
+    async def run():
+        session, torrent = await start_leecher(tmp_path, {})
+        try:
+            stream = session.open_stream(torrent.infoHash, 2)
+            read = asyncio.create_task(stream.read(100))
+            await asyncio.sleep(0.2)
+            assert not read.done()
+            session.set_file_priorities(torrent.infoHash, {2: PRIORITY_SKIP})
+            with pytest.raises(PieceSkipped):
+                await asyncio.wait_for(read, 5)
+            stream.close()
+        finally:
+            await session.shutdown()
+    asyncio.run(run())
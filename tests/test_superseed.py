@@ -0,0 +1,80 @@
+import asyncio
+import random
+
+from bittorrentclient.bitfield import BitField
+from bittorrentclient.superseed import SuperSeeder
+
+PIECES = 40
+
+
+class FakePeer:
+    """Пір без мережі: бітове поле змінюється тестом, оголошені йому куски записуються"""
+    def __init__(self):
+        self.bitfield = BitField(PIECES)
+        self.connected = True
+        self.offered: list[int] = list()
+        self.on_have = None
+
+    def reg_have_taker(self, clb):
+        self.on_have = clb
+
+    def have(self, index: int) -> None:
+        self.offered.append(index)
+
+    def got(self, index: int) -> None:
+        self.bitfield.set(index)
+        self.on_have(self, index)
+
+    def got_bitfield(self, indexes) -> None:
+        self.bitfield = BitField(PIECES)
+        for i in indexes:
+            self.bitfield.set(i)
+        self.on_have(self, None)
+
+
+def test_availability_matches_recount():
+    """Лічильники, що оновлюються в _on_have та detach, збігаються з повним перерахунком,
+    а пропонується найменш поширений кусок"""
+    async def run():
+        rng = random.Random(5)
+        connected: list[FakePeer] = list()
+        seeder = SuperSeeder(PIECES, lambda: connected, wait=60)
+        for step in range(400):
+            action = rng.random()
+            if action < 0.15 or not connected:
+                peer = FakePeer()
+                connected.append(peer)
+                seeder.attach(peer)
+            elif action < 0.25:
+                peer = connected.pop(rng.randrange(len(connected)))
+                seeder.detach(peer)
+            elif action < 0.35:
+                rng.choice(connected).got_bitfield(rng.sample(range(PIECES), rng.randrange(PIECES // 4)))
+            else:
+                rng.choice(connected).got(rng.randrange(PIECES))
+            if not seeder.active:
+                break
+            recount = [sum(p.bitfield.has(i) for p in connected) for i in range(PIECES)]
+            assert seeder._availability == recount
+            if action < 0.15:  # новому піру пропонується кусок, якого менше всього в інших
+                assert recount[peer.offered[0]] == min(recount)
+        assert step > 50
+    asyncio.run(run())
+
+
+def test_pieces_spread_before_new_offer():
+    """Новий кусок пір отримує, коли запропонований йому кусок з'явився в іншого піра"""
+    async def run():
+        connected: list[FakePeer] = list()
+        seeder = SuperSeeder(PIECES, lambda: connected, wait=60)
+        a, b = FakePeer(), FakePeer()
+        connected += [a, b]
+        seeder.attach(a)
+        seeder.attach(b)
+        assert len(a.offered) == 1 and len(b.offered) == 1 and a.offered != b.offered
+        a.got(a.offered[0])
+        assert len(a.offered) == 1  # кусок ще не передано далі
+        b.got(a.offered[0])
+        assert len(a.offered) == 2 and a.offered[1] not in (a.offered[0], b.offered[0])
+        assert seeder.allowed(a, a.offered[1]) and not seeder.allowed(a, b.offered[0])
+    asyncio.run(run())
@@ -0,0 +1,145 @@
+"""uTP на 127.0.0.1: передача через проміжний UDP вузол, що губить та переставляє пакети, та обробка
+пакетів, які не мають ламати з'єднання чи сокет.
+
+    $ python3 -m pytest tests/test_utp.py
+"""
+import asyncio
+import hashlib
+import os
+import random
+
+import pytest
+
+from bittorrentclient.utp import UTPSocket, UTPError, HEADER, VERSION, ST_SYN, ST_DATA, ST_FIN, \
+    MAX_INCOMING_PER_ADDRESS
+
+
+class LossyRelay(asyncio.DatagramProtocol):
+    """Пересилає пакети між клієнтом і сервером, губить частину loss та затримує частину reorder"""
+    def __init__(self, server: tuple[str, int], loss: float, reorder: float, seed: int = 1):
+        self._server = server
+        self._loss = loss
+        self._reorder = reorder
+        self._random = random.Random(seed)
+        self._client: tuple[str, int] | None = None
+        self.dropped = 0
+        self.reordered = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if addr != self._server:
+            self._client = addr
+        target = self._server if addr != self._server else self._client
+        if target is None:
+            return
+        if self._random.random() < self._loss:
+            self.dropped += 1
+        elif self._random.random() < self._reorder:
+            self.reordered += 1
+            delay = self._random.uniform(0.001, 0.02)
+            asyncio.get_running_loop().call_later(delay, self.transport.sendto, data, target)
+        else:
+            self.transport.sendto(data, target)
+
+
+def packet(kind: int, conn_id: int, seq: int, ack: int = 0, payload: bytes = b"") -> bytes:
+    return HEADER.pack(kind << 4 | VERSION, 0, conn_id, 0, 0, 1 << 20, seq, ack) + payload
+
+
+def test_transfer_with_loss_and_reordering():
+    async def run():
+        received = dict()
+
+        async def handler(reader, writer):
+            digest, size = hashlib.sha1(), 0
+            while data := await reader.read(1 << 16):
+                digest.update(data)
+                size += len(data)
+            received.update(size=size, digest=digest.digest())
+            writer.write(b"done")
+            await writer.drain()
+            writer.close()
+
+        server = UTPSocket(0, "127.0.0.1", handler)
+        await server.start()
+        client = UTPSocket(0, "127.0.0.1")
+        await client.start()
+        transport, relay = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: LossyRelay(("127.0.0.1", server.port), loss=0.03, reorder=0.1), local_addr=("127.0.0.1", 0))
+        try:
+            reader, writer = await client.open_connection("127.0.0.1", transport.get_extra_info("sockname")[1])
+            data = os.urandom(2 * 2 ** 20)
+            for i in range(0, len(data), 1 << 14):
+                writer.write(data[i:i + (1 << 14)])
+                await writer.drain()
+            writer.close()
+            assert await asyncio.wait_for(reader.read(), 60) == b"done"
+            assert received == dict(size=len(data), digest=hashlib.sha1(data).digest())
+            assert relay.dropped and relay.reordered
+        finally:
+            await client.stop()
+            await server.stop()
+            transport.close()
+    asyncio.run(run())
+
+
+async def start_server() -> tuple[UTPSocket, list]:
+    readers = list()
+
+    async def handler(reader, writer):
+        readers.append(reader)
+
+    server = UTPSocket(0, "127.0.0.1", handler, max_incoming=16)
+    await server.start()
+    return server, readers
+
+
+def test_data_after_fin_is_ignored():
+    async def run():
+        server, readers = await start_server()
+        address = ("127.0.0.1", 40000)
+        try:
+            server.datagram_received(packet(ST_SYN, 100, 1), address)
+            server.datagram_received(packet(ST_DATA, 101, 4, payload=b"late"), address)  # не по порядку, після FIN
+            server.datagram_received(packet(ST_DATA, 101, 2, payload=b"abc"), address)
+            server.datagram_received(packet(ST_FIN, 101, 3), address)
+            server.datagram_received(packet(ST_DATA, 101, 5, payload=b"later"), address)
+            await asyncio.sleep(0)
+            assert await asyncio.wait_for(readers[0].read(), 1) == b"abc"
+        finally:
+            await server.stop()
+    asyncio.run(run())
+
+
+def test_syn_flood_is_capped():
+    async def run():
+        server, _ = await start_server()
+        try:
+            for conn_id in range(0, 4000, 2):
+                server.datagram_received(packet(ST_SYN, conn_id, 1), ("127.0.0.1", 40000))
+            assert len(server.connections) == MAX_INCOMING_PER_ADDRESS
+            for port in range(41000, 42000):
+                server.datagram_received(packet(ST_SYN, 7, 1), ("127.0.0.1", port))
+            assert len(server.connections) == 16
+        finally:
+            await server.stop()
+    asyncio.run(run())
+
+
+def test_unreachable_is_remembered():
+    async def run():
+        client = UTPSocket(0, "127.0.0.1")
+        await client.start()
+        silent = UTPSocket(0, "127.0.0.1")  # сокет без handler ігнорує SYN
+        await silent.start()
+        try:
+            assert client.reachable("127.0.0.1", silent.port)
+            with pytest.raises(UTPError):
+                await client.open_connection("127.0.0.1", silent.port, timeout=0.3)
+            assert not client.reachable("127.0.0.1", silent.port)
+        finally:
+            await client.stop()
+            await silent.stop()
+    asyncio.run(run())
@@ -0,0 +1,138 @@
+"""Веб-сіди (BEP 19) на 127.0.0.1: локальний aiohttp файловий сервер замість HTTP дзеркал.
+
+    $ python3 -m pytest tests/test_webseed.py
+"""
+import asyncio
+import os
+import time
+
+from aiohttp import web
+
+from bittorrentclient import creator
+from bittorrentclient.bencoder import BenCoder
+from bittorrentclient.session import Session
+from bittorrentclient.torrentfile import TorrentFile
+
+PIECE_LENGTH = 1 << 15
+FILE_SIZES = [100_000, 1, 0, 777_777, 2_000_000, 33]
+
+
+def make_single(root: str) -> str:
+    path = os.path.join(root, "data set")
+    os.makedirs(root)
+    with open(path, "wb") as f:
+        f.write(os.urandom(3_000_001))
+    return path
+
+
+def make_multi(root: str) -> str:
+    path = os.path.join(root, "data set")
+    for i, size in enumerate(FILE_SIZES):
+        file_path = os.path.join(path, "sub dir" if i % 2 else "", f"f {i}.bin")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(os.urandom(size))
+    return path
+
+
+async def start_server(root: str) -> tuple[web.AppRunner, str]:
+    """/files/ - файли як є, /bad/ - завжди 404, /poison/ - перший байт кожного діапазону зіпсований"""
+    async def bad(request):
+        return web.Response(status=404)
+
+    async def poison(request):
+        path = os.path.join(root, request.match_info["tail"])
+        start, _, end = request.headers["Range"].removeprefix("bytes=").partition("-")
+        start, end = int(start), int(end)
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = bytearray(f.read(end - start + 1))
+        data[0] ^= 0xff
+        return web.Response(status=206, body=bytes(data), headers={"Content-Range": f"bytes {start}-{end}/*"})
+
+    app = web.Application()
+    app.router.add_get("/bad/{tail:.*}", bad)
+    app.router.add_get("/poison/{tail:.*}", poison)
+    app.router.add_static("/files/", root)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/"
+
+
+async def download(tmp_path, source: str, urls: list[str], timeout: float = 60) -> str:
+    """Завантаження лише з веб-сідів: трекер недоступний, пірів немає"""
+    meta = BenCoder.decode(creator.create(source, [["http://127.0.0.1:1/announce"]], PIECE_LENGTH))
+    meta["url-list"] = urls
+    torrent_path = os.path.join(tmp_path, "t.torrent")
+    with open(torrent_path, "wb") as f:
+        f.write(BenCoder.encode(meta))
+    destination = os.path.join(tmp_path, "out")
+    os.makedirs(destination)
+
+    session = Session(b"-PY0001-%012d" % 0, port=0, host="127.0.0.1", to_upload=False, tracker_timeout=1)
+    await session.start()
+    try:
+        session.add_torrent(TorrentFile.open(torrent_path), destination)
+        start = time.monotonic()
+        while session.get_stat().left and time.monotonic() - start < timeout:
+            await asyncio.sleep(0.1)
+        assert session.get_stat().left == 0
+    finally:
+        await session.shutdown()
+    return destination
+
+
+def assert_same(source: str, destination: str) -> None:
+    """Файли багатофайлового торенту лежать одразу в destination"""
+    if os.path.isfile(source):
+        with open(source, "rb") as a, open(os.path.join(destination, os.path.basename(source)), "rb") as b:
+            assert a.read() == b.read()
+        return
+    for dir_path, _, files in os.walk(source):
+        for file_name in files:
+            path = os.path.join(dir_path, file_name)
+            if not os.path.getsize(path):
+                continue
+            with open(path, "rb") as a, open(os.path.join(destination, os.path.relpath(path, source)), "rb") as b:
+                assert a.read() == b.read(), path
+
+
+def test_single_file(tmp_path):
+    async def run():
+        source = make_single(os.path.join(tmp_path, "srv"))
+        runner, base = await start_server(os.path.dirname(source))
+        try:
+            # для однофайлового торенту URL, що закінчується на /, доповнюється ім'ям файлу
+            destination = await download(tmp_path, source, [base + "files/"])
+        finally:
+            await runner.cleanup()
+        assert_same(source, destination)
+    asyncio.run(run())
+
+
+def test_multi_file_with_missing_mirror(tmp_path):
+    async def run():
+        source = make_multi(os.path.join(tmp_path, "srv"))
+        runner, base = await start_server(os.path.dirname(source))
+        try:
+            destination = await download(tmp_path, source, [base + "bad/", base + "files"])
+        finally:
+            await runner.cleanup()
+        assert_same(source, destination)
+    asyncio.run(run())
+
+
+def test_corrupting_mirror(tmp_path):
+    """Куски з дзеркала, що псує дані, не проходять перевірку, завантаження завершується з іншого"""
+    async def run():
+        source = make_multi(os.path.join(tmp_path, "srv"))
+        runner, base = await start_server(os.path.dirname(source))
+        try:
+            destination = await download(tmp_path, source, [base + "poison/", base + "files"])
+        finally:
+            await runner.cleanup()
+        assert_same(source, destination)
+    asyncio.run(run())